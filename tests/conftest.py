@@ -0,0 +1,27 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# The tools are flat scripts that import each other by module name
+TOOLS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+sys.path.insert(0, TOOLS_DIR)
+
+def run_tool(script, *args):
+    """Run a tool as its command line does; returns the completed process (raises if it fails)"""
+    return subprocess.run([sys.executable, os.path.join(TOOLS_DIR, script), *map(str, args)],
+                          check=True, capture_output=True, text=True)
+
+@pytest.fixture(scope='session')
+def sample_data(tmp_path_factory):
+    """A small generated data directory (CSV, scale 0.1); copy it before changing it"""
+    out_dir = tmp_path_factory.mktemp('sample') / 'data'
+    run_tool('generate_sample_data.py', out_dir, '--scale', '0.1')
+    return str(out_dir)
+
+@pytest.fixture
+def data_copy(sample_data, tmp_path):
+    """A private copy of sample_data"""
+    return shutil.copytree(sample_data, str(tmp_path / 'data'))
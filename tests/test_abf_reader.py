@@ -0,0 +1,317 @@
+import sqlite3
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import abf_reader as abf
+
+# ---------------------------------------------------------------------------
+# Writing the layouts abf_reader reads
+# ---------------------------------------------------------------------------
+
+def encode_segment(items, all_packed=False):
+    """IDF and IDFMETA bytes of one segment.
+
+    items are ('rle', data_id, count) runs and ('packed', [data_ids]) runs;
+    all_packed writes a single packed run as a segment with no RLE runs.
+    """
+    ids = [i for item in items for i in ([item[1]] * item[2] if item[0] == 'rle' else item[1])]
+    low, high = min(ids), max(ids)
+    packed = [i for item in items if item[0] == 'packed' for i in item[1]]
+    bit_width = max((high - low).bit_length(), 1)
+    per_word = 64 // bit_width
+    words = []
+    for start in range(0, len(packed), per_word):
+        word = 0
+        for k, value in enumerate(packed[start:start + per_word]):
+            word |= (value - low) << (k * bit_width)
+        words.append(word)
+    runs = []
+    packed_before = 0
+    for item in ([] if all_packed else items):
+        if item[0] == 'rle':
+            runs.append((item[1], item[2]))
+        else:
+            runs.append((abf.BIT_PACKED_MARKER - packed_before, len(item[1])))
+            packed_before += len(item[1])
+    idf = struct.pack('<Q', len(runs)) + b''.join(struct.pack('<II', *run) for run in runs)
+    idf += struct.pack('<Q', len(words)) + b''.join(struct.pack('<Q', word) for word in words)
+    meta = (abf.CP_OPEN + abf.CP_FIELDS.pack(1) + abf.CS_OPEN
+            + abf.CS_FIELDS.pack(len(ids), 1, 0, 0, 0, 0, 0, 0, 0) + abf.SS_OPEN
+            + abf.SS_FIELDS.pack(len(set(ids)), low, high, low, 0, len(ids), 0, len(runs), 0)
+            + abf.SS_CLOSE + bytes([bool(packed)]) + abf.CS_CLOSE + abf.CP_CLOSE)
+    return idf, meta, ids
+
+def encode_idf(segments):
+    """IDF and IDFMETA bytes of several segments, and the data ids they hold"""
+    parts = [encode_segment(*segment) for segment in segments]
+    return b''.join(p[0] for p in parts), b''.join(p[1] for p in parts), [i for p in parts for i in p[2]]
+
+def numeric_dictionary(values, real=False):
+    code = abf.DICTIONARY_REAL if real else abf.DICTIONARY_LONG
+    data = np.asarray(values, dtype='<f8' if real else '<i8').tobytes()
+    return struct.pack('<i', code) + bytes(24) + struct.pack('<QI', len(values), 8) + data
+
+def string_dictionary(pages, first_id):
+    """A string dictionary of uncompressed pages (lists of strings) starting at data id first_id"""
+    data = struct.pack('<i', abf.DICTIONARY_STRING) + bytes(24) + struct.pack('<qBqq', 0, 0, 0, len(pages))
+    start = first_id
+    for strings in pages:
+        text = ''.join(f'{s}\x00' for s in strings).encode('utf-16-le')
+        allocation = len(text) + 6
+        data += struct.pack('<QBQQB', 0, 0, start, len(strings), 0) + abf.STRING_STORE_BEGIN
+        data += struct.pack('<QQQ', 0, len(text) // 2, allocation) + text.ljust(allocation, b'\x00')
+        data += abf.STRING_STORE_END
+        start += len(strings)
+    return data
+
+METADATA_SCHEMA = """
+CREATE TABLE [Table] (ID INTEGER, Name TEXT);
+CREATE TABLE [Column] (ID INTEGER, TableID INTEGER, ExplicitName TEXT, InferredName TEXT,
+                       ExplicitDataType INTEGER, Type INTEGER, ColumnStorageID INTEGER);
+CREATE TABLE ColumnStorage (ID INTEGER, DictionaryStorageID INTEGER, Statistics_DistinctStates INTEGER);
+CREATE TABLE ColumnPartitionStorage (ID INTEGER, ColumnStorageID INTEGER, StorageFileID INTEGER);
+CREATE TABLE DictionaryStorage (ID INTEGER, BaseId INTEGER, Magnitude REAL, IsNullable INTEGER,
+                                StorageFileID INTEGER);
+CREATE TABLE StorageFile (ID INTEGER, FileName TEXT);
+"""
+
+def metadata_db(path, tables):
+    """A metadata.sqlitedb describing tables: {table: {column: spec}}"""
+    conn = sqlite3.connect(path)
+    conn.executescript(METADATA_SCHEMA)
+    ids = iter(range(1, 1000))
+    for table_id, (table, columns) in enumerate(tables.items(), 1):
+        conn.execute("INSERT INTO [Table] VALUES (?, ?)", (table_id, table))
+        for name, spec in columns.items():
+            column_id = next(ids)
+            dictionary_id = None
+            if 'dictionary' in spec or 'base_id' in spec:
+                dictionary_id = next(ids)
+                file_id = None
+                if 'dictionary' in spec:
+                    file_id = next(ids)
+                    conn.execute("INSERT INTO StorageFile VALUES (?, ?)", (file_id, f'{table}.{name}.dictionary'))
+                conn.execute("INSERT INTO DictionaryStorage VALUES (?, ?, ?, 0, ?)",
+                             (dictionary_id, spec.get('base_id', 0), spec.get('magnitude', 1), file_id))
+            conn.execute("INSERT INTO ColumnStorage VALUES (?, ?, 0)", (column_id, dictionary_id))
+            conn.execute("INSERT INTO [Column] VALUES (?, ?, NULL, ?, ?, ?, ?)",
+                         (column_id, table_id, name, spec['type'], spec.get('kind', 1), column_id))
+            for partition in range(len(spec['partitions'])):
+                file_id = next(ids)
+                conn.execute("INSERT INTO StorageFile VALUES (?, ?)", (file_id, f'{table}.{name}.{partition}.idf'))
+                conn.execute("INSERT INTO ColumnPartitionStorage VALUES (?, ?, ?)", (next(ids), column_id, file_id))
+    conn.commit()
+    conn.close()
+    with open(path, 'rb') as f:
+        return f.read()
+
+def write_abf(path, files):
+    """An ABF backup holding files {logical path: bytes}"""
+    def xml(text):
+        return ('\ufeff' + text).encode('utf-16-le')
+
+    body = bytearray()
+    stored = []
+    for n, (name, data) in enumerate(files.items()):
+        offset = abf.PAGE_SIZE + len(body)
+        stored.append((name, f'storage{n}', offset, len(data)))
+        body += data
+    log = xml('<BackupLog xmlns="http://schemas.microsoft.com/analysisservices/2003/backup"><BackupFiles>'
+              + ''.join(f'<BackupFile><Path>{name}</Path><StoragePath>{storage}</StoragePath></BackupFile>'
+                        for name, storage, _, _ in stored)
+              + '</BackupFiles></BackupLog>')
+    stored.append(('', 'log', abf.PAGE_SIZE + len(body), len(log)))
+    body += log
+    directory = xml('<VirtualDirectory>'
+                    + ''.join(f'<BackupFile><Path>{storage}</Path><m_cbOffsetHeader>{offset}</m_cbOffsetHeader>'
+                              f'<Size>{size}</Size></BackupFile>' for _, storage, offset, size in stored)
+                    + '</VirtualDirectory>')
+    header = xml(f'<BackupLogHeader><m_cbOffsetHeader>{abf.PAGE_SIZE + len(body)}</m_cbOffsetHeader>'
+                 f'<DataSize>{len(directory)}</DataSize><ApplyCompression>false</ApplyCompression>'
+                 '</BackupLogHeader>')
+    page = abf.SIGNATURE.encode('utf-16-le') + header
+    with open(path, 'wb') as f:
+        f.write(page.ljust(abf.PAGE_SIZE, b'\x00') + bytes(body) + directory)
+    return str(path)
+
+# ---------------------------------------------------------------------------
+# A small model
+# ---------------------------------------------------------------------------
+
+REGIONS = [['North', 'South'], ['East', 'Wést', '']]
+PRICES = [0.5, 1.25, 99.99]
+
+def sales_columns():
+    """Column specs of a 'sales' table covering each encoding, with the values each decodes to"""
+    rng = np.random.default_rng(3)
+    region_ids = [2 + int(i) for i in rng.integers(0, 5, 68)]
+    columns = {
+        # Hash-encoded strings over two dictionary pages, ids from 2; two partitions
+        'Region': {'type': abf.STRING, 'first_id': 2, 'partitions': [
+            [([('rle', 2, 7), ('packed', region_ids[:13]), ('rle', 6, 3)],), ([('packed', region_ids[13:63])], True)],
+            [([('rle', 4, 5), ('packed', region_ids[63:])],)],
+        ]},
+        # Value-encoded integers: data id + BaseId
+        'Quantity': {'type': abf.INT64, 'base_id': -10, 'partitions': [
+            [([('packed', list(range(10, 50)))], True), ([('rle', 12, 30), ('packed', [11, 19, 30])],)],
+            [([('rle', 15, 10)],)],
+        ]},
+        # Value-encoded with a magnitude
+        'Weight': {'type': abf.DOUBLE, 'base_id': 0, 'magnitude': 4, 'partitions': [
+            [([('rle', 1, 30), ('packed', [2, 3, 5, 7, 11] * 8 + [13, 17, 19])],)],
+            [([('packed', [0, 4]), ('rle', 8, 8)],)],
+        ]},
+        'Price': {'type': abf.DOUBLE, 'values': PRICES, 'real': True, 'partitions': [
+            [([('packed', [0, 1, 2, 1] * 15 + [0, 1, 2, 1, 0, 1, 2, 1, 0, 1, 2, 1, 0])],)],
+            [([('rle', 2, 10)],)],
+        ]},
+        'Amount': {'type': abf.DECIMAL, 'values': [125000, -5000, 0], 'partitions': [
+            [([('rle', 0, 40), ('rle', 1, 33)],)], [([('rle', 2, 10)],)],
+        ]},
+        'OrderDate': {'type': abf.DATETIME, 'values': [45292.0, 45292.5, 45658.25], 'real': True, 'partitions': [
+            [([('rle', 0, 20), ('packed', [1, 2, 0, 2] * 13 + [1])],)], [([('rle', 1, 10)],)],
+        ]},
+        'Active': {'type': abf.BOOLEAN, 'values': [0, 1], 'partitions': [
+            [([('packed', [0, 1] * 36 + [1])],)], [([('rle', 1, 10)],)],
+        ]},
+        'RowNumber': {'type': abf.INT64, 'kind': abf.ROW_NUMBER_COLUMN, 'base_id': 0, 'partitions': [
+            [([('packed', list(range(73)))],)], [([('packed', list(range(73, 83)))],)],
+        ]},
+    }
+    for spec in columns.values():
+        if spec['type'] == abf.STRING:
+            spec['dictionary'] = string_dictionary(REGIONS, spec['first_id'])
+        elif 'values' in spec:
+            spec['dictionary'] = numeric_dictionary(spec['values'], spec.get('real', False))
+    return columns
+
+def expected_values(spec, ids):
+    ids = np.asarray(ids)
+    if spec['type'] == abf.STRING:
+        return np.array([s for page in REGIONS for s in page], dtype=object)[ids - spec['first_id']]
+    if 'values' in spec:
+        values = np.asarray(spec['values'])[ids]
+    elif 'magnitude' in spec:
+        values = (ids + spec['base_id']) / spec['magnitude']
+    else:
+        values = ids + spec['base_id']
+    if spec['type'] == abf.DATETIME:
+        return abf.OLE_EPOCH + np.round(values * abf.MS_PER_DAY).astype('timedelta64[ms]')
+    if spec['type'] == abf.DECIMAL:
+        return values / abf.DECIMAL_SCALE
+    if spec['type'] == abf.BOOLEAN:
+        return values.astype(bool)
+    return values
+
+@pytest.fixture
+def model(tmp_path):
+    """A generated ABF with a 'sales' table in every layout and a one-column 'region' table;
+    returns (path, {table: {column: expected values}})"""
+    tables = {'sales': sales_columns(),
+              'region': {'Name': {'type': abf.STRING, 'first_id': 2, 'partitions': [[([('rle', 3, 2)],)]]}}}
+    tables['region']['Name']['dictionary'] = string_dictionary(REGIONS, 2)
+    files = {}
+    expected = {}
+    for table, columns in tables.items():
+        for name, spec in columns.items():
+            ids = []
+            for partition, segments in enumerate(spec['partitions']):
+                idf, meta, partition_ids = encode_idf(segments)
+                files[f'Model\\{table}.tbl\\{table}.{name}.{partition}.idf'] = idf
+                files[f'Model\\{table}.tbl\\{table}.{name}.{partition}.idfmeta'] = meta
+                ids += partition_ids
+            if 'dictionary' in spec:
+                files[f'Model\\{table}.tbl\\{table}.{name}.dictionary'] = spec['dictionary']
+            if spec.get('kind', 1) != abf.ROW_NUMBER_COLUMN:
+                expected.setdefault(table, {})[name] = expected_values(spec, ids)
+    files['Model\\metadata.sqlitedb'] = metadata_db(str(tmp_path / 'metadata.sqlitedb'), tables)
+    return write_abf(tmp_path / 'model.abf', files), expected
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+def test_directory_and_metadata(model):
+    path, expected = model
+    with abf.AbfReader(path) as reader:
+        assert reader.tables() == ['sales', 'region']
+        assert list(reader.columns()['sales']) == list(expected['sales'])
+        assert len(reader.columns()['sales']['Region']['idf']) == 2
+        assert reader.row_count('sales') == 83
+        assert bytes(reader.file('sales.Price.dictionary')) == bytes(reader.file('Model\\sales.tbl\\sales.Price.dictionary'))
+
+@pytest.mark.parametrize('column', ['Region', 'Quantity', 'Weight', 'Price', 'Amount', 'OrderDate', 'Active'])
+def test_columns_decode(model, column):
+    path, expected = model
+    with abf.AbfReader(path) as reader:
+        values = reader.column('sales', column)
+    assert values.dtype == expected['sales'][column].dtype
+    assert np.array_equal(values, expected['sales'][column])
+
+def test_tables_export(model, tmp_path):
+    path, expected = model
+    out_dir = tmp_path / 'out'
+    exported = {table: rows for table, rows, _ in abf.export_tables(path, str(out_dir), workers=2)}
+    assert exported == {'sales': 83, 'region': 2}
+    df = pd.read_csv(out_dir / 'region.csv')
+    assert df['Name'].tolist() == ['South', 'South']
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_export_in_chunks(model, tmp_path, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    path, _ = model
+    out = tmp_path / f'sales.{fmt}'
+    with abf.AbfReader(path) as reader:
+        whole = reader.table('sales')
+        # Chunks cut across the segments, which differ from column to column
+        assert [len(df) for df in reader.table_chunks('sales', rows=20)] == [20, 20, 20, 20, 3]
+        assert abf.write_table(reader, 'sales', str(out), fmt, rows=20) == 83
+    if fmt == 'csv':
+        assert out.read_text(encoding='utf-8') == whole.to_csv(index=False, date_format=abf.CSV_DATE_FORMAT)
+    else:
+        pd.testing.assert_frame_equal(pd.read_parquet(out), whole)
+
+def test_decode_idf_segments():
+    idf, meta, ids = encode_idf([
+        ([('packed', [5, 9, 6, 5, 7])], True),
+        ([('rle', 100, 3), ('packed', [101, 107, 120]), ('rle', 0, 2), ('packed', [1, 3]), ('rle', 7, 1)],),
+        ([('rle', 4, 6)],),
+    ])
+    segments = abf.read_idfmeta(meta)
+    assert [s['rows'] for s in segments] == [5, 11, 6]
+    assert [s['bit_packed'] for s in segments] == [True, True, False]
+    assert abf.decode_idf(idf, segments).tolist() == ids
+
+def test_decode_idf_checks_layout():
+    idf, meta, _ = encode_idf([([('rle', 4, 6), ('packed', [1, 2])],)])
+    segments = abf.read_idfmeta(meta)
+    with pytest.raises(ValueError, match='bytes after its last segment'):
+        abf.decode_idf(idf + bytes(8), segments)
+    with pytest.raises(ValueError, match='IDFMETA says 9'):
+        abf.decode_idf(idf, [dict(segments[0], rows=9)])
+    with pytest.raises(ValueError, match="expected b'<1:CS"):
+        abf.read_idfmeta(meta[:14] + b'x' + meta[15:])
+
+def test_dictionaries():
+    values, first_id = abf.read_dictionary(string_dictionary(REGIONS, 5))
+    assert (values.tolist(), first_id) == (['North', 'South', 'East', 'Wést', ''], 5)
+    values, first_id = abf.read_dictionary(numeric_dictionary([3, -1, 2 ** 40]))
+    assert (values.tolist(), first_id) == ([3, -1, 2 ** 40], 0)
+    assert abf.lookup(values, 0, np.array([2, 5, -1, 0])).tolist()[0] == 2 ** 40
+    assert np.isnan(abf.lookup(values, 0, np.array([2, 5]))[1])
+    # A column with blanks elsewhere keeps its nullable dtype in segments without any
+    assert abf.lookup(values, 0, np.array([2, 0]), blanks=True).dtype == np.float64
+    compressed = bytearray(string_dictionary(REGIONS, 0))
+    compressed[4 + 24 + struct.calcsize('<qBqq') + struct.calcsize('<QBQQ')] = 1
+    with pytest.raises(ValueError, match='Huffman'):
+        abf.read_dictionary(bytes(compressed))
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.abf'
+    path.write_bytes(b'PK' + bytes(abf.PAGE_SIZE))
+    with pytest.raises(ValueError, match='not an Analysis Services backup'):
+        abf.AbfReader(str(path))
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from aggregations import AggregationRouter, build_rollups
+
+SALES = {'Sales': ('SUM', 'NetSales'), 'Orders': ('COUNT', 'SalesKey'),
+         'Smallest': ('MIN', 'GrossSales'), 'Largest': ('MAX', 'GrossSales')}
+ORDERS = {'Quantity': ('SUM', 'Quantity'), 'Lines': ('COUNT', 'OrderKey'), 'Total': ('SUM', 'LineTotal')}
+
+QUERIES = [
+    ('fact_sales', SALES, ['dim_date.Year'], {}),
+    ('fact_sales', SALES, ['dim_date.Year'], {'dim_customer.Channel': ['Online']}),
+    ('fact_sales', SALES, ['dim_date.Quarter', 'dim_geography.Region'], {'dim_date.Year': [2023]}),
+    ('fact_sales', SALES, ['dim_date.YearMonth'], {}),
+    ('fact_orders', ORDERS, ['OrderStatus', 'dim_customer.Channel'], {'dim_date.Year': [2022, 2024]}),
+    ('fact_orders', ORDERS, [], {'dim_geography.Region': ['Europe'], 'fact_orders.OrderStatus': ['Completed']}),
+]
+
+@pytest.fixture
+def router(data_copy):
+    build_rollups(data_copy)
+    return AggregationRouter.from_directory(data_copy)
+
+@pytest.mark.parametrize('table, measures, group_by, filters', QUERIES)
+def test_rollups_match_detail(router, table, measures, group_by, filters):
+    result, served = router.aggregate(table, measures, group_by, filters)
+    assert served.startswith(f'{table}__'), served
+    expected = router.star.aggregate(table, measures, group_by, filters)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+def test_unanswerable_queries_go_to_detail(router):
+    measures = {'Customers': ('DISTINCTCOUNT', 'CustomerKey')}
+    result, served = router.aggregate('fact_sales', measures, ['dim_date.Year'])
+    assert 'detail: DISTINCTCOUNT is not additive' in served
+    pd.testing.assert_frame_equal(result, router.star.aggregate('fact_sales', measures, ['dim_date.Year']))
+    _, served = router.aggregate('fact_sales', SALES, ['dim_customer.CustomerType'])
+    assert 'detail: no rollup of fact_sales covers' in served
+
+def test_stale_rollups_are_not_used(data_copy):
+    build_rollups(data_copy)
+    with open(f'{data_copy}/fact_sales.csv', 'a', encoding='utf-8') as f:
+        f.write('\n')
+    router = AggregationRouter.from_directory(data_copy)
+    _, served = router.aggregate('fact_sales', SALES, ['dim_date.Year'])
+    assert 'out of date' in served
+    _, served = router.aggregate('fact_orders', ORDERS, ['dim_date.Year'])
+    assert served.startswith('fact_orders__')
@@ -0,0 +1,17 @@
+import random
+
+import numpy as np
+
+import benchmark
+import generate_sample_data as gen
+
+def test_sales_stage_rolls_up_every_order():
+    random.seed(42)
+    np.random.seed(42)
+    dates = gen.generate_date_dimension()
+    customers = gen.generate_customer_dimension(5000)
+    products = gen.generate_product_dimension()
+    orders = gen.generate_fact_orders_vectorized(customers, products, dates, n_orders=5000)
+    run, unit = benchmark.STAGES['sales'](0.1)
+    assert unit == 'rows'
+    assert run() == orders['OrderID'].nunique() == len(gen.rollup_fact_sales(orders))
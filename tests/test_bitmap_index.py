@@ -0,0 +1,102 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from bitmap_index import BitmapIndex, RoaringBitmap, build_index, pack_bitmaps, unpack_bitmaps
+from conftest import run_tool
+from dax_compiler import MeasureEvaluator
+from query_engine import StarModel
+
+FILTERS = [
+    {('dim_customer', 'Channel'): ['Online']},
+    {('dim_customer', 'Channel'): ['Online', 'Retail'], ('dim_geography', 'Region'): ['Europe']},
+    {('dim_customer', 'CustomerType'): ['B2B'], ('fact_orders', 'OrderStatus'): ['Completed']},
+    {('dim_customer', 'PriorityLevel'): ['High'], ('dim_date', 'Year'): [2023]},
+]
+
+def random_rows(rng, n_rows, density):
+    return np.flatnonzero(rng.random(n_rows) < density)
+
+@pytest.mark.parametrize('density', [0.001, 0.05, 0.5])
+def test_roaring_operations_match_sets(density):
+    rng = np.random.default_rng(7)
+    a_rows, b_rows = random_rows(rng, 300_000, density), random_rows(rng, 300_000, 0.06)
+    a, b = RoaringBitmap.from_rows(a_rows), RoaringBitmap.from_rows(b_rows)
+    assert len(a) == len(a_rows)
+    assert np.array_equal((a & b).rows(), np.intersect1d(a_rows, b_rows))
+    assert np.array_equal((a | b).rows(), np.union1d(a_rows, b_rows))
+    mask = np.zeros(300_000, dtype=bool)
+    mask[a_rows] = True
+    assert np.array_equal(a.mask(300_000), mask)
+    restored = unpack_bitmaps(pack_bitmaps([a, b]))
+    assert [bitmap.rows().tolist() for bitmap in restored] == [a_rows.tolist(), b_rows.tolist()]
+
+def test_extend_appends_rows():
+    rows = np.arange(0, 200_000, 3)
+    bitmap = RoaringBitmap.from_rows(rows[:10_000])
+    bitmap.extend(rows[10_000:])
+    assert np.array_equal(bitmap.rows(), rows)
+
+def table_masks(data_dir, table, filters):
+    plain = StarModel.from_directory(data_dir, bitmaps=False)
+    indexed = StarModel.from_directory(data_dir)
+    assert indexed.bitmaps is not None and table not in indexed.bitmaps.stale
+    return plain.table_mask(table, filters), indexed.table_mask(table, filters)
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('table', ['fact_orders', 'fact_sales', 'fact_returns'])
+def test_bitmap_masks_match_joins(data_copy, table, filters):
+    build_index(data_copy)
+    filters = {ref: values for ref, values in filters.items() if ref[0] != 'fact_orders' or table == 'fact_orders'}
+    joined, bitmapped = table_masks(data_copy, table, filters)
+    assert np.array_equal(joined, bitmapped)
+
+def test_date_sorted_model_maps_row_order(data_copy):
+    build_index(data_copy)
+    evaluator = MeasureEvaluator.from_files(data_copy, ast_cache=None, cache_mb=0)
+    assert evaluator.star.bitmaps is not None
+    filters = {('dim_customer', 'Channel'): ['Online'], ('fact_returns', 'ReturnReason'): ['Defective']}
+    plain = StarModel(evaluator.star.tables, evaluator.star.model_relationships)
+    assert np.array_equal(evaluator.star.table_mask('fact_returns', filters),
+                          plain.table_mask('fact_returns', filters))
+
+def test_measures_match_with_and_without_bitmaps(data_copy):
+    build_index(data_copy)
+    with_bitmaps = MeasureEvaluator.from_files(data_copy, ast_cache=None, cache_mb=0)
+    without = MeasureEvaluator.from_files(data_copy, ast_cache=None, cache_mb=0)
+    without.star.bitmaps = None
+    names = ['number_of_orders', 'curr_year_sales', 'prev_year_returns']
+    for filters in FILTERS:
+        filters = {f'{t}.{c}': v for (t, c), v in filters.items()}
+        expected = without.evaluate(names, ['dim_date.Year'], filters)
+        assert with_bitmaps.evaluate(names, ['dim_date.Year'], filters).equals(expected)
+
+def test_changed_dimension_makes_index_stale(data_copy):
+    build_index(data_copy)
+    path = os.path.join(data_copy, 'dim_customer.csv')
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n')
+    assert BitmapIndex.from_directory(data_copy).stale == {'fact_orders', 'fact_sales', 'fact_returns'}
+
+def test_incremental_build_keeps_skipping_wide_attributes(tmp_path):
+    data_dir = tmp_path / 'data'
+    attributes = ['dim_customer.Channel', 'dim_customer.CustomerName', 'OrderStatus']
+    run_tool('generate_sample_data.py', data_dir, '--scale', '0.1', '--end-date', '2024-06-30')
+    build_index(str(data_dir), attributes=attributes)
+    run_tool('generate_sample_data.py', data_dir, '--append')
+    build_index(str(data_dir), attributes=attributes)
+    with open(data_dir / '_bitmaps' / 'manifest.json', encoding='utf-8') as f:
+        entry = json.load(f)['tables']['fact_orders']
+    assert entry['skipped'] == ['dim_customer[CustomerName]']
+    assert 'dim_customer[CustomerName]' not in entry['attributes']
+
+    full = tmp_path / 'full'
+    build_index(str(data_dir), str(full), attributes=attributes, full=True)
+    with open(full / 'manifest.json', encoding='utf-8') as f:
+        assert json.load(f)['tables']['fact_orders']['attributes'] == entry['attributes']
+    for filters in ({('dim_customer', 'CustomerName'): ['Customer 11']},
+                    {('dim_customer', 'Channel'): ['Online'], ('fact_orders', 'OrderStatus'): ['Completed']}):
+        joined, bitmapped = table_masks(str(data_dir), 'fact_orders', filters)
+        assert np.array_equal(joined, bitmapped)
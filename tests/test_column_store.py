@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import column_store
+from column_store import ColumnBuilder, Pattern, pack_bits, unpack_bits
+from conftest import run_tool
+
+@pytest.mark.parametrize('bits', range(1, 65))
+def test_pack_bits_round_trip(bits):
+    rng = np.random.default_rng(bits)
+    values = rng.integers(0, np.iinfo(np.uint64).max, size=130, dtype=np.uint64, endpoint=True) >> np.uint64(64 - bits)
+    values[:2] = (0, (1 << bits) - 1)
+    words = pack_bits(values, bits)
+    assert len(words) == 3 * bits
+    assert np.array_equal(unpack_bits(words, bits, len(values)).astype(np.uint64), values)
+
+def test_pattern_with_a_variable_last_field():
+    values = np.array(['ORD00000002-3', 'ORD00000001-12', 'ORD00000002-100', 'ORD00000001-2'], dtype=object)
+    pattern = Pattern.infer(values)
+    assert (pattern.literals, pattern.widths) == (['ORD', '-', ''], [8, None])
+    fields = pattern.fields(values)
+    assert [list(f) for f in fields] == [[2, 1, 2, 1], [3, 12, 100, 2]]
+    assert list(pattern.format(fields)) == list(values)
+    order = np.lexsort(pattern.sort_keys(fields)[::-1])
+    assert list(values[order]) == sorted(values)
+    assert pattern.fields(np.array(['ORD00000001-012'], dtype=object)) is None
+    assert pattern.fields(np.array(['ORD0000001-1'], dtype=object)) is None
+
+def test_pattern_with_fixed_fields():
+    values = np.array(['CUST003907', 'CUST000012'], dtype=object)
+    pattern = Pattern.infer(values)
+    assert (pattern.literals, pattern.widths) == (['CUST', ''], [6])
+    assert list(pattern.format(pattern.fields(values))) == list(values)
+    assert Pattern.infer(np.array(['CUST1', 'ITEM2'], dtype=object)) is None
+
+def build(*chunks):
+    builder = ColumnBuilder()
+    for chunk in chunks:
+        builder.add(chunk)
+    return builder.finish()
+
+def test_integers_become_floats_on_nan():
+    column = build(np.array([1, 2, 3]), np.array([4.0, np.nan]))
+    assert column.encoding == 'dictionary' and column.dtype == float
+    np.testing.assert_array_equal(column.values(), [1.0, 2.0, 3.0, 4.0, np.nan])
+
+def test_pattern_falls_back_to_a_dictionary():
+    keys = np.array([f'ORD{i:08d}' for i in range(1, 5)], dtype=object)
+    builder = ColumnBuilder()
+    builder.add(keys)
+    assert builder.encoding == 'pattern'
+    builder.add(np.array(['ORD00000005', 'RETURN-1', None], dtype=object))
+    column = builder.finish()
+    assert column.encoding == 'dictionary'
+    assert list(column.values()) == list(keys) + ['ORD00000005', 'RETURN-1', None]
+
+def test_floats_fall_back_to_decimal_then_raw(monkeypatch):
+    monkeypatch.setattr(column_store, 'MAX_FLOAT_DICTIONARY', 8)
+    amounts = np.arange(20) / 100
+    builder = ColumnBuilder()
+    builder.add(amounts)
+    assert builder.encoding == 'decimal' and builder.scale == 100
+    thirds = np.arange(20) / 3
+    builder.add(thirds)
+    column = builder.finish()
+    assert column.encoding == 'raw'
+    np.testing.assert_array_equal(column.values(), np.concatenate([amounts, thirds]))
+
+def test_encoded_query_matches_plain(sample_data):
+    args = ('--data', sample_data, '--table', 'fact_orders', '--measure', 'Orders=DISTINCTCOUNT(OrderID)',
+            '--measure', 'Lines=COUNT(OrderID)', '--measure', 'First=MIN(OrderID)',
+            '--measure', 'Quantity=SUM(Quantity)', '--group-by', 'dim_customer.CustomerType',
+            '--filter', 'fact_orders.OrderStatus=Completed')
+    plain = run_tool('query_engine.py', *args).stdout.splitlines()
+    encoded = run_tool('query_engine.py', *args, '--encoded').stdout.splitlines()
+    # Only the timing at the end of the last line differs
+    assert encoded[:-1] == plain[:-1]
+    assert encoded[-1].split(';')[0] == plain[-1].split(';')[0]
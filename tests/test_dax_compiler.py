@@ -0,0 +1,26 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import run_tool
+from dax_compiler import MeasureEvaluator
+
+@pytest.fixture(scope='module')
+def evaluator(sample_data):
+    return MeasureEvaluator.from_files(sample_data, ast_cache=None, cache_mb=0)
+
+def test_counts_are_integers(evaluator):
+    result = evaluator.evaluate_columns(['number_of_orders', 'Total Returns', 'prev_year_orders'], ['dim_date.Year'])
+    assert result['number_of_orders'].dtype == np.int64
+    assert result['Total Returns'].dtype == np.int64
+    # The first year has no previous year: BLANK, so the counts stay floats
+    prev = result['prev_year_orders']
+    assert prev.dtype.kind == 'f' and np.isnan(prev[0])
+    assert np.array_equal(prev[1:], result['number_of_orders'][:-1])
+
+def test_json_counts_have_no_fraction(sample_data):
+    output = run_tool('dax_compiler.py', '--data', sample_data, '--ast-cache', '', '--measure', 'number_of_orders',
+                      '--group-by', 'dim_date.Year', '--json').stdout
+    records = json.loads(output)
+    assert records and all(isinstance(record['number_of_orders'], int) for record in records)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from distinct_sketches import SketchRouter, build_sketches, standard_error, validate
+
+@pytest.fixture
+def router(data_copy):
+    build_sketches(data_copy)
+    return SketchRouter.from_directory(data_copy)
+
+def test_sketched_counts_are_within_the_error(router):
+    report = validate(router)
+    assert {row['measure'] for row in report} == {'number_of_orders', 'number_of_customers', 'number_of_returns'}
+    for row in report:
+        assert row['max_error'] <= 3 * row['standard_error'], row
+        assert row['within_2se'] >= 0.9, row
+
+@pytest.mark.parametrize('group_by, filters', [
+    (['dim_date.Year'], {'dim_customer.Channel': ['Online', 'Retail']}),
+    (['dim_geography.Region', 'fact_orders.OrderStatus'], {'dim_date.Quarter': [2]}),
+])
+def test_filtered_queries_use_the_sketches(router, group_by, filters):
+    measures = {'Orders': ('DISTINCTCOUNT', 'OrderID'), 'Customers': ('DISTINCTCOUNT', 'CustomerKey')}
+    approx, served = router.aggregate('fact_orders', measures, group_by, filters)
+    assert served.startswith('fact_orders__'), served
+    exact = router.star.aggregate('fact_orders', measures, group_by, filters)
+    keys = [column for column in exact.columns if column not in measures]
+    assert approx[keys].equals(exact[keys])
+    error = 3 * standard_error(router.rollups[served.split()[0]]['precision'])
+    for measure in measures:
+        assert approx[measure].dtype == np.int64
+        assert np.allclose(approx[measure], exact[measure], rtol=error), measure
+
+def test_other_queries_are_exact(router, data_copy):
+    measures = {'Customers': ('DISTINCTCOUNT', 'CustomerKey')}
+    _, served = router.aggregate('fact_orders', {'Lines': ('COUNT', 'OrderKey')}, ['dim_date.Year'])
+    assert 'exact: COUNT is not sketched' in served
+    result, served = router.aggregate('fact_orders', measures, ['dim_customer.CustomerType'])
+    assert 'exact: no sketch of fact_orders covers' in served
+    assert result.equals(router.star.aggregate('fact_orders', measures, ['dim_customer.CustomerType']))
+    with open(f'{data_copy}/fact_orders.csv', 'a', encoding='utf-8') as f:
+        f.write('\n')
+    _, served = SketchRouter.from_directory(data_copy).aggregate('fact_orders', measures, ['dim_date.Year'])
+    assert 'out of date' in served
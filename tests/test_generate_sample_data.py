@@ -0,0 +1,55 @@
+import filecmp
+import io
+import os
+
+import pandas as pd
+
+from conftest import run_tool
+from generate_sample_data import rollup_fact_sales
+
+def assert_same_files(expected_dir, actual_dir):
+    """Both directory trees hold the same files with the same bytes"""
+    def files(top):
+        return sorted(os.path.relpath(os.path.join(root, name), top)
+                      for root, _, names in os.walk(top) for name in names)
+    names = files(expected_dir)
+    assert files(actual_dir) == names
+    match, mismatch, errors = filecmp.cmpfiles(expected_dir, actual_dir, names, shallow=False)
+    assert (mismatch, errors) == ([], [])
+
+def test_sales_match_a_groupby_over_the_orders(sample_data):
+    orders = pd.read_csv(os.path.join(sample_data, 'fact_orders.csv'))
+    grouped = pd.read_csv(io.StringIO(rollup_fact_sales(orders).to_csv(index=False)))
+    pd.testing.assert_frame_equal(pd.read_csv(os.path.join(sample_data, 'fact_sales.csv')), grouped,
+                                  check_dtype=False)
+
+def test_chunk_rows_do_not_change_output(sample_data, tmp_path):
+    out_dir = tmp_path / 'chunked'
+    run_tool('generate_sample_data.py', out_dir, '--scale', '0.1', '--chunk-rows', '3000')
+    assert_same_files(sample_data, out_dir)
+
+def test_workers_do_not_change_output(sample_data, tmp_path):
+    out_dir = tmp_path / 'parallel'
+    run_tool('generate_sample_data.py', out_dir, '--scale', '0.1', '--chunk-rows', '3000', '--workers', '2')
+    assert_same_files(sample_data, out_dir)
+
+def test_workers_do_not_change_partitions(tmp_path):
+    for workers in ('1', '3'):
+        run_tool('generate_sample_data.py', tmp_path / workers, '--scale', '0.1', '--chunk-rows', '3000',
+                 '--partition-by-month', '--workers', workers)
+    assert_same_files(tmp_path / '1', tmp_path / '3')
+
+def test_append_matches_a_full_run(tmp_path):
+    full, daily = tmp_path / 'full', tmp_path / 'daily'
+    run_tool('generate_sample_data.py', full, '--scale', '0.1', '--end-date', '2024-06-30')
+    run_tool('generate_sample_data.py', daily, '--scale', '0.1', '--end-date', '2024-03-31')
+    run_tool('generate_sample_data.py', daily, '--append')
+    run_tool('generate_sample_data.py', daily, '--append', '--end-date', '2024-06-30')
+    for name in ('dim_date', 'dim_customer', 'dim_product', 'dim_geography', 'fact_orders', 'fact_sales'):
+        assert filecmp.cmp(full / f'{name}.csv', daily / f'{name}.csv', shallow=False), name
+    # Returns of earlier orders are added as their days arrive, so only their keys differ
+    columns = [c for c in pd.read_csv(full / 'fact_returns.csv', nrows=0).columns if c not in ('ReturnKey', 'ReturnID')]
+    expected, appended = (pd.read_csv(d / 'fact_returns.csv')[columns].sort_values(columns).reset_index(drop=True)
+                          for d in (full, daily))
+    pd.testing.assert_frame_equal(appended, expected)
+    assert appended['ReturnAmount'].sum() > 0
@@ -0,0 +1,81 @@
+import asyncio
+import concurrent.futures
+import json
+
+import pytest
+
+from measure_service import MAX_BODY_BYTES, MeasureService, QueryBatcher, ServiceStats
+
+class CountingPool(concurrent.futures.Executor):
+    """Answers each worker call at once with one group whose measure values are the measure names"""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        names, group_by, filters = args
+        self.calls.append((fn.__name__, names, group_by, filters))
+        future = concurrent.futures.Future()
+        future.set_result({'keys': {'dim_date.Year': [2024]}, 'values': {name: [name] for name in names},
+                           'errors': {}, 'seconds': 0.0, 'cache': None, 'pid': 0})
+        return future
+
+async def gather_queries(pool, *queries):
+    """Send the queries to one QueryBatcher at the same time; returns its stats and their results"""
+    batcher = QueryBatcher(pool, ServiceStats(), batch_seconds=0.05)
+    results = await asyncio.gather(*(batcher.query(*query) for query in queries))
+    return batcher.stats, results
+
+async def exchange(request):
+    """Send raw request bytes to a MeasureService; returns (status, payload) of its response"""
+    service = MeasureService(None, ['Total Sales'])
+    server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+def request(content_length, path='/measures'):
+    return (f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+            f'Content-Length: {content_length}\r\n\r\n').encode('latin-1')
+
+@pytest.mark.parametrize('content_length', ['abc', '-5', '1.5', '5_0', '²'])
+def test_malformed_content_length_is_a_bad_request(content_length):
+    status, payload = asyncio.run(exchange(request(content_length)))
+    assert (status, payload) == (400, {'error': f"bad Content-Length {content_length!r}"})
+
+def test_request_errors():
+    assert asyncio.run(exchange(b'GET /measures\r\n\r\n')) == (400, {'error': 'bad request line'})
+    assert asyncio.run(exchange(request(MAX_BODY_BYTES + 1))) == (413, {'error': 'body too large'})
+
+@pytest.mark.parametrize('content_length', ['0', ''])
+def test_request_without_body(content_length):
+    assert asyncio.run(exchange(request(content_length))) == (200, {'measures': ['Total Sales']})
+
+def test_identical_queries_are_evaluated_once():
+    pool = CountingPool()
+    query = (('Total Sales',), ('dim_date.Year',), (('dim_customer.Channel', ('Online',)),))
+    stats, results = asyncio.run(gather_queries(pool, query, query))
+    assert pool.calls == [('_evaluate_in_worker', ['Total Sales'], ['dim_date.Year'],
+                           {'dim_customer.Channel': ['Online']})]
+    assert results[0] == results[1] == {'columns': ['dim_date.Year', 'Total Sales'], 'rows': [[2024, 'Total Sales']]}
+    assert (stats.coalesced, stats.batches, stats.batched_queries) == (1, 1, 2)
+
+def test_measures_of_one_context_share_a_worker_call():
+    pool = CountingPool()
+    filters = (('dim_customer.Channel', ('Online',)),)
+    stats, results = asyncio.run(gather_queries(pool, (('Total Sales',), ('dim_date.Year',), filters),
+                                                (('Total Cost',), ('dim_date.Year',), filters)))
+    assert [call[1] for call in pool.calls] == [['Total Sales', 'Total Cost']]
+    assert [result['rows'] for result in results] == [[[2024, 'Total Sales']], [[2024, 'Total Cost']]]
+    assert (stats.coalesced, stats.batches, stats.batched_measures) == (0, 1, 2)
+
+def test_other_filters_are_evaluated_separately():
+    pool = CountingPool()
+    stats, _ = asyncio.run(gather_queries(pool, (('Total Sales',), (), (('dim_customer.Channel', ('Online',)),)),
+                                          (('Total Sales',), (), (('dim_customer.Channel', ('Store',)),))))
+    assert sorted(call[3]['dim_customer.Channel'] for call in pool.calls) == [['Online'], ['Store']]
+    assert stats.batches == 2
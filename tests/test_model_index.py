@@ -0,0 +1,35 @@
+import json
+import os
+import shutil
+
+import model_index
+from model_index import cache_path, load_model_index
+from query_engine import DEFAULT_MODEL_PATH
+
+def test_cache_is_json_per_model(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    other = shutil.copy(DEFAULT_MODEL_PATH, str(tmp_path / 'Other.bim'))
+    fresh = load_model_index(DEFAULT_MODEL_PATH, cache_dir)
+    load_model_index(other, cache_dir)
+    assert cache_path(DEFAULT_MODEL_PATH, cache_dir) != cache_path(other, cache_dir)
+    for path in (DEFAULT_MODEL_PATH, other):
+        with open(cache_path(path, cache_dir), encoding='utf-8') as f:
+            assert json.load(f)['source'] == os.path.abspath(path)
+    cached = load_model_index(DEFAULT_MODEL_PATH, cache_dir)
+    assert cached.dependencies == fresh.dependencies
+    assert cached.measures == fresh.measures
+    assert not cached.problems
+
+def test_cache_from_other_code_is_rebuilt(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    fresh = load_model_index(DEFAULT_MODEL_PATH, cache_dir)
+    path = cache_path(DEFAULT_MODEL_PATH, cache_dir)
+    with open(path, encoding='utf-8') as f:
+        cached = json.load(f)
+    cached['version'] = f'{model_index.INDEX_VERSION}.0000000000000000'
+    cached['index']['dependencies'] = {}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cached, f)
+    assert load_model_index(DEFAULT_MODEL_PATH, cache_dir).dependencies == fresh.dependencies
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['version'] == model_index.code_version()
@@ -0,0 +1,43 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+import pbix_batch
+
+def write_pbix(path, layout):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('Report/Layout', json.dumps(layout).encode('utf-16-le'))
+
+def test_output_names_keep_relative_paths(tmp_path):
+    files = [str(tmp_path / 'v1' / 'report.pbix'), str(tmp_path / 'v2' / 'report.pbix')]
+    assert pbix_batch.output_names(files) == {files[0]: os.path.join('v1', 'report'),
+                                              files[1]: os.path.join('v2', 'report')}
+    assert pbix_batch.output_names([files[0]]) == {files[0]: 'report'}
+
+def test_output_names_reject_shared_directory(tmp_path):
+    with pytest.raises(ValueError, match='both be written'):
+        pbix_batch.output_names([str(tmp_path / 'report.pbix'), str(tmp_path / 'REPORT.pbix')])
+
+def test_same_name_in_two_directories(tmp_path):
+    for version in ('v1', 'v2'):
+        write_pbix(str(tmp_path / 'in' / version / 'report.pbix'), {'version': version})
+    files = pbix_batch.find_pbix_files([str(tmp_path / 'in')])
+    results = pbix_batch.run_batch(files, str(tmp_path / 'out'), str(tmp_path / 'cache'), workers=1)
+    assert not any(r['error'] for r in results)
+    for version in ('v1', 'v2'):
+        with open(tmp_path / 'out' / version / 'report' / 'Layout.json', encoding='utf-8') as f:
+            assert json.load(f) == {'version': version}
+
+def test_tables_of_an_earlier_model_are_pruned(tmp_path):
+    write_pbix(str(tmp_path / 'in' / 'report.pbix'), {})
+    out_dir = tmp_path / 'out' / 'report'
+    out_dir.mkdir(parents=True)
+    (out_dir / 'manifest.json').write_text(json.dumps({'format': 'csv', 'tables': {'old_table': 'x'}}))
+    (out_dir / 'old_table.csv').write_text('a\n1\n')
+    (out_dir / 'notes.csv').write_text('kept\n')
+    files = pbix_batch.find_pbix_files([str(tmp_path / 'in')])
+    pbix_batch.run_batch(files, str(tmp_path / 'out'), str(tmp_path / 'cache'), workers=1)
+    assert sorted(os.listdir(out_dir)) == ['Layout.json', 'manifest.json', 'notes.csv']
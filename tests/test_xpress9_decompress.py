@@ -0,0 +1,112 @@
+import os
+import sys
+import types
+import zipfile
+
+import pytest
+
+import xpress9_decompress as xp
+
+class FakeXpress9:
+    """Stands in for the xpress9 decoder: a block is its header plus the data XORed with
+    the number of blocks the decoder has seen, so blocks only decode in session order"""
+
+    def __init__(self):
+        self.blocks = 0
+
+    def decompress(self, payload, uncompressed_size):
+        key = self.blocks & 0xFF
+        self.blocks += 1
+        return bytes(b ^ key for b in payload[xp.BLOCK_HEADER.size:])
+
+def encode_block(data, index):
+    header = xp.BLOCK_HEADER.pack(xp.BLOCK_MAGIC, index)
+    return xp.BLOCK_FRAME.pack(len(data), len(header) + len(data)) + header + bytes(b ^ (index & 0xFF) for b in data)
+
+def datamodel(sessions, signature=xp.SIGNATURE):
+    """A DataModel of the given sessions (lists of uncompressed blocks); returns (member, decoded bytes)"""
+    member = signature.encode('utf-16-le').ljust(xp.HEADER_SIZE, b'\x00')
+    for blocks in sessions:
+        member += b''.join(encode_block(data, index) for index, data in enumerate(blocks))
+    return member, b''.join(b''.join(blocks) for blocks in sessions)
+
+def write_pbix(path, member, stored=True):
+    with zipfile.ZipFile(path, 'w') as pbix:
+        pbix.writestr('Version', '1.28'.encode('utf-16-le'))
+        pbix.writestr('DataModel', member, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+    return str(path)
+
+@pytest.fixture
+def fake_codec(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'xpress9', types.SimpleNamespace(Xpress9=FakeXpress9))
+
+SESSIONS = [[os.urandom(size) for size in sizes] for sizes in ([5000, 3000, 10], [7000], [1, 2, 3, 4], [65536, 100])]
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_parallel_sessions_match_serial_bytes(tmp_path, fake_codec, workers):
+    member, expected = datamodel(SESSIONS)
+    pbix = write_pbix(tmp_path / 'report.pbix', member)
+    dest = tmp_path / f'model{workers}.abf'
+    stats = xp.decompress_datamodel(pbix, str(dest), workers=workers)
+    assert dest.read_bytes() == expected
+    assert (stats['blocks'], stats['sessions'], stats['workers']) == (10, 4, workers)
+
+def test_deflated_member_is_streamed(tmp_path, fake_codec):
+    member, expected = datamodel(SESSIONS)
+    pbix = write_pbix(tmp_path / 'report.pbix', member, stored=False)
+    stats = xp.decompress_datamodel(pbix, str(tmp_path / 'model.abf'), workers=2)
+    assert (tmp_path / 'model.abf').read_bytes() == expected
+    assert stats['sessions'] == 4
+
+def test_describe_reads_framing(tmp_path):
+    member, expected = datamodel(SESSIONS)
+    info = xp.describe_datamodel(write_pbix(tmp_path / 'report.pbix', member))
+    assert (info['signature'], info['blocks'], info['sessions']) == (xp.SIGNATURE, 10, 4)
+    assert (info['decompressed_bytes'], info['largest_block']) == (len(expected), 65536)
+
+def test_bad_framing_is_rejected():
+    member, _ = datamodel(SESSIONS)
+    first_block = xp.HEADER_SIZE + xp.BLOCK_FRAME.size
+    bad_magic = member[:first_block] + b'\x00' * 4 + member[first_block + 4:]
+    with pytest.raises(ValueError, match='bad XPress9 block magic'):
+        xp.scan_blocks(bad_magic)
+    with pytest.raises(ValueError, match='runs past the end'):
+        xp.scan_blocks(member[:-1])
+    out_of_order = datamodel([[b'a']])[0] + encode_block(b'b', 2)
+    with pytest.raises(ValueError, match='block index 2 follows 0'):
+        xp.split_sessions(xp.scan_blocks(out_of_order))
+    with pytest.raises(ValueError, match='does not start a session'):
+        xp.split_sessions(xp.scan_blocks(datamodel([])[0] + encode_block(b'b', 1)))
+
+def test_multithreaded_variant_is_refused():
+    member, _ = datamodel(SESSIONS, 'This backup was created using multithreaded XPress9 compression.')
+    with pytest.raises(ValueError, match='unsupported XPress9 variant'):
+        xp.scan_blocks(member)
+
+def real_datamodel(sessions):
+    """A DataModel whose blocks come from the xpress9 encoder, one encoder per session"""
+    from xpress9 import Xpress9
+    member = xp.SIGNATURE.encode('utf-16-le').ljust(xp.HEADER_SIZE, b'\x00')
+    for blocks in sessions:
+        encoder = Xpress9()
+        for data in blocks:
+            block = encoder.compress(data, len(data))
+            member += xp.BLOCK_FRAME.pack(len(data), len(block)) + block
+    return member, b''.join(b''.join(blocks) for blocks in sessions)
+
+def test_real_xpress9_blocks(tmp_path):
+    pytest.importorskip('xpress9')
+    sessions = [[os.urandom(64) * size for size in sizes] for sizes in ([900, 300, 20], [1000], [5, 700])]
+    member, expected = real_datamodel(sessions)
+    # The encoder numbers the blocks of each session from 0, at byte 24 after its magic
+    blocks = xp.scan_blocks(member)
+    assert [block[4] for block in blocks] == [0, 1, 2, 0, 0, 1]
+    assert [len(session) for session in xp.split_sessions(blocks)] == [3, 1, 2]
+    # A block after the first of its session only decodes after the ones before it
+    src_offset, compressed_size, _, uncompressed_size, _ = blocks[1]
+    with pytest.raises(ValueError):
+        xp.decode_block(xp.load_codec(), member[src_offset:src_offset + compressed_size], uncompressed_size)
+    dest = tmp_path / 'model.abf'
+    stats = xp.decompress_datamodel(write_pbix(tmp_path / 'report.pbix', member), str(dest), workers=2)
+    assert dest.read_bytes() == expected
+    assert (stats['blocks'], stats['sessions']) == (6, 3)
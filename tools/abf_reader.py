@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+"""
+Read tables out of a decompressed PBIX DataModel, an Analysis Services backup (ABF).
+
+xpress9_decompress.py turns the DataModel into an ABF file. AbfReader maps that
+file and parses only its directory up front:
+
+    72 bytes    UTF-16-LE signature "STREAM_STORAGE_SIGNATURE_)!@#$%^&*("
+    page 0      BackupLogHeader XML (UTF-16) with the offset and size of the
+                VirtualDirectory
+    ...         VirtualDirectory XML: every stored file's offset and size; the
+                last entry is the BackupLog, whose XML maps logical file paths
+                (e.g. ...\\fact_orders.tbl\\...OrderID (57).0.idf) to those entries
+
+Table and column metadata come from the metadata.sqlitedb file inside the
+backup. Each column partition is stored as:
+
+    .idf        segments of RLE runs (uint32 data id, uint32 repeat count) plus
+                a bit-packed sub-segment of uint64 words; a run whose
+                data id + bit-packed offset == 0xFFFFFFFF takes its values from
+                the bit-packed words instead
+    .idfmeta    per segment <1:CP / <1:CS / <1:SS blocks with the row count,
+                minimum/maximum data id and RLE run count
+    .dictionary the distinct values (int64, double, or UTF-16 string pages)
+                for hash-encoded columns; value-encoded columns have none and
+                decode as (data id + BaseId) / Magnitude
+
+Files are only read when a column is requested, so exporting one table
+touches only its segments. RLE runs, bit-packed words and numeric
+dictionaries are parsed in place from the mapping. column() and table()
+return whole decoded arrays; an export decodes and writes EXPORT_ROWS rows
+at a time, so it holds one chunk of every column (plus the dictionaries)
+in memory whatever the table size. The layouts follow the community
+reverse-engineering of the format; Huffman-compressed string dictionary
+pages are not supported and raise ValueError, as does any block whose tags
+do not match.
+
+Usage: python abf_reader.py <abf-file> [--table NAME [--column NAME] [--head N]]
+                            [--export DIR [--format csv|parquet] [--workers N]]
+"""
+
+import argparse
+import itertools
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SIGNATURE = 'STREAM_STORAGE_SIGNATURE_)!@#$%^&*('
+SIGNATURE_BYTES = len(SIGNATURE) * 2
+PAGE_SIZE = 0x1000
+METADATA_FILE = 'metadata.sqlitedb'
+
+# Tabular object model DataType codes
+STRING, INT64, DOUBLE, DATETIME, DECIMAL, BOOLEAN = 2, 6, 8, 9, 10, 11
+# Column.Type of the hidden RowNumber column every table has
+ROW_NUMBER_COLUMN = 3
+# Decimal (currency) values are stored as integers with four implied places
+DECIMAL_SCALE = 10000
+OLE_EPOCH = np.datetime64('1899-12-30', 'ms')
+MS_PER_DAY = 86400000
+# Rows an export decodes and writes at a time
+EXPORT_ROWS = 1 << 20
+# One format for every chunk: pandas would drop the time from a chunk of midnights
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Dictionary types
+DICTIONARY_LONG, DICTIONARY_REAL, DICTIONARY_STRING = 0, 1, 2
+BIT_PACKED_MARKER = 0xFFFFFFFF
+STRING_STORE_BEGIN = bytes([0xDD, 0xCC, 0xBB, 0xAA] * 2)
+STRING_STORE_END = bytes([0xCD, 0xAB] * 4)
+
+COLUMNS_SQL = """
+SELECT t.Name, COALESCE(c.ExplicitName, c.InferredName), c.ExplicitDataType,
+       sfi.FileName, sfd.FileName, ds.BaseId, ds.Magnitude, ds.IsNullable,
+       cs.Statistics_DistinctStates
+FROM [Column] c
+JOIN [Table] t ON c.TableID = t.ID
+JOIN ColumnStorage cs ON c.ColumnStorageID = cs.ID
+JOIN ColumnPartitionStorage cps ON cps.ColumnStorageID = cs.ID
+JOIN StorageFile sfi ON sfi.ID = cps.StorageFileID
+LEFT JOIN DictionaryStorage ds ON ds.ID = cs.DictionaryStorageID
+LEFT JOIN StorageFile sfd ON sfd.ID = ds.StorageFileID
+WHERE c.Type != ?
+ORDER BY t.ID, c.ID, cps.ID
+"""
+
+# ---------------------------------------------------------------------------
+# Container
+# ---------------------------------------------------------------------------
+
+def _parse_xml(data, root):
+    """Parse the <root> element out of a UTF-16 or UTF-8 XML buffer, without namespaces"""
+    data = bytes(data)
+    if data[:2] == b'\xff\xfe' or data[1:2] == b'\x00':
+        text = data.decode('utf-16-le', errors='ignore')
+    else:
+        text = data.decode('utf-8-sig', errors='ignore')
+    start = text.find(f'<{root}')
+    end = text.find(f'</{root}>')
+    if start < 0 or end < 0:
+        raise ValueError(f"no <{root}> element where the ABF directory points")
+    element = ET.fromstring(text[start:end + len(root) + 3])
+    for node in element.iter():
+        node.tag = node.tag.rsplit('}', 1)[-1]
+    return element
+
+def _fields(element):
+    return {child.tag: (child.text or '') for child in element}
+
+def _basename(path):
+    return path.replace('\\', '/').rsplit('/', 1)[-1]
+
+class AbfReader:
+    """Lazy access to the files, tables and columns of an ABF backup.
+
+    Use as a context manager; views returned by file() are valid until close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+        self._view = memoryview(self._map)
+        try:
+            self.header = self._read_header()
+            self.files = self._read_directory()
+        except Exception:
+            self.close()
+            raise
+        self._by_name = {_basename(name): name for name in self.files}
+        self._columns = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            try:
+                self._map.close()
+            except BufferError:
+                # Decoded arrays still view the file; the mapping goes when they do
+                pass
+            self._file.close()
+
+    def _read_header(self):
+        signature = bytes(self._view[:SIGNATURE_BYTES]).decode('utf-16-le', errors='replace')
+        if signature != SIGNATURE:
+            raise ValueError(f"{self.path} is not an Analysis Services backup (ABF)")
+        return _fields(_parse_xml(self._view[SIGNATURE_BYTES:PAGE_SIZE], 'BackupLogHeader'))
+
+    def _read_directory(self):
+        """Map each logical file path in the BackupLog to its (offset, size) in the backup"""
+        if self.header.get('ApplyCompression', 'false').lower() == 'true':
+            raise ValueError(f"{self.path}: backups with compressed inner files are not supported")
+        offset, size = int(self.header['m_cbOffsetHeader']), int(self.header['DataSize'])
+        directory = _parse_xml(self._view[offset:offset + size], 'VirtualDirectory')
+        stored = {}
+        for entry in directory.iter('BackupFile'):
+            fields = _fields(entry)
+            stored[fields['Path']] = (int(fields['m_cbOffsetHeader']), int(fields['Size']))
+        if not stored:
+            raise ValueError(f"{self.path}: the VirtualDirectory lists no files")
+        log_offset, log_size = list(stored.values())[-1]
+        log = _parse_xml(self._view[log_offset:log_offset + log_size], 'BackupLog')
+        files = {}
+        for entry in log.iter('BackupFile'):
+            fields = _fields(entry)
+            if fields.get('StoragePath') in stored:
+                files[fields['Path']] = stored[fields['StoragePath']]
+        return files
+
+    def file(self, name):
+        """A zero-copy view of a stored file, by logical path or file name"""
+        path = name if name in self.files else self._by_name.get(_basename(name))
+        if path is None:
+            raise KeyError(f"{name!r} is not in {self.path}")
+        offset, size = self.files[path]
+        return self._view[offset:offset + size]
+
+    # Metadata ----------------------------------------------------------------
+
+    def metadata(self):
+        """An in-memory SQLite connection to the backup's metadata.sqlitedb"""
+        name = next((path for path in self.files if path.endswith(METADATA_FILE)), None)
+        if name is None:
+            raise ValueError(f"{self.path} has no {METADATA_FILE} (pre-2017 models are not supported)")
+        data = bytes(self.file(name))
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.deserialize(data)
+        except AttributeError:
+            # Python < 3.11: SQLite can only open it from disk
+            conn.close()
+            fd, temp_path = tempfile.mkstemp(suffix='.sqlitedb')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            conn = sqlite3.connect(temp_path)
+            if os.name != 'nt':
+                # The connection keeps the open file; it goes when the connection closes
+                os.unlink(temp_path)
+        return conn
+
+    def columns(self):
+        """{table: {column: info}} with each column's data type, IDF files and encoding"""
+        if self._columns is None:
+            conn = self.metadata()
+            try:
+                rows = conn.execute(COLUMNS_SQL, (ROW_NUMBER_COLUMN,)).fetchall()
+            finally:
+                conn.close()
+            tables = {}
+            for table, column, data_type, idf, dictionary, base_id, magnitude, nullable, distinct in rows:
+                info = tables.setdefault(table, {}).setdefault(column, {
+                    'table': table, 'column': column, 'data_type': data_type, 'idf': [],
+                    'dictionary': dictionary, 'base_id': base_id or 0, 'magnitude': magnitude or 1,
+                    'nullable': bool(nullable), 'distinct': distinct,
+                })
+                info['idf'].append(idf)
+            self._columns = tables
+        return self._columns
+
+    def tables(self):
+        return list(self.columns())
+
+    def column_info(self, table, column):
+        try:
+            return self.columns()[table][column]
+        except KeyError:
+            raise KeyError(f"no column {table}[{column}] in {self.path}") from None
+
+    # Decoding ----------------------------------------------------------------
+
+    def data_ids(self, table, column):
+        """The column's data ids for every row, across partitions and segments"""
+        info = self.column_info(table, column)
+        parts = [decode_idf(self.file(idf), read_idfmeta(self.file(idf + 'meta'))) for idf in info['idf']]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def column_segments(self, table, column):
+        """Decode one column a segment at a time; every array it yields has the dtype column() returns"""
+        info = self.column_info(table, column)
+        files = [(self.file(idf), read_idfmeta(self.file(idf + 'meta'))) for idf in info['idf']]
+        parts = itertools.chain.from_iterable(iter_idf_segments(*f) for f in files)
+        # An empty column still yields one (empty) array
+        first = next(parts, np.empty(0, dtype=np.int64))
+        parts = itertools.chain([first], parts)
+        if info['dictionary']:
+            values, first_id = read_dictionary(self.file(info['dictionary']))
+            # Blanks anywhere make the whole column nullable, not just the segments holding them
+            blanks = any(segment['min_data_id'] < first_id or segment['max_data_id'] >= first_id + len(values)
+                         for _, segments in files for segment in segments)
+            for ids in parts:
+                yield convert(lookup(values, first_id, ids, blanks), info['data_type'], blanks)
+            return
+        for ids in parts:
+            ids = ids + int(info['base_id'])
+            yield convert(ids / info['magnitude'] if info['magnitude'] not in (0, 1) else ids, info['data_type'])
+
+    def column(self, table, column):
+        """Decode one column to a NumPy array, touching only its own files"""
+        parts = list(self.column_segments(table, column))
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def table(self, table):
+        """Decode every column of a table into a DataFrame"""
+        return pd.DataFrame({column: self.column(table, column) for column in self.columns()[table]})
+
+    def table_chunks(self, table, rows=EXPORT_ROWS):
+        """Decode a table `rows` rows at a time; yields a DataFrame per chunk"""
+        columns = list(self.columns()[table])
+        streams = [_rebatch(self.column_segments(table, column), rows) for column in columns]
+        for parts in itertools.zip_longest(*streams):
+            if any(part is None for part in parts) or len({len(part) for part in parts}) > 1:
+                raise ValueError(f"the columns of {table} hold different numbers of rows")
+            yield pd.DataFrame(dict(zip(columns, parts)))
+
+    def row_count(self, table):
+        """Rows of a table, from the IDFMETA of its first column (no data is decoded)"""
+        info = next(iter(self.columns()[table].values()))
+        return sum(segment['rows'] for idf in info['idf']
+                   for segment in read_idfmeta(self.file(idf + 'meta')))
+
+# ---------------------------------------------------------------------------
+# Column segments
+# ---------------------------------------------------------------------------
+
+def _expect(buffer, offset, tag):
+    if bytes(buffer[offset:offset + len(tag)]) != tag:
+        raise ValueError(f"expected {tag!r} at byte {offset:,} of an IDFMETA file")
+    return offset + len(tag)
+
+CP_OPEN, CP_CLOSE = b'<1:CP\x00', b'CP:1>\x00'
+CS_OPEN, CS_CLOSE = b'<1:CS\x00', b'CS:1>\x00'
+SS_OPEN, SS_CLOSE = b'<1:SS\x00', b'SS:1>\x00'
+# CP: version; CS: records, one, a_b_a_5_a, iterator, bookmark bits, storage
+# allocated/used, needs resizing, compression info; SS: distinct states,
+# min/max/original min data id, RLE sort order, rows, has nulls, RLE runs,
+# other RLE runs
+CP_FIELDS = struct.Struct('<Q')
+CS_FIELDS = struct.Struct('<QQIIQQQBI')
+SS_FIELDS = struct.Struct('<QIIIqQBQQ')
+
+def read_idfmeta(buffer):
+    """Segment statistics from an IDFMETA file: one dict per segment"""
+    segments = []
+    offset = 0
+    while offset < len(buffer):
+        offset = _expect(buffer, offset, CP_OPEN) + CP_FIELDS.size
+        offset = _expect(buffer, offset, CS_OPEN)
+        cs = CS_FIELDS.unpack_from(buffer, offset)
+        offset = _expect(buffer, offset + CS_FIELDS.size, SS_OPEN)
+        ss = SS_FIELDS.unpack_from(buffer, offset)
+        offset = _expect(buffer, offset + SS_FIELDS.size, SS_CLOSE)
+        has_bit_packed = buffer[offset]
+        offset = _expect(buffer, offset + 1, CS_CLOSE)
+        offset = _expect(buffer, offset, CP_CLOSE)
+        segments.append({
+            'records': cs[0], 'compression_info': cs[8], 'distinct': ss[0],
+            'min_data_id': ss[1], 'max_data_id': ss[2], 'rows': ss[5],
+            'has_nulls': bool(ss[6]), 'rle_runs': ss[7], 'bit_packed': bool(has_bit_packed),
+        })
+    return segments
+
+def unpack_words(words, bit_width, count):
+    """The first count values packed low-bits-first, 64 // bit_width per uint64 word"""
+    per_word = 64 // bit_width
+    shifts = np.arange(per_word, dtype=np.uint64) * np.uint64(bit_width)
+    mask = np.uint64((1 << bit_width) - 1)
+    values = (words[:, None] >> shifts[None, :]) & mask
+    return values.reshape(-1)[:count].astype(np.int64)
+
+def _bit_width(segment, n_words, count):
+    """Bits per packed value: enough for the segment's data id range, checked against the word count"""
+    bit_width = max(int(segment['max_data_id'] - segment['min_data_id']).bit_length(), 1)
+    if count and n_words != -(-count // (64 // bit_width)):
+        raise ValueError(f"{count:,} bit-packed values do not fit {n_words:,} words at {bit_width} bits")
+    return bit_width
+
+def decode_idf(buffer, segments):
+    """Expand an IDF file's RLE/bit-packed hybrid segments into one int64 array of data ids"""
+    parts = list(iter_idf_segments(buffer, segments))
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+def iter_idf_segments(buffer, segments):
+    """The data ids of an IDF file, one int64 array per segment"""
+    offset = 0
+    for segment in segments:
+        n_runs, = struct.unpack_from('<Q', buffer, offset)
+        runs = np.frombuffer(buffer, dtype='<u4', count=2 * n_runs, offset=offset + 8).reshape(-1, 2)
+        offset += 8 + 8 * n_runs
+        n_words, = struct.unpack_from('<Q', buffer, offset)
+        words = np.frombuffer(buffer, dtype='<u8', count=n_words, offset=offset + 8)
+        offset += 8 + 8 * n_words
+
+        if n_runs == 0:
+            # Entirely bit-packed
+            count = segment['rows']
+            bit_width = _bit_width(segment, n_words, count)
+            yield unpack_words(words, bit_width, count) + segment['min_data_id']
+            continue
+        values, repeats = runs[:, 0].astype(np.int64), runs[:, 1].astype(np.int64)
+        # A bit-packed run carries 0xFFFFFFFF minus the number of packed values
+        # before it; only ids that close to the marker can be one
+        is_packed = np.zeros(len(values), dtype=bool)
+        packed_count = 0
+        for i in np.flatnonzero(values > BIT_PACKED_MARKER - segment['rows'] - 1):
+            if values[i] + packed_count == BIT_PACKED_MARKER:
+                is_packed[i] = True
+                packed_count += int(repeats[i])
+        ids = np.repeat(values, repeats)
+        if packed_count:
+            bit_width = _bit_width(segment, n_words, packed_count)
+            packed = unpack_words(words, bit_width, packed_count) + segment['min_data_id']
+            ids[np.repeat(is_packed, repeats)] = packed
+        if len(ids) != segment['rows']:
+            raise ValueError(f"IDF segment decoded to {len(ids):,} rows, IDFMETA says {segment['rows']:,}")
+        yield ids
+    if offset != len(buffer):
+        raise ValueError(f"IDF file has {len(buffer) - offset:,} bytes after its last segment")
+
+def _rebatch(parts, rows):
+    """Regroup a stream of arrays into arrays of `rows` rows; the last one may be shorter"""
+    pending, held = [], 0
+    for part in parts:
+        while len(part):
+            take = min(rows - held, len(part))
+            pending.append(part[:take])
+            held += take
+            part = part[take:]
+            if held == rows:
+                yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+                pending, held = [], 0
+    if pending:
+        yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+# ---------------------------------------------------------------------------
+# Dictionaries and values
+# ---------------------------------------------------------------------------
+
+def read_dictionary(buffer):
+    """Distinct values of a hash-encoded column and the data id of the first one"""
+    dictionary_type, = struct.unpack_from('<i', buffer, 0)
+    # Type, then six int32 of hash table information
+    offset = 4 + 24
+    if dictionary_type in (DICTIONARY_LONG, DICTIONARY_REAL):
+        count, size = struct.unpack_from('<QI', buffer, offset)
+        kinds = {(DICTIONARY_LONG, 8): '<i8', (DICTIONARY_LONG, 4): '<i4',
+                 (DICTIONARY_REAL, 8): '<f8', (DICTIONARY_REAL, 4): '<f4'}
+        if (dictionary_type, size) not in kinds:
+            raise ValueError(f"unexpected {size}-byte elements in a numeric dictionary")
+        return np.frombuffer(buffer, dtype=kinds[dictionary_type, size], count=count, offset=offset + 12), 0
+    if dictionary_type != DICTIONARY_STRING:
+        raise ValueError(f"unknown dictionary type {dictionary_type}")
+
+    _, compressed, _, n_pages = struct.unpack_from('<qBqq', buffer, offset)
+    offset += struct.calcsize('<qBqq')
+    strings = []
+    first_id = None
+    for _ in range(n_pages):
+        _, _, start_index, page_strings, page_compressed = struct.unpack_from('<QBQQB', buffer, offset)
+        offset += struct.calcsize('<QBQQB')
+        if bytes(buffer[offset:offset + 8]) != STRING_STORE_BEGIN:
+            raise ValueError(f"missing string store mark at byte {offset:,} of a dictionary")
+        offset += 8
+        if page_compressed:
+            raise ValueError("Huffman-compressed string dictionary pages are not supported")
+        _, used_chars, allocation = struct.unpack_from('<QQQ', buffer, offset)
+        offset += 24
+        text = bytes(buffer[offset:offset + 2 * used_chars]).decode('utf-16-le')
+        offset += allocation
+        if bytes(buffer[offset:offset + 8]) != STRING_STORE_END:
+            raise ValueError(f"missing string store end mark at byte {offset:,} of a dictionary")
+        offset += 8
+        if first_id is None:
+            first_id = start_index
+        elif start_index != first_id + len(strings):
+            raise ValueError("string dictionary pages are not contiguous")
+        strings.extend(text.split('\x00')[:page_strings])
+    return np.array(strings, dtype=object), first_id or 0
+
+def lookup(values, first_id, ids, blanks=False):
+    """Map data ids to dictionary values; ids outside the dictionary are blanks.
+
+    With blanks, the result has a nullable dtype even if these ids are all valid.
+    """
+    index = ids - first_id
+    valid = (index >= 0) & (index < len(values))
+    if valid.all() and not blanks:
+        return values[index]
+    if values.dtype == object:
+        result = np.full(len(ids), None, dtype=object)
+    else:
+        result = np.full(len(ids), np.nan)
+    result[valid] = values[index[valid]]
+    return result
+
+def convert(values, data_type, blanks=None):
+    """Turn stored values into the column's logical type; blanks None looks for NaN in values"""
+    if data_type == DATETIME and values.dtype != object:
+        # OLE Automation dates: days since 1899-12-30
+        days = np.asarray(values, dtype=np.float64)
+        return OLE_EPOCH + np.round(days * MS_PER_DAY).astype('timedelta64[ms]')
+    if data_type == DECIMAL and values.dtype != object:
+        return np.asarray(values, dtype=np.float64) / DECIMAL_SCALE
+    if data_type == BOOLEAN and values.dtype != object:
+        if blanks is None:
+            blanks = np.isnan(np.sum(values, dtype=np.float64))
+        if not blanks:
+            return np.asarray(values).astype(bool)
+    return values
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+EXTENSIONS = {'csv': 'csv', 'parquet': 'parquet'}
+
+def write_table(reader, table, path, fmt, rows=EXPORT_ROWS):
+    """Decode a table `rows` rows at a time into one CSV or Parquet file; returns the rows written"""
+    columns = list(reader.columns()[table])
+    written = 0
+    if fmt == 'csv':
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for df in reader.table_chunks(table, rows):
+                df.to_csv(f, index=False, header=not written, date_format=CSV_DATE_FORMAT)
+                written += len(df)
+            if not written:
+                pd.DataFrame(columns=columns).to_csv(f, index=False)
+        return written
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+    writer = None
+    try:
+        for df in reader.table_chunks(table, rows):
+            chunk = pa.Table.from_pandas(df, schema=writer.schema if writer else None, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, chunk.schema)
+            writer.write_table(chunk)
+            written += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame(columns=columns).to_parquet(path, index=False)
+    return written
+
+_worker_state = {}
+
+def _init_worker(abf_path):
+    _worker_state['reader'] = AbfReader(abf_path)
+
+def _export_in_worker(task):
+    return export_table(_worker_state['reader'], *task)
+
+def export_table(reader, table, output_dir, fmt='csv'):
+    """Decode one table and write it to <output_dir>/<table>.<ext>; returns (table, rows, seconds)"""
+    started = time.perf_counter()
+    rows = write_table(reader, table, os.path.join(output_dir, f'{table}.{EXTENSIONS[fmt]}'), fmt)
+    return table, rows, time.perf_counter() - started
+
+def export_tables(abf_path, output_dir, fmt='csv', workers=1, tables=None):
+    """Export tables in parallel, one table per task; each worker maps the ABF itself.
+
+    Yields (table, rows, seconds) as tables finish.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with AbfReader(abf_path) as reader:
+        tables = tables or reader.tables()
+        missing = [table for table in tables if table not in reader.columns()]
+        if missing:
+            raise KeyError(f"no table(s) {', '.join(missing)} in {abf_path}")
+        workers = min(workers or os.cpu_count(), len(tables)) or 1
+        if workers == 1:
+            for table in tables:
+                yield export_table(reader, table, output_dir, fmt)
+            return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(abf_path,)) as pool:
+        yield from pool.map(_export_in_worker, [(table, output_dir, fmt) for table in tables])
+
+def print_tables(reader):
+    print(f"{'Table':<32}{'Columns':>8}{'Rows':>14}{'Bytes':>16}")
+    for table, columns in reader.columns().items():
+        size = sum(len(reader.file(name)) for info in columns.values()
+                   for name in info['idf'] + ([info['dictionary']] if info['dictionary'] else []))
+        print(f"{table:<32}{len(columns):>8}{reader.row_count(table):>14,}{size:>16,}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Read tables from a decompressed PBIX DataModel (ABF)")
+    parser.add_argument('abf', help="decompressed DataModel, e.g. from xpress9_decompress.py")
+    parser.add_argument('--table', action='append', help="table to show or export (repeatable)")
+    parser.add_argument('--column', help="with one --table, show only this column")
+    parser.add_argument('--head', type=int, default=10, help="rows to show (default: 10)")
+    parser.add_argument('--export', metavar='DIR', help="write the tables to DIR")
+    parser.add_argument('--format', choices=sorted(EXTENSIONS), default='csv', help="export format (default: csv)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes exporting tables in parallel; 0 uses every CPU (default: 0)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.abf):
+        print(f"Error: file not found: {args.abf}")
+        sys.exit(1)
+    try:
+        if args.export:
+            started = time.perf_counter()
+            total = 0
+            for table, rows, seconds in export_tables(args.abf, args.export, args.format, args.workers, args.table):
+                total += rows
+                print(f"  {table}: {rows:,} rows in {seconds:.2f} s")
+            print(f"Exported {total:,} rows to {args.export} in {time.perf_counter() - started:.2f} s")
+            return
+        with AbfReader(args.abf) as reader:
+            if not args.table:
+                print_tables(reader)
+                return
+            for table in args.table:
+                if args.column:
+                    df = pd.DataFrame({args.column: reader.column(table, args.column)})
+                else:
+                    df = reader.table(table)
+                print(f"{table} ({len(df):,} rows)")
+                print(df.head(args.head).to_string(index=False))
+    except (ImportError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
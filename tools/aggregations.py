@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregated rollup tables for the fact tables in data/, with query routing.
+
+Like Power BI aggregations: each rollup stores a fact table summarized at a
+grain (a list of fact or dimension columns) with SUM, COUNT, MIN and MAX of
+the fact columns. A grouped query is answered from the smallest rollup whose
+grain covers its group-by and filter columns. Dimension attributes that are
+determined by a grain column are covered too, so a dim_date[YearMonth] rollup
+answers queries by Year or Quarter. Queries that no rollup can answer exactly
+(DISTINCTCOUNT, columns outside every grain) go to the detail table.
+
+Rollups are written as CSV files plus a manifest.json that records the size,
+mtime and content hash of the source tables and of Model.bim. --build only
+rebuilds the rollups whose sources or grain changed; the router ignores
+rollups that are out of date.
+
+Usage:
+    python aggregations.py --build [--data DIR] [--out DIR] [--config grains.json] [--force]
+    python aggregations.py --table fact_sales --measure "Sales=SUM(NetSales)" \\
+        --group-by dim_date.Year [--filter dim_customer.Channel=Online] [--json]
+
+    grains.json maps a fact table to a list of grains, e.g.
+    {"fact_sales": [["dim_date.YearMonth", "dim_customer.Channel"]]}
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from query_engine import (DEFAULT_DATA_DIR, DEFAULT_MODEL_PATH, StarModel, aggregate_groups, factorize_groups,
+                          file_hash, filter_mask, parse_column_ref, parse_filter, parse_measure, table_paths)
+
+ROLLUP_VERSION = 1
+ROLLUP_DIR = '_aggregations'
+MANIFEST_FILE = 'manifest.json'
+
+# Month x channel x region covers most visuals of the Overview, Sales and Orders pages
+DEFAULT_GRAINS = {
+    'fact_sales': [
+        ['dim_date.YearMonth', 'dim_customer.Channel', 'dim_geography.Region'],
+        ['dim_date.YearMonth'],
+    ],
+    'fact_orders': [
+        ['dim_date.YearMonth', 'dim_customer.Channel', 'dim_geography.Region', 'OrderStatus'],
+        ['dim_date.YearMonth', 'dim_customer.Channel'],
+    ],
+}
+
+# Aggregations that can be re-aggregated from a rollup, and how
+ROLLUP_FUNCTIONS = {'SUM': 'SUM', 'COUNT': 'SUM', 'MIN': 'MIN', 'MAX': 'MAX'}
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def grain_columns(table, grain):
+    """(table, column) pairs of a grain; bare column names are on the fact table"""
+    return [parse_column_ref(ref, table) for ref in grain]
+
+def rollup_name(table, columns):
+    return f"{table}__{'_'.join(column for _, column in columns)}"
+
+def key_name(table, column):
+    return f'{table}[{column}]'
+
+def source_state(path, previous=None):
+    """Size, mtime and content hash of a source file; the hash is reused if size and mtime match"""
+    st = os.stat(path)
+    state = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if previous and all(previous.get(k) == v for k, v in state.items()):
+        state['hash'] = previous['hash']
+    else:
+        state['hash'] = file_hash(path)
+    return state
+
+def _unchanged(previous, path):
+    if previous is None or not os.path.exists(path):
+        return False
+    return source_state(path, previous)['hash'] == previous['hash']
+
+def source_tables(star, table, columns):
+    """The fact table plus every table on the relationship paths to the grain columns"""
+    tables = {table}
+    for column_table, _ in columns:
+        path = star.path(table, column_table)
+        if path is None:
+            raise ValueError(f"no relationship path from {table} to {column_table}")
+        tables.update(rel.to_table for rel in path)
+    return sorted(tables)
+
+def build_rollup(star, table, columns):
+    """Summarize table at the grain columns: one row per existing key combination"""
+    key_columns = [star.related_column(table, t, c) for t, c in columns]
+    group_ids, n_groups, keys = factorize_groups(key_columns, star.rows[table])
+    result = {key_name(t, c): values for (t, c), values in zip(columns, keys)}
+    grain = {c for t, c in columns if t == table}
+    for column, values in star.tables[table].items():
+        if column in grain:
+            continue
+        result[f'COUNT({column})'] = aggregate_groups('COUNT', values, group_ids, n_groups)
+        if values.dtype.kind in 'iuf':
+            for func in ('SUM', 'MIN', 'MAX'):
+                result[f'{func}({column})'] = aggregate_groups(func, values, group_ids, n_groups)
+    return pd.DataFrame(result)
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'version': ROLLUP_VERSION, 'rollups': {}}
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != ROLLUP_VERSION:
+        return {'version': ROLLUP_VERSION, 'rollups': {}}
+    return manifest
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def is_current(entry, data_dir, model_path):
+    """True if none of the rollup's source tables (or Model.bim) changed since it was built"""
+    paths = table_paths(data_dir)
+    for table, state in entry['sources'].items():
+        if table not in paths or not _unchanged(state, paths[table]):
+            return False
+    return entry.get('model') is None or _unchanged(entry['model'], model_path)
+
+def build_rollups(data_dir=DEFAULT_DATA_DIR, out_dir=None, grains=None, model_path=DEFAULT_MODEL_PATH,
+                  force=False):
+    """Build the rollups that are missing or out of date; returns {name: status}"""
+    out_dir = out_dir or os.path.join(data_dir, ROLLUP_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    grains = DEFAULT_GRAINS if grains is None else grains
+    manifest = read_manifest(out_dir)
+    previous = manifest['rollups']
+    rollups = {}
+    status = {}
+    star = None
+    paths = table_paths(data_dir)
+
+    for table, table_grains in grains.items():
+        for grain in table_grains:
+            columns = grain_columns(table, grain)
+            name = rollup_name(table, columns)
+            entry = previous.get(name)
+            if (not force and entry is not None and entry['grain'] == grain
+                    and os.path.exists(os.path.join(out_dir, entry['file']))
+                    and is_current(entry, data_dir, model_path)):
+                rollups[name] = entry
+                status[name] = 'up to date'
+                continue
+            if star is None:
+                # Fingerprint before loading: a table rewritten meanwhile makes the rollups stale, not wrong
+                known = {t: state for e in previous.values() for t, state in e['sources'].items()}
+                states = {t: source_state(path, known.get(t)) for t, path in paths.items()}
+                model_state = source_state(model_path) if model_path else None
+                star = StarModel.from_directory(data_dir, model_path)
+            try:
+                columns = [star.resolve(t, c) for t, c in columns]
+                sources = source_tables(star, table, columns)
+            except (KeyError, ValueError) as e:
+                status[name] = f"skipped: {e.args[0]}"
+                continue
+            started = time.perf_counter()
+            frame = build_rollup(star, table, columns)
+            file_name = f'{name}.csv'
+            frame.to_csv(os.path.join(out_dir, file_name), index=False)
+            rollups[name] = {
+                'table': table,
+                'grain': grain,
+                'columns': [list(c) for c in columns],
+                'file': file_name,
+                'rows': len(frame),
+                'source_rows': star.rows[table],
+                'measures': [c for c in frame.columns if c.endswith(')')],
+                'sources': {t: states[t] for t in sources},
+                'model': model_state,
+                'built': datetime.now().isoformat(timespec='seconds'),
+            }
+            status[name] = (f"built {len(frame):,} rows from {star.rows[table]:,} "
+                            f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    for name, entry in previous.items():
+        if name not in rollups and name not in status:
+            path = os.path.join(out_dir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            status[name] = 'removed'
+    manifest['rollups'] = rollups
+    _write_manifest(out_dir, manifest)
+    return status
+
+# ---------------------------------------------------------------------------
+# Routing
+# ---------------------------------------------------------------------------
+
+class AggregationRouter:
+    """Answers grouped aggregations from the smallest rollup that covers them exactly"""
+
+    # What the summaries are called in routing messages
+    kind = 'rollup'
+
+    def __init__(self, star, rollups, out_dir, stale=()):
+        self.star = star
+        self.rollups = rollups
+        self.out_dir = out_dir
+        self.stale = dict(stale)
+        self._frames = {}
+        self._determines = {}
+
+    @classmethod
+    def from_directory(cls, data_dir=DEFAULT_DATA_DIR, out_dir=None, model_path=DEFAULT_MODEL_PATH, star=None):
+        """Router over the up-to-date rollups in out_dir (stale ones are ignored)"""
+        out_dir = out_dir or os.path.join(data_dir, ROLLUP_DIR)
+        star = star or StarModel.from_directory(data_dir, model_path)
+        rollups = {}
+        stale = {}
+        for name, entry in read_manifest(out_dir)['rollups'].items():
+            if is_current(entry, data_dir, model_path):
+                rollups[name] = entry
+            else:
+                stale[name] = entry
+        return cls(star, rollups, out_dir, stale)
+
+    def _frame(self, name):
+        if name not in self._frames:
+            entry = self.rollups[name]
+            # Keys of text columns stay text ('2022-01', '001', ...) whatever they look like
+            dtypes = {key_name(t, c): object for t, c in entry['columns']
+                      if self.star.column(t, c).dtype.kind == 'O'}
+            self._frames[name] = pd.read_csv(os.path.join(self.out_dir, entry['file']), dtype=dtypes,
+                                             float_precision='round_trip')
+        return self._frames[name]
+
+    def determines(self, table, key, column):
+        """True if every value of table[key] comes with a single value of table[column]"""
+        cache_key = (table, key, column)
+        if cache_key not in self._determines:
+            key_codes = self.star.dictionary(table, key)[0]
+            codes = self.star.dictionary(table, column)[0]
+            width = int(codes.max()) + 2 if len(codes) else 1
+            pairs = np.unique(key_codes * width + codes + 1)
+            self._determines[cache_key] = len(pairs) == len(np.unique(key_codes))
+        return self._determines[cache_key]
+
+    def _cover(self, entry, column):
+        """Grain column that answers column on this rollup, or None"""
+        columns = [tuple(c) for c in entry['columns']]
+        if column in columns:
+            return column
+        table, name = column
+        if table == entry['table']:
+            return None
+        for grain_table, key in columns:
+            if grain_table == table and self.determines(table, key, name):
+                return grain_table, key
+        return None
+
+    def unsupported(self, func):
+        """Why func cannot be answered from a summary, or None if it can"""
+        return None if func in ROLLUP_FUNCTIONS else f"{func} is not additive"
+
+    def route(self, table, measures, group_by=(), filters=None):
+        """(rollup name, None) if a rollup answers the query exactly, else (None, reason)"""
+        for func, ref in measures.values():
+            ref_table, column = parse_column_ref(ref, table)
+            reason = self.unsupported(func.upper())
+            if reason:
+                return None, reason
+            if ref_table != table:
+                return None, f"{ref_table}[{column}] is not a column of {table}"
+        needed = [self.star.resolve(*parse_column_ref(ref, table)) for ref in group_by]
+        for ref in (filters or {}):
+            ref = parse_column_ref(ref) if isinstance(ref, str) else ref
+            needed.append(self.star.resolve(*ref))
+        candidates = []
+        for name, entry in self.rollups.items():
+            if entry['table'] != table:
+                continue
+            if any(f'{func.upper()}({parse_column_ref(ref, table)[1]})' not in entry['measures']
+                   for func, ref in measures.values()):
+                continue
+            if all(self._cover(entry, column) is not None for column in needed):
+                candidates.append((entry['rows'], name))
+        if not candidates:
+            reason = f"no {self.kind} of {table} covers {', '.join(f'{t}[{c}]' for t, c in needed) or 'the measures'}"
+            stale = [name for name, entry in self.stale.items() if entry['table'] == table]
+            if stale:
+                reason += f"; out of date: {', '.join(stale)} (run --build)"
+            return None, reason
+        return min(candidates)[1], None
+
+    def _rollup_column(self, name, column):
+        """Values of column for every row of the rollup"""
+        entry = self.rollups[name]
+        grain_table, key = self._cover(entry, column)
+        keys = self._frame(name)[key_name(grain_table, key)].to_numpy()
+        if grain_table == entry['table']:
+            return keys if keys.dtype.kind != 'O' else np.where(pd.isna(keys), None, keys)
+        # Map each key to the first dimension row with that key
+        codes, uniques = pd.factorize(self.star.column(grain_table, key))
+        first = np.full(len(uniques), -1)
+        first[codes[::-1]] = np.arange(len(codes))[::-1]
+        position = pd.Index(uniques).get_indexer(keys)
+        rows = np.where(position >= 0, first[position], -1)
+        values = self.star.column(*column)[rows]
+        if (rows < 0).any():
+            values = values.astype(float if values.dtype.kind in 'biuf' else object)
+            values[rows < 0] = np.nan if values.dtype.kind == 'f' else None
+        return values
+
+    def groups(self, name, table, group_by=(), filters=None):
+        """Filter and group the rows of a summary.
+
+        Returns (row mask, group id per selected row, number of groups,
+        {output column: group key values}).
+        """
+        mask = np.ones(self.rollups[name]['rows'], dtype=bool)
+        for ref, condition in (filters or {}).items():
+            ref = parse_column_ref(ref) if isinstance(ref, str) else ref
+            mask &= filter_mask(self._rollup_column(name, self.star.resolve(*ref)), condition)
+        group_refs = [self.star.resolve(*parse_column_ref(ref, table)) for ref in group_by]
+        key_columns = [self._rollup_column(name, column)[mask] for column in group_refs]
+        group_ids, n_groups, keys = factorize_groups(key_columns, int(np.count_nonzero(mask)))
+        keys_by_name = {}
+        for (t, c), values in zip(group_refs, keys):
+            keys_by_name[c if c not in keys_by_name else f'{t}[{c}]'] = values
+        return mask, group_ids, n_groups, keys_by_name
+
+    def aggregate(self, table, measures, group_by=(), filters=None):
+        """Grouped aggregation like StarModel.aggregate; returns (DataFrame, what served it)"""
+        table = self.star.resolve(table)
+        name, reason = self.route(table, measures, group_by, filters)
+        if name is None:
+            return self.star.aggregate(table, measures, group_by, filters), f"{table} (detail: {reason})"
+
+        frame = self._frame(name)
+        mask, group_ids, n_groups, result = self.groups(name, table, group_by, filters)
+        for measure, (func, ref) in measures.items():
+            func = func.upper()
+            values = frame[f'{func}({parse_column_ref(ref, table)[1]})'].to_numpy()[mask]
+            result[measure] = aggregate_groups(ROLLUP_FUNCTIONS[func], values, group_ids, n_groups)
+        entry = self.rollups[name]
+        return pd.DataFrame(result), f"{name} ({entry['rows']:,} of {entry['source_rows']:,} rows)"
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build pre-aggregated rollups and route queries to them.')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of table CSV files')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Model.bim with the relationships')
+    parser.add_argument('--out', help=f'rollup directory (default: DATA/{ROLLUP_DIR})')
+    parser.add_argument('--build', action='store_true', help='build missing or out-of-date rollups')
+    parser.add_argument('--config', help='JSON file mapping fact tables to lists of grains')
+    parser.add_argument('--force', action='store_true', help='rebuild every rollup')
+    parser.add_argument('--table', help='table to aggregate')
+    parser.add_argument('--measure', type=parse_measure, action='append', default=[],
+                        help='[Name=]FUNC(column); may be repeated')
+    parser.add_argument('--group-by', action='append', default=[], help='group column; may be repeated')
+    parser.add_argument('--filter', type=parse_filter, action='append', default=[],
+                        help='table.column=value[,value...]; may be repeated')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON records')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not args.build and not (args.table and args.measure):
+        print("Error: give --build, or --table with at least one --measure")
+        sys.exit(1)
+
+    if args.build:
+        grains = None
+        if args.config:
+            with open(args.config, encoding='utf-8') as f:
+                grains = json.load(f)
+        for name, status in build_rollups(args.data, args.out, grains, args.model, args.force).items():
+            print(f"  {name}: {status}")
+        if not args.table:
+            return
+
+    started = time.perf_counter()
+    router = AggregationRouter.from_directory(args.data, args.out, args.model)
+    loaded = time.perf_counter()
+    try:
+        result, served_by = router.aggregate(args.table, dict(args.measure), args.group_by, dict(args.filter))
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0] if e.args else e}")
+        sys.exit(1)
+    finished = time.perf_counter()
+
+    if args.json:
+        print(result.to_json(orient='records'))
+        return
+    print(result.to_string(index=False))
+    print(f"\n{len(result)} rows from {served_by}; load {(loaded - started) * 1000:.0f} ms, "
+          f"query {(finished - loaded) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
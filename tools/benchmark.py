@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for generate_sample_data.py stages and the PBIX extract scripts,
+with regression gates against a stored baseline.
+
+Each stage runs at several scale factors, in a fresh process per
+measurement, and records wall time, CPU time, rows (or bytes) per second and
+peak RSS. Setup work (e.g. generating the orders that the returns stage
+reads) happens before the clock starts, and on Linux the peak-RSS counter is
+reset after setup so the figure covers the stage alone.
+
+Every run is appended to a JSON history file. With a baseline file present,
+the run fails (exit code 1) when a stage is slower than the baseline by more
+than --threshold, or uses more memory by more than --rss-threshold.
+
+Stages:
+    date, customer, product   dimension generators (dim_date spans 3 years x scale,
+                              dim_customer has 5,000 x scale rows)
+    orders                    vectorized fact_orders (50,000 x scale order attempts)
+    returns                   return lines drawn for the order lines of each planned unit,
+                              as the CLI draws them (generate_return_lines)
+    sales                     fact_sales rolled up from the order line arrays (sales_rollup_frame)
+    pbix_open                 open a PBIX and map its DataModel (pbix_reader.PbixReader)
+    pbix_scan                 open, list members, look for the model and read the DataModel header
+    orders_loop, returns_loop the original row-by-row engine; slow, so not run by default
+    sales_loop                fact_sales as the loop engine builds it, a groupby over fact_orders
+
+Without --pbix the PBIX stages use a synthetic file of the same layout with a
+64 MB x scale DataModel.
+
+Usage:
+    python benchmark.py [--stages date,orders,...] [--scales 0.1,0.5,1] [--repeat 3]
+                        [--threshold 0.25] [--rss-threshold 0.5] [--min-slowdown SECONDS]
+                        [--stage-threshold STAGE=R ...]
+                        [--history FILE] [--baseline FILE] [--update-baseline] [--pbix FILE]
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(TOOLS_DIR, '..', 'benchmarks')
+DEFAULT_HISTORY = os.path.join(BENCH_DIR, 'history.json')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+DEFAULT_STAGES = ('date', 'customer', 'product', 'orders', 'returns', 'sales', 'pbix_open', 'pbix_scan')
+DEFAULT_SCALES = (0.1, 0.5, 1.0)
+PBIX_DATAMODEL_MB = 64
+# Slowdowns smaller than this are timer noise, whatever the ratio
+MIN_SLOWDOWN_S = 0.05
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+# Each stage takes the scale and returns (run, unit): run() does the timed
+# work and returns how many units (rows or bytes) it processed.
+
+def _date_range(scale):
+    """Start and end date of a dim_date spanning 3 years x scale"""
+    start = datetime(2022, 1, 1)
+    end = start + timedelta(days=max(int(round(1096 * scale)), 1) - 1)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+def _dimensions():
+    """dim_date, dim_customer and dim_product, seeded as the CLI seeds them so row counts repeat"""
+    import random
+    import numpy as np
+    import generate_sample_data as gen
+    random.seed(42)
+    np.random.seed(42)
+    dates = gen.generate_date_dimension(*_date_range(1.0))
+    return gen, dates, gen.generate_customer_dimension(5000), gen.generate_product_dimension()
+
+def _orders(scale, engine='vectorized'):
+    gen, dates, customers, products = _dimensions()
+    n_orders = int(round(50000 * scale))
+    if engine == 'loop':
+        return gen, dates, gen.generate_fact_orders(customers, products, dates, n_orders=n_orders)
+    return gen, dates, gen.generate_fact_orders_vectorized(customers, products, dates, n_orders=n_orders)
+
+def _unit_lines(scale):
+    """The order lines of each unit the generator plans for 50,000 x scale order attempts"""
+    gen, dates, customers, products = _dimensions()
+    n_orders = int(round(50000 * scale))
+    ctx = gen.build_order_context(customers, products, dates)
+    units = gen.plan_order_units(ctx, n_orders / len(dates), 42)
+    return gen, ctx, [gen.generate_unit(ctx, unit, 42)[0] for unit in units]
+
+def stage_date(scale):
+    import generate_sample_data as gen
+    start, end = _date_range(scale)
+    return lambda: len(gen.generate_date_dimension(start, end)), 'rows'
+
+def stage_customer(scale):
+    import generate_sample_data as gen
+    return lambda: len(gen.generate_customer_dimension(max(int(round(5000 * scale)), 1))), 'rows'
+
+def stage_product(scale):
+    import generate_sample_data as gen
+    return lambda: len(gen.generate_product_dimension()), 'rows'
+
+def stage_orders(scale):
+    gen, dates, customers, products = _dimensions()
+    n_orders = int(round(50000 * scale))
+    return lambda: len(gen.generate_fact_orders_vectorized(customers, products, dates, n_orders=n_orders)), 'rows'
+
+def stage_returns(scale):
+    import numpy as np
+    gen, ctx, batches = _unit_lines(scale)
+
+    def run():
+        # One stream for the whole run; the CLI continues each unit's order stream
+        rng = np.random.default_rng(42)
+        return sum(len(gen.generate_return_lines(rng, ctx, lines)['order_key']) for lines in batches)
+    return run, 'rows'
+
+def stage_sales(scale):
+    import numpy as np
+    gen, ctx, batches = _unit_lines(scale)
+    lines = {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+    # A fresh dict each run: sales_rollup_frame caches the line amounts in it
+    return lambda: len(gen.sales_rollup_frame(ctx, dict(lines))), 'rows'
+
+def stage_orders_loop(scale):
+    gen, dates, customers, products = _dimensions()
+    n_orders = int(round(50000 * scale))
+    return lambda: len(gen.generate_fact_orders(customers, products, dates, n_orders=n_orders)), 'rows'
+
+def stage_returns_loop(scale):
+    gen, dates, orders = _orders(scale, engine='loop')
+    return lambda: len(gen.generate_fact_returns(orders, dates)), 'rows'
+
+def stage_sales_loop(scale):
+    gen, dates, orders = _orders(scale)
+    return lambda: len(gen.rollup_fact_sales(orders)), 'rows'
+
+def write_synthetic_pbix(path, scale):
+    """A ZIP laid out like a PBIX: incompressible DataModel (stored), JSON report layout, metadata"""
+    datamodel_bytes = max(int(PBIX_DATAMODEL_MB * scale * (1 << 20)), 1 << 16)
+    with zipfile.ZipFile(path, 'w') as pbix:
+        pbix.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="utf-8"?><Types/>')
+        pbix.writestr('Version', '1.28'.encode('utf-16-le'))
+        pbix.writestr('Metadata', json.dumps({'version': 5}).encode('utf-16-le'))
+        pbix.writestr('Settings', json.dumps({'Version': 4}).encode('utf-16-le'))
+        layout = {'sections': [{'name': f'page{i}', 'visualContainers': [{'x': j} for j in range(50)]}
+                               for i in range(6)]}
+        pbix.writestr(zipfile.ZipInfo('Report/Layout'), json.dumps(layout).encode('utf-16-le'),
+                      compress_type=zipfile.ZIP_DEFLATED)
+        with pbix.open(zipfile.ZipInfo('DataModel'), 'w') as f:
+            remaining = datamodel_bytes
+            while remaining:
+                block = min(remaining, 1 << 20)
+                f.write(os.urandom(block))
+                remaining -= block
+
+def _pbix(scale, pbix_path):
+    if pbix_path:
+        return pbix_path
+    work_dir = tempfile.mkdtemp(prefix='pbix_bench_')
+    atexit.register(shutil.rmtree, work_dir, True)
+    path = os.path.join(work_dir, 'bench.pbix')
+    write_synthetic_pbix(path, scale)
+    return path
+
+def stage_pbix_open(scale, pbix_path=None):
+    import extract_pbix_actual
+    path = _pbix(scale, pbix_path)
+
+    def run():
+        with extract_pbix_actual.open_pbix(path) as reader:
+            if 'DataModel' in reader:
+                len(reader.buffer('DataModel'))
+        return os.path.getsize(path)
+    return run, 'bytes'
+
+def stage_pbix_scan(scale, pbix_path=None):
+    import extract_pbix_actual
+    import extract_pbix_data
+    path = _pbix(scale, pbix_path)
+
+    def run():
+        with extract_pbix_actual.open_pbix(path) as reader:
+            extract_pbix_data.list_pbix_members(reader)
+            extract_pbix_actual.check_for_bim_file(reader)
+            if 'DataModel' in reader:
+                extract_pbix_actual.analyze_datamodel(reader)
+        return os.path.getsize(path)
+    return run, 'bytes'
+
+STAGES = {
+    'date': stage_date,
+    'customer': stage_customer,
+    'product': stage_product,
+    'orders': stage_orders,
+    'returns': stage_returns,
+    'sales': stage_sales,
+    'orders_loop': stage_orders_loop,
+    'returns_loop': stage_returns_loop,
+    'sales_loop': stage_sales_loop,
+    'pbix_open': stage_pbix_open,
+    'pbix_scan': stage_pbix_scan,
+}
+PBIX_STAGES = ('pbix_open', 'pbix_scan')
+
+# ---------------------------------------------------------------------------
+# Measuring (in the child process)
+# ---------------------------------------------------------------------------
+
+def _reset_peak_rss():
+    """Reset the kernel's peak-RSS counter (Linux); False where unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _rss_mb(field):
+    """VmRSS / VmHWM from /proc (Linux), else ru_maxrss"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def measure(stage, scale, pbix_path=None):
+    """Run one stage once in this process and return its measurements"""
+    sys.path.insert(0, TOOLS_DIR)
+    factory = STAGES[stage]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run, unit = factory(scale, pbix_path) if stage in PBIX_STAGES else factory(scale)
+        reset = _reset_peak_rss()
+        rss_before = _rss_mb('VmRSS')
+        wall, cpu = time.perf_counter(), time.process_time()
+        count = run()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    peak = _rss_mb('VmHWM')
+    return {
+        'stage': stage,
+        'scale': scale,
+        'unit': unit,
+        'count': int(count),
+        'wall_s': round(wall, 6),
+        'cpu_s': round(cpu, 6),
+        'per_s': round(count / wall, 1) if wall > 0 else None,
+        'peak_rss_mb': round(peak, 1),
+        'stage_rss_mb': round(max(peak - rss_before, 0), 1) if reset else None,
+    }
+
+def run_measurement(stage, scale, pbix_path=None):
+    """measure() in a fresh interpreter, so imports and earlier stages do not skew memory"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', stage, str(scale)]
+    if pbix_path:
+        command += ['--pbix', pbix_path]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"stage {stage} at scale {scale} failed:\n{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def run_benchmarks(stages, scales, repeat=3, pbix_path=None):
+    """Best-of-repeat measurements of every stage at every scale"""
+    results = []
+    for stage in stages:
+        # A given PBIX file has one size; synthetic ones follow the scale
+        stage_scales = [1.0] if stage in PBIX_STAGES and pbix_path else scales
+        for scale in stage_scales:
+            runs = [run_measurement(stage, scale, pbix_path) for _ in range(repeat)]
+            best = min(runs, key=lambda r: r['wall_s'])
+            best['peak_rss_mb'] = max(r['peak_rss_mb'] for r in runs)
+            best['repeat'] = repeat
+            results.append(best)
+            print(f"  {stage:<13} x{scale:<5g} {best['count']:>12,} {best['unit']:<5} {best['wall_s']:>9.3f} s "
+                  f"{best['per_s'] or 0:>14,.0f}/s {best['peak_rss_mb']:>8.1f} MB peak")
+    return results
+
+# ---------------------------------------------------------------------------
+# History and regression gates
+# ---------------------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=TOOLS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def make_run(results):
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPUs)",
+        'results': results,
+    }
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def append_history(path, run):
+    history = read_json(path, [])
+    history.append(run)
+    write_json(path, history)
+
+def find_regressions(run, baseline, threshold=0.25, rss_threshold=0.5, stage_thresholds=None,
+                     min_slowdown=MIN_SLOWDOWN_S):
+    """Stages slower (by wall time) or larger (by peak RSS) than the baseline beyond the thresholds"""
+    stage_thresholds = stage_thresholds or {}
+    base = {(r['stage'], r['scale']): r for r in baseline['results']}
+    regressions = []
+    for result in run['results']:
+        reference = base.get((result['stage'], result['scale']))
+        if reference is None:
+            continue
+        limit = stage_thresholds.get(result['stage'], threshold)
+        slowdown = result['wall_s'] / reference['wall_s'] - 1 if reference['wall_s'] > 0 else 0
+        if slowdown > limit and result['wall_s'] - reference['wall_s'] >= min_slowdown:
+            regressions.append(f"{result['stage']} x{result['scale']:g}: {slowdown:+.0%} wall time "
+                               f"({reference['wall_s']:.3f} s -> {result['wall_s']:.3f} s, limit {limit:+.0%})")
+        growth = result['peak_rss_mb'] / reference['peak_rss_mb'] - 1 if reference['peak_rss_mb'] > 0 else 0
+        if growth > rss_threshold:
+            regressions.append(f"{result['stage']} x{result['scale']:g}: {growth:+.0%} peak RSS "
+                               f"({reference['peak_rss_mb']:.0f} MB -> {result['peak_rss_mb']:.0f} MB, "
+                               f"limit {rss_threshold:+.0%})")
+    return regressions
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def _parse_list(text):
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+def _parse_stage_threshold(text):
+    stage, sep, value = text.partition('=')
+    try:
+        if not sep or stage not in STAGES:
+            raise ValueError
+        return stage, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected STAGE=RATIO with STAGE in {', '.join(STAGES)}, got {text!r}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the generator and extract tools.')
+    parser.add_argument('--stages', type=_parse_list, default=list(DEFAULT_STAGES),
+                        help=f"comma-separated stages (default: {','.join(DEFAULT_STAGES)}; "
+                             f"also: {','.join(s for s in STAGES if s not in DEFAULT_STAGES)})")
+    parser.add_argument('--scales', type=lambda t: [float(s) for s in _parse_list(t)], default=list(DEFAULT_SCALES),
+                        help='comma-separated scale factors (default: 0.1,0.5,1)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement; the fastest counts (default: 3)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed wall-time slowdown against the baseline (default: 0.25 = 25%%)')
+    parser.add_argument('--rss-threshold', type=float, default=0.5,
+                        help='allowed peak-RSS growth against the baseline (default: 0.5 = 50%%)')
+    parser.add_argument('--min-slowdown', type=float, default=MIN_SLOWDOWN_S,
+                        help='ignore slowdowns shorter than this many seconds (default: %(default)s)')
+    parser.add_argument('--stage-threshold', type=_parse_stage_threshold, action='append', default=[],
+                        help='STAGE=RATIO wall-time threshold for one stage; may be repeated')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON file the run is appended to')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='JSON file with the baseline run')
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--pbix', help='real PBIX file for the pbix_* stages (default: synthetic)')
+    parser.add_argument('--child', nargs=2, metavar=('STAGE', 'SCALE'), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.child:
+        print(json.dumps(measure(args.child[0], float(args.child[1]), args.pbix)))
+        return
+    unknown = [s for s in args.stages if s not in STAGES]
+    if unknown:
+        print(f"Error: unknown stage(s) {', '.join(unknown)}; expected {', '.join(STAGES)}")
+        sys.exit(1)
+
+    print(f"Benchmarking {', '.join(args.stages)} at scale(s) {', '.join(f'{s:g}' for s in args.scales)} "
+          f"(best of {args.repeat})...")
+    try:
+        results = run_benchmarks(args.stages, args.scales, args.repeat, args.pbix)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    run = make_run(results)
+    append_history(args.history, run)
+    print(f"\nAppended to {args.history}")
+
+    if args.update_baseline:
+        write_json(args.baseline, run)
+        print(f"Baseline updated: {args.baseline}")
+        return
+    baseline = read_json(args.baseline, None)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    regressions = find_regressions(run, baseline, args.threshold, args.rss_threshold, dict(args.stage_threshold),
+                                   args.min_slowdown)
+    if regressions:
+        print(f"\n✗ {len(regressions)} regression(s) against the baseline from {baseline.get('timestamp')} "
+              f"({baseline.get('commit')}):")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print(f"\n✓ No regressions against the baseline from {baseline.get('timestamp')} ({baseline.get('commit')})")
+
+if __name__ == "__main__":
+    main()
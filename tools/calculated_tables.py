@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Materialize the DAX calculated tables of legacy/Model.bim from the data/ tables, incrementally.
+
+Two calculated tables in the model are derived from fact_sales:
+
+    dim_date            CALENDAR(MIN(fact_sales[SalesDate]), MAX(...)) with 18
+                        ADDCOLUMNS (year, month, quarter, week, start/end of
+                        month, quarter and year, ...)
+    KPI_Summary_Table   TOPN(1) of a fact amount summed by an attribute: most
+                        sales generating country, most profitable region, top
+                        selling product and top buying customer
+
+Both are computed with vectorized NumPy/pandas operations and written to
+DATA/_calculated/ with a manifest.json recording the fact-table watermarks
+they were derived from (rows, maximum key and date range) and the per-value
+sums behind each TopN. On the next run only fact rows that arrived since then
+are read: rows appended to a CSV file (its old content is unchanged) and new
+partition files listed in the data manifest.json. The calendar is extended to
+the new date range, and the new rows' sums per country, region, product and
+customer are merged into the stored ones before the TopN is taken again. If a
+source file was rewritten, removed or a dimension table changed, everything
+is rebuilt.
+
+Model.bim's tables are mapped to the generated ones (see KPI_SPECS); the
+generated fact_sales has no product key, so product sales come from the
+fact_orders lines.
+
+Usage: python calculated_tables.py [--data DIR] [--out DIR] [--full] [--show]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from query_engine import DEFAULT_DATA_DIR, StarModel, frame_columns, parse_column_ref
+
+CALCULATED_VERSION = 1
+CALCULATED_DIR = '_calculated'
+MANIFEST_FILE = 'manifest.json'
+DATA_MANIFEST_FILE = 'manifest.json'
+DATA_EXTENSIONS = ('csv', 'parquet', 'feather')
+
+# Key and date column of each fact table, recorded as its watermark
+FACT_WATERMARKS = {'fact_sales': ('SalesKey', 'SalesDate'), 'fact_orders': ('OrderKey', 'OrderDate')}
+
+# CALENDAR(MIN(fact_sales[SalesDate]), MAX(fact_sales[SalesDate]))
+CALENDAR_SOURCE = ('fact_sales', 'SalesDate')
+
+# The rows of KPI_Summary_Table: TOPN(1, SUMMARIZE(ALL(key), key, metric), metric, DESC)
+KPI_SPECS = [
+    {'category': 'Most Sales Generating Country', 'name': 'Country Name', 'key': 'dim_geography.Country',
+     'metric': 'Total Sales', 'table': 'fact_sales', 'value': 'NetSales'},
+    {'category': 'Most Profitable Region', 'name': 'Region Name', 'key': 'dim_geography.Continent',
+     'metric': 'Total Gross Profit', 'table': 'fact_sales', 'value': 'GrossProfit'},
+    # fact_sales has no product key; its NetSales is the order lines' LineTotal less the 5% discount
+    {'category': 'Top Selling Product', 'name': 'Product Name', 'key': 'dim_product.ProductName',
+     'metric': 'Total Sales', 'table': 'fact_orders', 'value': 'LineTotal', 'scale': 0.95},
+    {'category': 'Top Buying Customer', 'name': 'Customer Name', 'key': 'dim_customer.CustomerName',
+     'metric': 'Total Sales', 'table': 'fact_sales', 'value': 'NetSales'},
+]
+
+KPI_COLUMNS = ['KPI Category', 'KPI Name', 'KPI Value', 'Metric Name', 'Metric Value']
+METRIC_DECIMALS = 4
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+def _data_manifest(data_dir):
+    path = os.path.join(data_dir, DATA_MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('tables', {})
+
+def table_files(data_dir, table, data_manifest=None):
+    """Data files of a table, relative to data_dir: its partitions in the run manifest, else <table>.<ext>"""
+    data_manifest = _data_manifest(data_dir) if data_manifest is None else data_manifest
+    if table in data_manifest:
+        return [entry['path'] for entry in data_manifest[table]['files']]
+    for ext in DATA_EXTENSIONS:
+        if os.path.exists(os.path.join(data_dir, f'{table}.{ext}')):
+            return [f'{table}.{ext}']
+    return []
+
+def read_frame(path, columns=None):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.feather'):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+def _columns_of(data_dir, table, data_manifest):
+    files = table_files(data_dir, table, data_manifest)
+    if not files:
+        raise ValueError(f"no data files for {table} in {data_dir}")
+    path = os.path.join(data_dir, files[0])
+    if path.endswith('.csv'):
+        return list(pd.read_csv(path, nrows=0).columns)
+    return list(read_frame(path).columns)
+
+def _scan_file(path, previous):
+    """(state, tail) of a data file; tail is the bytes appended since previous, or None if it was rewritten"""
+    st = os.stat(path)
+    state = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if previous and previous['size'] == st.st_size and previous['mtime_ns'] == st.st_mtime_ns:
+        return dict(previous), b''
+    grown = (previous is not None and path.endswith('.csv') and previous.get('newline')
+             and st.st_size > previous['size'])
+    digest = hashlib.blake2b(digest_size=16)
+    tail = None
+    with open(path, 'rb') as f:
+        if grown:
+            remaining = previous['size']
+            while remaining:
+                block = f.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            if digest.hexdigest() == previous['hash']:
+                tail = f.read()
+                digest.update(tail)
+        if tail is None:
+            f.seek(0)
+            digest = hashlib.blake2b(digest_size=16)
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        f.seek(max(st.st_size - 1, 0))
+        state['newline'] = f.read(1) == b'\n'
+    state['hash'] = digest.hexdigest()
+    if previous and tail is None and state['hash'] == previous['hash']:
+        tail = b''
+    return state, tail
+
+def scan_table(data_dir, table, columns, previous=None, data_manifest=None):
+    """Rows of a table added since previous (every row if previous is None).
+
+    Returns (frame, files state, appended); appended is False when a file was
+    rewritten or removed since previous, and frame then holds every row.
+    """
+    files = table_files(data_dir, table, data_manifest)
+    if not files:
+        raise ValueError(f"no data files for {table} in {data_dir}")
+    previous = previous or {}
+    if set(previous) - set(files):
+        return scan_table(data_dir, table, columns, None, data_manifest)
+    states, parts, appended = {}, [], bool(previous)
+    for rel_path in files:
+        path = os.path.join(data_dir, rel_path)
+        state, tail = _scan_file(path, previous.get(rel_path))
+        states[rel_path] = state
+        if rel_path not in previous:
+            parts.append(read_frame(path, columns))
+        elif tail is None:
+            return scan_table(data_dir, table, columns, None, data_manifest)
+        elif tail:
+            header = pd.read_csv(path, nrows=0).columns
+            parts.append(pd.read_csv(io.BytesIO(tail), header=None, names=header, usecols=columns))
+    frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+    return frame, states, appended
+
+def _dimension_tables():
+    return sorted({parse_column_ref(spec['key'])[0] for spec in KPI_SPECS} | {'dim_customer'})
+
+def load_dimensions(data_dir, data_manifest=None, names=None):
+    """Dimension tables with file hashes; by default those the KPIs group by (and dim_customer, which links them)"""
+    tables, states = {}, {}
+    for table in _dimension_tables() if names is None else names:
+        frames = []
+        for rel_path in table_files(data_dir, table, data_manifest):
+            path = os.path.join(data_dir, rel_path)
+            states[rel_path] = _scan_file(path, None)[0]['hash']
+            frames.append(read_frame(path))
+        if not frames:
+            raise ValueError(f"no data files for {table} in {data_dir}")
+        tables[table] = frame_columns(pd.concat(frames, ignore_index=True))
+    return tables, states
+
+# ---------------------------------------------------------------------------
+# dim_date
+# ---------------------------------------------------------------------------
+
+def calendar(first, last):
+    """The dim_date rows of CALENDAR(first, last) with the model's ADDCOLUMNS"""
+    dates = pd.date_range(first, last, freq='D')
+    days = dates.values.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = days.astype('datetime64[Y]')
+    month = dates.month.to_numpy()
+    quarter = dates.quarter.to_numpy()
+    day_of_year = dates.dayofyear.to_numpy()
+    weekday = dates.weekday.to_numpy()
+    # WEEKNUM(date, 2): weeks start on Monday and week 1 holds January 1st
+    jan1_weekday = (weekday - (day_of_year - 1)) % 7
+    quarter_start = months - (month - 1) % 3
+    year_text = dates.year.to_numpy().astype(str)
+    quarter_text = np.char.add('Q', quarter.astype(str))
+    return pd.DataFrame({
+        'Date': days,
+        'Year': dates.year.to_numpy(),
+        'Year Month': dates.strftime('%Y-%m'),
+        'Month Number': month,
+        'Month Name': dates.month_name(),
+        'Short Month': dates.strftime('%b'),
+        'Quarter': quarter_text,
+        'Year Quarter': np.char.add(np.char.add(year_text, '-'), quarter_text),
+        'Week Number': (day_of_year - 1 + jan1_weekday) // 7 + 1,
+        'Day': dates.day.to_numpy(),
+        'Day Name': dates.day_name(),
+        'Short Day': dates.strftime('%a'),
+        'Is Weekend': weekday >= 5,
+        'Start of Month': months.astype('datetime64[D]'),
+        'End of Month': (months + 1).astype('datetime64[D]') - 1,
+        'Start of Quarter': quarter_start.astype('datetime64[D]'),
+        'End of Quarter': (quarter_start + 3).astype('datetime64[D]') - 1,
+        'Start of Year': years.astype('datetime64[D]'),
+        'End of Year': (years + 1).astype('datetime64[D]') - 1,
+    })
+
+def _date_range(values):
+    dates = pd.to_datetime(pd.Series(values), errors='coerce').dropna()
+    if dates.empty:
+        return None
+    return dates.min().strftime('%Y-%m-%d'), dates.max().strftime('%Y-%m-%d')
+
+def refresh_calendar(out_dir, entry, frame):
+    """Write or extend dim_date for the date range of frame; returns (entry, status)"""
+    path = os.path.join(out_dir, 'dim_date.csv')
+    table, column = CALENDAR_SOURCE
+    found = _date_range(frame[column]) if len(frame) else None
+    if entry is None:
+        if found is None:
+            raise ValueError(f"{table}[{column}] has no dates")
+        rows = calendar(*found)
+        rows.to_csv(path, index=False)
+        return {'file': 'dim_date.csv', 'rows': len(rows), 'range': list(found)}, f"built {len(rows):,} days"
+    first, last = entry['range']
+    if found is None or (found[0] >= first and found[1] <= last):
+        return entry, 'up to date'
+    new_first, new_last = min(first, found[0]), max(last, found[1])
+    if new_first < first:
+        rows = calendar(new_first, new_last)
+        rows.to_csv(path, index=False)
+    else:
+        rows = calendar((pd.Timestamp(last) + pd.Timedelta(days=1)).strftime('%Y-%m-%d'), new_last)
+        rows.to_csv(path, index=False, header=False, mode='a')
+    added = (pd.Timestamp(new_last) - pd.Timestamp(new_first)).days + 1 - entry['rows']
+    entry = dict(entry, rows=entry['rows'] + added, range=[new_first, new_last])
+    return entry, f"extended to {new_first}..{new_last} (+{added:,} days)"
+
+# ---------------------------------------------------------------------------
+# KPI_Summary_Table
+# ---------------------------------------------------------------------------
+
+def partial_sums(spec, frame, dimensions):
+    """Sum of spec['value'] per value of spec['key'] over the rows of frame"""
+    if not len(frame):
+        return {}
+    table = spec['table']
+    key_table, key_column = parse_column_ref(spec['key'])
+    star = StarModel({table: frame_columns(frame), **dimensions})
+    keys = star.related_column(table, key_table, key_column)
+    values = frame[spec['value']].to_numpy(dtype=float) * spec.get('scale', 1)
+    sums = pd.Series(values).groupby(pd.Series(keys, dtype=object), dropna=True).sum()
+    return {str(key): float(value) for key, value in sums.items()}
+
+def merge_sums(total, new):
+    merged = dict(total)
+    for key, value in new.items():
+        merged[key] = merged.get(key, 0.0) + value
+    return merged
+
+def kpi_rows(aggregates):
+    """KPI_Summary_Table rows: every value tied for the highest sum, like TOPN(1, ...)"""
+    rows = []
+    for spec in KPI_SPECS:
+        sums = aggregates.get(spec['category'], {})
+        if not sums:
+            continue
+        # Rounded, so incremental and full sums (added in a different order) give the same rows
+        sums = {key: round(value, METRIC_DECIMALS) for key, value in sums.items()}
+        best = max(sums.values())
+        for key in sorted(k for k, v in sums.items() if v == best):
+            rows.append([spec['category'], spec['name'], key, spec['metric'], best])
+    return pd.DataFrame(rows, columns=KPI_COLUMNS)
+
+def kpi_columns():
+    """Columns read from each fact table for the KPIs"""
+    columns = {}
+    for spec in KPI_SPECS:
+        columns.setdefault(spec['table'], set()).add(spec['value'])
+    return columns
+
+# ---------------------------------------------------------------------------
+# Refresh
+# ---------------------------------------------------------------------------
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != CALCULATED_VERSION:
+        return None
+    return manifest
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _watermark(frame, key, date_column, previous=None):
+    """Rows, maximum key and date range of a fact table, advanced by the rows in frame"""
+    mark = dict(previous or {'rows': 0, 'max_key': None, 'range': None})
+    mark['rows'] += len(frame)
+    if key and key in frame and len(frame):
+        top = frame[key].max()
+        top = top.item() if hasattr(top, 'item') else top
+        mark['max_key'] = top if mark['max_key'] is None else max(mark['max_key'], top)
+    found = _date_range(frame[date_column]) if date_column and date_column in frame and len(frame) else None
+    if found:
+        old = mark['range'] or found
+        mark['range'] = [min(old[0], found[0]), max(old[1], found[1])]
+    return mark
+
+def refresh(data_dir=DEFAULT_DATA_DIR, out_dir=None, full=False):
+    """Build or incrementally update dim_date and KPI_Summary_Table; returns {table: status}"""
+    out_dir = out_dir or os.path.join(data_dir, CALCULATED_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    data_manifest = _data_manifest(data_dir)
+    manifest = None if full else read_manifest(out_dir)
+    if manifest and not all(os.path.exists(os.path.join(out_dir, entry['file']))
+                            for entry in manifest['tables'].values()):
+        manifest = None
+
+    dimensions, dimension_states = load_dimensions(data_dir, data_manifest)
+    if manifest and manifest['dimensions'] != dimension_states:
+        manifest = None
+    wanted = kpi_columns()
+    wanted.setdefault(CALENDAR_SOURCE[0], set()).add(CALENDAR_SOURCE[1])
+    link_columns = {column for table in dimensions.values() for column in table}
+
+    facts, sources = {}, {}
+    for table, columns in sorted(wanted.items()):
+        header = _columns_of(data_dir, table, data_manifest)
+        needed = columns | set(FACT_WATERMARKS.get(table, ())) | link_columns
+        needed = [column for column in header if column in needed]
+        previous = manifest['sources'].get(table) if manifest else None
+        frame, states, appended = scan_table(data_dir, table, needed, previous, data_manifest)
+        if manifest and not appended:
+            # A rewritten file invalidates what was derived from it: start over
+            return refresh(data_dir, out_dir, full=True)
+        facts[table], sources[table] = frame, states
+
+    tables = manifest['tables'] if manifest else {}
+    watermarks = manifest['watermarks'] if manifest else {}
+    status = {}
+    started = time.perf_counter()
+    entry, message = refresh_calendar(out_dir, tables.get('dim_date'), facts[CALENDAR_SOURCE[0]])
+    tables['dim_date'] = entry
+    status['dim_date'] = f"{message} ({(time.perf_counter() - started) * 1000:.0f} ms)"
+
+    started = time.perf_counter()
+    previous = tables.get('KPI_Summary_Table', {}).get('aggregates', {})
+    aggregates = {}
+    for spec in KPI_SPECS:
+        frame = facts[spec['table']]
+        aggregates[spec['category']] = merge_sums(previous.get(spec['category'], {}),
+                                                  partial_sums(spec, frame, dimensions))
+    if aggregates != previous or 'KPI_Summary_Table' not in tables:
+        rows = kpi_rows(aggregates)
+        rows.to_csv(os.path.join(out_dir, 'KPI_Summary_Table.csv'), index=False)
+        tables['KPI_Summary_Table'] = {'file': 'KPI_Summary_Table.csv', 'rows': len(rows),
+                                       'aggregates': aggregates}
+        n_rows = sum(len(frame) for frame in facts.values())
+        message = f"updated from {n_rows:,} new fact rows" if previous else f"built from {n_rows:,} fact rows"
+        status['KPI_Summary_Table'] = f"{message} ({(time.perf_counter() - started) * 1000:.0f} ms)"
+    else:
+        status['KPI_Summary_Table'] = 'up to date'
+
+    for table, frame in facts.items():
+        key, date_column = FACT_WATERMARKS.get(table, (None, None))
+        watermarks[table] = _watermark(frame, key, date_column, watermarks.get(table))
+    _write_manifest(out_dir, {
+        'version': CALCULATED_VERSION,
+        'sources': sources,
+        'dimensions': dimension_states,
+        'watermarks': watermarks,
+        'tables': tables,
+        'refreshed': datetime.now().isoformat(timespec='seconds'),
+    })
+    return status
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Materialize dim_date and KPI_Summary_Table incrementally")
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of the data tables')
+    parser.add_argument('--out', help=f'output directory (default: DATA/{CALCULATED_DIR})')
+    parser.add_argument('--full', action='store_true', help='rebuild from every fact row')
+    parser.add_argument('--show', action='store_true', help='print KPI_Summary_Table and the watermarks')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    out_dir = args.out or os.path.join(args.data, CALCULATED_DIR)
+    try:
+        status = refresh(args.data, out_dir, args.full)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    for table, message in status.items():
+        print(f"  {table}: {message}")
+    if args.show:
+        manifest = read_manifest(out_dir)
+        print()
+        print(pd.read_csv(os.path.join(out_dir, 'KPI_Summary_Table.csv')).to_string(index=False))
+        print()
+        for table, mark in manifest['watermarks'].items():
+            print(f"  {table}: {mark['rows']:,} rows, max key {mark['max_key']}, "
+                  f"dates {'..'.join(mark['range'] or ['-'])}")
+
+if __name__ == "__main__":
+    main()
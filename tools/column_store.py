@@ -0,0 +1,714 @@
+#!/usr/bin/env python3
+"""
+Compressed in-memory column store for the data/ tables (VertiPaq-style).
+
+Every column is cut into segments of SEGMENT_ROWS rows and stored with one of:
+
+    dictionary  sorted distinct values plus bit-packed integer codes (text,
+                booleans and floats with few distinct values); code 0 is BLANK
+    pattern     text keys made of constant text and digit fields, such as
+                ORD00000001, CUST003907 or ORD00000001-12; each digit field is
+                stored as bit-packed integers and no strings are kept
+    value       integers as bit-packed offsets from the segment minimum
+    decimal     floats with a few decimal places (amounts), value-encoded as
+                integers times 10**k
+    raw         float64, for other floats with many distinct values
+
+Integer streams whose values form long runs (sorted columns such as dates)
+are run-length encoded instead of packed.
+
+CSV files are encoded chunk by chunk while they are read, so a table never has
+to fit in memory as a DataFrame. Dictionary and pattern columns hand their
+codes straight to query_engine.py, which filters on the dictionary and runs
+COUNT, DISTINCTCOUNT, MIN and MAX on the codes without decoding the values.
+
+Usage:
+    python column_store.py [--data DIR] [--compare]
+
+    --compare also reads each CSV into pandas, to report the DataFrame memory
+    (deep) next to the encoded size.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(TOOLS_DIR, '..', 'data')
+
+SEGMENT_ROWS = 1 << 20
+# Float columns leave the dictionary above this many distinct values
+MAX_FLOAT_DICTIONARY = 1 << 16
+# Decimal places tried for decimal encoding
+DECIMAL_SCALES = (1, 10, 100, 1000, 10000)
+# Text columns with this many distinct values (or mostly distinct) try a pattern
+MIN_PATTERN_DISTINCT = 4096
+# Digits of all pattern fields together must fit an int64 sort key
+MAX_PATTERN_DIGITS = 18
+
+# ---------------------------------------------------------------------------
+# Integer streams
+# ---------------------------------------------------------------------------
+
+def _bit_width(max_value):
+    return max(int(max_value).bit_length(), 1)
+
+def pack_bits(values, bits):
+    """Pack non-negative integers into `bits` bits each (64 values per `bits` uint64 words)"""
+    padded = np.zeros(-(-len(values) // 64) * 64, dtype=np.uint64)
+    padded[:len(values)] = values
+    lanes = padded.reshape(-1, 64)
+    words = np.zeros((len(lanes), bits), dtype=np.uint64)
+    for k in range(64):
+        word, shift = divmod(k * bits, 64)
+        words[:, word] |= lanes[:, k] << np.uint64(shift)
+        if shift + bits > 64:
+            words[:, word + 1] |= lanes[:, k] >> np.uint64(64 - shift)
+    return words.ravel()
+
+def unpack_bits(words, bits, n):
+    """Inverse of pack_bits: the first n values as int64"""
+    words = words.reshape(-1, bits)
+    mask = np.uint64((1 << bits) - 1)
+    values = np.empty((len(words), 64), dtype=np.uint64)
+    for k in range(64):
+        word, shift = divmod(k * bits, 64)
+        lane = words[:, word] >> np.uint64(shift)
+        if shift + bits > 64:
+            lane |= words[:, word + 1] << np.uint64(64 - shift)
+        values[:, k] = lane & mask
+    return values.ravel()[:n].astype(np.int64)
+
+class Packed:
+    """Non-negative integers bit-packed at the width of the largest one"""
+
+    __slots__ = ('words', 'bits', 'n')
+
+    def __init__(self, values):
+        self.n = len(values)
+        self.bits = _bit_width(values.max(initial=0))
+        self.words = pack_bits(values, self.bits)
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def decode(self):
+        return unpack_bits(self.words, self.bits, self.n)
+
+class RunLength:
+    """Run values and run lengths, each bit-packed"""
+
+    __slots__ = ('values', 'lengths', 'n')
+
+    def __init__(self, values, starts, n):
+        self.n = n
+        self.values = Packed(values[starts])
+        self.lengths = Packed(np.diff(np.append(starts, n)))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.lengths.nbytes
+
+    @property
+    def bits(self):
+        return self.values.bits
+
+    def decode(self):
+        return np.repeat(self.values.decode(), self.lengths.decode())
+
+class IntSegment:
+    """One segment of an integer stream: values - base, packed or run-length encoded"""
+
+    __slots__ = ('base', 'data')
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        self.base = int(values.min(initial=0))
+        offsets = values - self.base
+        starts = np.flatnonzero(np.diff(offsets)) + 1
+        starts = np.concatenate(([0], starts)) if len(offsets) else starts
+        bits = _bit_width(offsets.max(initial=0))
+        run_bits = len(starts) * (bits + _bit_width(len(offsets)))
+        if run_bits < len(offsets) * bits // 2:
+            self.data = RunLength(offsets, starts, len(offsets))
+        else:
+            self.data = Packed(offsets)
+
+    def __len__(self):
+        return self.data.n
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    @property
+    def run_length(self):
+        return isinstance(self.data, RunLength)
+
+    def decode(self):
+        return self.data.decode() + self.base
+
+def _segments(values, segment_rows=SEGMENT_ROWS):
+    return [IntSegment(values[start:start + segment_rows]) for start in range(0, len(values), segment_rows)]
+
+def _decode_stream(segments):
+    if not segments:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([segment.decode() for segment in segments])
+
+# ---------------------------------------------------------------------------
+# Text patterns
+# ---------------------------------------------------------------------------
+
+class Pattern:
+    """Constant text with digit fields, e.g. 'ORD', 8 digits, '-', any digits.
+
+    Fields have a fixed width (zero-padded) except possibly the last one,
+    which may have a variable width without leading zeros.
+    """
+
+    def __init__(self, literals, widths):
+        self.literals = literals  # len(widths) + 1 strings around the fields
+        self.widths = widths      # digits per field, None for a variable-width last field
+
+    @classmethod
+    def infer(cls, values):
+        """Pattern of the first value if every value matches it, else None"""
+        literals, widths = [''], []
+        for token in re.findall(r'\d+|\D+', values[0]):
+            if token.isdigit():
+                widths.append(len(token))
+                literals.append('')
+            else:
+                literals[-1] = token
+        if not widths or sum(widths) > MAX_PATTERN_DIGITS:
+            return None
+        candidates = [widths]
+        if literals[-1] == '':
+            candidates.append(widths[:-1] + [None])
+        for candidate in candidates:
+            pattern = cls(literals, candidate)
+            if pattern.fields(values) is not None:
+                return pattern
+        return None
+
+    @property
+    def variable(self):
+        return self.widths[-1] is None
+
+    def fields(self, values):
+        """Integer value of every field for every value (list of arrays), or None if a value does not match"""
+        try:
+            data = np.asarray(values, dtype=bytes)
+        except (UnicodeEncodeError, TypeError, ValueError):
+            return None
+        width = data.dtype.itemsize
+        chars = data.view(np.uint8).reshape(len(data), width).astype(np.int64)
+        lengths = np.count_nonzero(chars, axis=1)
+        fields, position = [], 0
+        for literal, digits in zip(self.literals, self.widths + [0]):
+            literal = literal.encode('ascii')
+            if position + len(literal) > width:
+                return None
+            if not (chars[:, position:position + len(literal)] == np.frombuffer(literal, np.uint8)).all():
+                return None
+            position += len(literal)
+            if digits is None:
+                return self._variable_field(chars[:, position:], lengths - position, fields)
+            if digits:
+                field = chars[:, position:position + digits] - 48
+                if field.shape[1] < digits or not ((field >= 0) & (field <= 9)).all():
+                    return None
+                fields.append(field @ 10 ** np.arange(digits - 1, -1, -1, dtype=np.int64))
+                position += digits
+        return fields if (lengths == position).all() else None
+
+    def _variable_field(self, chars, lengths, fields):
+        """The last field when its width varies; no leading zeros, at most the digits left over"""
+        room = MAX_PATTERN_DIGITS - self.fixed_digits
+        if not len(lengths) or lengths.min() < 1 or lengths.max() > room:
+            return None
+        chars = chars[:, :lengths.max()] - 48
+        inside = np.arange(chars.shape[1]) < lengths[:, None]
+        if not ((chars >= 0) & (chars <= 9) | ~inside).all():
+            return None
+        if ((chars[:, 0] == 0) & (lengths > 1)).any():
+            return None
+        left = np.where(inside, chars, 0) @ 10 ** np.arange(chars.shape[1] - 1, -1, -1, dtype=np.int64)
+        return fields + [left // 10 ** (chars.shape[1] - lengths)]
+
+    @property
+    def fixed_digits(self):
+        return sum(w for w in self.widths if w)
+
+    def format(self, fields):
+        """Strings for the field values"""
+        text = pd.Series(self.literals[0], index=range(len(fields[0])), dtype=object)
+        for values, width, literal in zip(fields, self.widths, self.literals[1:]):
+            digits = pd.Series(values).astype(str)
+            text = text + (digits.str.zfill(width) if width else digits) + literal
+        return text.to_numpy(dtype=object)
+
+    def sort_keys(self, fields):
+        """Keys that order the values as strings: (fixed digits, left-aligned last field, its length)"""
+        fixed = np.zeros(len(fields[0]), dtype=np.int64)
+        for values, width in zip(fields, self.widths):
+            if width:
+                fixed = fixed * 10 ** width + values
+        if not self.variable:
+            return [fixed]
+        last = fields[-1]
+        lengths = np.floor(np.log10(np.maximum(last, 1))).astype(np.int64) + 1
+        width = MAX_PATTERN_DIGITS - self.fixed_digits
+        return [fixed, last * 10 ** (width - lengths), lengths]
+
+# ---------------------------------------------------------------------------
+# Decimals
+# ---------------------------------------------------------------------------
+
+def _scaled(values, scale):
+    """values * scale as int64 if that round-trips exactly, else None"""
+    scaled = np.round(values * scale)
+    if not np.isfinite(scaled).all() or np.abs(scaled).max(initial=0) >= 2 ** 53:
+        return None
+    if not np.array_equal(scaled / scale, values):
+        return None
+    return scaled.astype(np.int64)
+
+def decimal_scale(values):
+    """Smallest power of ten that turns every value into an exact integer, or None"""
+    for scale in DECIMAL_SCALES:
+        if _scaled(values, scale) is not None:
+            return scale
+    return None
+
+# ---------------------------------------------------------------------------
+# Columns
+# ---------------------------------------------------------------------------
+
+def _object_size(values):
+    return values.nbytes + sum(sys.getsizeof(v) for v in values) if values.dtype.kind == 'O' else values.nbytes
+
+class EncodedColumn:
+    """A column stored as encoded segments.
+
+    streams holds the integer segments: one stream of code + 1 (dictionary),
+    value (value), value * scale (decimal) or one stream per digit field
+    (pattern). raw columns keep float64 segments.
+    """
+
+    def __init__(self, encoding, n, streams=(), dictionary=None, pattern=None, raw=None, dtype=None, scale=1):
+        self.encoding = encoding
+        self.n = n
+        self.streams = [list(s) for s in streams]
+        self.dictionary = dictionary
+        self.pattern = pattern
+        self.raw = raw
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self.scale = scale
+        self._codes = None
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def nbytes(self):
+        size = sum(segment.nbytes for stream in self.streams for segment in stream)
+        if self.raw is not None:
+            size += sum(segment.nbytes for segment in self.raw)
+        return size + self.dictionary_bytes
+
+    @property
+    def dictionary_bytes(self):
+        return _object_size(self.dictionary) if self.dictionary is not None else 0
+
+    @property
+    def cardinality(self):
+        if self.dictionary is not None:
+            return len(self.dictionary)
+        return len(self.codes()[1]) if self.encoding == 'pattern' else None
+
+    @property
+    def segments(self):
+        return len(self.streams[0]) if self.streams else len(self.raw or ())
+
+    @property
+    def bits(self):
+        """Bits per row, dictionary excluded"""
+        return (self.nbytes - self.dictionary_bytes) * 8 / max(self.n, 1)
+
+    def codes(self):
+        """(codes, sorted distinct values) for dictionary and pattern columns (-1 = BLANK), else None"""
+        if self.encoding == 'dictionary':
+            return _decode_stream(self.streams[0]) - 1, self.dictionary
+        if self.encoding != 'pattern':
+            return None
+        if self._codes is None:
+            fields = [_decode_stream(stream) for stream in self.streams]
+            keys = self.pattern.sort_keys(fields)
+            order = np.lexsort(keys[::-1])
+            first = np.concatenate(([True], np.logical_or.reduce([np.diff(k[order]) != 0 for k in keys])))
+            codes = np.empty(self.n, dtype=np.int64)
+            codes[order] = np.cumsum(first) - 1
+            # Cache the distinct values by their first row; the strings are only built on request
+            self._codes = codes, order[first]
+        codes, rows = self._codes
+        uniques = self.pattern.format([_decode_stream(stream)[rows] for stream in self.streams])
+        return codes, uniques
+
+    def values(self):
+        """The column as load_table() would return it"""
+        if self.encoding == 'raw':
+            return np.concatenate(self.raw) if self.raw else np.zeros(0)
+        if self.encoding == 'value':
+            return _decode_stream(self.streams[0])
+        if self.encoding == 'decimal':
+            return _decode_stream(self.streams[0]) / self.scale
+        if self.encoding == 'pattern':
+            return self.pattern.format([_decode_stream(stream) for stream in self.streams])
+        codes = _decode_stream(self.streams[0]) - 1
+        return _dictionary_values(self.dictionary, codes)
+
+    def take(self, rows):
+        """A new column with the given rows, re-encoded"""
+        if self.encoding == 'raw':
+            values = self.values()[rows]
+            raw = [values[s:s + SEGMENT_ROWS] for s in range(0, len(values), SEGMENT_ROWS)]
+            return EncodedColumn('raw', len(values), raw=raw, dtype=self.dtype)
+        streams = [_segments(_decode_stream(stream)[rows]) for stream in self.streams]
+        return EncodedColumn(self.encoding, len(rows), streams, self.dictionary, self.pattern, dtype=self.dtype,
+                             scale=self.scale)
+
+def _dictionary_values(dictionary, codes):
+    values = dictionary[np.maximum(codes, 0)] if len(dictionary) else np.full(len(codes), None, dtype=object)
+    blank = codes < 0
+    if not blank.any():
+        return values
+    if values.dtype.kind == 'f':
+        values = values.copy()
+        values[blank] = np.nan
+        return values
+    values = values.astype(object)
+    values[blank] = None
+    return values
+
+# ---------------------------------------------------------------------------
+# Tables
+# ---------------------------------------------------------------------------
+
+class EncodedTable(Mapping):
+    """Column name -> values, like a load_table() dict, backed by EncodedColumns.
+
+    A column is decoded the first time its values are read and kept; columns
+    only filtered, grouped or counted through their codes stay encoded.
+    """
+
+    def __init__(self, columns):
+        self.columns = dict(columns)
+        self.n_rows = len(next(iter(self.columns.values()), ()))
+        self._decoded = {}
+
+    def __getitem__(self, name):
+        if name not in self._decoded:
+            self._decoded[name] = self.columns[name].values()
+        return self._decoded[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def encoded(self, name):
+        return self.columns[name]
+
+    @property
+    def nbytes(self):
+        """Encoded size; decoded copies are not counted"""
+        return sum(column.nbytes for column in self.columns.values())
+
+    def take(self, rows):
+        """A new table with the given rows"""
+        return EncodedTable({name: column.take(rows) for name, column in self.columns.items()})
+
+# ---------------------------------------------------------------------------
+# Building columns chunk by chunk
+# ---------------------------------------------------------------------------
+
+def _chunk_kind(values):
+    if values.dtype.kind == 'f':
+        return 'null' if np.isnan(values).all() else 'float'
+    if values.dtype.kind in 'iu':
+        return 'int'
+    if values.dtype.kind == 'b':
+        return 'bool'
+    return 'null' if pd.isna(values).all() else 'object'
+
+# How chunks of two kinds combine (pandas' dtype for the whole file)
+_COMBINED = {
+    frozenset(('int', 'float')): 'float',
+    frozenset(('int', 'null')): 'float',
+    frozenset(('float', 'null')): 'float',
+    frozenset(('bool', 'null')): 'object',
+    frozenset(('bool', 'object')): 'object',
+    frozenset(('object', 'null')): 'object',
+}
+
+class ColumnBuilder:
+    """Encodes the chunks of one column as they arrive.
+
+    The encoding follows the data: integers are value-encoded, floats use a
+    dictionary until it grows too large, text uses a pattern when the values
+    are mostly distinct keys and a dictionary otherwise. When a chunk does not
+    fit (a NaN among integers, a key that breaks the pattern), the segments
+    built so far are decoded and replayed into the new encoding.
+    """
+
+    def __init__(self):
+        self.kind = None
+        self.encoding = None
+        self.n = 0
+        self.pending_nulls = 0
+        self.chunks = []  # encoded segments, one entry per chunk
+        self.index = None
+        self.pattern = None
+        self.scale = 1
+
+    def add(self, values):
+        kind = _chunk_kind(values)
+        if self.kind is None:
+            if kind == 'null':
+                self.pending_nulls += len(values)
+                return
+            self.kind = kind
+            self._start(values)
+            if self.pending_nulls:
+                nulls, self.pending_nulls = self.pending_nulls, 0
+                self.add(np.full(nulls, np.nan))
+        elif kind != self.kind and not (kind == 'null' and self.kind == 'object'):
+            combined = _COMBINED.get(frozenset((kind, self.kind)), 'object')
+            if combined != self.kind:
+                self._convert(combined)
+            values = self._as_kind(values)
+        self.n += len(values)
+        self._append(values)
+
+    def _as_kind(self, values):
+        if self.kind == 'float':
+            return values.astype(float)
+        if self.kind == 'object' and values.dtype.kind != 'O':
+            if values.dtype.kind == 'f':
+                text = values.astype(object)
+                text[np.isnan(values)] = None
+                return np.array([v if v is None else (str(int(v)) if float(v).is_integer() else str(v))
+                                 for v in text], dtype=object)
+            return values.astype(str).astype(object) if values.dtype.kind in 'iu' else values.astype(object)
+        return values
+
+    def _start(self, values):
+        if self.kind == 'int':
+            self.encoding = 'value'
+        elif self.kind in ('float', 'bool'):
+            self.encoding = 'dictionary'
+        else:
+            self.encoding = 'dictionary'
+            text = values[~pd.isna(values)]
+            distinct = len(pd.unique(text))
+            if (distinct * 2 > len(text) or distinct >= MIN_PATTERN_DISTINCT) and isinstance(text[0], str):
+                self.pattern = Pattern.infer(text)
+                if self.pattern is not None:
+                    self.encoding = 'pattern'
+
+    def _convert(self, kind):
+        """Replay the chunks built so far into a new kind of column"""
+        decoded = [self._decode_chunk(chunk) for chunk in self.chunks]
+        self.kind = kind
+        self.encoding = None
+        self.chunks = []
+        self.index = None
+        self.pattern = None
+        self.scale = 1
+        self.n = 0
+        first = next((d for d in decoded if _chunk_kind(d) != 'null'), None)
+        if first is None:
+            self.encoding = 'dictionary'
+        else:
+            self._start(self._as_kind(first))
+        for values in decoded:
+            values = self._as_kind(values)
+            self.n += len(values)
+            self._append(values)
+
+    def _decode_chunk(self, chunk):
+        if self.encoding == 'value':
+            return chunk.decode()
+        if self.encoding == 'decimal':
+            return chunk.decode() / self.scale
+        if self.encoding == 'raw':
+            return chunk
+        if self.encoding == 'pattern':
+            return self.pattern.format([segment.decode() for segment in chunk])
+        return _dictionary_values(np.asarray(self.index), chunk.decode() - 1)
+
+    def _append(self, values):
+        if self.encoding == 'value':
+            self.chunks.append(IntSegment(values))
+        elif self.encoding == 'decimal':
+            scaled = _scaled(values, self.scale)
+            if scaled is None:
+                self.chunks = [self._decode_chunk(chunk) for chunk in self.chunks]
+                self.encoding = 'raw'
+                self._append(values)
+                return
+            self.chunks.append(IntSegment(scaled))
+        elif self.encoding == 'raw':
+            self.chunks.append(np.asarray(values, dtype=float))
+        elif self.encoding == 'pattern':
+            fields = self.pattern.fields(values) if not pd.isna(values).any() else None
+            if fields is None:
+                self._to_dictionary()
+                self._append(values)
+                return
+            self.chunks.append([IntSegment(f) for f in fields])
+        else:
+            self._append_codes(values)
+
+    def _to_dictionary(self):
+        decoded = [self._decode_chunk(chunk) for chunk in self.chunks]
+        self.encoding = 'dictionary'
+        self.pattern = None
+        self.chunks = []
+        for values in decoded:
+            self._append_codes(values)
+
+    def _append_codes(self, values):
+        """Codes into a dictionary kept in first-seen order; sorted once all chunks are in"""
+        valid = ~pd.isna(values) if values.dtype.kind != 'f' else ~np.isnan(values)
+        local_codes, uniques = pd.factorize(values[valid])
+        dtype = float if self.kind == 'float' else object
+        uniques = np.asarray(uniques, dtype=dtype)
+        if self.index is None:
+            self.index = pd.Index([], dtype=dtype)
+        positions = self.index.get_indexer(uniques)
+        new = positions < 0
+        if new.any():
+            positions[new] = len(self.index) + np.arange(np.count_nonzero(new))
+            self.index = self.index.append(pd.Index(uniques[new], dtype=self.index.dtype))
+        codes = np.zeros(len(values), dtype=np.int64)
+        codes[valid] = positions[local_codes] + 1
+        self.chunks.append(IntSegment(codes))
+        if self.kind == 'float' and len(self.index) > MAX_FLOAT_DICTIONARY and len(self.index) * 8 > self.n:
+            # Too many distinct floats: scaled integers if the values allow, else plain float64
+            decoded = [self._decode_chunk(chunk) for chunk in self.chunks]
+            self.index = None
+            self.chunks = []
+            scale = decimal_scale(np.concatenate(decoded))
+            if scale is None:
+                self.encoding = 'raw'
+                self.chunks = decoded
+                return
+            self.encoding = 'decimal'
+            self.scale = scale
+            for values in decoded:
+                self._append(values)
+
+    def finish(self):
+        if self.kind is None:
+            self.kind = 'float'
+            self.encoding = 'raw'
+            self.chunks = [np.full(self.pending_nulls, np.nan)] if self.pending_nulls else []
+            self.n = self.pending_nulls
+        if self.encoding == 'raw':
+            return EncodedColumn('raw', self.n, raw=self.chunks, dtype=float)
+        if self.encoding == 'value':
+            return EncodedColumn('value', self.n, [self.chunks], dtype=np.int64)
+        if self.encoding == 'decimal':
+            return EncodedColumn('decimal', self.n, [self.chunks], dtype=float, scale=self.scale)
+        if self.encoding == 'pattern':
+            return EncodedColumn('pattern', self.n, list(zip(*self.chunks)), pattern=self.pattern, dtype=object)
+        # Sort the dictionary and renumber the codes; 0 stays BLANK
+        uniques = np.asarray(self.index if self.index is not None else [], dtype=object)
+        rank, dictionary = pd.factorize(uniques, sort=True)
+        dictionary = np.asarray(dictionary)
+        if self.kind == 'float':
+            dictionary = dictionary.astype(float)
+        elif self.kind == 'bool':
+            dictionary = dictionary.astype(bool)
+        remap = np.concatenate(([0], rank + 1))
+        segments = [IntSegment(remap[chunk.decode()]) for chunk in self.chunks]
+        return EncodedColumn('dictionary', self.n, [segments], dictionary=dictionary, dtype=dictionary.dtype)
+
+def _chunk_values(series):
+    if series.dtype.kind in 'biuf':
+        return series.to_numpy()
+    return series.to_numpy(dtype=object, na_value=None)
+
+def load_encoded_table(path, chunk_rows=SEGMENT_ROWS):
+    """Read a CSV file chunk by chunk into an EncodedTable"""
+    builders = {}
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        for name in chunk.columns:
+            builders.setdefault(name, ColumnBuilder()).add(_chunk_values(chunk[name]))
+    return EncodedTable({name: builder.finish() for name, builder in builders.items()})
+
+def dataframe_bytes(path, chunk_rows=SEGMENT_ROWS):
+    """Memory of the CSV as a pandas DataFrame (deep), measured chunk by chunk"""
+    return sum(int(chunk.memory_usage(deep=True, index=False).sum())
+               for chunk in pd.read_csv(path, chunksize=chunk_rows))
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def _mb(size):
+    return f'{size / (1 << 20):,.1f}'
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Encode the data/ tables into the compressed column store.')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of table CSV files')
+    parser.add_argument('--compare', action='store_true', help='also measure the pandas DataFrame memory')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    paths = sorted(glob.glob(os.path.join(args.data, '*.csv')))
+    if not paths:
+        print(f"Error: no CSV files in {args.data}")
+        sys.exit(1)
+
+    total_encoded = total_frame = 0
+    header = f"{'table':<16} {'rows':>12} {'encoded MB':>11}"
+    if args.compare:
+        header += f" {'DataFrame MB':>13} {'ratio':>6}"
+    print(header + f" {'load s':>7}")
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        started = time.perf_counter()
+        table = load_encoded_table(path)
+        elapsed = time.perf_counter() - started
+        encoded, rows = table.nbytes, table.n_rows
+        line = f"{name:<16} {rows:>12,} {_mb(encoded):>11}"
+        total_encoded += encoded
+        if args.compare:
+            frame = dataframe_bytes(path)
+            total_frame += frame
+            line += f" {_mb(frame):>13} {frame / max(encoded, 1):>5.1f}x"
+        print(line + f" {elapsed:>7.2f}")
+    line = f"{'total':<16} {'':>12} {_mb(total_encoded):>11}"
+    if args.compare:
+        line += f" {_mb(total_frame):>13} {total_frame / max(total_encoded, 1):>5.1f}x"
+    print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1563 @@
+#!/usr/bin/env python3
+"""
+Compile the DAX measures in legacy/Model.bim into vectorized Python evaluators.
+
+Measures are parsed into JSON ASTs (cached on disk, keyed by a hash of the
+expression text) and compiled into closures that run over the StarModel
+columns of query_engine.py. A query evaluates every measure for all groups of
+a grouping at once: each group is one filter context, so a matrix visual with
+thousands of cells is one vectorized pass per measure.
+
+Supported DAX: VAR/RETURN, arithmetic, comparisons, &, &&, ||, NOT,
+CALCULATE/CALCULATETABLE with boolean, VALUES, ALL/REMOVEFILTERS, KEEPFILTERS
+and DATEADD/SAMEPERIODLASTYEAR/DATESYTD/DATESQTD/DATESMTD filters,
+TOTALYTD/TOTALQTD/TOTALMTD, SUM, COUNT, AVERAGE, MIN, MAX, DISTINCTCOUNT,
+COUNTROWS, VALUES, INTERSECT, EXCEPT, SELECTEDVALUE, DIVIDE, IF, ISBLANK,
+BLANK, ABS, YEAR, MONTH, FORMAT and measure references. Anything else
+(iterators such as MAXX, TREATAS, ADDCOLUMNS, ...) is reported per measure
+by --report.
+
+Fact tables are sorted by their date column when loaded. Filters that depend
+on the date alone (the date column, dim_date attributes, YEAR(date) = year,
+shifted and period-to-date dates) select contiguous row ranges of that order
+instead of scanning the table.
+
+Usage:
+    python dax_compiler.py --report
+    python dax_compiler.py --measure curr_year_sales --measure prev_year_sales \\
+        --group-by dim_date.Year [--filter dim_date.Quarter=1,2] [--data DIR]
+    python dax_compiler.py --all --group-by dim_date.YearMonth --json
+
+Options:
+    --model PATH      Model.bim with the measures and relationships
+    --ast-cache PATH  parsed-AST cache file ('' to disable)
+    --encoded         keep the tables in the compressed column store
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import OrderedDict, namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+
+from model_index import load_model_index
+from query_engine import (DEFAULT_DATA_DIR, DEFAULT_MODEL_PATH, SourceFingerprints, StarModel,
+                          coerce_value, load_table, parse_column_ref, parse_filter, ragged_positions,
+                          table_paths)
+
+PARSER_VERSION = 1
+DEFAULT_AST_CACHE = os.path.join(tempfile.gettempdir(), 'dax_ast_cache.json')
+DEFAULT_CACHE_MB = 64
+
+class DaxError(ValueError):
+    """A measure that cannot be parsed, compiled or evaluated"""
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<space>\s+|--[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<table>'(?:[^']|'')*')
+  | (?P<bracket>\[[^\]]*\])
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_.]*)
+  | (?P<op><=|>=|<>|==|&&|\|\||[-+*/^&=<>(),{}])
+''', re.VERBOSE | re.DOTALL)
+
+# Binary operators from lowest to highest precedence
+PRECEDENCE = [('||',), ('&&',), ('=', '==', '<>', '<', '>', '<=', '>='), ('&',), ('+', '-'), ('*', '/'), ('^',)]
+COMPARISON_LEVEL = 2
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise DaxError(f"unexpected character {text[pos]!r} at offset {pos}")
+        if match.lastgroup != 'space':
+            tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    tokens.append(('end', ''))
+    return tokens
+
+class Parser:
+    """Recursive-descent parser producing JSON-serializable list ASTs.
+
+    Nodes: ['num', v], ['str', s], ['col', table, column], ['table', name],
+    ['measure', name], ['name', ident], ['call', FUNC, [args]],
+    ['bin', op, left, right], ['neg', x], ['not', x], ['let', [[name, expr], ...], body]
+    """
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, word):
+        kind, text = self.peek()
+        if kind in ('op', 'ident') and text.upper() == word:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, word):
+        if not self.accept(word):
+            raise DaxError(f"expected {word!r}, found {self.peek()[1] or 'end of expression'!r}")
+
+    def parse(self):
+        if self.peek()[0] == 'end':
+            raise DaxError("empty expression")
+        node = self.expression()
+        if self.peek()[0] != 'end':
+            raise DaxError(f"unexpected {self.peek()[1]!r} after expression")
+        return node
+
+    def expression(self):
+        if not self.accept('VAR'):
+            return self.binary(0)
+        bindings = []
+        while True:
+            kind, name = self.next()
+            if kind != 'ident':
+                raise DaxError(f"expected a variable name after VAR, found {name!r}")
+            self.expect('=')
+            bindings.append([name, self.expression()])
+            if self.accept('RETURN'):
+                return ['let', bindings, self.expression()]
+            self.expect('VAR')
+
+    def binary(self, level):
+        if level == len(PRECEDENCE):
+            return self.unary()
+        if level == COMPARISON_LEVEL and self.accept('NOT'):
+            return ['not', self.binary(level)]
+        left = self.binary(level + 1)
+        while True:
+            kind, text = self.peek()
+            if kind != 'op' or text not in PRECEDENCE[level]:
+                return left
+            self.next()
+            left = ['bin', '=' if text == '==' else text, left, self.binary(level + 1)]
+
+    def unary(self):
+        if self.accept('-'):
+            return ['neg', self.unary()]
+        if self.accept('+'):
+            return self.unary()
+        return self.primary()
+
+    def primary(self):
+        kind, text = self.next()
+        if kind == 'number':
+            return ['num', float(text)]
+        if kind == 'string':
+            return ['str', text[1:-1].replace('""', '"')]
+        if kind == 'bracket':
+            return ['measure', text[1:-1]]
+        if kind == 'table':
+            name = text[1:-1].replace("''", "'")
+            if self.peek()[0] == 'bracket':
+                return ['col', name, self.next()[1][1:-1]]
+            return ['table', name]
+        if kind == 'ident':
+            if self.peek() == ('op', '('):
+                self.next()
+                args = []
+                if not self.accept(')'):
+                    while True:
+                        args.append(self.expression())
+                        if self.accept(')'):
+                            break
+                        self.expect(',')
+                return ['call', text.upper(), args]
+            if self.peek()[0] == 'bracket':
+                return ['col', text, self.next()[1][1:-1]]
+            return ['name', text]
+        if (kind, text) == ('op', '('):
+            node = self.expression()
+            self.expect(')')
+            return node
+        raise DaxError(f"unexpected {text or 'end of expression'!r}")
+
+def parse_dax(text):
+    return Parser(text).parse()
+
+class AstCache:
+    """Parsed ASTs stored in a JSON file keyed by a hash of the expression text"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('version') == PARSER_VERSION:
+                self.entries = data.get('asts', {})
+
+    def parse(self, text):
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        ast = self.entries.get(key)
+        if ast is None:
+            ast = parse_dax(text)
+            self.entries[key] = ast
+            self.dirty = True
+        return ast
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': PARSER_VERSION, 'asts': self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+def read_measures(model_path):
+    """Measure name -> (home table, DAX expression) from a Model.bim file"""
+    index = load_model_index(model_path)
+    return {name: (measure['table'], measure['expression']) for name, measure in index.measures.items()}
+
+# ---------------------------------------------------------------------------
+# Values
+#
+# Scalars are NumPy arrays with one element per group (float with NaN for
+# BLANK, int for counts that no group leaves BLANK, or object with None).
+# Inside a CALCULATE boolean filter they are
+# broadcast as (groups, 1) against the filtered column's distinct values
+# (1, values).
+# ---------------------------------------------------------------------------
+
+def _is_blank(x):
+    x = np.asarray(x)
+    if x.dtype.kind == 'f':
+        return np.isnan(x)
+    if x.dtype.kind in 'OUS':
+        return pd.isna(x) if x.ndim else np.asarray(pd.isna(x.item()))
+    return np.zeros(x.shape, dtype=bool)
+
+def _num(x):
+    x = np.asarray(x)
+    if x.dtype.kind == 'O':
+        return pd.to_numeric(pd.Series(x.ravel()), errors='coerce').to_numpy(dtype=float).reshape(x.shape)
+    return x.astype(float)
+
+def _counts(counts):
+    """Counts per group: integers, or floats with NaN (BLANK) when some group counts nothing"""
+    counts = np.asarray(counts).astype(np.int64)
+    return counts if counts.all() else np.where(counts > 0, counts, np.nan)
+
+def _zero_blank(x):
+    return np.where(np.isnan(x), 0.0, x)
+
+def _truth(x):
+    x = np.asarray(x)
+    if x.dtype.kind == 'b':
+        return x
+    if x.dtype.kind in 'iuf':
+        return _zero_blank(x.astype(float)) != 0
+    return ~_is_blank(x)
+
+def _to_text(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, (bool, np.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (float, np.floating)):
+        return f'{value:.15g}'
+    return str(value)
+
+_text = np.vectorize(_to_text, otypes=[object])
+
+def _as_dates(x):
+    x = np.asarray(x)
+    if x.dtype.kind == 'M':
+        return x.astype('datetime64[D]')
+    if x.dtype.kind == 'f':
+        return np.full(x.shape, np.datetime64('NaT'), dtype='datetime64[D]')
+    dates = pd.to_datetime(pd.Series(x.ravel(), dtype=object), errors='coerce')
+    return dates.to_numpy(dtype='datetime64[D]').reshape(x.shape)
+
+def _period_start(dates, unit):
+    """First day of the year ('Y'), quarter ('Q') or month ('M') of each date"""
+    if unit == 'Y':
+        return dates.astype('datetime64[Y]').astype('datetime64[D]')
+    months = dates.astype('datetime64[M]')
+    if unit == 'Q':
+        months = months - months.astype(np.int64) % 3
+    return months.astype('datetime64[D]')
+
+def _date_part(x, unit):
+    dates = _as_dates(x)
+    if unit == 'Y':
+        part = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    else:
+        part = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    return np.where(np.isnat(dates), np.nan, part.astype(float))
+
+def _arithmetic(op, a, b):
+    a, b = _num(a), _num(b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if op in ('+', '-'):
+            both_blank = np.isnan(a) & np.isnan(b)
+            result = _zero_blank(a) + _zero_blank(b) if op == '+' else _zero_blank(a) - _zero_blank(b)
+            return np.where(both_blank, np.nan, result)
+        if op == '*':
+            return a * b
+        if op == '/':
+            return np.where(np.isnan(a), np.nan, a / _zero_blank(b))
+        return np.power(a, b)
+
+COMPARISONS = {
+    '=': np.equal, '<>': np.not_equal, '<': np.less, '>': np.greater, '<=': np.less_equal, '>=': np.greater_equal,
+}
+
+def _compare(op, a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype.kind in 'OUS' or b.dtype.kind in 'OUS':
+        if a.dtype.kind in 'biuf' and b.dtype.kind in 'OUS' or b.dtype.kind in 'biuf' and a.dtype.kind in 'OUS':
+            a, b = _num(a), _num(b)
+        else:
+            a, b = _text(a).astype(str), _text(b).astype(str)
+            return COMPARISONS[op](a, b)
+    return COMPARISONS[op](_zero_blank(_num(a)), _zero_blank(_num(b)))
+
+def _where(condition, a, b):
+    condition = _truth(condition)
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype.kind in 'biuf' and b.dtype.kind in 'biuf':
+        return np.where(condition, _num(a), _num(b))
+    return np.where(condition, a.astype(object), b.astype(object))
+
+def _divide(a, b, alternate):
+    a, b = _num(a), _num(b)
+    invalid = np.isnan(b) | (b == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _where(invalid, alternate, a / np.where(invalid, 1.0, b))
+
+def compile_format(spec):
+    """Formatter for a .NET-style custom number format ('#,##0.00', '0.0%', '$ 0.0 M', 'pos;neg;zero')"""
+    sections = [_format_section(section) for section in spec.split(';')]
+
+    def format_value(value):
+        if value is None or isinstance(value, str):
+            return '' if value is None else value
+        value = float(value)
+        if np.isnan(value):
+            return ''
+        if np.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        if len(sections) >= 3 and value == 0:
+            return sections[2](0.0)[0]
+        if len(sections) >= 2 and value < 0:
+            return sections[1](-value)[0]
+        text, is_zero = sections[0](abs(value))
+        return '-' + text if value < 0 and not is_zero else text
+
+    return format_value
+
+def _format_section(section):
+    placeholders = [i for i, ch in enumerate(section) if ch in '0#']
+    if not placeholders:
+        return lambda value: (section, value == 0)
+    start, end = placeholders[0], placeholders[-1] + 1
+    core = section[start:end]
+    prefix, suffix = section[:start], section[end:]
+    scale = 1.0
+    while suffix.startswith(','):
+        scale /= 1000
+        suffix = suffix[1:]
+    scale *= 100 ** (prefix + suffix).count('%')
+    integer, _, fraction = core.partition('.')
+    grouping = ',' in integer
+    min_decimals = fraction.count('0')
+    max_decimals = fraction.count('0') + fraction.count('#')
+    quantum = Decimal(1).scaleb(-max_decimals)
+
+    def format_number(value):
+        number = Decimal(repr(value * scale)).quantize(quantum, rounding=ROUND_HALF_UP)
+        text = f'{number:{"," if grouping else ""}.{max_decimals}f}'
+        if max_decimals > min_decimals:
+            whole, _, decimals = text.partition('.')
+            decimals = decimals[:min_decimals] + decimals[min_decimals:].rstrip('0')
+            text = f'{whole}.{decimals}' if decimals else whole
+        if '0' not in integer and text.startswith('0'):
+            text = text[1:]
+        return prefix + text + suffix, number == 0
+
+    return format_number
+
+# ---------------------------------------------------------------------------
+# Filter contexts
+# ---------------------------------------------------------------------------
+
+# A filter on one column over its dictionary codes: either a mask shared by
+# every group, or sorted keys group * width + code (width = distinct values + 1,
+# the last code standing for BLANK). The digest identifies equal filters.
+ColumnFilter = namedtuple('ColumnFilter', 'mask keys digest')
+ValueSet = namedtuple('ValueSet', 'column width keys')
+RowGroups = namedtuple('RowGroups', 'rows row_sig n_sigs pair_sig pair_g')
+
+def column_filter(mask=None, keys=None):
+    data = np.ascontiguousarray(mask if keys is None else keys)
+    digest = hashlib.blake2b(data.tobytes(), digest_size=16).digest() + (b'm' if keys is None else b'k')
+    return ColumnFilter(mask, keys, digest)
+
+def _join_groups(item_sig, pair_sig, pair_g, n_sigs):
+    """Expand items by signature into (item, group) pairs using the (signature, group) pairs"""
+    order = np.argsort(pair_sig, kind='stable')
+    counts = np.bincount(pair_sig, minlength=n_sigs)
+    starts = np.cumsum(counts) - counts
+    lengths = counts[item_sig]
+    item = np.repeat(np.arange(len(item_sig)), lengths)
+    return item, pair_g[order][ragged_positions(starts[item_sig], lengths)]
+
+def _contains(sorted_keys, values):
+    index = np.minimum(np.searchsorted(sorted_keys, values), max(len(sorted_keys) - 1, 0))
+    return sorted_keys[index] == values if len(sorted_keys) else np.zeros(len(values), dtype=bool)
+
+def _signatures(columns):
+    """Distinct code combinations: id of each row's combination and each combination's codes"""
+    combined = columns[0]
+    for column in columns[1:]:
+        combined = np.unique(combined, return_inverse=True)[1].reshape(-1)
+        combined = combined * (int(column.max(initial=0)) + 1) + column
+    _, first, row_sig = np.unique(combined, return_index=True, return_inverse=True)
+    return row_sig.reshape(-1), len(first), [column[first] for column in columns]
+
+def _context_key(filters):
+    """Canonical form of a filter context: the filtered columns and a digest of their filters"""
+    return frozenset((column, f.digest) for column, f in filters.items())
+
+class FilterContext:
+    """Per-group filters of one evaluation; caches rows and measure values"""
+
+    def __init__(self, evaluator, n_groups, filters, shared=None):
+        self.evaluator = evaluator
+        self.star = evaluator.star
+        self.n_groups = n_groups
+        self.filters = filters
+        self.key = _context_key(filters)
+        # Contexts derived from the same root, by filters: CALCULATEs that end
+        # up with equal filters share rows and measure values
+        self._shared = {} if shared is None else shared
+        self._row_groups = {}
+        self._value_keys = {}
+        self._measures = {}
+
+    def width(self, table, column):
+        return len(self.star.dictionary(table, column)[1]) + 1
+
+    def derive(self, modifications):
+        filters = dict(self.filters)
+        for action, table, column, new_filter in sorted(modifications, key=lambda m: m[0] != 'remove'):
+            if action == 'remove':
+                for key in [k for k in filters if k[0] == table and column in (None, k[1])]:
+                    del filters[key]
+                if table is None:
+                    filters.clear()
+            elif action == 'replace_table':
+                for key in [k for k in filters if k[0] == table]:
+                    del filters[key]
+                filters[(table, column)] = new_filter
+            elif action == 'keep' and (table, column) in filters:
+                filters[(table, column)] = self._intersect((table, column), filters[(table, column)], new_filter)
+            else:
+                filters[(table, column)] = new_filter
+        key = _context_key(filters)
+        if key not in self._shared:
+            self._shared[key] = FilterContext(self.evaluator, self.n_groups, filters, self._shared)
+        return self._shared[key]
+
+    def _keys(self, column, group_filter):
+        if group_filter.keys is not None:
+            return group_filter.keys
+        width = self.width(*column)
+        codes = np.flatnonzero(group_filter.mask)
+        return (np.arange(self.n_groups)[:, None] * width + codes[None, :]).ravel()
+
+    def _intersect(self, column, a, b):
+        if a.mask is not None and b.mask is not None:
+            return column_filter(mask=a.mask & b.mask)
+        return column_filter(keys=np.intersect1d(self._keys(column, a), self._keys(column, b)))
+
+    def row_groups(self, table):
+        """Rows of table visible in any group, and which groups see them.
+
+        Rows are grouped into signatures (distinct codes of the per-group
+        filter columns); (pair_sig, pair_g) lists the groups of each signature.
+        """
+        if table in self._row_groups:
+            return self._row_groups[table]
+        star = self.star
+        index = star.time_index(table)
+        dates = None
+        masks = []
+        keyed = []
+        # Slicers (the same filter in every group) on attributes of the bitmap index select rows from it
+        slicers = {(filter_table, column): star.dictionary(filter_table, column)[1][group_filter.mask]
+                   for (filter_table, column), group_filter in self.filters.items()
+                   if group_filter.mask is not None and star.reachable(table, filter_table)
+                   and (index is None or star.date_codes(table, filter_table, column) is None)}
+        selected, rest = star.bitmap_mask(table, slicers) if slicers else (None, {})
+        for (filter_table, column), group_filter in self.filters.items():
+            if not star.reachable(table, filter_table) or ((filter_table, column) in slicers
+                                                          and (filter_table, column) not in rest):
+                continue
+            width = self.width(filter_table, column)
+            date_codes = star.date_codes(table, filter_table, column) if index is not None else None
+            if date_codes is not None:
+                # Filters that depend on the date alone select date ranges of the time index
+                if group_filter.mask is not None:
+                    passed = group_filter.mask
+                else:
+                    passed = np.zeros(width, dtype=bool)
+                    passed[group_filter.keys % width] = True
+                passed = np.append(passed[:width - 1], False)[date_codes]
+                dates = passed if dates is None else dates & passed
+                if group_filter.mask is not None:
+                    continue
+            codes = star.related_codes(table, filter_table, column)
+            if group_filter.mask is not None:
+                masks.append((codes, group_filter.mask))
+            else:
+                keyed.append((codes, group_filter.keys, width))
+        # Expand signatures through the filter with the fewest groups per value first
+        keyed.sort(key=lambda k: len(k[1]) / k[2])
+        rows = np.arange(star.rows[table]) if dates is None else index.rows(dates)
+        if selected is not None:
+            rows = rows[selected[rows]]
+        for codes, mask in masks:
+            rows = rows[np.append(mask, False)[codes[rows]]]
+        if not keyed:
+            groups = RowGroups(rows, np.zeros(len(rows), dtype=np.int64), 1,
+                               np.zeros(self.n_groups, dtype=np.int64), np.arange(self.n_groups))
+        else:
+            columns = [codes[rows] for codes, _, _ in keyed]
+            matched = np.logical_and.reduce([c >= 0 for c in columns])
+            if not matched.all():
+                rows = rows[matched]
+                columns = [c[matched] for c in columns]
+            if not len(rows):
+                groups = RowGroups(rows, rows, 0, rows, rows)
+            else:
+                row_sig, n_sigs, sig_codes = _signatures(columns)
+                keys, width = keyed[0][1], keyed[0][2]
+                pair_sig, pair_g = _join_groups(sig_codes[0], keys % width, keys // width, width)
+                for codes, (_, keys, width) in zip(sig_codes[1:], keyed[1:]):
+                    keep = _contains(keys, pair_g * width + codes[pair_sig])
+                    pair_sig, pair_g = pair_sig[keep], pair_g[keep]
+                groups = RowGroups(rows, row_sig, n_sigs, pair_sig, pair_g)
+        self._row_groups[table] = groups
+        return groups
+
+    def _per_group(self, groups, per_sig):
+        return np.bincount(groups.pair_g, weights=per_sig[groups.pair_sig], minlength=self.n_groups)
+
+    def aggregate(self, func, table, column=None):
+        """SUM, COUNT, AVERAGE, MIN, MAX or COUNTROWS for every group (NaN = BLANK)"""
+        groups = self.row_groups(table)
+        if func == 'COUNTROWS':
+            return _counts(self._per_group(groups, np.bincount(groups.row_sig, minlength=groups.n_sigs)))
+        values = self.star.column(table, column)[groups.rows]
+        valid = ~_is_blank(values)
+        row_sig = groups.row_sig[valid]
+        counts = self._per_group(groups, np.bincount(row_sig, minlength=groups.n_sigs))
+        if func in ('MIN', 'MAX'):
+            codes, uniques = self.star.dictionary(table, column)
+            codes = codes[groups.rows][valid]
+            reduce, empty = (np.minimum, len(uniques)) if func == 'MIN' else (np.maximum, -1)
+            sig_best = np.full(groups.n_sigs, empty, dtype=np.int64)
+            reduce.at(sig_best, row_sig, codes)
+            best = np.full(self.n_groups, empty, dtype=np.int64)
+            reduce.at(best, groups.pair_g, sig_best[groups.pair_sig])
+            found = counts > 0
+            if uniques.dtype.kind in 'biuf':
+                result = np.full(self.n_groups, np.nan)
+            else:
+                result = np.full(self.n_groups, None, dtype=object)
+            result[found] = uniques[best[found]]
+            return result
+        if func == 'COUNT':
+            return _counts(counts)
+        sums = self._per_group(groups, np.bincount(row_sig, weights=values[valid].astype(float),
+                                                   minlength=groups.n_sigs))
+        if func == 'AVERAGE':
+            sums = sums / np.where(counts > 0, counts, 1)
+        return np.where(counts > 0, sums, np.nan)
+
+    def value_keys(self, table, column):
+        """Distinct values of table[column] visible in each group, as sorted group * width + code keys"""
+        key = (table, column)
+        if key not in self._value_keys:
+            groups = self.row_groups(table)
+            width = self.width(table, column)
+            codes = self.star.dictionary(table, column)[0][groups.rows]
+            codes = np.where(codes < 0, width - 1, codes)
+            sig_values = np.unique(groups.row_sig * width + codes)
+            item, group = _join_groups(sig_values // width, groups.pair_sig, groups.pair_g, groups.n_sigs)
+            self._value_keys[key] = np.unique(group * width + (sig_values % width)[item])
+        return self._value_keys[key]
+
+    def values(self, table, column):
+        return ValueSet((table, column), self.width(table, column), self.value_keys(table, column))
+
+    def count_rows(self, value_set):
+        return _counts(np.bincount(value_set.keys // value_set.width, minlength=self.n_groups))
+
+    def selected_value(self, table, column, alternate):
+        keys = self.value_keys(table, column)
+        width = self.width(table, column)
+        group, code = keys // width, keys % width
+        counts = np.bincount(group, minlength=self.n_groups)
+        codes = np.full(self.n_groups, width - 1)
+        codes[group] = code
+        uniques = np.append(self.star.dictionary(table, column)[1].astype(object), None)
+        single = (counts == 1) & (codes < width - 1)
+        return _where(single, uniques[codes], alternate)
+
+    def measure(self, name):
+        if name not in self._measures:
+            cache = self.evaluator.cache
+            key = (name, self.n_groups, self.key)
+            value = cache.get(key) if cache is not None else _MISSING
+            if value is _MISSING:
+                value = self.evaluator.compiler.compile(name)(self, Env())
+                if cache is not None:
+                    cache.put(key, value, self.evaluator.dependencies(name, self.filters))
+            self._measures[name] = value
+        return self._measures[name]
+
+    # -- time intelligence ----------------------------------------------------
+
+    def shifted_dates(self, table, column, keys, years=0, months=0, days=0):
+        """Per-group date keys moved by the given interval (DATEADD)"""
+        width = self.width(table, column)
+        shift = self.evaluator.date_shift(table, column, years, months, days)
+        group, code = keys // width, keys % width
+        target = np.append(shift, -1)[np.where(code == width - 1, len(shift), code)]
+        found = target >= 0
+        return np.unique(group[found] * width + target[found])
+
+    def period_to_date(self, table, column, keys, unit='Y'):
+        """Dates from the start of the year, quarter or month up to the last per-group date key.
+
+        DATESYTD, DATESQTD and DATESMTD; the dates are sorted, so the period
+        start is a binary search.
+        """
+        width = self.width(table, column)
+        group, code = keys // width, keys % width
+        dated = code < width - 1
+        last = np.full(self.n_groups, -1)
+        np.maximum.at(last, group[dated], code[dated])
+        groups = np.flatnonzero(last >= 0)
+        dates = self.evaluator.dates(table, column)
+        first = np.searchsorted(dates, _period_start(dates[last[groups]], unit))
+        lengths = last[groups] - first + 1
+        codes = ragged_positions(first, lengths)
+        return np.repeat(groups, lengths) * width + codes
+
+    def year_dates(self, table, column, years):
+        """Per-group keys of the dates whose year is the group's year (YEAR(column) = years)"""
+        width = self.width(table, column)
+        dates = self.evaluator.dates(table, column)
+        years = np.broadcast_to(_num(years), (self.n_groups,))
+        with np.errstate(invalid='ignore'):
+            groups = np.flatnonzero(np.isfinite(years) & (years % 1 == 0))
+        starts = (years[groups].astype(np.int64) - 1970).astype('datetime64[Y]')
+        first = np.searchsorted(dates, starts.astype('datetime64[D]'))
+        lengths = np.searchsorted(dates, (starts + 1).astype('datetime64[D]')) - first
+        return np.repeat(groups, lengths) * width + ragged_positions(first, lengths)
+
+class Env:
+    """Variable bindings, plus the filtered column when evaluating a CALCULATE boolean filter"""
+
+    __slots__ = ('values', 'row')
+
+    def __init__(self, values=None, row=None):
+        self.values = values or {}
+        self.row = row
+
+    def bind(self, name, value):
+        values = dict(self.values)
+        values[name] = value
+        return Env(values, self.row)
+
+    def with_row(self, column, values):
+        return Env(self.values, (column, values))
+
+    def per_group(self, value):
+        if self.row is not None and isinstance(value, np.ndarray) and value.ndim == 1:
+            return value[:, None]
+        return value
+
+# ---------------------------------------------------------------------------
+# Compiler
+# ---------------------------------------------------------------------------
+
+AGGREGATE_FUNCTIONS = ('SUM', 'COUNT', 'AVERAGE', 'MIN', 'MAX')
+TIME_FILTER_FUNCTIONS = ('DATEADD', 'SAMEPERIODLASTYEAR', 'DATESYTD', 'DATESQTD', 'DATESMTD')
+PERIOD_TO_DATE = {'DATESYTD': 'Y', 'DATESQTD': 'Q', 'DATESMTD': 'M'}
+FILTER_ONLY_FUNCTIONS = TIME_FILTER_FUNCTIONS + ('ALL', 'REMOVEFILTERS', 'KEEPFILTERS')
+DATEADD_INTERVALS = {'YEAR': (1, 0, 0), 'QUARTER': (0, 3, 0), 'MONTH': (0, 1, 0), 'DAY': (0, 0, 1)}
+# Functions whose arguments are not evaluated against the filtered column
+TABLE_FUNCTIONS = ('VALUES', 'CALCULATETABLE', 'INTERSECT', 'EXCEPT')
+OPAQUE_FUNCTIONS = AGGREGATE_FUNCTIONS + ('DISTINCTCOUNT', 'COUNTROWS', 'VALUES', 'CALCULATE',
+                                          'CALCULATETABLE', 'SELECTEDVALUE') + FILTER_ONLY_FUNCTIONS
+
+def _names(node):
+    """Lower-cased identifiers referenced anywhere in an AST"""
+    if not isinstance(node, list) or not node:
+        return set()
+    if node[0] == 'name' and len(node) == 2 and isinstance(node[1], str):
+        return {node[1].lower()}
+    names = set()
+    for child in node:
+        names |= _names(child)
+    return names
+
+class Scope:
+    """Compile-time state: variables in scope, problems found, the filtered column"""
+
+    def __init__(self, problems, variables=frozenset(), row_column=None):
+        self.problems = problems
+        self.variables = variables
+        self.row_column = row_column
+
+    def with_variable(self, name):
+        return Scope(self.problems, self.variables | {name.lower()}, self.row_column)
+
+    def with_row_column(self, column):
+        return Scope(self.problems, self.variables, column)
+
+    def problem(self, message):
+        if message not in self.problems:
+            self.problems.append(message)
+        return _fail(message)
+
+def _fail(message):
+    def fail(ctx, env):
+        raise DaxError(message)
+    return fail
+
+class MeasureCompiler:
+    """Compiles Model.bim measures into functions of (FilterContext, Env)"""
+
+    def __init__(self, star, measures, ast_cache=None):
+        self.star = star
+        self.measures = measures
+        self.ast_cache = ast_cache or AstCache()
+        self._names = {name.lower(): name for name in measures}
+        self._compiled = {}
+        self._problems = {}
+        self._compiling = set()
+        self._tables = {}
+
+    def measure_name(self, name):
+        return self._names.get(name.lower())
+
+    def problems(self, name):
+        """Reasons the measure cannot be evaluated (empty if it compiles)"""
+        self.compile(name, strict=False)
+        return self._problems[name]
+
+    def compile(self, name, strict=True):
+        if name not in self._compiled:
+            self._compiling.add(name)
+            problems = []
+            try:
+                ast = self.ast_cache.parse(self.measures[name][1])
+            except DaxError as e:
+                problems.append(f"syntax error: {e}")
+                fn = _fail(problems[0])
+            else:
+                fn = self._compile(ast, Scope(problems))
+            self._compiling.discard(name)
+            self._compiled[name] = fn
+            self._problems[name] = problems
+        if strict and self._problems[name]:
+            raise DaxError(f"[{name}]: " + '; '.join(self._problems[name]))
+        return self._compiled[name]
+
+    def tables(self, name):
+        """Tables a measure reads, including through the measures it references"""
+        if name not in self._tables:
+            self._tables[name] = set()
+            tables = set()
+            self._collect_tables(self.ast_cache.parse(self.measures[name][1]), tables)
+            self._tables[name] = tables
+        return self._tables[name]
+
+    def _collect_tables(self, node, tables):
+        if not isinstance(node, list) or not node:
+            return
+        if node[0] in ('col', 'table', 'name') and isinstance(node[1], str):
+            try:
+                tables.add(self.star.resolve(node[1]))
+            except KeyError:
+                pass
+        elif node[0] == 'measure':
+            measure = self.measure_name(node[1])
+            if measure is not None:
+                tables |= self.tables(measure)
+        else:
+            for child in node:
+                self._collect_tables(child, tables)
+
+    # -- nodes ------------------------------------------------------------------
+
+    def _compile(self, node, scope):
+        kind = node[0]
+        if kind in ('num', 'str'):
+            value = node[1]
+            return lambda ctx, env: value
+        if kind == 'name':
+            return self._compile_name(node[1], scope)
+        if kind == 'col':
+            column = self._column(node, scope)
+            if column is None:
+                return _fail('unresolved column')
+            if column != scope.row_column:
+                return scope.problem(f"column {column[0]}[{column[1]}] used outside an aggregation")
+            return lambda ctx, env: env.row[1]
+        if kind == 'measure':
+            return self._compile_measure_ref(node[1], scope)
+        if kind == 'table':
+            return scope.problem(f"table expression '{node[1]}' is not supported here")
+        if kind == 'neg':
+            operand = self._compile(node[1], scope)
+            return lambda ctx, env: -_num(operand(ctx, env))
+        if kind == 'not':
+            operand = self._compile(node[1], scope)
+            return lambda ctx, env: ~_truth(operand(ctx, env))
+        if kind == 'bin':
+            return self._compile_binary(node[1], self._compile(node[2], scope), self._compile(node[3], scope))
+        if kind == 'let':
+            # Unused variables are never evaluated, as in DAX
+            used = _names(node[2])
+            live = set()
+            for name, expression in reversed(node[1]):
+                if name.lower() in used:
+                    live.add(name.lower())
+                    used |= _names(expression)
+            bindings = []
+            for name, expression in node[1]:
+                if name.lower() in live:
+                    bindings.append((name.lower(), self._compile(expression, scope)))
+                scope = scope.with_variable(name)
+            body = self._compile(node[2], scope)
+
+            def let(ctx, env):
+                for name, fn in bindings:
+                    env = env.bind(name, fn(ctx, env))
+                return body(ctx, env)
+            return let
+        if kind == 'call':
+            if node[1] in TABLE_FUNCTIONS:
+                return self._compile_table(node, scope)
+            handler = getattr(self, '_call_' + node[1], None)
+            if node[1] in FILTER_ONLY_FUNCTIONS:
+                return scope.problem(f"{node[1]} is only supported as a CALCULATE filter")
+            if handler is None:
+                return scope.problem(f"unsupported function {node[1]}")
+            return handler(node[2], scope)
+        return scope.problem(f"unsupported expression {kind}")
+
+    def _compile_name(self, name, scope):
+        key = name.lower()
+        if key in scope.variables:
+            return lambda ctx, env: env.per_group(env.values[key])
+        if name.upper() in ('TRUE', 'FALSE'):
+            value = np.bool_(name.upper() == 'TRUE')
+            return lambda ctx, env: value
+        return scope.problem(f"unknown name {name}")
+
+    def _compile_measure_ref(self, name, scope):
+        measure = self.measure_name(name)
+        if measure is None:
+            return scope.problem(f"unknown measure [{name}]")
+        if measure in self._compiling:
+            return scope.problem(f"circular reference to [{measure}]")
+        if self.problems(measure):
+            return scope.problem(f"depends on [{measure}]")
+        return lambda ctx, env: env.per_group(ctx.measure(measure))
+
+    def _compile_binary(self, op, left, right):
+        if op in COMPARISONS:
+            return lambda ctx, env: _compare(op, left(ctx, env), right(ctx, env))
+        if op == '&':
+            return lambda ctx, env: _text(left(ctx, env)) + _text(right(ctx, env))
+        if op == '&&':
+            return lambda ctx, env: _truth(left(ctx, env)) & _truth(right(ctx, env))
+        if op == '||':
+            return lambda ctx, env: _truth(left(ctx, env)) | _truth(right(ctx, env))
+        return lambda ctx, env: _arithmetic(op, left(ctx, env), right(ctx, env))
+
+    def _column(self, node, scope):
+        if node[0] != 'col':
+            scope.problem("expected a column reference")
+            return None
+        try:
+            return self.star.resolve(node[1], node[2])
+        except KeyError as e:
+            scope.problem(f"{e.args[0]} in the data")
+            return None
+
+    def _table(self, node, scope):
+        if node[0] in ('table', 'name'):
+            try:
+                return self.star.resolve(node[1])
+            except KeyError:
+                pass
+        scope.problem("expected a table reference")
+        return None
+
+    def _arity(self, name, args, scope, low, high=None):
+        high = low if high is None else high
+        if not low <= len(args) <= high:
+            scope.problem(f"{name} expects {low}{'' if low == high else f'-{high}'} arguments")
+            return False
+        return True
+
+    def _args(self, args, scope):
+        return [self._compile(arg, scope) for arg in args]
+
+    # -- functions --------------------------------------------------------------
+
+    def _aggregate(self, func, args, scope):
+        if func in ('MIN', 'MAX') and len(args) == 2:
+            a, b = self._args(args, scope)
+            pick = np.fmin if func == 'MIN' else np.fmax
+            return lambda ctx, env: pick(_num(a(ctx, env)), _num(b(ctx, env)))
+        if not self._arity(func, args, scope, 1):
+            return _fail(func)
+        column = self._column(args[0], scope)
+        if column is None:
+            return _fail(func)
+        return lambda ctx, env: env.per_group(ctx.aggregate(func, *column))
+
+    def _call_SUM(self, args, scope):
+        return self._aggregate('SUM', args, scope)
+
+    def _call_COUNT(self, args, scope):
+        return self._aggregate('COUNT', args, scope)
+
+    def _call_AVERAGE(self, args, scope):
+        return self._aggregate('AVERAGE', args, scope)
+
+    def _call_MIN(self, args, scope):
+        return self._aggregate('MIN', args, scope)
+
+    def _call_MAX(self, args, scope):
+        return self._aggregate('MAX', args, scope)
+
+    def _call_DISTINCTCOUNT(self, args, scope):
+        if not self._arity('DISTINCTCOUNT', args, scope, 1):
+            return _fail('DISTINCTCOUNT')
+        column = self._column(args[0], scope)
+        if column is None:
+            return _fail('DISTINCTCOUNT')
+        return lambda ctx, env: env.per_group(ctx.count_rows(ctx.values(*column)))
+
+    def _call_COUNTROWS(self, args, scope):
+        if not self._arity('COUNTROWS', args, scope, 1):
+            return _fail('COUNTROWS')
+        if args[0][0] == 'table' or (args[0][0] == 'name' and args[0][1].lower() not in scope.variables):
+            table = self._table(args[0], scope)
+            return lambda ctx, env: env.per_group(ctx.aggregate('COUNTROWS', table))
+        table_expr = self._compile_table(args[0], scope)
+        return lambda ctx, env: env.per_group(ctx.count_rows(table_expr(ctx, env)))
+
+    def _call_SELECTEDVALUE(self, args, scope):
+        if not self._arity('SELECTEDVALUE', args, scope, 1, 2):
+            return _fail('SELECTEDVALUE')
+        column = self._column(args[0], scope)
+        alternate = self._compile(args[1], scope) if len(args) > 1 else (lambda ctx, env: np.nan)
+        return lambda ctx, env: env.per_group(ctx.selected_value(*column, alternate(ctx, env)))
+
+    def _call_CALCULATE(self, args, scope):
+        if not args:
+            return scope.problem("CALCULATE expects an expression")
+        expression = self._compile(args[0], scope)
+        filters = [self._compile_filter(arg, scope) for arg in args[1:]]
+
+        def calculate(ctx, env):
+            inner = ctx.derive([m for f in filters for m in f(ctx, env)])
+            return env.per_group(expression(inner, Env(env.values)))
+        return calculate
+
+    def _call_TOTALYTD(self, args, scope):
+        return self._total_to_date('DATESYTD', args, scope)
+
+    def _call_TOTALQTD(self, args, scope):
+        return self._total_to_date('DATESQTD', args, scope)
+
+    def _call_TOTALMTD(self, args, scope):
+        return self._total_to_date('DATESMTD', args, scope)
+
+    def _total_to_date(self, dates_function, args, scope):
+        """TOTALxTD(expression, dates[, filter]) is CALCULATE(expression, DATESxTD(dates)[, filter])"""
+        if not self._arity('TOTAL' + dates_function[-3:], args, scope, 2, 3):
+            return _fail(dates_function)
+        if len(args) == 3 and args[2][0] == 'str':
+            return scope.problem("a fiscal year end date is not supported")
+        return self._call_CALCULATE([args[0], ['call', dates_function, [args[1]]]] + args[2:], scope)
+
+    def _call_DIVIDE(self, args, scope):
+        if not self._arity('DIVIDE', args, scope, 2, 3):
+            return _fail('DIVIDE')
+        a, b, *alternate = self._args(args, scope)
+        alternate = alternate[0] if alternate else (lambda ctx, env: np.nan)
+        return lambda ctx, env: _divide(a(ctx, env), b(ctx, env), alternate(ctx, env))
+
+    def _call_IF(self, args, scope):
+        if not self._arity('IF', args, scope, 2, 3):
+            return _fail('IF')
+        condition, then, *otherwise = self._args(args, scope)
+        otherwise = otherwise[0] if otherwise else (lambda ctx, env: np.nan)
+        return lambda ctx, env: _where(condition(ctx, env), then(ctx, env), otherwise(ctx, env))
+
+    def _call_ISBLANK(self, args, scope):
+        if not self._arity('ISBLANK', args, scope, 1):
+            return _fail('ISBLANK')
+        value = self._compile(args[0], scope)
+        return lambda ctx, env: _is_blank(value(ctx, env))
+
+    def _call_BLANK(self, args, scope):
+        return lambda ctx, env: np.nan
+
+    def _call_TRUE(self, args, scope):
+        return lambda ctx, env: np.bool_(True)
+
+    def _call_FALSE(self, args, scope):
+        return lambda ctx, env: np.bool_(False)
+
+    def _call_AND(self, args, scope):
+        if not self._arity('AND', args, scope, 2):
+            return _fail('AND')
+        return self._compile_binary('&&', *self._args(args, scope))
+
+    def _call_OR(self, args, scope):
+        if not self._arity('OR', args, scope, 2):
+            return _fail('OR')
+        return self._compile_binary('||', *self._args(args, scope))
+
+    def _call_ABS(self, args, scope):
+        if not self._arity('ABS', args, scope, 1):
+            return _fail('ABS')
+        value = self._compile(args[0], scope)
+        return lambda ctx, env: np.abs(_num(value(ctx, env)))
+
+    def _call_YEAR(self, args, scope):
+        if not self._arity('YEAR', args, scope, 1):
+            return _fail('YEAR')
+        value = self._compile(args[0], scope)
+        return lambda ctx, env: _date_part(value(ctx, env), 'Y')
+
+    def _call_MONTH(self, args, scope):
+        if not self._arity('MONTH', args, scope, 1):
+            return _fail('MONTH')
+        value = self._compile(args[0], scope)
+        return lambda ctx, env: _date_part(value(ctx, env), 'M')
+
+    def _call_FORMAT(self, args, scope):
+        if not self._arity('FORMAT', args, scope, 2):
+            return _fail('FORMAT')
+        if args[1][0] != 'str':
+            return scope.problem("FORMAT needs a constant format string")
+        value = self._compile(args[0], scope)
+        formatter = np.vectorize(compile_format(args[1][1]), otypes=[object])
+        return lambda ctx, env: formatter(np.asarray(value(ctx, env), dtype=object))
+
+    # -- table expressions ------------------------------------------------------
+
+    def _compile_table(self, node, scope):
+        """Compile an expression producing a ValueSet (one column of distinct values per group)"""
+        if node[0] == 'name' and node[1].lower() in scope.variables:
+            key = node[1].lower()
+            return lambda ctx, env: env.values[key]
+        if node[0] == 'call' and node[1] == 'VALUES':
+            if not self._arity('VALUES', node[2], scope, 1):
+                return _fail('VALUES')
+            column = self._column(node[2][0], scope)
+            return lambda ctx, env: ctx.values(*column)
+        if node[0] == 'call' and node[1] == 'CALCULATETABLE':
+            if not node[2]:
+                return scope.problem("CALCULATETABLE expects a table expression")
+            table_expr = self._compile_table(node[2][0], scope)
+            filters = [self._compile_filter(arg, scope) for arg in node[2][1:]]
+            return lambda ctx, env: table_expr(ctx.derive([m for f in filters for m in f(ctx, env)]), env)
+        if node[0] == 'call' and node[1] in ('INTERSECT', 'EXCEPT'):
+            if not self._arity(node[1], node[2], scope, 2):
+                return _fail(node[1])
+            left, right = (self._compile_table(arg, scope) for arg in node[2])
+            combine = np.intersect1d if node[1] == 'INTERSECT' else np.setdiff1d
+
+            def set_operation(ctx, env):
+                a, b = left(ctx, env), right(ctx, env)
+                if a.column != b.column:
+                    raise DaxError(f"{node[1]} of different columns is not supported")
+                return ValueSet(a.column, a.width, combine(a.keys, b.keys, assume_unique=True))
+            return set_operation
+        if node[0] == 'call' and node[1] not in OPAQUE_FUNCTIONS and not hasattr(self, '_call_' + node[1]):
+            return scope.problem(f"unsupported function {node[1]}")
+        return scope.problem("unsupported table expression")
+
+    # -- CALCULATE filters ------------------------------------------------------
+
+    def _compile_filter(self, node, scope):
+        """Compile a CALCULATE filter argument into a function returning context modifications"""
+        if node[0] == 'call' and node[1] in ('ALL', 'REMOVEFILTERS'):
+            targets = []
+            for arg in node[2]:
+                if arg[0] == 'col':
+                    column = self._column(arg, scope)
+                    targets.append(('remove', column[0], column[1], None) if column else None)
+                else:
+                    table = self._table(arg, scope)
+                    targets.append(('remove', table, None, None))
+            targets = targets or [('remove', None, None, None)]
+            return lambda ctx, env: targets
+        if node[0] == 'call' and node[1] == 'KEEPFILTERS':
+            if not self._arity('KEEPFILTERS', node[2], scope, 1):
+                return _fail('KEEPFILTERS')
+            inner = self._compile_filter(node[2][0], scope)
+            return lambda ctx, env: [('keep',) + m[1:] if m[0] in ('set', 'replace_table') else m
+                                     for m in inner(ctx, env)]
+        if node[0] == 'call' and node[1] in TIME_FILTER_FUNCTIONS:
+            return self._compile_time_filter(node[1], node[2], scope)
+        if node[0] == 'call' and node[1] == 'VALUES':
+            column = self._column(node[2][0], scope) if self._arity('VALUES', node[2], scope, 1) else None
+            if column is None:
+                return _fail('VALUES')
+            return lambda ctx, env: [('set', *column, column_filter(keys=ctx.value_keys(*column)))]
+        if node[0] in ('table', 'name') and node[1].lower() not in scope.variables:
+            return self._compile_table_filter(node, scope)
+        year_filter = self._compile_year_filter(node, scope)
+        if year_filter is not None:
+            return year_filter
+
+        columns = set()
+        self._row_columns(node, columns)
+        if len(columns) != 1:
+            return scope.problem("boolean CALCULATE filters must reference exactly one column")
+        column = columns.pop()
+        predicate = self._compile(node, scope.with_row_column(column))
+
+        def boolean_filter(ctx, env):
+            uniques = ctx.star.dictionary(*column)[1]
+            result = np.atleast_2d(_truth(predicate(ctx, env.with_row(column, uniques[None, :]))))
+            if result.shape[0] == 1:
+                return [('set', *column, column_filter(mask=np.broadcast_to(result[0], len(uniques)).copy()))]
+            group, code = np.nonzero(np.broadcast_to(result, (ctx.n_groups, len(uniques))))
+            return [('set', *column, column_filter(keys=group * (len(uniques) + 1) + code))]
+        return boolean_filter
+
+    def _compile_year_filter(self, node, scope):
+        """YEAR(column) = expression as a range of the sorted dates per group (None if not that shape)"""
+        if node[0] != 'bin' or node[1] != '=':
+            return None
+        for call, other in ((node[2], node[3]), (node[3], node[2])):
+            if call[0] != 'call' or call[1] != 'YEAR' or len(call[2]) != 1 or call[2][0][0] != 'col':
+                continue
+            columns = set()
+            self._row_columns(other, columns)
+            if columns:
+                continue
+            column = self._column(call[2][0], scope)
+            if column is None:
+                return _fail('YEAR')
+            year = self._compile(other, scope)
+
+            def year_filter(ctx, env):
+                years = year(ctx, env)
+                keys = ctx.year_dates(*column, years)
+                width = ctx.width(*column)
+                if np.size(years) == 1:
+                    mask = np.zeros(width - 1, dtype=bool)
+                    mask[keys[keys < width] % width] = True
+                    return [('set', *column, column_filter(mask=mask))]
+                return [('set', *column, column_filter(keys=keys))]
+            return year_filter
+        return None
+
+    def _compile_table_filter(self, node, scope):
+        """A table used as a filter: the rows visible in the outer context, matched on a unique column"""
+        table = self._table(node, scope)
+        if table is None:
+            return _fail('table filter')
+        key = next((c for c in self.star.tables[table]
+                    if len(self.star.dictionary(table, c)[1]) == self.star.rows[table]), None)
+        if key is None:
+            return scope.problem(f"table filter '{table}' needs a column with unique values")
+        return lambda ctx, env: [('replace_table', table, key, column_filter(keys=ctx.value_keys(table, key)))]
+
+    def _row_columns(self, node, columns):
+        if not isinstance(node, list) or not node:
+            return
+        if node[0] == 'col':
+            try:
+                columns.add(self.star.resolve(node[1], node[2]))
+            except KeyError:
+                columns.add((node[1], node[2]))
+            return
+        if node[0] == 'call' and node[1] in OPAQUE_FUNCTIONS:
+            return
+        for child in node[1:]:
+            if isinstance(child, list):
+                if child and isinstance(child[0], list):
+                    for item in child:
+                        self._row_columns(item, columns)
+                else:
+                    self._row_columns(child, columns)
+
+    def _compile_time_filter(self, name, args, scope):
+        column, dates = self._compile_time_function(name, args, scope)
+        if column is None:
+            return _fail(name)
+        return lambda ctx, env: [('replace_table', *column, column_filter(keys=dates(ctx, env)))]
+
+    def _compile_dates(self, node, scope):
+        """A date column (its visible dates) or a nested time-intelligence call, as (column, keys function)"""
+        if node[0] == 'call' and node[1] in TIME_FILTER_FUNCTIONS:
+            return self._compile_time_function(node[1], node[2], scope)
+        column = self._column(node, scope)
+        if column is None:
+            return None, None
+        return column, lambda ctx, env: ctx.value_keys(*column)
+
+    def _compile_time_function(self, name, args, scope):
+        if not self._arity(name, args, scope, 3 if name == 'DATEADD' else 1):
+            return None, None
+        column, dates = self._compile_dates(args[0], scope)
+        if column is None:
+            return None, None
+        if name in PERIOD_TO_DATE:
+            unit = PERIOD_TO_DATE[name]
+            return column, lambda ctx, env: ctx.period_to_date(*column, dates(ctx, env), unit)
+        years, months, days = -1, 0, 0
+        if name == 'DATEADD':
+            count = args[1][1] if args[1][0] == 'num' else (
+                -args[1][1][1] if args[1][0] == 'neg' and args[1][1][0] == 'num' else None)
+            interval = DATEADD_INTERVALS.get(args[2][1].upper()) if args[2][0] == 'name' else None
+            if count is None or interval is None:
+                scope.problem("DATEADD needs a constant count and a YEAR/QUARTER/MONTH/DAY interval")
+                return None, None
+            years, months, days = (int(count) * part for part in interval)
+        return column, lambda ctx, env: ctx.shifted_dates(*column, dates(ctx, env), years, months, days)
+
+# ---------------------------------------------------------------------------
+# Evaluation
+# ---------------------------------------------------------------------------
+
+_MISSING = object()
+
+def _result_size(value):
+    """Approximate memory held by a cached measure result"""
+    array = np.asarray(value)
+    size = array.nbytes + 256
+    if array.dtype.kind == 'O':
+        size += sum(sys.getsizeof(v) for v in array.ravel())
+    return size
+
+class MeasureCache:
+    """LRU cache of measure results keyed by (measure, groups, filter context).
+
+    Memory is bounded by the approximate size of the cached arrays. Every
+    entry records the tables it was computed from, so a changed table only
+    drops the results that read it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MB << 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, tables):
+        size = _result_size(value)
+        if size > self.max_bytes:
+            return
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[2]
+        self._entries[key] = (value, frozenset(tables), size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self.bytes -= self._entries.popitem(last=False)[1][2]
+            self.evictions += 1
+
+    def invalidate(self, tables):
+        """Drop the results computed from any of tables; returns how many were dropped"""
+        tables = set(tables)
+        stale = [key for key, entry in self._entries.items() if entry[1] & tables]
+        for key in stale:
+            self.bytes -= self._entries.pop(key)[2]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations}
+
+class MeasureEvaluator:
+    """Evaluates compiled measures over a StarModel for every group of a grouping.
+
+    With sources (SourceFingerprints of the table files), every evaluation
+    first reloads the tables whose files changed.
+    """
+
+    def __init__(self, star, compiler, sources=None, cache=None):
+        self.star = star
+        self.compiler = compiler
+        self.sources = sources
+        self.cache = cache
+        self._dates = {}
+        self._shifts = {}
+        self._dependencies = {}
+
+    @classmethod
+    def from_files(cls, data_dir=DEFAULT_DATA_DIR, model_path=DEFAULT_MODEL_PATH, ast_cache=DEFAULT_AST_CACHE,
+                   cache_mb=DEFAULT_CACHE_MB, encoded=False):
+        # Fingerprint before loading: a file rewritten in between is reloaded on the next refresh
+        sources = SourceFingerprints(table_paths(data_dir))
+        star = StarModel.from_directory(data_dir, model_path, sort_by_date=True, encoded=encoded)
+        compiler = MeasureCompiler(star, read_measures(model_path), AstCache(ast_cache))
+        return cls(star, compiler, sources, MeasureCache(int(cache_mb * (1 << 20))) if cache_mb else None)
+
+    def refresh(self):
+        """Reload the tables whose files changed and drop the results computed from them"""
+        if self.sources is None:
+            return []
+        changed = self.sources.changed()
+        if changed:
+            encoded = self.star.encoded
+            self.star = self.star.with_tables({name: load_table(self.sources.paths[name], encoded)
+                                               for name in changed})
+            self.compiler = MeasureCompiler(self.star, self.compiler.measures, self.compiler.ast_cache)
+            self._dates.clear()
+            self._shifts.clear()
+            self._dependencies.clear()
+            if self.cache is not None:
+                self.cache.invalidate(changed)
+        return changed
+
+    def dependencies(self, name, filters):
+        """Tables a measure result depends on: the ones it reads, their dimensions and the filtered ones"""
+        if name not in self._dependencies:
+            tables = set()
+            for table in self.compiler.tables(name):
+                tables |= self.star.related_tables(table)
+            self._dependencies[name] = frozenset(tables)
+        return self._dependencies[name] | {table for table, _ in filters}
+
+    def dates(self, table, column):
+        key = (table, column)
+        if key not in self._dates:
+            self._dates[key] = _as_dates(self.star.dictionary(table, column)[1])
+        return self._dates[key]
+
+    def date_shift(self, table, column, years, months, days):
+        """Code of each date moved by the interval (-1 if outside the column)"""
+        key = (table, column, years, months, days)
+        if key not in self._shifts:
+            dates = pd.DatetimeIndex(self.dates(table, column))
+            shifted = dates + pd.DateOffset(years=years, months=months, days=days)
+            self._shifts[key] = pd.Index(dates).get_indexer(shifted)
+        return self._shifts[key]
+
+    def root_context(self, group_by=(), filters=None):
+        """Filter context with one group per existing combination of the group-by columns.
+
+        Combinations are the distinct values found in each table, crossed
+        between tables. Slicer filters apply to every group.
+        """
+        star = self.star
+        slicers = {}
+        for ref, condition in (filters or {}).items():
+            table, column = parse_column_ref(ref) if isinstance(ref, str) else ref
+            if table is None:
+                raise DaxError(f"filter column {column!r} needs a table name (table.column)")
+            slicers[star.resolve(table, column)] = condition
+
+        by_table = {}
+        for ref in group_by:
+            table, column = parse_column_ref(ref)
+            if table is None:
+                raise DaxError(f"group-by column {column!r} needs a table name (table.column)")
+            table, column = star.resolve(table, column)
+            by_table.setdefault(table, []).append(column)
+
+        combinations = []
+        for table, columns in by_table.items():
+            own = {(table, c): v for (t, c), v in slicers.items() if t == table}
+            mask = star.table_mask(table, own)
+            codes = np.stack([star.dictionary(table, c)[0] for c in columns], axis=1)
+            if mask is not None:
+                codes = codes[mask]
+            combinations.append(np.unique(codes, axis=0))
+        sizes = [len(c) for c in combinations]
+        n_groups = int(np.prod(sizes)) if sizes else 1
+        positions = np.unravel_index(np.arange(n_groups), sizes) if sizes else ()
+
+        group_keys = {}
+        context_filters = {}
+        for (table, columns), combos, position in zip(by_table.items(), combinations, positions):
+            for i, column in enumerate(columns):
+                width = len(star.dictionary(table, column)[1]) + 1
+                codes = combos[position, i]
+                codes = np.where(codes < 0, width - 1, codes)
+                uniques = np.append(star.dictionary(table, column)[1].astype(object), None)
+                group_keys[column if column not in group_keys else f'{table}[{column}]'] = uniques[codes]
+                context_filters[(table, column)] = column_filter(keys=np.arange(n_groups) * width + codes)
+        for (table, column), condition in slicers.items():
+            uniques = star.dictionary(table, column)[1]
+            if callable(condition):
+                mask = np.asarray(condition(uniques), dtype=bool)
+            else:
+                wanted = condition if isinstance(condition, (list, tuple, set, frozenset)) else [condition]
+                mask = np.isin(uniques, [coerce_value(v, uniques) for v in wanted])
+            slicer = column_filter(mask=mask)
+            if (table, column) in context_filters:
+                context = FilterContext(self, n_groups, {})
+                slicer = context._intersect((table, column), context_filters[(table, column)], slicer)
+            context_filters[(table, column)] = slicer
+        return FilterContext(self, n_groups, context_filters), group_keys
+
+    def evaluate(self, names, group_by=(), filters=None):
+        """DataFrame with the group-by columns and one column per measure"""
+        return pd.DataFrame(self.evaluate_columns(names, group_by, filters))
+
+    def evaluate_columns(self, names, group_by=(), filters=None):
+        """evaluate() as a dict of arrays: the group-by columns, then one per measure"""
+        self.refresh()
+        fns = {name: self.compiler.compile(self._measure(name)) for name in names}
+        ctx, result = self.root_context(group_by, filters)
+        for name in fns:
+            value = np.broadcast_to(np.asarray(ctx.measure(self._measure(name))), (ctx.n_groups,))
+            if value.dtype.kind == 'O':
+                value = np.where(_is_blank(value), None, value)
+            result[name] = value
+        return result
+
+    def _measure(self, name):
+        measure = self.compiler.measure_name(name)
+        if measure is None:
+            raise DaxError(f"unknown measure [{name}]")
+        return measure
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def print_report(compiler):
+    supported = 0
+    for name in compiler.measures:
+        problems = compiler.problems(name)
+        table = compiler.measures[name][0]
+        if problems:
+            print(f"  {table}[{name}]: " + '; '.join(problems))
+        else:
+            supported += 1
+    print(f"\n{supported} of {len(compiler.measures)} measures compile against this data")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compile and evaluate the Model.bim DAX measures.')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of table CSV files')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Model.bim with measures and relationships')
+    parser.add_argument('--ast-cache', default=DEFAULT_AST_CACHE, help="parsed-AST cache file ('' to disable)")
+    parser.add_argument('--report', action='store_true', help='list measures that cannot be compiled and why')
+    parser.add_argument('--measure', action='append', default=[], help='measure to evaluate; may be repeated')
+    parser.add_argument('--all', action='store_true', help='evaluate every measure that compiles')
+    parser.add_argument('--group-by', action='append', default=[], help='table.column to group by; may be repeated')
+    parser.add_argument('--filter', type=parse_filter, action='append', default=[],
+                        help='table.column=value[,value...]; may be repeated')
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_MB,
+                        help='memory bound of the measure-result cache in MB (0 to disable)')
+    parser.add_argument('--encoded', action='store_true',
+                        help='keep the tables in the compressed column store (less memory)')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON records')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    started = time.perf_counter()
+    evaluator = MeasureEvaluator.from_files(args.data, args.model, args.ast_cache or None, args.cache_mb,
+                                            args.encoded)
+    compiler = evaluator.compiler
+    loaded = time.perf_counter()
+
+    if args.report:
+        print_report(compiler)
+        compiler.ast_cache.save()
+        return
+
+    names = [name for name in compiler.measures if not compiler.problems(name)] if args.all else args.measure
+    if not names:
+        print("Error: give --measure NAME, --all or --report")
+        sys.exit(1)
+    try:
+        result = evaluator.evaluate(names, args.group_by, dict(args.filter))
+    except (DaxError, KeyError) as e:
+        print(f"Error: {e.args[0] if e.args else e}")
+        sys.exit(1)
+    finally:
+        compiler.ast_cache.save()
+    finished = time.perf_counter()
+
+    if args.json:
+        print(result.to_json(orient='records', force_ascii=False))
+        return
+    print(result.to_string(index=False))
+    print(f"\n{len(result)} groups x {len(names)} measures; load {(loaded - started) * 1000:.0f} ms, "
+          f"evaluate {(finished - loaded) * 1000:.1f} ms")
+    if evaluator.cache is not None:
+        stats = evaluator.cache.stats()
+        print(f"measure cache: {stats['entries']} results, {stats['bytes'] / (1 << 20):.1f} MB, "
+              f"{stats['hits']} hits, {stats['misses']} misses")
+
+if __name__ == "__main__":
+    main()
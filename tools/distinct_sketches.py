@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+HyperLogLog sketches for the DISTINCTCOUNT measures, as an approximate mode.
+
+number_of_orders, number_of_customers and number_of_returns are exact
+distinct counts in Model.bim, which no rollup can pre-aggregate: the orders
+of two months cannot be added up if a customer ordered in both. A
+HyperLogLog sketch can: it keeps 2**precision small registers per partition,
+and the sketch of a union is the element-wise maximum of the registers. Only
+the registers that are set are stored, so small partitions stay small.
+
+--build stores one sketch per partition of a grain (like aggregations.py,
+e.g. month x channel x region x order status) for every Model.bim measure
+that is a bare DISTINCTCOUNT of a column in the data. A query filters the
+partitions with the slicers, merges the registers per group and estimates
+the counts. The relative standard error is 1.04 / sqrt(2**precision);
+--error picks the precision for a target error. Queries the sketches cannot
+answer go to the exact detail table.
+
+--validate compares exact and approximate counts for every sketched measure,
+overall and grouped by each grain column, and reports the errors and query
+times.
+
+Usage:
+    python distinct_sketches.py --build [--data DIR] [--out DIR] [--config grains.json]
+                                [--precision P | --error E] [--force]
+    python distinct_sketches.py --measure number_of_orders [--group-by dim_date.Year]
+                                [--filter dim_customer.Channel=Online] [--json]
+    python distinct_sketches.py --table fact_orders --measure "Orders=DISTINCTCOUNT(OrderID)" ...
+    python distinct_sketches.py --validate [--json]
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from aggregations import (AggregationRouter, grain_columns, is_current, key_name, rollup_name,
+                          source_state, source_tables)
+from query_engine import (DEFAULT_DATA_DIR, DEFAULT_MODEL_PATH, MEASURE_PATTERN, StarModel, factorize_groups,
+                          parse_column_ref, parse_filter, parse_measure, ragged_positions, table_paths)
+
+SKETCH_VERSION = 1
+SKETCH_DIR = '_sketches'
+MANIFEST_FILE = 'manifest.json'
+
+DEFAULT_PRECISION = 12  # 4,096 registers per partition, 1.6% standard error
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+# The order and return grains of aggregations.DEFAULT_GRAINS, by reason for returns
+DEFAULT_GRAINS = {
+    'fact_orders': [
+        ['dim_date.YearMonth', 'dim_customer.Channel', 'dim_geography.Region', 'OrderStatus'],
+    ],
+    'fact_returns': [
+        ['dim_date.YearMonth', 'dim_customer.Channel', 'dim_geography.Region', 'ReturnReason'],
+    ],
+}
+
+# Model.bim counts fact_orders[CustomerID]; the sample data only has the key
+SAMPLE_COLUMNS = {('fact_orders', 'CustomerID'): ('fact_orders', 'CustomerKey')}
+
+DISTINCTCOUNT_PATTERN = re.compile(r"DISTINCTCOUNT\s*\(\s*'?([^'\[]+?)'?\s*\[([^\]]+)\]\s*\)", re.IGNORECASE)
+
+# ---------------------------------------------------------------------------
+# HyperLogLog
+# ---------------------------------------------------------------------------
+
+def standard_error(precision):
+    """Relative standard error of a HyperLogLog estimate with 2**precision registers"""
+    return 1.04 / math.sqrt(1 << precision)
+
+def precision_for_error(error):
+    """Smallest precision whose standard error is at most error"""
+    precision = math.ceil(math.log2((1.04 / error) ** 2))
+    if not MIN_PRECISION <= precision <= MAX_PRECISION:
+        raise ValueError(f"an error of {error} needs precision {precision}; "
+                         f"supported: {MIN_PRECISION}-{MAX_PRECISION} "
+                         f"({standard_error(MAX_PRECISION):.2%}-{standard_error(MIN_PRECISION):.0%})")
+    return precision
+
+def hash_values(values):
+    """64-bit hashes of values (stable across runs and processes)"""
+    return pd.util.hash_array(np.asarray(values))
+
+def _bit_length(values):
+    """Bit length of each uint64"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp's exponent is the bit length of an integer-valued float
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+def register_updates(hashes, precision):
+    """(register index, rank) of each hash: its top bits pick the register, the rest its rank"""
+    width = 64 - precision
+    index = (hashes >> np.uint64(width)).astype(np.int64)
+    rest = hashes & np.uint64((1 << width) - 1)
+    rank = (width + 1 - _bit_length(rest)).astype(np.uint8)
+    return index, rank
+
+def build_sketches_sparse(hashes, group_ids, n_groups, precision):
+    """The sketch of every group in sparse form: only registers that are set are stored.
+
+    Returns (offsets, index, rank): the set registers of group g are
+    index[offsets[g]:offsets[g + 1]] with values rank[...]. A partition with
+    few distinct values takes a few bytes instead of 2**precision.
+    """
+    m = 1 << precision
+    index, rank = register_updates(hashes, precision)
+    cells = group_ids.astype(np.int64) * m + index
+    order = np.lexsort((rank, cells))
+    cells, rank = cells[order], rank[order]
+    # The highest rank of each cell sorts last
+    last = np.r_[cells[1:] != cells[:-1], True] if len(cells) else np.zeros(0, dtype=bool)
+    cells, rank = cells[last], rank[last]
+    offsets = np.searchsorted(cells // m, np.arange(n_groups + 1))
+    return offsets, (cells % m).astype(np.uint16), rank
+
+def merge_registers(sketch, partitions, group_ids, n_groups, precision):
+    """Union of the sparse sketches of the partitions in each group, as dense register rows"""
+    offsets, index, rank = sketch
+    merged = np.zeros((n_groups, 1 << precision), dtype=np.uint8)
+    starts = offsets[partitions]
+    lengths = offsets[partitions + 1] - starts
+    positions = ragged_positions(starts, lengths)
+    np.maximum.at(merged, (np.repeat(group_ids, lengths), index[positions]), rank[positions])
+    return merged
+
+def estimate(registers):
+    """Distinct count estimate of each row of registers.
+
+    The raw HyperLogLog estimate, with linear counting over the empty
+    registers for small cardinalities. 64-bit hashes need no large-range
+    correction.
+    """
+    m = registers.shape[-1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum(axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def distinct_measures(model_path=DEFAULT_MODEL_PATH):
+    """Model.bim measures that are a bare DISTINCTCOUNT: {measure: (table, column)}"""
+    from model_index import load_model_index
+    index = load_model_index(model_path)
+    measures = {}
+    for name in index.measures:
+        expression = index.expression(name).strip()
+        match = DISTINCTCOUNT_PATTERN.fullmatch(expression)
+        if match:
+            column = (match.group(1).strip(), match.group(2).strip())
+            measures[name] = SAMPLE_COLUMNS.get(column, column)
+    return measures
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'version': SKETCH_VERSION, 'sketches': {}}
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SKETCH_VERSION:
+        return {'version': SKETCH_VERSION, 'sketches': {}}
+    return manifest
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def build_sketch_set(star, table, columns, counted, precision):
+    """Partition keys of table at the grain columns plus the sparse sketches of each counted column"""
+    key_columns = [star.related_column(table, t, c) for t, c in columns]
+    group_ids, n_groups, keys = factorize_groups(key_columns, star.rows[table])
+    frame = pd.DataFrame({key_name(t, c): values for (t, c), values in zip(columns, keys)})
+    sketches = {}
+    for column in counted:
+        values = star.column(table, column)
+        valid = ~pd.isna(values)  # DISTINCTCOUNT does not count blanks
+        sketches[column] = build_sketches_sparse(hash_values(values[valid]), group_ids[valid], n_groups, precision)
+    return frame, sketches
+
+def _files_present(out_dir, entry):
+    files = [entry['file'], *entry['sketch_files'].values()]
+    return all(os.path.exists(os.path.join(out_dir, name)) for name in files)
+
+def build_sketches(data_dir=DEFAULT_DATA_DIR, out_dir=None, grains=None, model_path=DEFAULT_MODEL_PATH,
+                   precision=DEFAULT_PRECISION, force=False):
+    """Build the sketch sets that are missing or out of date; returns {name: status}"""
+    out_dir = out_dir or os.path.join(data_dir, SKETCH_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    grains = DEFAULT_GRAINS if grains is None else grains
+    manifest = read_manifest(out_dir)
+    previous = manifest['sketches']
+    sketches = {}
+    status = {}
+    star = None
+    paths = table_paths(data_dir)
+    measures = distinct_measures(model_path)
+
+    for table, table_grains in grains.items():
+        counted = sorted({column for t, column in measures.values() if t == table})
+        for grain in table_grains:
+            columns = grain_columns(table, grain)
+            name = rollup_name(table, columns)
+            entry = previous.get(name)
+            if (not force and entry is not None and entry['grain'] == grain
+                    and entry['precision'] == precision and sorted(entry['sketch_files']) == counted
+                    and _files_present(out_dir, entry) and is_current(entry, data_dir, model_path)):
+                sketches[name] = entry
+                status[name] = 'up to date'
+                continue
+            if star is None:
+                # Fingerprint before loading: a table rewritten meanwhile makes the sketches stale, not wrong
+                known = {t: state for e in previous.values() for t, state in e['sources'].items()}
+                states = {t: source_state(path, known.get(t)) for t, path in paths.items()}
+                model_state = source_state(model_path) if model_path else None
+                star = StarModel.from_directory(data_dir, model_path)
+            try:
+                columns = [star.resolve(t, c) for t, c in columns]
+                sources = source_tables(star, table, columns)
+                counted = [star.resolve(table, column)[1] for column in counted]
+            except (KeyError, ValueError) as e:
+                status[name] = f"skipped: {e.args[0]}"
+                continue
+            if not counted:
+                status[name] = f"skipped: no DISTINCTCOUNT measure counts a column of {table}"
+                continue
+            started = time.perf_counter()
+            frame, column_sketches = build_sketch_set(star, table, columns, counted, precision)
+            file_name = f'{name}.csv'
+            frame.to_csv(os.path.join(out_dir, file_name), index=False)
+            sketch_files = {}
+            for column, (offsets, index, rank) in column_sketches.items():
+                sketch_files[column] = f'{name}__{column}.npz'
+                np.savez(os.path.join(out_dir, sketch_files[column]), offsets=offsets, index=index, rank=rank)
+            sketches[name] = {
+                'table': table,
+                'grain': grain,
+                'columns': [list(c) for c in columns],
+                'file': file_name,
+                'rows': len(frame),
+                'source_rows': star.rows[table],
+                'precision': precision,
+                'measures': [f'DISTINCTCOUNT({column})' for column in counted],
+                'sketch_files': sketch_files,
+                'sources': {t: states[t] for t in sources},
+                'model': model_state,
+                'built': datetime.now().isoformat(timespec='seconds'),
+            }
+            size = sum(array.nbytes for sketch in column_sketches.values() for array in sketch)
+            status[name] = (f"built {len(frame):,} partitions x {len(counted)} sketches ({size / 1e6:.1f} MB) "
+                            f"from {star.rows[table]:,} rows in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    for name, entry in previous.items():
+        if name not in sketches and name not in status:
+            for file_name in [entry['file'], *entry['sketch_files'].values()]:
+                path = os.path.join(out_dir, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+            status[name] = 'removed'
+    manifest['sketches'] = sketches
+    _write_manifest(out_dir, manifest)
+    return status
+
+# ---------------------------------------------------------------------------
+# Querying
+# ---------------------------------------------------------------------------
+
+class SketchRouter(AggregationRouter):
+    """Answers DISTINCTCOUNT queries approximately by merging the sketches of the selected partitions"""
+
+    kind = 'sketch'
+
+    def __init__(self, star, sketches, out_dir, stale=()):
+        super().__init__(star, sketches, out_dir, stale)
+        self._sketches = {}
+
+    @classmethod
+    def from_directory(cls, data_dir=DEFAULT_DATA_DIR, out_dir=None, model_path=DEFAULT_MODEL_PATH, star=None):
+        """Router over the up-to-date sketch sets in out_dir (stale ones are ignored)"""
+        out_dir = out_dir or os.path.join(data_dir, SKETCH_DIR)
+        star = star or StarModel.from_directory(data_dir, model_path)
+        sketches = {}
+        stale = {}
+        for name, entry in read_manifest(out_dir)['sketches'].items():
+            if _files_present(out_dir, entry) and is_current(entry, data_dir, model_path):
+                sketches[name] = entry
+            else:
+                stale[name] = entry
+        return cls(star, sketches, out_dir, stale)
+
+    def unsupported(self, func):
+        return None if func == 'DISTINCTCOUNT' else f"{func} is not sketched"
+
+    def sketch(self, name, column):
+        """(offsets, index, rank) of a sketched column, as written by build_sketches_sparse"""
+        key = (name, column)
+        if key not in self._sketches:
+            path = os.path.join(self.out_dir, self.rollups[name]['sketch_files'][column])
+            with np.load(path) as arrays:
+                self._sketches[key] = arrays['offsets'], arrays['index'], arrays['rank']
+        return self._sketches[key]
+
+    def aggregate(self, table, measures, group_by=(), filters=None):
+        """Like StarModel.aggregate with approximate DISTINCTCOUNTs; returns (DataFrame, what served it)"""
+        table = self.star.resolve(table)
+        name, reason = self.route(table, measures, group_by, filters)
+        if name is None:
+            return self.star.aggregate(table, measures, group_by, filters), f"{table} (exact: {reason})"
+
+        mask, group_ids, n_groups, result = self.groups(name, table, group_by, filters)
+        partitions = np.flatnonzero(mask)
+        precision = self.rollups[name]['precision']
+        for measure, (func, ref) in measures.items():
+            sketch = self.sketch(name, parse_column_ref(ref, table)[1])
+            counts = estimate(merge_registers(sketch, partitions, group_ids, n_groups, precision))
+            result[measure] = np.rint(counts).astype(np.int64)
+        entry = self.rollups[name]
+        return pd.DataFrame(result), (f"{name} ({int(np.count_nonzero(mask)):,} of {entry['rows']:,} partitions, "
+                                      f"±{standard_error(entry['precision']):.1%})")
+
+# ---------------------------------------------------------------------------
+# Validation
+# ---------------------------------------------------------------------------
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+def validate(router, model_path=DEFAULT_MODEL_PATH):
+    """Exact vs approximate counts of every sketched measure, overall and by each grain column"""
+    names = {column: name for name, column in distinct_measures(model_path).items()}
+    report = []
+    for name, entry in router.rollups.items():
+        table = entry['table']
+        groupings = [[]] + [[f'{t}.{c}'] for t, c in entry['columns']]
+        for column in entry['sketch_files']:
+            measures = {'count': ('DISTINCTCOUNT', column)}
+            for group_by in groupings:
+                exact, exact_ms = _timed(router.star.aggregate, table, measures, group_by)
+                (approx, served_by), approx_ms = _timed(router.aggregate, table, measures, group_by)
+                keys = [c for c in exact.columns if c != 'count']
+                both = exact.merge(approx, on=keys, suffixes=('_exact', '_approx')) if keys else \
+                    pd.DataFrame({'count_exact': exact['count'], 'count_approx': approx['count']})
+                counted = both['count_exact'] > 0
+                error = (both['count_approx'] - both['count_exact'])[counted] / both['count_exact'][counted]
+                bound = 2 * standard_error(entry['precision'])
+                report.append({
+                    'measure': names.get((table, column), f'DISTINCTCOUNT({table}[{column}])'),
+                    'sketch': name,
+                    'group_by': group_by[0] if group_by else None,
+                    'groups': len(both),
+                    'exact': int(both['count_exact'].sum()),
+                    'approx': int(both['count_approx'].sum()),
+                    'mean_error': float(error.abs().mean()) if len(error) else 0.0,
+                    'max_error': float(error.abs().max()) if len(error) else 0.0,
+                    'within_2se': float((error.abs() <= bound).mean()) if len(error) else 1.0,
+                    'standard_error': standard_error(entry['precision']),
+                    'exact_ms': exact_ms,
+                    'approx_ms': approx_ms,
+                })
+    return report
+
+def print_report(report):
+    if not report:
+        print("No sketches to validate (run --build)")
+        return
+    print(f"{'measure':<22} {'group by':<22} {'groups':>6} {'exact':>10} {'approx':>10} "
+          f"{'mean err':>8} {'max err':>8} {'<=2SE':>6} {'exact ms':>9} {'sketch ms':>9}")
+    for row in report:
+        print(f"{row['measure']:<22} {row['group_by'] or '(total)':<22} {row['groups']:>6,} "
+              f"{row['exact']:>10,} {row['approx']:>10,} {row['mean_error']:>8.2%} {row['max_error']:>8.2%} "
+              f"{row['within_2se']:>6.0%} {row['exact_ms']:>9.1f} {row['approx_ms']:>9.1f}")
+    errors = sorted({row['standard_error'] for row in report})
+    print(f"\nStandard error: {', '.join(f'{e:.2%}' for e in errors)}; "
+          f"'<=2SE' is the share of groups within twice that (about 95% expected)")
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def resolve_measures(specs, table, model_path):
+    """(table, {name: (FUNC, column)}) for Model.bim measure names or [Name=]FUNC(column) specs"""
+    model_measures = None
+    measures = {}
+    for spec in specs:
+        if MEASURE_PATTERN.match(spec.strip()):
+            name, measure = parse_measure(spec)
+            measures[name] = measure
+            continue
+        if model_measures is None:
+            model_measures = distinct_measures(model_path)
+        if spec not in model_measures:
+            raise ValueError(f"{spec!r} is neither a DISTINCTCOUNT measure of the model nor FUNC(column); "
+                             f"measures: {', '.join(sorted(model_measures))}")
+        measure_table, column = model_measures[spec]
+        if table is not None and measure_table != table:
+            raise ValueError(f"{spec} counts {measure_table}[{column}], not a column of {table}")
+        table = measure_table
+        measures[spec] = ('DISTINCTCOUNT', column)
+    if table is None:
+        raise ValueError("give --table for FUNC(column) measures")
+    return table, measures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Approximate DISTINCTCOUNT measures with HyperLogLog sketches.')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of table CSV files')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Model.bim with the measures and relationships')
+    parser.add_argument('--out', help=f'sketch directory (default: DATA/{SKETCH_DIR})')
+    parser.add_argument('--build', action='store_true', help='build missing or out-of-date sketches')
+    parser.add_argument('--config', help='JSON file mapping fact tables to lists of grains')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help=f'log2 of the registers per sketch, {MIN_PRECISION}-{MAX_PRECISION} '
+                             f'(default: {DEFAULT_PRECISION}, {standard_error(DEFAULT_PRECISION):.1%} error)')
+    parser.add_argument('--error', type=float, help='target relative standard error; overrides --precision')
+    parser.add_argument('--force', action='store_true', help='rebuild every sketch set')
+    parser.add_argument('--validate', action='store_true', help='report exact vs approximate counts')
+    parser.add_argument('--table', help='table to aggregate (implied by Model.bim measure names)')
+    parser.add_argument('--measure', action='append', default=[],
+                        help='Model.bim measure name or [Name=]DISTINCTCOUNT(column); may be repeated')
+    parser.add_argument('--group-by', action='append', default=[], help='group column; may be repeated')
+    parser.add_argument('--filter', type=parse_filter, action='append', default=[],
+                        help='table.column=value[,value...]; may be repeated')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not (args.build or args.validate or args.measure):
+        print("Error: give --build, --validate or at least one --measure")
+        sys.exit(1)
+
+    if args.build:
+        grains = None
+        if args.config:
+            with open(args.config, encoding='utf-8') as f:
+                grains = json.load(f)
+        try:
+            precision = precision_for_error(args.error) if args.error else args.precision
+            if not MIN_PRECISION <= precision <= MAX_PRECISION:
+                raise ValueError(f"precision must be {MIN_PRECISION}-{MAX_PRECISION}, got {precision}")
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Building sketches with precision {precision} ({standard_error(precision):.2%} standard error)")
+        for name, status in build_sketches(args.data, args.out, grains, args.model, precision, args.force).items():
+            print(f"  {name}: {status}")
+        if not (args.validate or args.measure):
+            return
+
+    started = time.perf_counter()
+    router = SketchRouter.from_directory(args.data, args.out, args.model)
+    loaded = time.perf_counter()
+
+    if args.validate:
+        report = validate(router, args.model)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+        return
+
+    try:
+        table, measures = resolve_measures(args.measure, args.table, args.model)
+        result, served_by = router.aggregate(table, measures, args.group_by, dict(args.filter))
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0] if e.args else e}")
+        sys.exit(1)
+    finished = time.perf_counter()
+
+    if args.json:
+        print(result.to_json(orient='records'))
+        return
+    print(result.to_string(index=False))
+    print(f"\n{len(result)} rows from {served_by}; load {(loaded - started) * 1000:.0f} ms, "
+          f"query {(finished - loaded) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
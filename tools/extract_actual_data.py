@@ -6,12 +6,11 @@ This script uses the Microsoft.AnalysisServices.Tabular library to read the mode
 
 import os
 import sys
-import zipfile
-import tempfile
-import shutil
 import csv
 import clr  # pythonnet
 
+from pbix_reader import PbixReader
+
 def setup_analysis_services():
     """Load Analysis Services libraries"""
     try:
@@ -49,18 +48,11 @@ def setup_analysis_services():
         print(f"Error loading Analysis Services: {e}")
         return None
 
-def extract_pbix_to_temp(pbix_path):
-    """Extract PBIX file to temporary directory"""
-    temp_dir = tempfile.mkdtemp(prefix='pbix_extract_')
-    print(f"Extracting PBIX to: {temp_dir}")
-    
-    with zipfile.ZipFile(pbix_path, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-    
-    return temp_dir
+def extract_data_with_analysis_services(reader, output_dir):
+    """Extract data using Analysis Services Tabular Object Model.
 
-def extract_data_with_analysis_services(datamodel_path, output_dir):
-    """Extract data using Analysis Services Tabular Object Model"""
+    reader is the open PbixReader; the DataModel is read from it in place.
+    """
     
     Tabular = setup_analysis_services()
     if not Tabular:
@@ -102,17 +94,16 @@ def main():
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
     
-    # Extract PBIX
-    temp_dir = extract_pbix_to_temp(pbix_file)
+    # Open PBIX (members are read in place, nothing is extracted)
+    reader = PbixReader(pbix_file)
     
     try:
         # Check for DataModel
-        datamodel_path = os.path.join(temp_dir, 'DataModel')
-        if os.path.exists(datamodel_path):
-            print(f"\nFound DataModel: {os.path.getsize(datamodel_path):,} bytes")
+        if 'DataModel' in reader:
+            print(f"\nFound DataModel: {reader.size('DataModel'):,} bytes")
             
             # Try extraction
-            success = extract_data_with_analysis_services(datamodel_path, output_dir)
+            success = extract_data_with_analysis_services(reader, output_dir)
             
             if not success:
                 print("\n" + "="*70)
@@ -139,9 +130,7 @@ def main():
                 print("="*70)
         
     finally:
-        # Cleanup
-        shutil.rmtree(temp_dir)
-        print(f"\nCleaned up temporary files")
+        reader.close()
 
 if __name__ == "__main__":
     main()
@@ -2,55 +2,50 @@
 """
 Attempt to extract actual data from PBIX DataModel.
 The DataModel uses Microsoft XPress9 compression which is proprietary.
-This script attempts multiple methods to decompress and extract the data.
+With the xpress9 package installed, it is decompressed block-parallel by
+xpress9_decompress.py; otherwise this script attempts other methods.
 """
 
 import os
 import sys
-import zipfile
-import struct
-import tempfile
-import shutil
-
-def extract_pbix(pbix_path):
-    """Extract PBIX contents"""
-    temp_dir = tempfile.mkdtemp(prefix='pbix_extract_')
-    with zipfile.ZipFile(pbix_path, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-    return temp_dir
-
-def analyze_datamodel(datamodel_path):
+
+from pbix_reader import PbixReader
+import xpress9_decompress
+
+def open_pbix(pbix_path):
+    """Open a PBIX for reading in place; members are streamed or memory-mapped, never extracted"""
+    return PbixReader(pbix_path)
+
+def analyze_datamodel(reader, name='DataModel'):
     """Analyze the DataModel file structure"""
-    with open(datamodel_path, 'rb') as f:
-        # Read first few bytes
-        header = f.read(100)
-        
-        print("DataModel header analysis:")
-        print(f"  Size: {os.path.getsize(datamodel_path):,} bytes")
-        print(f"  First 100 bytes (as string): {header[:100]}")
-        
-        # Check for compression signatures
-        if b'XPress' in header or b'xpress' in header.lower():
-            print("  ✓ Detected XPress compression signature")
-        
-        # Try to find JSON or XML content (uncompressed parts)
-        f.seek(0)
-        content = f.read(10000)
-        
-        if b'{' in content or b'<' in content:
-            print("  ✓ Found potential JSON/XML content")
-            # Try to extract it
-            try:
-                start_idx = content.find(b'{')
-                if start_idx > 0:
-                    print(f"  JSON starts at byte {start_idx}")
-            except:
-                pass
+    # Only the first 10 KB are read, straight from the archive
+    content = reader.header(name, 10000)
+    header = content[:100]
+    
+    print("DataModel header analysis:")
+    print(f"  Size: {reader.size(name):,} bytes")
+    print(f"  First 100 bytes (as string): {header[:100]}")
+    
+    # Check for compression signatures
+    if b'XPress' in header or b'xpress' in header.lower():
+        print("  ✓ Detected XPress compression signature")
+    
+    # Try to find JSON or XML content (uncompressed parts)
+    if b'{' in content or b'<' in content:
+        print("  ✓ Found potential JSON/XML content")
+        # Try to extract it
+        try:
+            start_idx = content.find(b'{')
+            if start_idx > 0:
+                print(f"  JSON starts at byte {start_idx}")
+        except:
+            pass
 
 def try_decompress_xpress(compressed_data):
     """
     Attempt to decompress XPress compressed data.
     XPress is proprietary Microsoft compression.
+    compressed_data may be any buffer, e.g. a memory-mapped view of the DataModel.
     """
     try:
         # Try lz4 (similar to XPress in some cases)
@@ -77,27 +72,33 @@ def try_decompress_xpress(compressed_data):
     
     return None, None
 
-def check_for_bim_file(temp_dir):
-    """Check if there's a BIM (JSON) file we can parse"""
-    for root, dirs, files in os.walk(temp_dir):
-        for file in files:
-            if file.endswith('.bim') or 'model' in file.lower():
-                file_path = os.path.join(root, file)
-                print(f"\nFound model file: {file_path}")
-                
-                # Try to read it
-                try:
-                    with open(file_path, 'rb') as f:
-                        content = f.read(1000)
-                        if content.startswith(b'{'):
-                            print("  ✓ This appears to be a JSON file")
-                            return file_path
-                        else:
-                            print("  ! This appears to be compressed")
-                except:
-                    pass
+def check_for_bim_file(reader):
+    """Check if there's a BIM (JSON) member we can parse; returns its name"""
+    for name in reader.find_model_members():
+        print(f"\nFound model file: {name}")
+        
+        # Try to read it
+        try:
+            content = reader.header(name, 1000)
+            if content.startswith(b'{'):
+                print("  ✓ This appears to be a JSON file")
+                return name
+            else:
+                print("  ! This appears to be compressed")
+        except:
+            pass
     return None
 
+def export_abf_tables(abf_path, output_dir):
+    """Export every table of a decompressed DataModel to CSV, in parallel"""
+    import abf_reader
+    print("\n   Exporting tables from the decompressed model...")
+    try:
+        for table, rows, seconds in abf_reader.export_tables(abf_path, output_dir, 'csv', workers=0):
+            print(f"   ✓ {table}.csv ({rows:,} rows, {seconds:.2f} s)")
+    except (KeyError, ValueError) as e:
+        print(f"   ✗ Could not read the model's tables: {e}")
+
 def extract_with_tabular_editor_command(pbix_path, output_dir):
     """
     Generate instructions and scripts for using Tabular Editor with command line.
@@ -192,38 +193,53 @@ def main():
     
     os.makedirs(output_dir, exist_ok=True)
     
-    # Extract PBIX
-    print("\n1. Extracting PBIX archive...")
-    temp_dir = extract_pbix(pbix_file)
-    print(f"   ✓ Extracted to: {temp_dir}")
+    # Open PBIX
+    print("\n1. Opening PBIX archive...")
+    reader = open_pbix(pbix_file)
+    print(f"   ✓ {len(reader.members())} members (read in place, nothing extracted)")
     
+    decompressed_xpress9 = False
     try:
         # Check for BIM files
         print("\n2. Searching for model files...")
-        bim_file = check_for_bim_file(temp_dir)
+        bim_file = check_for_bim_file(reader)
         
         # Analyze DataModel
-        datamodel_path = os.path.join(temp_dir, 'DataModel')
-        if os.path.exists(datamodel_path):
+        if 'DataModel' in reader:
             print("\n3. Analyzing DataModel...")
-            analyze_datamodel(datamodel_path)
+            analyze_datamodel(reader)
             
-            # Try to decompress
+            # Try to decompress (a stored DataModel is memory-mapped, not read into memory)
             print("\n4. Attempting decompression...")
-            with open(datamodel_path, 'rb') as f:
-                compressed_data = f.read()
-            
-            decompressed, method = try_decompress_xpress(compressed_data)
+            output_file = os.path.join(output_dir, 'DataModel_decompressed.bin')
+            if xpress9_decompress.is_xpress9(reader.header('DataModel', xpress9_decompress.HEADER_SIZE)):
+                try:
+                    stats = xpress9_decompress.decompress_datamodel(pbix_file, output_file, workers=0)
+                    print(f"   ✓ Decompressed {stats['blocks']:,} XPress9 blocks "
+                          f"({stats['decompressed_bytes']:,} bytes) in {stats['seconds']:.2f} s")
+                    print(f"   ✓ Saved to: {output_file}")
+                    decompressed_xpress9 = True
+                    export_abf_tables(output_file, output_dir)
+                except (ImportError, ValueError) as e:
+                    print(f"   ✗ XPress9 decompression failed: {e}")
             
-            if decompressed:
-                print(f"   ✓ Successfully decompressed using {method}!")
-                output_file = os.path.join(output_dir, 'DataModel_decompressed.bin')
-                with open(output_file, 'wb') as f:
-                    f.write(decompressed)
-                print(f"   ✓ Saved to: {output_file}")
-            else:
-                print("   ✗ Standard decompression methods failed")
-                print("   The DataModel uses proprietary Microsoft XPress9 compression")
+            if not decompressed_xpress9:
+                compressed_data = reader.buffer('DataModel')
+                try:
+                    decompressed, method = try_decompress_xpress(compressed_data)
+                finally:
+                    # A stored DataModel is a view on the PBIX mapping; release it so close() can unmap
+                    if isinstance(compressed_data, memoryview):
+                        compressed_data.release()
+                
+                if decompressed:
+                    print(f"   ✓ Successfully decompressed using {method}!")
+                    with open(output_file, 'wb') as f:
+                        f.write(decompressed)
+                    print(f"   ✓ Saved to: {output_file}")
+                else:
+                    print("   ✗ Standard decompression methods failed")
+                    print("   The DataModel uses proprietary Microsoft XPress9 compression")
         
         # Generate helper scripts
         print("\n5. Generating helper scripts...")
@@ -232,8 +248,15 @@ def main():
         print("\n" + "="*70)
         print("CONCLUSION")
         print("="*70)
-        print("\nThe PBIX DataModel uses Microsoft XPress9 compression which is")
-        print("proprietary and not supported by standard Python libraries.")
+        if decompressed_xpress9:
+            print("\nThe DataModel was decompressed to DataModel_decompressed.bin, an")
+            print("Analysis Services (ABF) backup holding the VertiPaq column data.")
+            print("Tables that could be decoded were written as CSV; use abf_reader.py")
+            print("to read single tables or columns, or to export Parquet.")
+            print("="*70)
+            return
+        print("\nThe PBIX DataModel uses Microsoft XPress9 compression, which needs")
+        print("the xpress9 package (pip install xpress9) to decompress in Python.")
         print("\nTo extract the actual data, please use one of these methods:")
         print("\n✓ DAX Studio (easiest):")
         print("  https://daxstudio.org/")
@@ -245,9 +268,7 @@ def main():
         print("="*70)
         
     finally:
-        # Cleanup
-        shutil.rmtree(temp_dir)
-        print(f"\nCleaned up temporary files")
+        reader.close()
 
 if __name__ == "__main__":
     main()
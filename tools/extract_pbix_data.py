@@ -6,31 +6,17 @@ The PBIX file uses proprietary XPress9 compression which requires special handli
 
 import os
 import sys
-import zipfile
-import tempfile
 import json
 import subprocess
 from pathlib import Path
 
-def extract_pbix(pbix_path):
-    """Extract PBIX file contents (PBIX is a ZIP file)"""
-    temp_dir = tempfile.mkdtemp(prefix='pbix_extract_')
-    print(f"Extracting PBIX to: {temp_dir}")
-    
-    with zipfile.ZipFile(pbix_path, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-    
-    return temp_dir
+from pbix_reader import PbixReader
 
-def list_files_in_extracted(temp_dir):
-    """List all files in extracted PBIX"""
-    print("\nExtracted files:")
-    for root, dirs, files in os.walk(temp_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            size = os.path.getsize(file_path)
-            rel_path = os.path.relpath(file_path, temp_dir)
-            print(f"  {rel_path} ({size:,} bytes)")
+def list_pbix_members(reader):
+    """List all files in the PBIX archive (read from its directory, nothing is extracted)"""
+    print("\nPBIX members:")
+    for member in reader.members():
+        print(f"  {member['name']} ({member['size']:,} bytes)")
 
 def extract_with_dotnet(pbix_path, output_dir):
     """
@@ -72,14 +58,14 @@ def main():
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
     
-    # Extract PBIX contents
-    temp_dir = extract_pbix(pbix_file)
-    list_files_in_extracted(temp_dir)
+    # List PBIX contents
+    with PbixReader(pbix_file) as reader:
+        list_pbix_members(reader)
+        has_datamodel = 'DataModel' in reader
+        size = reader.size('DataModel') if has_datamodel else 0
     
     # Check for DataModel
-    datamodel_path = os.path.join(temp_dir, 'DataModel')
-    if os.path.exists(datamodel_path):
-        size = os.path.getsize(datamodel_path)
+    if has_datamodel:
         print(f"\nDataModel file found: {size:,} bytes")
         print("The DataModel is compressed with Microsoft XPress9 compression.")
         print("This requires specialized decompression tools.")
@@ -107,11 +93,6 @@ def main():
         print("   - Export results to CSV")
         print("\nAlternatively, run the companion script 'generate_sample_data.py'")
         print("to create sample CSV files that match the schema.")
-    
-    # Cleanup
-    import shutil
-    shutil.rmtree(temp_dir)
-    print(f"\nCleaned up temporary files: {temp_dir}")
 
 if __name__ == "__main__":
     main()
@@ -3,22 +3,68 @@
 Generate sample CSV data files that match the Power BI Performance Dashboard schema.
 Based on the dashboard requirements: Sales, Customers, Orders, and Returns analysis.
 
-Usage: python generate_sample_data.py [output_directory]
+Usage: python generate_sample_data.py [output_directory] [--scale N] [--engine vectorized|loop] [--seed N]
+                                      [--end-date YYYY-MM-DD] [--append]
+                                      [--chunk-rows N] [--workers N] [--format csv|parquet|feather]
+                                      [--partition-by-month] [--return-rate R] [--return-lag MIN-MAX]
+                                      [--return-lag-mean DAYS] [--return-reasons REASON=WEIGHT,...]
+                                      [--profile] [--profile-dir DIR] [--profile-no-memory] [--profile-cprofile]
 If output_directory is not specified, uses ./data relative to the script location.
+
+--scale multiplies the number of generated orders (default 1.0 = 50,000 order attempts).
+--engine selects how fact_orders is built: 'vectorized' (default) generates order lines
+in NumPy batches at millions of rows per second; 'loop' is the original row-by-row
+generator that produced the checked-in sample files.
+--chunk-rows sets how many order lines the vectorized engine generates and appends
+to the fact CSVs at a time; memory stays bounded by the chunk, and the output is
+byte-identical for a given seed whatever the chunk size.
+--workers generates chunks in a process pool (0 = all CPUs). Each chunk draws from
+seed streams derived from the master seed, so the output does not depend on the
+worker count.
+--return-rate, --return-lag, --return-lag-mean and --return-reasons configure the
+vectorized returns engine (defaults: 5% of Completed lines, uniform 1-60 days, all
+reasons equally likely).
+--format parquet/feather writes columnar files (requires pyarrow) with dictionary-encoded
+status/reason/segment columns and date-typed *Date columns. --partition-by-month writes
+each fact table as Hive-style <table>/YearMonth=YYYY-MM/part-NNNNN files. Every run
+writes manifest.json listing the files, row counts and min/max keys per partition.
+--end-date extends the calendar (default 2024-12-31) at the same daily order rate.
+--append continues an existing output directory from its manifest.json: dim_date is
+extended and only the new days' orders, returns and sales are generated, with keys
+continuing from the existing ones, so the result matches a full run to the same date.
+--profile records wall time, CPU time, tracemalloc peak and rows/sec for every generate,
+frame (pandas construction), encode (CSV/Arrow serialization) and write stage, prints a
+summary, and writes profile.json and a Chrome trace-event file (profile.trace.json).
+--profile-no-memory skips tracemalloc for undistorted timings; --profile-cprofile adds
+one cProfile dump per stage name.
 """
 
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import argparse
+import cProfile
+import json
 import os
+import re
+import shutil
 import sys
 import random
+import time
+import tracemalloc
 
 # Set random seed for reproducibility
 random.seed(42)
 np.random.seed(42)
 
-def generate_date_dimension(start_date='2022-01-01', end_date='2024-12-31'):
+# Default calendar; --end-date extends it and --append continues it
+DEFAULT_START_DATE = '2022-01-01'
+DEFAULT_END_DATE = '2024-12-31'
+
+def generate_date_dimension(start_date=DEFAULT_START_DATE, end_date=DEFAULT_END_DATE):
     """Generate date dimension table"""
     dates = pd.date_range(start=start_date, end=end_date, freq='D')
     
@@ -127,11 +173,15 @@ def generate_customer_dimension(n_customers=5000):
     
     return pd.DataFrame(customers)
 
+# Status pools; duplicates weight the uniform draw (5/8 of orders complete)
+ORDER_STATUSES = ['Completed', 'Completed', 'Completed', 'Completed', 'Completed',
+                  'Cancelled', 'Pending', 'Processing']
+DELIVERY_STATUSES = ['On-Time', 'On-Time', 'On-Time', 'On-Time', 'Late', 'Early']
+
 def generate_fact_orders(customers, products, dates, n_orders=50000):
     """Generate orders fact table"""
-    order_statuses = ['Completed', 'Completed', 'Completed', 'Completed', 'Completed', 
-                      'Cancelled', 'Pending', 'Processing']
-    delivery_statuses = ['On-Time', 'On-Time', 'On-Time', 'On-Time', 'Late', 'Early']
+    order_statuses = ORDER_STATUSES
+    delivery_statuses = DELIVERY_STATUSES
     
     orders = []
     order_id = 1
@@ -194,6 +244,216 @@ def generate_fact_orders(customers, products, dates, n_orders=50000):
     df['GrossProfit'] = df['LineTotal'] - df['COGS']
     return df
 
+def _ascii_digits(numbers, width):
+    """Zero-padded ASCII digits of non-negative integers as an (n, width) uint8 block"""
+    rest = np.asarray(numbers, dtype=np.int64).copy()
+    out = np.empty((len(rest), width), dtype=np.uint8)
+    for pos in range(width - 1, -1, -1):
+        out[:, pos] = rest % 10 + 48
+        rest //= 10
+    return out
+
+def _ascii_text(n, *parts):
+    """Join literal strings and uint8 digit blocks column-wise into n fixed-width strings"""
+    blocks = []
+    for part in parts:
+        if isinstance(part, str):
+            part = np.broadcast_to(np.frombuffer(part.encode('ascii'), dtype=np.uint8), (n, len(part)))
+        blocks.append(part)
+    buf = np.ascontiguousarray(np.hstack(blocks))
+    return buf.view(f'S{buf.shape[1]}').ravel().astype(f'U{buf.shape[1]}')
+
+def _day_ordinals(values):
+    """Convert dates or YYYY-MM-DD strings to int64 days since 1970-01-01"""
+    return pd.to_datetime(pd.Series(values)).values.astype('datetime64[D]').astype(np.int64)
+
+def _date_keys(ordinals):
+    """YYYYMMDD integer keys for int64 day ordinals"""
+    days = np.asarray(ordinals).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    return ((years.astype(np.int64) + 1970) * 10000
+            + (months.astype(np.int64) % 12 + 1) * 100
+            + (days - months).astype(np.int64) + 1)
+
+def _date_column_ordinals(values):
+    """Day ordinals for a date column that may be categorical text, text or datetimes"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = _day_ordinals(values.cat.categories)
+        return categories[values.cat.codes.values]
+    return _day_ordinals(values)
+
+def build_date_index(dates, horizon_days=90):
+    """Day-ordinal lookup tables for the date dimension.
+
+    Position i of each table describes day text_start + i, from the first
+    dimension date to horizon_days past the last one. 'in_dimension' answers
+    "is this day in dim_date" with one array lookup instead of a scan of
+    dates['DateKey']; 'date_text' and 'text_key' render the day as
+    YYYY-MM-DD text and a YYYYMMDD key.
+    """
+    date_ord = _day_ordinals(dates['Date'])
+    text_start = date_ord.min()
+    text_days = np.arange(text_start, date_ord.max() + horizon_days)
+    in_dimension = np.zeros(len(text_days), dtype=bool)
+    in_dimension[date_ord - text_start] = True
+    return {
+        'date_ord': date_ord,
+        'date_key': dates['DateKey'].values.astype(np.int64),
+        'text_start': text_start,
+        'date_text': np.datetime_as_string(text_days.astype('datetime64[D]')).astype(object),
+        'text_key': _date_keys(text_days),
+        'in_dimension': in_dimension,
+    }
+
+def dimension_days(date_index, ordinals):
+    """Boolean mask of which day ordinals exist in the date dimension (O(1) per value)"""
+    offset = np.asarray(ordinals) - date_index['text_start']
+    in_dimension = date_index['in_dimension']
+    # The table always ends with days past the dimension, so clipping is safe
+    return (offset >= 0) & in_dimension[np.clip(offset, 0, len(in_dimension) - 1)]
+
+def build_order_context(customers, products, dates, return_profile=None):
+    """Precompute the lookup arrays the vectorized order engine indexes into.
+
+    Customers are sorted by FirstOrderDate so that the customers allowed to order
+    on a given day are always a prefix of that ordering.
+    """
+    ctx = build_date_index(dates)
+    first_ord = _day_ordinals(customers['FirstOrderDate'])
+    by_first_order = np.argsort(first_ord, kind='stable')
+    ctx.update({
+        'eligible': np.searchsorted(first_ord[by_first_order], ctx['date_ord'], side='right'),
+        'customer_keys': customers['CustomerKey'].values[by_first_order].astype(np.int64),
+        'n_customers': len(customers),
+        'product_key': products['ProductKey'].values.astype(np.int64),
+        'unit_price': products['UnitPrice'].values.astype(np.float64),
+        'unit_cost': products['UnitCost'].values.astype(np.float64),
+        'returns': return_profile or make_return_profile(),
+    })
+    return ctx
+
+def _sample_products(rng, n_orders, n_products, k=5):
+    """Draw k distinct product indices per order (Floyd's algorithm), in random order"""
+    picks = np.empty((n_orders, k), dtype=np.int64)
+    for col in range(k):
+        j = n_products - k + col
+        t = rng.integers(0, j + 1, n_orders)
+        taken = (picks[:, :col] == t[:, None]).any(axis=1)
+        picks[:, col] = np.where(taken, j, t)
+    shuffle = np.argsort(rng.random((n_orders, k)), axis=1)
+    return np.take_along_axis(picks, shuffle, axis=1)
+
+def generate_order_lines(rng, ctx, order_day, first_order_key=1):
+    """Generate the order lines for a batch of orders, one per entry of order_day.
+
+    order_day holds indices into the date dimension. Returns a dict of NumPy
+    columns; generate_fact_orders_vectorized turns it into the fact_orders layout.
+    """
+    n = len(order_day)
+    # Any customer whose FirstOrderDate is on or before the order date
+    eligible = ctx['eligible'][order_day]
+    customer_key = ctx['customer_keys'][(rng.random(n) * eligible).astype(np.int64)]
+    n_items = rng.integers(1, 6, n)
+    status = rng.integers(0, len(ORDER_STATUSES), n)
+    picks = _sample_products(rng, n, len(ctx['product_key']))
+
+    # Explode orders into lines
+    line_order = np.repeat(np.arange(n), n_items)
+    line_no = np.arange(len(line_order)) - np.repeat(np.cumsum(n_items) - n_items, n_items)
+    n_lines = len(line_order)
+    product = picks[line_order, line_no]
+
+    quantity = rng.integers(1, 11, n_lines)
+    unit_price = ctx['unit_price'][product] * rng.uniform(0.9, 1.1, n_lines)  # Some price variation
+    processing_days = rng.integers(1, 4, n_lines)
+    shipping_days = rng.integers(2, 15, n_lines)
+    delivery_status = rng.integers(0, len(DELIVERY_STATUSES), n_lines)
+
+    completed = np.asarray(ORDER_STATUSES)[status[line_order]] == 'Completed'
+    order_ord = ctx['date_ord'][order_day[line_order]]
+    unit_cost = ctx['unit_cost'][product]
+    return {
+        'order_key': first_order_key + line_order,
+        'line_no': line_no + 1,
+        'order_day': order_day[line_order],
+        'order_ord': order_ord,
+        'customer_key': customer_key[line_order],
+        'product_key': ctx['product_key'][product],
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'unit_cost': unit_cost,
+        'status': status[line_order],
+        'completed': completed,
+        'delivery_status': np.where(completed, delivery_status, -1),
+        'expected_ord': order_ord + 7,
+        'delivery_ord': order_ord + processing_days + shipping_days,
+    }
+
+def _categorical(codes, categories):
+    """Wrap integer codes as a pandas Categorical (-1 becomes missing)"""
+    return pd.Categorical.from_codes(codes, categories=pd.Index(categories, dtype=object))
+
+def _line_amounts(lines):
+    """Rounded LineTotal and COGS of generated order lines, computed once per batch"""
+    if 'line_total' not in lines:
+        lines['line_total'] = np.round(lines['quantity'] * lines['unit_price'], 2)
+        lines['cogs'] = np.round(lines['quantity'] * lines['unit_cost'], 2)
+    return lines['line_total'], lines['cogs']
+
+def order_lines_frame(ctx, lines):
+    """Render generated order line columns in the fact_orders CSV layout.
+
+    Status and date text columns stay categorical: codes into a small lookup
+    table instead of one Python string per row. to_csv writes the same text.
+    """
+    n = len(lines['order_key'])
+    order_id = _ascii_digits(lines['order_key'], 8)
+    line_total, cogs = _line_amounts(lines)
+    date_text = ctx['date_text']
+    start = ctx['text_start']
+    status_names, status_codes = np.unique(ORDER_STATUSES, return_inverse=True)
+    delivery_names, delivery_codes = np.unique(DELIVERY_STATUSES, return_inverse=True)
+    # -1 (not Completed) stays -1 and becomes a missing value
+    delivery = np.append(delivery_codes, -1)[lines['delivery_status']]
+    df = pd.DataFrame({
+        'OrderKey': lines['order_key'],
+        'OrderID': _ascii_text(n, 'ORD', order_id),
+        'OrderLineID': _ascii_text(n, 'ORD', order_id, '-', _ascii_digits(lines['line_no'], 1)),
+        'OrderDateKey': ctx['date_key'][lines['order_day']],
+        'OrderDate': _categorical(lines['order_ord'] - start, date_text),
+        'CustomerKey': lines['customer_key'],
+        'ProductKey': lines['product_key'],
+        'Quantity': lines['quantity'],
+        'UnitPrice': np.round(lines['unit_price'], 2),
+        'LineTotal': line_total,
+        'UnitCost': lines['unit_cost'],
+        'COGS': cogs,
+        'OrderStatus': _categorical(status_codes[lines['status']], status_names),
+        'DeliveryStatus': _categorical(delivery, delivery_names),
+        'ExpectedDeliveryDate': _categorical(lines['expected_ord'] - start, date_text),
+        'ActualDeliveryDate': _categorical(np.where(lines['completed'], lines['delivery_ord'] - start, -1), date_text),
+    })
+    df['GrossProfit'] = df['LineTotal'] - df['COGS']
+    return df
+
+def generate_fact_orders_vectorized(customers, products, dates, n_orders=50000, seed=42):
+    """Generate the orders fact table with array operations instead of a row loop.
+
+    Follows the same rules as generate_fact_orders. The loop draws a random
+    (date, customer) pair and drops it when the customer's FirstOrderDate is
+    later; here each day instead receives a Poisson number of orders with the
+    same expected value, placed only on eligible customers. Order lines are
+    grouped per OrderKey and sorted by order date.
+
+    Produces the same rows as the streaming pipeline (iter_fact_chunks) for
+    the same seed, but holds the whole table in memory.
+    """
+    ctx = build_order_context(customers, products, dates)
+    units = plan_order_units(ctx, n_orders / len(dates), seed)
+    lines = _concat_columns([generate_unit(ctx, unit, seed)[0] for unit in units])
+    return order_lines_frame(ctx, lines)
+
 def generate_fact_returns(orders, dates):
     """Generate returns fact table (about 5% of orders)"""
     return_reasons = [
@@ -238,78 +498,1027 @@ def generate_fact_returns(orders, dates):
     
     return pd.DataFrame(returns)
 
+RETURN_REASONS = [
+    'Defective', 'Wrong Item', 'Not as Described', 'Changed Mind',
+    'Too Late', 'Damaged in Transit', 'Quality Issues', 'Other'
+]
+RETURN_STATUSES = ['Processed', 'Processing', 'Pending', 'Rejected']
+
+# Upper bound on orders generated from one seed stream; busy days are split
+BLOCK_ORDERS = 50000
+
+# --scale sets the order attempts over the default calendar; other date ranges
+# keep the same daily rate so a longer calendar only adds days
+BASE_CALENDAR_DAYS = (datetime.strptime(DEFAULT_END_DATE, '%Y-%m-%d')
+                      - datetime.strptime(DEFAULT_START_DATE, '%Y-%m-%d')).days + 1
+
+def plan_order_units(ctx, orders_per_day, seed):
+    """Split fact generation into deterministic units of at most BLOCK_ORDERS orders.
+
+    Every day draws its order count from its own seed stream, so unit
+    boundaries, OrderKeys and unit contents depend only on the seed and
+    never on how units are later grouped into chunks.
+    Returns (day_index, n_orders, first_order_key, block) tuples in date order.
+    """
+    expected = orders_per_day * ctx['eligible'] / ctx['n_customers']
+    units = []
+    next_key = 1
+    for day, day_ord in enumerate(ctx['date_ord']):
+        count = int(np.random.default_rng([seed, int(day_ord), 0]).poisson(expected[day]))
+        for block, start in enumerate(range(0, count, BLOCK_ORDERS)):
+            size = min(BLOCK_ORDERS, count - start)
+            units.append((day, size, next_key, block))
+            next_key += size
+    return units
+
+def make_return_profile(rate=0.05, lag=(1, 60), lag_mean=None, reason_weights=None):
+    """Build the settings the returns engine draws from.
+
+    rate is the share of Completed order lines that get returned. lag is the
+    (min, max) number of days between order and return; the lag is uniform
+    unless lag_mean is given, in which case it decays geometrically from
+    the minimum with roughly that mean. reason_weights maps reason names to
+    relative weights (default: RETURN_REASONS, equally likely).
+    """
+    lag_min, lag_max = lag
+    if not 0 <= rate <= 1:
+        raise ValueError(f"return rate must be between 0 and 1, got {rate}")
+    if not 0 <= lag_min <= lag_max:
+        raise ValueError(f"invalid return lag range {lag_min}-{lag_max}")
+    lag_p = None
+    if lag_mean is not None:
+        if not lag_min < lag_mean:
+            raise ValueError(f"return lag mean must exceed the minimum lag ({lag_min}), got {lag_mean}")
+        ratio = (lag_mean - lag_min) / (lag_mean - lag_min + 1)
+        lag_p = ratio ** np.arange(lag_max - lag_min + 1)
+        lag_p /= lag_p.sum()
+    reasons = list(reason_weights) if reason_weights else list(RETURN_REASONS)
+    reason_p = None
+    if reason_weights:
+        weights = np.asarray(list(reason_weights.values()), dtype=np.float64)
+        if (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError("return reason weights must be non-negative and not all zero")
+        reason_p = weights / weights.sum()
+    return {'rate': rate, 'lag_min': lag_min, 'lag_max': lag_max, 'lag_p': lag_p,
+            'reasons': reasons, 'reason_p': reason_p}
+
+def draw_returns(rng, date_index, profile, completed, order_ord, quantity):
+    """Pick returned lines and draw their return attributes with array operations.
+
+    Returns (picked line positions, columns) where the columns describe the
+    kept returns: lines whose return date falls outside the date dimension
+    are dropped, as in generate_fact_returns.
+    """
+    candidates = np.flatnonzero(completed)
+    picked = candidates[rng.random(len(candidates)) < profile['rate']]
+    n = len(picked)
+    if profile['lag_p'] is None:
+        lag = rng.integers(profile['lag_min'], profile['lag_max'] + 1, n)
+    else:
+        lag = profile['lag_min'] + rng.choice(len(profile['lag_p']), n, p=profile['lag_p'])
+    return_ord = order_ord[picked] + lag
+    return_quantity = rng.integers(1, quantity[picked] + 1)
+    if profile['reason_p'] is None:
+        reason = rng.integers(0, len(profile['reasons']), n)
+    else:
+        reason = rng.choice(len(profile['reasons']), n, p=profile['reason_p'])
+    status = rng.integers(0, len(RETURN_STATUSES), n)
+    # Only return if return date exists in our date dimension
+    keep = dimension_days(date_index, return_ord)
+    return picked[keep], {
+        'return_ord': return_ord[keep],
+        'return_date_key': date_index['text_key'][return_ord[keep] - date_index['text_start']],
+        'quantity': return_quantity[keep],
+        'reason': reason[keep],
+        'status': status[keep],
+    }
+
+def generate_return_lines(rng, ctx, lines):
+    """Draw returns for the Completed lines of a generated batch of order lines"""
+    picked, returns = draw_returns(rng, ctx, ctx['returns'], lines['completed'],
+                                   lines['order_ord'], lines['quantity'])
+    returns.update({
+        'order_key': lines['order_key'][picked],
+        'customer_key': lines['customer_key'][picked],
+        'product_key': lines['product_key'][picked],
+        'amount': np.round(returns['quantity'] * np.round(lines['unit_price'][picked], 2), 2),
+    })
+    return returns
+
+def generate_fact_returns_vectorized(orders, dates, return_profile=None, seed=42):
+    """Generate the returns fact table for a whole fact_orders frame with array operations.
+
+    The counterpart of generate_fact_returns without the per-row loop, date
+    parsing and linear DateKey scan; works on frames from either engine.
+    """
+    rng = np.random.default_rng(seed)
+    ctx = build_date_index(dates)
+    ctx['returns'] = return_profile or make_return_profile()
+    picked, returns = draw_returns(rng, ctx, ctx['returns'], (orders['OrderStatus'] == 'Completed').values,
+                                   _date_column_ordinals(orders['OrderDate']), orders['Quantity'].values)
+    returns.update({
+        'order_key': orders['OrderKey'].values[picked],
+        'customer_key': orders['CustomerKey'].values[picked],
+        'product_key': orders['ProductKey'].values[picked],
+        'amount': np.round(returns['quantity'] * orders['UnitPrice'].values[picked], 2),
+    })
+    return return_lines_frame(ctx, returns)
+
+def return_lines_frame(ctx, returns, first_return_key=1):
+    """Render generated return columns in the fact_returns CSV layout"""
+    n = len(returns['order_key'])
+    return_key = first_return_key + np.arange(n)
+    return pd.DataFrame({
+        'ReturnKey': return_key,
+        'ReturnID': _ascii_text(n, 'RET', _ascii_digits(return_key, 8)),
+        'ReturnDateKey': returns['return_date_key'],
+        'ReturnDate': _categorical(returns['return_ord'] - ctx['text_start'], ctx['date_text']),
+        'OrderKey': returns['order_key'],
+        'OrderID': _ascii_text(n, 'ORD', _ascii_digits(returns['order_key'], 8)),
+        'CustomerKey': returns['customer_key'],
+        'ProductKey': returns['product_key'],
+        'ReturnQuantity': returns['quantity'],
+        'ReturnAmount': returns['amount'],
+        'ReturnReason': _categorical(returns['reason'], ctx['returns']['reasons']),
+        'ReturnStatus': _categorical(returns['status'], RETURN_STATUSES),
+    })
+
+def rollup_fact_sales(fact_orders):
+    """Aggregate order lines into the fact_sales table (one row per order).
+
+    Used by the loop engine; the vectorized engine builds the same layout
+    from its line arrays with sales_rollup_frame.
+    """
+    fact_sales = fact_orders.groupby(['OrderKey', 'OrderID', 'OrderDateKey', 'OrderDate', 'CustomerKey'],
+                                     observed=True).agg({
+        'LineTotal': 'sum',
+        'COGS': 'sum',
+        'GrossProfit': 'sum',
+        'Quantity': 'sum'
+    }).reset_index()
+    fact_sales.rename(columns={
+        'OrderKey': 'SalesKey',
+        'OrderID': 'SalesID',
+        'OrderDateKey': 'SalesDateKey',
+        'OrderDate': 'SalesDate',
+        'LineTotal': 'GrossSales',
+        'Quantity': 'TotalQuantity'
+    }, inplace=True)
+    fact_sales['NetSales'] = fact_sales['GrossSales'] - (fact_sales['GrossSales'] * 0.05)  # 5% discount
+    return fact_sales
+
+def sales_rollup_frame(ctx, lines):
+    """Build fact_sales rows (one per order) straight from generated order lines.
+
+    Lines of an order are contiguous, so the per-order totals are a
+    segment reduction over the line arrays (np.add.reduceat) rather than a
+    hash groupby over the rendered fact_orders frame. Produces the
+    rollup_fact_sales layout.
+    """
+    order_key = lines['order_key']
+    n_lines = len(order_key)
+    starts = np.flatnonzero(np.r_[n_lines > 0, order_key[1:] != order_key[:-1]])
+    n = len(starts)
+
+    def per_order(values):
+        return np.add.reduceat(values, starts) if n else values[:0]
+
+    line_total, cogs = _line_amounts(lines)
+    gross_sales = per_order(line_total)
+    total_cogs = per_order(cogs)
+    gross_profit = per_order(line_total - cogs)
+    quantity = per_order(lines['quantity'])
+    sales_key = order_key[starts]
+    return pd.DataFrame({
+        'SalesKey': sales_key,
+        'SalesID': _ascii_text(n, 'ORD', _ascii_digits(sales_key, 8)),
+        'SalesDateKey': ctx['date_key'][lines['order_day'][starts]],
+        'SalesDate': _categorical(lines['order_ord'][starts] - ctx['text_start'], ctx['date_text']),
+        'CustomerKey': lines['customer_key'][starts],
+        'GrossSales': gross_sales,
+        'COGS': total_cogs,
+        'GrossProfit': gross_profit,
+        'TotalQuantity': quantity,
+        'NetSales': gross_sales - (gross_sales * 0.05),  # 5% discount
+    })
+
+def generate_unit(ctx, unit, seed):
+    """Generate the order lines and returns of one planned unit from its own seed stream"""
+    day, n_orders, first_order_key, block = unit
+    rng = np.random.default_rng([seed, int(ctx['date_ord'][day]), 1 + block])
+    lines = generate_order_lines(rng, ctx, np.full(n_orders, day), first_order_key)
+    return lines, generate_return_lines(rng, ctx, lines)
+
+def carried_returns(ctx, units, seed, last_day):
+    """Returns of orders up to day index last_day whose return date falls after it.
+
+    A run whose date dimension ended on last_day dropped these returns; they
+    are regenerated from the seed streams of the units within lag_max days
+    of last_day, which makes an appended run match a full one.
+    """
+    first_day = last_day - ctx['returns']['lag_max']
+    last_ord = ctx['date_ord'][last_day]
+    batches = []
+    for unit in units:
+        if first_day < unit[0] <= last_day:
+            returns = generate_unit(ctx, unit, seed)[1]
+            keep = returns['return_ord'] > last_ord
+            batches.append({name: values[keep] for name, values in returns.items()})
+    return _concat_columns(batches) if batches else None
+
+def _concat_columns(batches):
+    """Concatenate a list of column dicts into one"""
+    return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+
+def plan_chunks(units, chunk_rows=1_000_000):
+    """Group consecutive units into chunks of about chunk_rows order lines.
+
+    Grouping uses the planned order counts (3 lines per order on average),
+    so chunk boundaries are known before any data is generated and chunks
+    can be rendered independently. Each chunk covers a contiguous date and
+    OrderKey range.
+    """
+    chunks = []
+    current = []
+    current_rows = 0
+    for unit in units:
+        current.append(unit)
+        current_rows += unit[1] * 3
+        if current_rows >= chunk_rows:
+            chunks.append(current)
+            current = []
+            current_rows = 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+# Profiling ------------------------------------------------------------------
+
+class StageProfiler:
+    """Record wall time, CPU time, tracemalloc peak and rows/sec per stage.
+
+    Disabled until start(), so instrumented code pays one flag check per
+    stage. Stages nest; each reports the peak traced memory above its own
+    starting point. With cprofile set, each stage name also gets a
+    cProfile of its own time (nested stages excluded), dumped by write().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.origin = 0.0
+        self._stack = []
+        self._profiles = {}
+        self._cprofile = False
+
+    def start(self, trace_memory=True, cprofile=False, origin=None):
+        """Start recording; origin aligns worker timestamps with the parent's"""
+        self.enabled = True
+        self.events = []
+        self.origin = time.perf_counter() if origin is None else origin
+        self._stack = []
+        self._profiles = {}
+        self._cprofile = cprofile
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def drain(self):
+        """Hand over the recorded events (used to ship them from pool workers)"""
+        events, self.events = self.events, []
+        return events
+
+    @contextmanager
+    def stage(self, name, category, rows=None):
+        """Time the enclosed block; set stage['rows'] inside it when rows are known only afterwards"""
+        record = {'rows': rows}
+        if not self.enabled:
+            yield record
+            return
+        parent = self._stack[-1] if self._stack else None
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent['peak'] = max(parent['peak'], peak)
+            tracemalloc.reset_peak()
+            record['base'] = record['peak'] = current
+        if self._cprofile:
+            if parent is not None:
+                parent['profile'].disable()
+            record['profile'] = self._profiles.setdefault(name, cProfile.Profile())
+            record['profile'].enable()
+        self._stack.append(record)
+        started, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall_s = time.perf_counter() - started
+            cpu_s = time.process_time() - cpu
+            self._stack.pop()
+            if self._cprofile:
+                record['profile'].disable()
+                if parent is not None:
+                    parent['profile'].enable()
+            alloc_peak = None
+            if tracing:
+                record['peak'] = max(record['peak'], tracemalloc.get_traced_memory()[1])
+                alloc_peak = record['peak'] - record['base']
+                if parent is not None:
+                    parent['peak'] = max(parent['peak'], record['peak'])
+                tracemalloc.reset_peak()
+            rows = record['rows']
+            self.events.append({
+                'name': name,
+                'category': category,
+                'pid': os.getpid(),
+                'depth': len(self._stack),
+                'start_s': round(started - self.origin, 6),
+                'wall_s': round(wall_s, 6),
+                'cpu_s': round(cpu_s, 6),
+                'rows': rows,
+                'rows_per_s': round(rows / wall_s) if rows is not None and wall_s > 0 else None,
+                'alloc_peak_mb': round(alloc_peak / 1e6, 3) if alloc_peak is not None else None,
+            })
+
+    def summary(self):
+        """Totals per stage name, in the order the stages first ran"""
+        totals = {}
+        for event in self.events:
+            total = totals.setdefault(event['name'], {
+                'name': event['name'], 'category': event['category'], 'calls': 0,
+                'wall_s': 0.0, 'cpu_s': 0.0, 'rows': None, 'rows_per_s': None, 'alloc_peak_mb': None})
+            total['calls'] += 1
+            total['wall_s'] += event['wall_s']
+            total['cpu_s'] += event['cpu_s']
+            if event['rows'] is not None:
+                total['rows'] = (total['rows'] or 0) + event['rows']
+            if event['alloc_peak_mb'] is not None:
+                total['alloc_peak_mb'] = max(total['alloc_peak_mb'] or 0.0, event['alloc_peak_mb'])
+        for total in totals.values():
+            if total['rows'] is not None and total['wall_s'] > 0:
+                total['rows_per_s'] = round(total['rows'] / total['wall_s'])
+            total['wall_s'] = round(total['wall_s'], 6)
+            total['cpu_s'] = round(total['cpu_s'], 6)
+        return list(totals.values())
+
+    def write(self, profile_dir, settings):
+        """Write profile.json, a Chrome trace and any cProfile dumps; returns the paths"""
+        os.makedirs(profile_dir, exist_ok=True)
+        main_pid = os.getpid()
+        trace = {
+            'settings': settings,
+            'wall_s': round(time.perf_counter() - self.origin, 6),
+            'stages': self.summary(),
+            'events': self.events,
+        }
+        paths = [os.path.join(profile_dir, 'profile.json'), os.path.join(profile_dir, 'profile.trace.json')]
+        with open(paths[0], 'w') as f:
+            json.dump(trace, f, indent=2)
+
+        # Chrome trace-event format: complete ('X') events in microseconds, one
+        # track per process. Open in chrome://tracing or https://ui.perfetto.dev
+        trace_events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                         'args': {'name': 'generate_sample_data' if pid == main_pid else f'worker {pid}'}}
+                        for pid in sorted({event['pid'] for event in self.events})]
+        for event in self.events:
+            trace_events.append({
+                'name': event['name'], 'cat': event['category'], 'ph': 'X',
+                'ts': round(event['start_s'] * 1e6, 1), 'dur': round(event['wall_s'] * 1e6, 1),
+                'pid': event['pid'], 'tid': 0,
+                'args': {key: event[key] for key in ('cpu_s', 'rows', 'rows_per_s', 'alloc_peak_mb')
+                         if event[key] is not None},
+            })
+        with open(paths[1], 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+        for name, profile in self._profiles.items():
+            path = os.path.join(profile_dir, f"profile-{re.sub(r'[^A-Za-z0-9_]+', '_', name)}.prof")
+            profile.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def print_summary(self):
+        print(f"\n{'Stage':<28}{'Calls':>6}{'Wall s':>10}{'CPU s':>10}{'Rows':>13}{'Rows/s':>13}{'Peak MB':>10}")
+        for total in self.summary():
+            rows = f"{total['rows']:,}" if total['rows'] is not None else '-'
+            rate = f"{total['rows_per_s']:,}" if total['rows_per_s'] is not None else '-'
+            peak = f"{total['alloc_peak_mb']:.1f}" if total['alloc_peak_mb'] is not None else '-'
+            print(f"{total['name']:<28}{total['calls']:>6}{total['wall_s']:>10.3f}{total['cpu_s']:>10.3f}"
+                  f"{rows:>13}{rate:>13}{peak:>10}")
+
+# Shared by every instrumented stage; main() starts it for --profile
+PROFILER = StageProfiler()
+
+def render_chunk(ctx, chunk, seed, fmt='csv', partitioned=False):
+    """Generate one chunk and encode its fact_orders and fact_sales rows.
+
+    Returns ({table: pieces}, returns) where pieces come from encode_pieces.
+    Returns stay as arrays because ReturnKeys are numbered across chunks by
+    the caller.
+    """
+    with PROFILER.stage('generate order lines', 'generate') as stage:
+        batches = [generate_unit(ctx, unit, seed) for unit in chunk]
+        lines = _concat_columns([batch[0] for batch in batches])
+        returns = _concat_columns([batch[1] for batch in batches])
+        stage['rows'] = len(lines['order_key'])
+    with PROFILER.stage('frame fact_orders', 'frame', len(lines['order_key'])):
+        fact_orders = order_lines_frame(ctx, lines)
+    with PROFILER.stage('frame fact_sales', 'frame') as stage:
+        fact_sales = sales_rollup_frame(ctx, lines)
+        stage['rows'] = len(fact_sales)
+    pieces = {
+        'fact_orders': encode_pieces('fact_orders', fact_orders, fmt, partitioned),
+        'fact_sales': encode_pieces('fact_sales', fact_sales, fmt, partitioned),
+    }
+    return pieces, returns
+
+_worker_state = {}
+
+def _init_worker(ctx, seed, fmt, partitioned, profile=None):
+    _worker_state.update(ctx=ctx, seed=seed, fmt=fmt, partitioned=partitioned)
+    if profile is not None:
+        PROFILER.start(trace_memory=profile['trace_memory'], origin=profile['origin'])
+    else:
+        PROFILER.stop()
+
+def _render_chunk_in_worker(chunk):
+    state = _worker_state
+    rendered = render_chunk(state['ctx'], chunk, state['seed'], state['fmt'], state['partitioned'])
+    return rendered, PROFILER.drain()
+
+def iter_rendered_chunks(ctx, chunks, seed, workers=1, fmt='csv', partitioned=False):
+    """Render chunks in order, in this process or across a process pool.
+
+    Every chunk is generated from the seed streams of its own units, so the
+    rendered output is identical for any number of workers. At most two
+    chunks per worker are in flight, which keeps memory bounded.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield render_chunk(ctx, chunk, seed, fmt, partitioned)
+        return
+    profile = None
+    if PROFILER.enabled:
+        profile = {'origin': PROFILER.origin, 'trace_memory': tracemalloc.is_tracing()}
+
+    def collect(future):
+        rendered, events = future.result()
+        PROFILER.events.extend(events)
+        return rendered
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(ctx, seed, fmt, partitioned, profile)) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.submit(_render_chunk_in_worker, chunk))
+            if len(in_flight) >= 2 * workers:
+                yield collect(in_flight.popleft())
+        while in_flight:
+            yield collect(in_flight.popleft())
+
+# Output formats -------------------------------------------------------------
+
+FORMAT_EXTENSIONS = {'csv': 'csv', 'parquet': 'parquet', 'feather': 'feather'}
+
+# Surrogate key recorded as min/max per file in the manifest
+TABLE_KEYS = {
+    'dim_date': 'DateKey',
+    'dim_geography': 'GeographyKey',
+    'dim_product': 'ProductKey',
+    'dim_customer': 'CustomerKey',
+    'fact_orders': 'OrderKey',
+    'fact_returns': 'ReturnKey',
+    'fact_sales': 'SalesKey',
+}
+
+# Date key each fact table is partitioned on (YearMonth = first 6 digits)
+PARTITION_DATE_KEYS = {
+    'fact_orders': 'OrderDateKey',
+    'fact_returns': 'ReturnDateKey',
+    'fact_sales': 'SalesDateKey',
+}
+
+# Low-cardinality text stored as dictionary-encoded columns in Parquet/Feather
+DICTIONARY_COLUMNS = ['OrderStatus', 'DeliveryStatus', 'ReturnReason', 'ReturnStatus',
+                      'Channel', 'CustomerType', 'PriorityLevel']
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        print("Error: Parquet and Feather output require pyarrow (pip install pyarrow)")
+        sys.exit(1)
+    return pyarrow
+
+def to_arrow_table(df):
+    """Convert a generated frame to an Arrow table with typed columnar encodings.
+
+    DICTIONARY_COLUMNS become dictionary arrays and *Date text columns become
+    date32, so readers get categories and dates without re-parsing text.
+    """
+    pa = _import_pyarrow()
+    df = df.copy(deep=False)
+    for column in df.columns:
+        values = df[column]
+        if column in DICTIONARY_COLUMNS and not isinstance(values.dtype, pd.CategoricalDtype):
+            df[column] = values.astype('category')
+        elif column.endswith('Date') and not pd.api.types.is_datetime64_any_dtype(values.dtype):
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = pd.to_datetime(values.cat.categories).values.astype('datetime64[D]')
+                df[column] = np.append(categories, np.datetime64('NaT', 'D'))[values.cat.codes.values]
+            else:
+                df[column] = pd.to_datetime(values).values.astype('datetime64[D]')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Date dimension datetimes are whole days
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.date32()))
+    return table
+
+def encode_frame(df, fmt):
+    """Encode a frame for a writer: CSV text for 'csv', an Arrow table otherwise"""
+    if fmt == 'csv':
+        return df.to_csv(index=False)
+    return to_arrow_table(df)
+
+def year_month(date_keys):
+    """'YYYY-MM' partition values for YYYYMMDD keys"""
+    months = np.asarray(date_keys) // 100
+    return [f'{m // 100:04d}-{m % 100:02d}' for m in months]
+
+def encode_pieces(name, df, fmt, partitioned):
+    """Encode a frame as (partition, payload, rows, min_key, max_key) pieces.
+
+    Without partitioning this is a single piece with partition None; with it,
+    one piece per YearMonth present in the frame.
+    """
+    key = TABLE_KEYS[name]
+    if partitioned and len(df):
+        months = np.asarray(df[PARTITION_DATE_KEYS[name]]) // 100
+        unique_months = np.unique(months)
+        parts = [(partition, df[months == month])
+                 for partition, month in zip(year_month(unique_months * 100), unique_months)]
+    else:
+        parts = [(None, df)]
+    pieces = []
+    with PROFILER.stage(f'encode {name}', 'encode', len(df)):
+        for partition, part in parts:
+            keys = part[key].values
+            pieces.append((partition, encode_frame(part, fmt), len(part),
+                           int(keys.min()) if len(keys) else None, int(keys.max()) if len(keys) else None))
+    return pieces
+
+class CsvTableWriter:
+    """Append encoded chunks to a single CSV file, writing the header once.
+
+    With append=True the file is continued and no header is written.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'a' if append else 'w', newline='')
+        self._header = not append
+
+    def write(self, text, rows):
+        """Append CSV text from encode_frame; its header line is dropped after the first chunk"""
+        if not self._header:
+            text = text[text.index('\n') + 1:]
+        self._file.write(text)
+        self._header = False
+        self.rows += rows
+
+    def close(self):
+        self._file.close()
+
+class ArrowTableWriter:
+    """Append Arrow tables to a single Parquet file (as row groups) or Feather file"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        self._writer = None
+
+    def write(self, table, rows):
+        pa = _import_pyarrow()
+        if self._writer is None:
+            if self.fmt == 'parquet':
+                self._writer = pa.parquet.ParquetWriter(self.path, table.schema, compression='snappy')
+            else:
+                compression = 'lz4' if pa.Codec.is_available('lz4') else None
+                options = pa.ipc.IpcWriteOptions(compression=compression)
+                self._writer = pa.ipc.new_file(self.path, table.schema, options=options)
+        self._writer.write_table(table)
+        self.rows += rows
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def open_table_writer(path, fmt, append=False):
+    if fmt == 'csv':
+        return CsvTableWriter(path, append)
+    if append:
+        raise ValueError(f"cannot append to a single {fmt} file; write partitioned output instead")
+    return ArrowTableWriter(path, fmt)
+
+class TableOutput:
+    """Write one table as a single file or as Hive-style YearMonth partitions.
+
+    Single-file tables go to <name>.<ext>; partitioned ones to
+    <name>/YearMonth=<YYYY-MM>/part-<chunk>.<ext>. Every file written is
+    recorded for the run manifest with its row count and key range.
+
+    existing is the table's entry in the manifest of an earlier run; the
+    table is then continued (new partition files, or rows appended to the
+    single CSV file) instead of rewritten.
+    """
+
+    def __init__(self, output_dir, name, fmt='csv', partitioned=False, existing=None):
+        self.output_dir = output_dir
+        self.name = name
+        self.fmt = fmt
+        self.partitioned = partitioned
+        self.ext = FORMAT_EXTENSIONS[fmt]
+        self.files = [dict(entry) for entry in existing['files']] if existing else []
+        self._writer = None
+        if partitioned:
+            if not existing:
+                shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+        else:
+            self._writer = open_table_writer(os.path.join(output_dir, f'{name}.{self.ext}'), fmt,
+                                             append=bool(existing))
+            if not existing:
+                self.files.append({'path': f'{name}.{self.ext}', 'partition': None,
+                                   'rows': 0, 'min_key': None, 'max_key': None})
+
+    @property
+    def rows(self):
+        return sum(entry['rows'] for entry in self.files)
+
+    def write_pieces(self, pieces, part_no=0):
+        with PROFILER.stage(f'write {self.name}', 'write', sum(piece[2] for piece in pieces)):
+            self._write_pieces(pieces, part_no)
+
+    def _write_pieces(self, pieces, part_no):
+        for partition, payload, rows, min_key, max_key in pieces:
+            if self.partitioned:
+                rel_dir = os.path.join(self.name, f'YearMonth={partition}')
+                os.makedirs(os.path.join(self.output_dir, rel_dir), exist_ok=True)
+                rel_path = os.path.join(rel_dir, f'part-{part_no:05d}.{self.ext}')
+                writer = open_table_writer(os.path.join(self.output_dir, rel_path), self.fmt)
+                writer.write(payload, rows)
+                writer.close()
+                self.files.append({'path': rel_path.replace(os.sep, '/'), 'partition': partition,
+                                   'rows': rows, 'min_key': min_key, 'max_key': max_key})
+            else:
+                self._writer.write(payload, rows)
+                entry = self.files[0]
+                entry['rows'] += rows
+                if min_key is not None:
+                    entry['min_key'] = min_key if entry['min_key'] is None else min(entry['min_key'], min_key)
+                    entry['max_key'] = max_key if entry['max_key'] is None else max(entry['max_key'], max_key)
+
+    def write_frame(self, df, part_no=0):
+        self.write_pieces(encode_pieces(self.name, df, self.fmt, self.partitioned), part_no)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def manifest(self):
+        return {'key': TABLE_KEYS[self.name], 'rows': self.rows, 'files': self.files}
+
+def read_manifest(output_dir):
+    """The manifest.json of an earlier run in output_dir, or None"""
+    try:
+        with open(os.path.join(output_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def manifest_max_key(entry):
+    """Largest key of a manifest table entry (0 when it has no rows)"""
+    keys = [file['max_key'] for file in entry['files'] if file['max_key'] is not None]
+    return max(keys, default=0)
+
+def write_manifest(output_dir, outputs, settings, tables=None):
+    """Write manifest.json listing every output file with row counts and key ranges.
+
+    tables holds the entries of tables carried over unchanged from an
+    earlier run; outputs replace them.
+    """
+    manifest = dict(settings)
+    manifest['tables'] = dict(tables or {})
+    manifest['tables'].update((output.name, output.manifest()) for output in outputs)
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def _next_part_number(tables):
+    """First part-NNNNN number not used by any file of the given manifest tables"""
+    numbers = [int(match.group(1)) for entry in tables.values() for file in entry['files']
+               for match in [re.search(r'part-(\d+)', file['path'])] if match]
+    return max(numbers, default=-1) + 1
+
+def write_fact_tables(output_dir, ctx, units, seed, chunk_rows=1_000_000, workers=1,
+                      fmt='csv', partitioned=False, existing=None, carried=None):
+    """Stream fact_orders, fact_returns and fact_sales to disk chunk by chunk.
+
+    existing holds the manifest entries of an earlier run to append to:
+    ReturnKeys continue after its last one and new partition files are
+    numbered after its parts. carried (from carried_returns) is written to
+    fact_returns first.
+    Returns the TableOutput of each fact table (closed), for the manifest.
+    """
+    existing = existing or {}
+    outputs = {name: TableOutput(output_dir, name, fmt, partitioned, existing.get(name))
+               for name in ('fact_orders', 'fact_returns', 'fact_sales')}
+    next_return_key = manifest_max_key(existing['fact_returns']) + 1 if existing else 1
+    first_part = _next_part_number(existing)
+    try:
+        if carried is not None and len(carried['order_key']):
+            fact_returns = return_lines_frame(ctx, carried, next_return_key)
+            outputs['fact_returns'].write_frame(fact_returns, first_part)
+            next_return_key += len(fact_returns)
+            first_part += 1
+            print(f"  Carried over {len(fact_returns):,} returns of earlier orders")
+        chunks = plan_chunks(units, chunk_rows)
+        rendered = iter_rendered_chunks(ctx, chunks, seed, workers, fmt, partitioned)
+        for chunk_no, (pieces, returns) in enumerate(rendered):
+            for name, table_pieces in pieces.items():
+                outputs[name].write_pieces(table_pieces, first_part + chunk_no)
+            with PROFILER.stage('frame fact_returns', 'frame', len(returns['order_key'])):
+                fact_returns = return_lines_frame(ctx, returns, next_return_key)
+            outputs['fact_returns'].write_frame(fact_returns, first_part + chunk_no)
+            next_return_key += len(fact_returns)
+            print(f"  Chunk {chunk_no + 1}/{len(chunks)}: {outputs['fact_orders'].rows:,} order lines written")
+    finally:
+        for output in outputs.values():
+            output.close()
+    return list(outputs.values())
+
+def _parse_range(text):
+    low, _, high = text.partition('-')
+    try:
+        return int(low), int(high or low)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected MIN-MAX days, got {text!r}")
+
+def _parse_weights(text):
+    weights = {}
+    for item in text.split(','):
+        name, _, weight = item.rpartition('=')
+        try:
+            weights[name.strip()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected REASON=WEIGHT, got {item!r}")
+    return weights
+
+def _parse_date(text):
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {text!r}")
+
+def continue_run(args, manifest):
+    """Point args at the run recorded in manifest for --append.
+
+    Returns the date key its dim_date ends on. Exits when that run cannot
+    be continued.
+    """
+    if manifest is None:
+        print("Error: --append needs the manifest.json of an earlier run in the output directory")
+        sys.exit(1)
+    if manifest.get('engine') != 'vectorized':
+        print("Error: --append can only continue output of the vectorized engine")
+        sys.exit(1)
+    args.engine = 'vectorized'
+    args.seed = manifest['seed']
+    args.scale = manifest['scale']
+    args.format = manifest['format']
+    args.partition_by_month = manifest.get('partition_by') == 'YearMonth'
+    if args.format != 'csv' and not args.partition_by_month:
+        print(f"Error: single {args.format} files cannot be appended to; generate with --partition-by-month")
+        sys.exit(1)
+    returns = manifest.get('returns')
+    if returns:
+        args.return_rate = returns['rate']
+        args.return_lag = tuple(returns['lag'])
+        args.return_lag_mean = returns['lag_mean']
+        args.return_reasons = returns['reasons']
+    last_key = manifest_max_key(manifest['tables']['dim_date'])
+    if args.end_date is None:
+        last = datetime.strptime(str(last_key), '%Y%m%d')
+        args.end_date = (last + timedelta(days=1)).strftime('%Y-%m-%d')
+    return last_key
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate sample data for the Power BI Performance Dashboard")
+    parser.add_argument('output_dir', nargs='?', help="output directory (default: ./data next to this script)")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiplier for the number of orders (default: 1.0 = 50,000 order attempts)")
+    parser.add_argument('--engine', choices=['vectorized', 'loop'], default='vectorized',
+                        help="fact_orders generator (default: vectorized)")
+    parser.add_argument('--seed', type=int, default=42, help="random seed (default: 42)")
+    parser.add_argument('--end-date', type=_parse_date, metavar='YYYY-MM-DD',
+                        help=f"last day of dim_date and of the generated orders (default: {DEFAULT_END_DATE}; "
+                             "with --append, the day after the existing output ends)")
+    parser.add_argument('--append', action='store_true',
+                        help="extend the output in the directory up to --end-date: only the new days' "
+                             "orders, returns and sales are generated and appended, with the seed, scale, "
+                             "format and returns settings recorded in its manifest.json")
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000,
+                        help="order lines generated and written per chunk by the vectorized engine (default: 1,000,000)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes generating chunks in parallel; 0 uses every CPU (default: 1)")
+    parser.add_argument('--format', choices=sorted(FORMAT_EXTENSIONS), default='csv',
+                        help="output file format (default: csv)")
+    parser.add_argument('--partition-by-month', action='store_true',
+                        help="write fact tables as Hive-style YearMonth=YYYY-MM partitions")
+    parser.add_argument('--return-rate', type=float, default=0.05,
+                        help="share of Completed order lines that are returned (default: 0.05)")
+    parser.add_argument('--return-lag', type=_parse_range, default=(1, 60), metavar='MIN-MAX',
+                        help="days between order and return (default: 1-60)")
+    parser.add_argument('--return-lag-mean', type=float,
+                        help="make return lags decay geometrically with this mean instead of uniform")
+    parser.add_argument('--return-reasons', type=_parse_weights, metavar='REASON=WEIGHT,...',
+                        help="return reason mix, e.g. 'Defective=3,Changed Mind=1' (default: all reasons equally)")
+    parser.add_argument('--profile', action='store_true',
+                        help="record wall/CPU time, tracemalloc peak and rows/sec per stage and write "
+                             "profile.json plus a Chrome trace (profile.trace.json)")
+    parser.add_argument('--profile-dir',
+                        help="directory for the profile files (default: the output directory)")
+    parser.add_argument('--profile-no-memory', action='store_true',
+                        help="with --profile, skip tracemalloc, which slows allocation-heavy stages "
+                             "such as CSV encoding several times over")
+    parser.add_argument('--profile-cprofile', action='store_true',
+                        help="with --profile, also dump a cProfile .prof file per stage name")
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args()
     print("Generating sample data for Power BI Performance Dashboard...")
+    random.seed(args.seed)
+    np.random.seed(args.seed)
     
     # Create output directory (use script directory + data folder, or allow override via arg)
-    if len(sys.argv) > 1:
-        output_dir = sys.argv[1]
+    if args.output_dir:
+        output_dir = args.output_dir
     else:
         script_dir = os.path.dirname(os.path.abspath(__file__))
         output_dir = os.path.join(script_dir, 'data')
     
     os.makedirs(output_dir, exist_ok=True)
     print(f"Output directory: {output_dir}")
+    previous = None
+    if args.append:
+        previous = read_manifest(output_dir)
+        last_date_key = continue_run(args, previous)
+        if int(args.end_date.replace('-', '')) <= last_date_key:
+            print(f"Nothing to append: the output already runs through {last_date_key}")
+            return
+        print(f"Appending {last_date_key} (exclusive) to {args.end_date}")
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+    end_date = args.end_date or DEFAULT_END_DATE
+    if args.profile:
+        PROFILER.start(trace_memory=not args.profile_no_memory, cprofile=args.profile_cprofile)
     
     # Generate dimensions
+    fmt = args.format
+    ext = FORMAT_EXTENSIONS[fmt]
+    outputs = []
+    
+    def write_dimension(name, df):
+        if previous is not None and name != 'dim_date':
+            return  # unchanged; regenerated from the seed only to build the order context
+        output = TableOutput(output_dir, name, fmt)
+        output.write_frame(df)
+        output.close()
+        outputs.append(output)
+        print(f"  Created {name}.{ext} ({len(df)} rows)")
+    
+    def generate(name, build, *build_args, **build_kwargs):
+        with PROFILER.stage(f'generate {name}', 'generate') as stage:
+            df = build(*build_args, **build_kwargs)
+            stage['rows'] = len(df)
+        return df
+    
     print("Generating date dimension...")
-    dim_date = generate_date_dimension()
-    dim_date.to_csv(os.path.join(output_dir, 'dim_date.csv'), index=False)
-    print(f"  Created dim_date.csv ({len(dim_date)} rows)")
+    dim_date = generate('dim_date', generate_date_dimension, end_date=end_date)
+    write_dimension('dim_date', dim_date)
     
     print("Generating geography dimension...")
-    dim_geography = generate_geography_dimension()
-    dim_geography.to_csv(os.path.join(output_dir, 'dim_geography.csv'), index=False)
-    print(f"  Created dim_geography.csv ({len(dim_geography)} rows)")
+    dim_geography = generate('dim_geography', generate_geography_dimension)
+    write_dimension('dim_geography', dim_geography)
     
     print("Generating product dimension...")
-    dim_product = generate_product_dimension()
-    dim_product.to_csv(os.path.join(output_dir, 'dim_product.csv'), index=False)
-    print(f"  Created dim_product.csv ({len(dim_product)} rows)")
+    dim_product = generate('dim_product', generate_product_dimension)
+    write_dimension('dim_product', dim_product)
     
     print("Generating customer dimension...")
-    dim_customer = generate_customer_dimension(n_customers=5000)
-    dim_customer.to_csv(os.path.join(output_dir, 'dim_customer.csv'), index=False)
-    print(f"  Created dim_customer.csv ({len(dim_customer)} rows)")
+    dim_customer = generate('dim_customer', generate_customer_dimension, n_customers=5000)
+    write_dimension('dim_customer', dim_customer)
     
     # Generate facts
-    print("Generating orders fact table...")
-    fact_orders = generate_fact_orders(dim_customer, dim_product, dim_date, n_orders=50000)
-    fact_orders.to_csv(os.path.join(output_dir, 'fact_orders.csv'), index=False)
-    print(f"  Created fact_orders.csv ({len(fact_orders)} rows)")
-    
-    print("Generating returns fact table...")
-    fact_returns = generate_fact_returns(fact_orders, dim_date)
-    fact_returns.to_csv(os.path.join(output_dir, 'fact_returns.csv'), index=False)
-    print(f"  Created fact_returns.csv ({len(fact_returns)} rows)")
+    n_orders = int(round(50000 * args.scale))
+    if args.engine == 'loop':
+        def write_fact(name, df):
+            output = TableOutput(output_dir, name, fmt, args.partition_by_month)
+            output.write_frame(df)
+            output.close()
+            outputs.append(output)
+            print(f"  Created {name} ({len(df)} rows)")
+        
+        print(f"Generating orders fact table (loop engine, {n_orders:,} order attempts)...")
+        fact_orders = generate('fact_orders', generate_fact_orders, dim_customer, dim_product, dim_date,
+                               n_orders=n_orders)
+        write_fact('fact_orders', fact_orders)
+        
+        print("Generating returns fact table...")
+        fact_returns = generate('fact_returns', generate_fact_returns, fact_orders, dim_date)
+        write_fact('fact_returns', fact_returns)
+        
+        # Generate a sales view (aggregated from orders)
+        print("Generating sales fact table...")
+        fact_sales = generate('fact_sales', rollup_fact_sales, fact_orders)
+        write_fact('fact_sales', fact_sales)
+    else:
+        workers = args.workers or os.cpu_count()
+        print(f"Generating fact tables (vectorized engine, {n_orders:,} order attempts, "
+              f"chunks of {args.chunk_rows:,} lines, {workers} worker(s))...")
+        try:
+            return_profile = make_return_profile(args.return_rate, args.return_lag,
+                                                 args.return_lag_mean, args.return_reasons)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        with PROFILER.stage('plan order units', 'generate') as stage:
+            ctx = build_order_context(dim_customer, dim_product, dim_date, return_profile)
+            units = plan_order_units(ctx, n_orders / BASE_CALENDAR_DAYS, args.seed)
+            stage['rows'] = len(units)
+        carried = None
+        if previous is not None:
+            # Units are planned over the whole calendar, so the earlier days'
+            # OrderKeys must end exactly where the existing fact_orders does
+            last_day = int(np.searchsorted(ctx['date_key'], last_date_key))
+            planned = sum(unit[1] for unit in units if unit[0] <= last_day)
+            last_order_key = manifest_max_key(previous['tables']['fact_orders'])
+            if planned != last_order_key:
+                print(f"Error: existing fact_orders ends at OrderKey {last_order_key}, but seed {args.seed} "
+                      f"at scale {args.scale} plans {planned} orders through {last_date_key}")
+                sys.exit(1)
+            with PROFILER.stage('carry over returns', 'generate') as stage:
+                carried = carried_returns(ctx, units, args.seed, last_day)
+                stage['rows'] = len(carried['order_key']) if carried else 0
+            units = [unit for unit in units if unit[0] > last_day]
+        fact_outputs = write_fact_tables(output_dir, ctx, units, args.seed, args.chunk_rows, workers,
+                                         fmt, args.partition_by_month,
+                                         previous and previous['tables'], carried)
+        for output in fact_outputs:
+            print(f"  Created {output.name} ({output.rows} rows in {len(output.files)} file(s))")
+        outputs.extend(fact_outputs)
     
-    # Generate a sales view (aggregated from orders)
-    print("Generating sales fact table...")
-    fact_sales = fact_orders.groupby(['OrderKey', 'OrderID', 'OrderDateKey', 'OrderDate', 'CustomerKey']).agg({
-        'LineTotal': 'sum',
-        'COGS': 'sum',
-        'GrossProfit': 'sum',
-        'Quantity': 'sum'
-    }).reset_index()
-    fact_sales.rename(columns={
-        'OrderKey': 'SalesKey',
-        'OrderID': 'SalesID',
-        'OrderDateKey': 'SalesDateKey',
-        'OrderDate': 'SalesDate',
-        'LineTotal': 'GrossSales',
-        'Quantity': 'TotalQuantity'
-    }, inplace=True)
-    fact_sales['NetSales'] = fact_sales['GrossSales'] - (fact_sales['GrossSales'] * 0.05)  # 5% discount
-    fact_sales.to_csv(os.path.join(output_dir, 'fact_sales.csv'), index=False)
-    print(f"  Created fact_sales.csv ({len(fact_sales)} rows)")
+    settings = {
+        'seed': args.seed,
+        'scale': args.scale,
+        'engine': args.engine,
+        'format': fmt,
+        'partition_by': 'YearMonth' if args.partition_by_month else None,
+        'end_date': end_date,
+        'returns': {'rate': args.return_rate, 'lag': list(args.return_lag),
+                    'lag_mean': args.return_lag_mean, 'reasons': args.return_reasons},
+    }
+    write_manifest(output_dir, outputs, settings, previous and previous['tables'])
     
-    print(f"\n✓ All CSV files generated successfully in: {output_dir}")
+    print(f"\n✓ All {fmt.upper()} files generated successfully in: {output_dir}")
     print("\nGenerated files:")
-    for file in sorted(os.listdir(output_dir)):
-        if file.endswith('.csv'):
-            filepath = os.path.join(output_dir, file)
-            size = os.path.getsize(filepath) / 1024  # KB
-            print(f"  - {file} ({size:.1f} KB)")
+    for output in outputs:
+        size = sum(os.path.getsize(os.path.join(output_dir, entry['path'])) for entry in output.files) / 1024  # KB
+        if output.partitioned:
+            print(f"  - {output.name}/ ({len(output.files)} files, {size:.1f} KB)")
+        else:
+            print(f"  - {output.files[0]['path']} ({size:.1f} KB)")
+    print("  - manifest.json")
+    
+    if args.profile:
+        settings.update(chunk_rows=args.chunk_rows, workers=args.workers or os.cpu_count(),
+                        tracemalloc=tracemalloc.is_tracing())
+        PROFILER.print_summary()
+        paths = PROFILER.write(args.profile_dir or output_dir, settings)
+        PROFILER.stop()
+        print(f"\nProfile written to {paths[0]} and {paths[1]}")
+        if len(paths) > 2:
+            print(f"  plus {len(paths) - 2} cProfile dumps (profile-*.prof, view with python -m pstats)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+Local HTTP service answering dashboard measure queries from the data/ tables
+and the Model.bim measures.
+
+A query names measures, group-by columns and slicer filters:
+
+    POST /query  {"measures": ["curr_year_sales", "prev_year_sales"],
+                  "group_by": ["dim_date.Year"],
+                  "filters": {"dim_customer.Channel": ["Online", "Retail"]}}
+    GET  /query?measure=curr_year_sales&group_by=dim_date.Year&filter=dim_customer.Channel=Online
+
+and returns {"columns": [...], "rows": [[...], ...]}: the group-by columns
+followed by the measures. A POST body may also be a list of queries (one per
+visual of a page); the answer is {"results": [...]} in the same order.
+
+The measures are evaluated by dax_compiler.MeasureEvaluator in a pool of
+worker processes (--workers), each holding the tables, the compiled measures
+and its own measure-result cache. The event loop only does HTTP and JSON.
+Requests for the same groups and filters that arrive within --batch-ms of
+each other are evaluated as one batch: one filter context, one pass over the
+rows per measure. A request whose measures are already being computed for
+the same groups and filters waits for that evaluation instead of starting
+another. Changed table files are reloaded by the workers before the next
+evaluation.
+
+GET /stats reports request counts, batching and coalescing, the worker cache
+statistics and latency histograms (whole query, batch round trip through the
+pool, evaluation inside the worker). GET /measures lists the measures that
+compile against the data. The service binds to 127.0.0.1 and needs nothing
+beyond the standard library and what dax_compiler.py already imports.
+
+Usage:
+    python measure_service.py [--data DIR] [--model Model.bim] [--port 8765]
+                              [--workers N] [--batch-ms 2] [--cache-mb 64] [--encoded]
+    python measure_service.py --bench 20000 [--concurrency 64] [--url http://127.0.0.1:8765]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from dax_compiler import DEFAULT_AST_CACHE, DEFAULT_CACHE_MB, DaxError, MeasureEvaluator
+from query_engine import DEFAULT_DATA_DIR, DEFAULT_MODEL_PATH, parse_filter, table_paths
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_BATCH_MS = 2.0
+MAX_BODY_BYTES = 1 << 20
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# Histogram buckets: four per doubling, upper bounds from 10 us to about 3 minutes
+HISTOGRAM_MIN = 10e-6
+HISTOGRAM_STEPS = 4
+HISTOGRAM_BUCKETS = 98
+
+# ---------------------------------------------------------------------------
+# Workers
+# ---------------------------------------------------------------------------
+
+_worker_state = {}
+
+def _init_worker(data_dir, model_path, ast_cache, cache_mb, encoded):
+    if multiprocessing.parent_process() is not None:
+        # Ctrl+C is handled by the server, which shuts the pool down
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_state['evaluator'] = MeasureEvaluator.from_files(data_dir, model_path, ast_cache, cache_mb, encoded)
+
+def _measures_in_worker():
+    compiler = _worker_state['evaluator'].compiler
+    return [name for name in compiler.measures if not compiler.problems(name)]
+
+def _json_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+def _error_message(error):
+    return str(error.args[0]) if error.args else str(error)
+
+def _evaluate_in_worker(names, group_by, filters):
+    """Evaluate a batch of measures for one grouping and filter context.
+
+    Returns the group-by columns and measure values as JSON-ready lists. A
+    measure that fails is reported in 'errors' without failing the others.
+    """
+    evaluator = _worker_state['evaluator']
+    started = time.perf_counter()
+    errors = {}
+    try:
+        results = [evaluator.evaluate_columns(names, group_by, filters)]
+    except (DaxError, KeyError, ValueError) as e:
+        if len(names) == 1:
+            results, errors = [], {names[0]: _error_message(e)}
+        else:
+            # Find the failing measures one at a time; the rest of the batch still gets answered
+            results = []
+            for name in names:
+                try:
+                    results.append(evaluator.evaluate_columns([name], group_by, filters))
+                except (DaxError, KeyError, ValueError) as error:
+                    errors[name] = _error_message(error)
+    keys, values = {}, {}
+    for result in results:
+        n_keys = len(result) - sum(name in result for name in names)
+        for position, (column, array) in enumerate(result.items()):
+            target = keys if position < n_keys else values
+            target[column] = [_json_value(v) for v in array.tolist()]
+    cache = evaluator.cache.stats() if evaluator.cache is not None else None
+    return {'keys': keys, 'values': values, 'errors': errors, 'seconds': time.perf_counter() - started,
+            'pid': os.getpid(), 'cache': cache}
+
+def worker_pool(workers, data_dir, model_path, ast_cache=DEFAULT_AST_CACHE, cache_mb=DEFAULT_CACHE_MB,
+                encoded=False):
+    """Executor evaluating the measures; one worker runs in a thread of this process"""
+    workers = workers or os.cpu_count() or 1
+    initargs = (data_dir, model_path, ast_cache, cache_mb, encoded)
+    if workers == 1:
+        return ThreadPoolExecutor(max_workers=1, initializer=_init_worker, initargs=initargs)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+class LatencyHistogram:
+    """Latencies counted in log-spaced buckets (four per doubling)"""
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bound(bucket):
+        """Upper bound of a bucket in seconds"""
+        return HISTOGRAM_MIN * 2 ** (bucket / HISTOGRAM_STEPS)
+
+    def add(self, seconds):
+        bucket = 0
+        if seconds > HISTOGRAM_MIN:
+            bucket = min(math.ceil(math.log2(seconds / HISTOGRAM_MIN) * HISTOGRAM_STEPS), HISTOGRAM_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (at most the largest latency)"""
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bound(bucket), self.max)
+        return self.max
+
+    def to_json(self):
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {'count': self.count, 'mean_ms': ms(self.total / self.count) if self.count else None,
+                'p50_ms': ms(self.quantile(0.5)), 'p90_ms': ms(self.quantile(0.9)),
+                'p99_ms': ms(self.quantile(0.99)), 'max_ms': ms(self.max),
+                'buckets': [[ms(self.bound(b)), count] for b, count in enumerate(self.counts) if count]}
+
+class ServiceStats:
+    """Request counters and latency histograms of a running service"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.queries = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.batched_measures = 0
+        self.histograms = {name: LatencyHistogram() for name in ('query', 'batch', 'evaluate')}
+        self.workers = {}
+
+    def to_json(self):
+        return {'uptime_s': round(time.time() - self.started, 1), 'requests': self.requests,
+                'queries': self.queries, 'errors': self.errors, 'coalesced': self.coalesced,
+                'batches': self.batches, 'batched_queries': self.batched_queries,
+                'batched_measures': self.batched_measures,
+                'latency': {name: h.to_json() for name, h in self.histograms.items()},
+                'workers': {str(pid): cache for pid, cache in sorted(self.workers.items())}}
+
+# ---------------------------------------------------------------------------
+# Batching and coalescing
+# ---------------------------------------------------------------------------
+
+class QueryError(ValueError):
+    """A malformed query or one whose measures cannot be evaluated (HTTP 400)"""
+
+def parse_query(payload):
+    """(measures, group_by, filters) of a JSON query, as hashable tuples"""
+    if not isinstance(payload, dict):
+        raise QueryError("a query is a JSON object with 'measures', 'group_by' and 'filters'")
+    measures = payload.get('measures', payload.get('measure'))
+    group_by = payload.get('group_by', [])
+    filters = payload.get('filters') or {}
+    measures = [measures] if isinstance(measures, str) else measures
+    group_by = [group_by] if isinstance(group_by, str) else group_by
+    if not measures or not all(isinstance(m, str) for m in measures):
+        raise QueryError("'measures' must be a measure name or a non-empty list of them")
+    if not isinstance(group_by, list) or not all(isinstance(g, str) for g in group_by):
+        raise QueryError("'group_by' must be a list of table.column names")
+    if not isinstance(filters, dict):
+        raise QueryError("'filters' must map table.column to a value or a list of values")
+    normalized = []
+    for ref, values in filters.items():
+        values = values if isinstance(values, list) else [values]
+        if not all(v is None or isinstance(v, (str, int, float)) for v in values):
+            raise QueryError(f"filter values of {ref!r} must be strings, numbers or booleans")
+        normalized.append((ref, tuple(values)))
+    return tuple(dict.fromkeys(measures)), tuple(group_by), tuple(sorted(normalized))
+
+def query_from_url(query_string):
+    """Query of GET /query?measure=NAME&group_by=COLUMN&filter=table.column=v1,v2"""
+    params = parse_qs(query_string)
+    filters = {}
+    for spec in params.get('filter', []):
+        try:
+            (table, column), values = parse_filter(spec)
+        except argparse.ArgumentTypeError as e:
+            raise QueryError(str(e)) from None
+        filters[f'{table}.{column}'] = values
+    return parse_query({'measures': params.get('measure', []), 'group_by': params.get('group_by', []),
+                        'filters': filters})
+
+class _Batch:
+    def __init__(self, loop):
+        self.names = {}
+        self.queries = 0
+        self.future = loop.create_future()
+
+class QueryBatcher:
+    """Groups concurrent queries by grouping and filters and evaluates each group once.
+
+    Queries for the same context arriving within the batch window are merged
+    into one worker call for the union of their measures. A query whose
+    measures are all part of an evaluation still running for its context
+    waits for that result.
+    """
+
+    def __init__(self, pool, stats, batch_seconds=DEFAULT_BATCH_MS / 1000):
+        self.pool = pool
+        self.stats = stats
+        self.batch_seconds = batch_seconds
+        self._pending = {}
+        self._running = {}
+
+    async def query(self, names, group_by, filters):
+        """Columns and rows of one parsed query"""
+        context = (group_by, filters)
+        for batch in self._running.get(context, ()):
+            if all(name in batch.names for name in names):
+                self.stats.coalesced += 1
+                break
+        else:
+            batch = self._pending.get(context)
+            if batch is None:
+                batch = self._pending[context] = _Batch(asyncio.get_running_loop())
+                asyncio.get_running_loop().call_later(self.batch_seconds, self._dispatch, context)
+            elif all(name in batch.names for name in names):
+                self.stats.coalesced += 1
+            batch.names.update(dict.fromkeys(names))
+            batch.queries += 1
+        # A client that disconnects must not cancel the evaluation other queries share
+        result = await asyncio.shield(batch.future)
+        errors = [f"[{name}]: {result['errors'][name]}" for name in names if name in result['errors']]
+        if errors:
+            raise QueryError('; '.join(errors))
+        columns = list(result['keys']) + list(names)
+        data = list(result['keys'].values()) + [result['values'][name] for name in names]
+        return {'columns': columns, 'rows': [list(row) for row in zip(*data)]}
+
+    def _dispatch(self, context):
+        batch = self._pending.pop(context)
+        self._running.setdefault(context, []).append(batch)
+        self.stats.batches += 1
+        self.stats.batched_queries += batch.queries
+        self.stats.batched_measures += len(batch.names)
+        group_by, filters = context
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self.pool, _evaluate_in_worker, list(batch.names), list(group_by),
+                                    {ref: list(values) for ref, values in filters})
+        task.add_done_callback(lambda done: self._finish(context, batch, done, started))
+
+    def _finish(self, context, batch, done, started):
+        running = self._running[context]
+        running.remove(batch)
+        if not running:
+            del self._running[context]
+        self.stats.histograms['batch'].add(time.perf_counter() - started)
+        if done.exception() is not None:
+            batch.future.set_exception(done.exception())
+            # Retrieved here so an error nobody awaited is not logged as unhandled
+            batch.future.exception()
+            return
+        result = done.result()
+        self.stats.histograms['evaluate'].add(result['seconds'])
+        if result['cache'] is not None:
+            self.stats.workers[result['pid']] = result['cache']
+        batch.future.set_result(result)
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    head = (f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n')
+    if not keep_alive:
+        head += 'Connection: close\r\n'
+    return (head + '\r\n').encode('ascii') + body
+
+class MeasureService:
+    """HTTP/1.1 front end of a QueryBatcher; keep-alive connections answer one request at a time"""
+
+    def __init__(self, pool, measures, batch_seconds=DEFAULT_BATCH_MS / 1000):
+        self.stats = ServiceStats()
+        self.batcher = QueryBatcher(pool, self.stats, batch_seconds)
+        self.measures = measures
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                started = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                content_length = headers.get('content-length') or '0'
+                length = int(content_length) if content_length.isascii() and content_length.isdigit() else -1
+                if len(parts) != 3:
+                    status, error = 400, 'bad request line'
+                elif length < 0:
+                    status, error = 400, f"bad Content-Length {content_length!r}"
+                elif length > MAX_BODY_BYTES:
+                    status, error = 413, 'body too large'
+                else:
+                    status = None
+                if status is not None:
+                    writer.write(_response(status, {'error': error}, keep_alive=False))
+                    break
+                method, target, version = parts
+                body = await reader.readexactly(length) if length else b''
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+                status, payload = await self.respond(method, target, body)
+                self.stats.requests += 1
+                if status != 200:
+                    self.stats.errors += 1
+                if urlsplit(target).path == '/query':
+                    self.stats.histograms['query'].add(time.perf_counter() - started)
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, body):
+        """(status, JSON payload) of one request"""
+        url = urlsplit(target)
+        routes = {'/query': ('GET', 'POST'), '/measures': ('GET',), '/stats': ('GET',), '/health': ('GET',)}
+        if url.path not in routes:
+            return 404, {'error': f"no such endpoint {url.path}; try /query, /measures or /stats"}
+        if method not in routes[url.path]:
+            return 405, {'error': f"{url.path} accepts {' and '.join(routes[url.path])}"}
+        if url.path == '/health':
+            return 200, {'status': 'ok'}
+        if url.path == '/measures':
+            return 200, {'measures': self.measures}
+        if url.path == '/stats':
+            return 200, self.stats.to_json()
+        try:
+            if method == 'GET':
+                return 200, await self.query(query_from_url(url.query))
+            try:
+                payload = json.loads(body or b'null')
+            except ValueError as e:
+                return 400, {'error': f"invalid JSON: {e}"}
+            if isinstance(payload, list):
+                results = await asyncio.gather(*[self.query(parse_query(p)) for p in payload],
+                                               return_exceptions=True)
+                return 200, {'results': [self._error(r)[1] if isinstance(r, Exception) else r for r in results]}
+            return 200, await self.query(parse_query(payload))
+        except Exception as e:
+            return self._error(e)
+
+    async def query(self, parsed):
+        self.stats.queries += 1
+        return await self.batcher.query(*parsed)
+
+    @staticmethod
+    def _error(error):
+        if isinstance(error, QueryError):
+            return 400, {'error': _error_message(error)}
+        print(f"Error: {error!r}", file=sys.stderr)
+        return 500, {'error': f"{type(error).__name__}: {error}"}
+
+async def serve(args):
+    started = time.perf_counter()
+    workers = args.workers or os.cpu_count() or 1
+    pool = worker_pool(workers, args.data, args.model, args.ast_cache or None, args.cache_mb, args.encoded)
+    try:
+        # One task per worker so every process loads the tables before the first query
+        loop = asyncio.get_running_loop()
+        measures = await asyncio.gather(*[loop.run_in_executor(pool, _measures_in_worker)
+                                          for _ in range(workers)])
+        service = MeasureService(pool, measures[0], args.batch_ms / 1000)
+        server = await asyncio.start_server(service.handle_connection, args.host, args.port, backlog=1024)
+        print(f"Serving {len(measures[0])} measures from {os.path.abspath(args.data)} on "
+              f"http://{args.host}:{args.port} ({workers} worker{'s' if workers != 1 else ''}, "
+              f"ready in {time.perf_counter() - started:.1f} s)", flush=True)
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+# ---------------------------------------------------------------------------
+# Load test
+# ---------------------------------------------------------------------------
+
+async def _http(reader, writer, method, path, payload=None):
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+def bench_queries(measures, n_requests, page_size=8):
+    """Requests of dashboard pages: page_size measures, yearly, under one of five quarter slicers"""
+    contexts = [{}] + [{'dim_date.Quarter': [quarter]} for quarter in range(1, 5)]
+    measures = measures[:page_size]
+    return [{'measures': [measures[i % len(measures)]], 'group_by': ['dim_date.Year'],
+             'filters': contexts[i // len(measures) % len(contexts)]} for i in range(n_requests)]
+
+async def bench(url, n_requests, concurrency):
+    """Send n_requests single-measure queries over concurrency keep-alive connections"""
+    url = urlsplit(url)
+    host, port = url.hostname or DEFAULT_HOST, url.port or DEFAULT_PORT
+    reader, writer = await asyncio.open_connection(host, port)
+    measures = (await _http(reader, writer, 'GET', '/measures'))[1]['measures']
+    before = (await _http(reader, writer, 'GET', '/stats'))[1]
+    if not measures:
+        raise SystemExit("Error: no measure compiles against the served data")
+    queries = bench_queries(measures, n_requests)
+    latency = LatencyHistogram()
+    failures = []
+
+    async def client(offset):
+        conn_reader, conn_writer = await asyncio.open_connection(host, port)
+        try:
+            for query in queries[offset::concurrency]:
+                sent = time.perf_counter()
+                status, payload = await _http(conn_reader, conn_writer, 'POST', '/query', query)
+                latency.add(time.perf_counter() - sent)
+                if status != 200:
+                    failures.append(payload.get('error'))
+        finally:
+            conn_writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(min(concurrency, n_requests))])
+    elapsed = time.perf_counter() - started
+    after = (await _http(reader, writer, 'GET', '/stats'))[1]
+    writer.close()
+
+    summary = latency.to_json()
+    print(f"{n_requests:,} queries over {concurrency} connections in {elapsed:.2f} s: "
+          f"{n_requests / elapsed:,.0f} queries/s")
+    print(f"latency: p50 {summary['p50_ms']} ms, p90 {summary['p90_ms']} ms, p99 {summary['p99_ms']} ms, "
+          f"max {summary['max_ms']} ms")
+    batches = after['batches'] - before['batches']
+    print(f"server: {batches:,} batches ({(after['batched_queries'] - before['batched_queries']) / max(batches, 1):.1f}"
+          f" queries each), {after['coalesced'] - before['coalesced']:,} coalesced, "
+          f"evaluate p50 {after['latency']['evaluate']['p50_ms']} ms")
+    if failures:
+        print(f"{len(failures):,} failed, e.g. {failures[0]}")
+        sys.exit(1)
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the Model.bim measures over HTTP on localhost.')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of table CSV files')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Model.bim with measures and relationships')
+    parser.add_argument('--ast-cache', default=DEFAULT_AST_CACHE, help="parsed-AST cache file ('' to disable)")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'address to bind (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port (default: {DEFAULT_PORT})')
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes evaluating measures, each with its own copy of the tables; "
+                             "0 uses every CPU, 1 evaluates in a thread of the server (default: 0)")
+    parser.add_argument('--batch-ms', type=float, default=DEFAULT_BATCH_MS,
+                        help=f'how long queries for the same groups and filters are collected into one '
+                             f'evaluation (default: {DEFAULT_BATCH_MS:g})')
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_MB,
+                        help='memory bound of each worker\'s measure-result cache in MB (0 to disable)')
+    parser.add_argument('--encoded', action='store_true',
+                        help='keep the tables in the compressed column store (less memory)')
+    parser.add_argument('--bench', type=int, metavar='N',
+                        help='instead of serving, send N queries to a running service and report throughput')
+    parser.add_argument('--url', default=f'http://{DEFAULT_HOST}:{DEFAULT_PORT}', help='service for --bench')
+    parser.add_argument('--concurrency', type=int, default=64, help='connections used by --bench (default: 64)')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.bench:
+        try:
+            asyncio.run(bench(args.url, args.bench, args.concurrency))
+        except OSError as e:
+            print(f"Error: cannot reach {args.url}: {e}")
+            sys.exit(1)
+        return
+    if not table_paths(args.data):
+        print(f"Error: no table files in {args.data}")
+        sys.exit(1)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    except (OSError, BrokenExecutor) as e:
+        # Port in use, or a worker failed to load the tables (its traceback is printed above)
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Index a Model.bim once and load the index in milliseconds afterwards.
+
+Model.bim is a tabular JSON file of tens of thousands of lines; reading one
+measure from it means parsing all of it. ModelIndex holds what the tools
+need from it: tables (with their kind and partition sources), columns,
+measures, relationships, and the dependency graph of the DAX expressions.
+Expressions stored as line arrays are joined, with line endings normalized.
+
+The index is saved as JSON in a cache directory, one file per model path,
+together with the model's size, mtime and content hash and the versions of
+the code that built it. A later load with the same size and mtime, or the
+same content, reads that small file instead of the whole Model.bim. Any
+change to this module or dax_compiler.py (whose tokenizer finds the
+references) invalidates it.
+
+Graph nodes use DAX notation: '[measure]', 'table[column]' and 'table' (for
+calculated tables and whole-table references such as ALL('fact_sales')).
+Measures, calculated columns and calculated tables depend on the nodes their
+expressions reference. A bare [name] is a measure when one has that name,
+otherwise a column of the expression's own table; references to virtual
+columns (e.g. the [Date] of CALENDAR) are left out. Columns of a calculated
+table depend on the table, and a node that references a whole table counts
+as depending on each of its columns.
+
+Usage: python model_index.py [--model PATH] [--cache-dir DIR]
+                             [--measure NAME] [--depends-on NODE] [--order] [--json]
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import sys
+import tempfile
+import time
+
+from query_engine import DEFAULT_MODEL_PATH, file_hash, parse_column_ref
+
+INDEX_VERSION = 2
+DEFAULT_INDEX_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'model_index')
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def normalize_expression(expression):
+    """One string for an expression stored as a string or a list of lines"""
+    if isinstance(expression, list):
+        expression = '\n'.join(expression)
+    return (expression or '').replace('\r\n', '\n').strip()
+
+def measure_node(name):
+    return f'[{name}]'
+
+def column_node(table, column):
+    return f'{table}[{column}]'
+
+def build_index(model):
+    """The index of a parsed Model.bim 'model' object, as plain dicts and lists"""
+    tables, columns, measures, partitions = {}, {}, {}, {}
+    for table in model.get('tables', []):
+        name = table['name']
+        sources = [{
+            'name': partition.get('name'),
+            'type': partition.get('source', {}).get('type'),
+            'mode': partition.get('mode'),
+            'expression': normalize_expression(partition.get('source', {}).get('expression')),
+        } for partition in table.get('partitions', [])]
+        partitions[name] = sources
+        tables[name] = {
+            'name': name,
+            'kind': 'calculated' if any(p['type'] == 'calculated' for p in sources) else 'import',
+            'hidden': bool(table.get('isHidden', False)),
+            'columns': [column['name'] for column in table.get('columns', [])],
+            'measures': [measure['name'] for measure in table.get('measures', [])],
+        }
+        for column in table.get('columns', []):
+            columns[column_node(name, column['name'])] = {
+                'table': name,
+                'column': column['name'],
+                'data_type': column.get('dataType'),
+                'kind': column.get('type', 'data'),
+                'hidden': bool(column.get('isHidden', False)),
+                'source_column': column.get('sourceColumn'),
+                'expression': normalize_expression(column.get('expression')),
+            }
+        for measure in table.get('measures', []):
+            measures[measure['name']] = {
+                'table': name,
+                'name': measure['name'],
+                'expression': normalize_expression(measure.get('expression')),
+                'format_string': measure.get('formatString'),
+                'display_folder': measure.get('displayFolder'),
+                'hidden': bool(measure.get('isHidden', False)),
+            }
+    relationships = [{
+        'from_table': rel['fromTable'],
+        'from_column': rel['fromColumn'],
+        'to_table': rel['toTable'],
+        'to_column': rel['toColumn'],
+        'active': rel.get('isActive', True) is not False,
+        'both_directions': rel.get('crossFilteringBehavior') == 'bothDirections',
+    } for rel in model.get('relationships', [])]
+    index = {
+        'tables': tables, 'columns': columns, 'measures': measures,
+        'partitions': partitions, 'relationships': relationships,
+    }
+    index['dependencies'], index['problems'] = _build_dependencies(index)
+    return index
+
+class _Names:
+    """Case-insensitive lookup of the model's table, column and measure names"""
+
+    def __init__(self, index):
+        self.tables = {name.lower(): name for name in index['tables']}
+        self.measures = {name.lower(): name for name in index['measures']}
+        self.columns = {name: {column.lower(): column for column in table['columns']}
+                        for name, table in index['tables'].items()}
+
+def _references(expression, home_table, names):
+    """Nodes referenced by a DAX expression"""
+    from dax_compiler import tokenize
+
+    tokens = tokenize(expression)
+    refs = set()
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else ('end', '')
+        if kind in ('table', 'ident'):
+            name = text[1:-1].replace("''", "'") if kind == 'table' else text
+            table = names.tables.get(name.lower())
+            if table is not None and following[0] == 'bracket':
+                column = following[1][1:-1]
+                refs.add(column_node(table, names.columns[table].get(column.lower(), column)))
+                i += 1
+            elif table is not None and following != ('op', '('):
+                refs.add(table)
+        elif kind == 'bracket':
+            name = text[1:-1]
+            if name.lower() in names.measures:
+                refs.add(measure_node(names.measures[name.lower()]))
+            elif home_table is not None and name.lower() in names.columns[home_table]:
+                refs.add(column_node(home_table, names.columns[home_table][name.lower()]))
+        i += 1
+    return refs
+
+def _build_dependencies(index):
+    """{node: sorted referenced nodes} for every DAX expression, and {node: error} for unreadable ones"""
+    from dax_compiler import DaxError
+
+    names = _Names(index)
+    expressions = {measure_node(name): (info['table'], info['expression'])
+                   for name, info in index['measures'].items()}
+    dependencies = {}
+    for node, info in index['columns'].items():
+        if info['kind'] == 'calculated':
+            expressions[node] = (info['table'], info['expression'])
+        elif info['kind'] == 'calculatedTableColumn':
+            dependencies[node] = [info['table']]
+    for table, sources in index['partitions'].items():
+        dax = [p['expression'] for p in sources if p['type'] == 'calculated']
+        if dax:
+            expressions[table] = (None, '\n'.join(dax))
+    problems = {}
+    for node, (table, expression) in expressions.items():
+        try:
+            refs = _references(expression, table, names)
+        except DaxError as e:
+            problems[node] = str(e)
+            refs = set()
+        refs.discard(node)
+        dependencies[node] = sorted(refs)
+    return dependencies, problems
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+def _stat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+_code_version = None
+
+def code_version():
+    """INDEX_VERSION and a hash of the source of this module and dax_compiler.py (which it parses with)"""
+    global _code_version
+    if _code_version is None:
+        here = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.blake2b(digest_size=8)
+        for name in ('model_index.py', 'dax_compiler.py'):
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        _code_version = f'{INDEX_VERSION}.{digest.hexdigest()}'
+    return _code_version
+
+def cache_path(model_path, cache_dir=DEFAULT_INDEX_CACHE_DIR):
+    """The cache file of a model: one per absolute model path"""
+    key = hashlib.blake2b(os.path.abspath(model_path).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f'{key}.json')
+
+def _read_cache(path, source):
+    try:
+        with open(path, encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(cached, dict) or cached.get('version') != code_version()
+            or cached.get('source') != source):
+        return None
+    return cached
+
+def _write_cache(path, cached):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cached, f)
+    os.replace(tmp_path, path)
+
+def load_model_index(model_path=DEFAULT_MODEL_PATH, cache_dir=DEFAULT_INDEX_CACHE_DIR):
+    """The ModelIndex of a Model.bim, from the cache when the file is unchanged ('' or None: no cache)"""
+    source = os.path.abspath(model_path)
+    stat = list(_stat(source))
+    path = cache_path(source, cache_dir) if cache_dir else None
+    cached = _read_cache(path, source) if path else None
+    if cached is not None:
+        if cached['stat'] == stat:
+            return ModelIndex(cached['index'], source, cached['hash'])
+        digest = file_hash(source)
+        if cached['hash'] == digest:
+            # Touched but not changed: remember the new mtime
+            cached['stat'] = stat
+            _write_cache(path, cached)
+            return ModelIndex(cached['index'], source, digest)
+    else:
+        digest = file_hash(source)
+    with open(source, encoding='utf-8-sig') as f:
+        index = build_index(json.load(f)['model'])
+    if path:
+        _write_cache(path, {'version': code_version(), 'source': source, 'stat': stat,
+                            'hash': digest, 'index': index})
+    return ModelIndex(index, source, digest)
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+class ModelIndex:
+    """Tables, columns, measures, relationships and the DAX dependency graph of a model"""
+
+    def __init__(self, index, path=None, digest=None):
+        self.path = path
+        self.hash = digest
+        self.tables = index['tables']
+        self.columns = index['columns']
+        self.measures = index['measures']
+        self.partitions = index['partitions']
+        self.relationships = index['relationships']
+        self.dependencies = index['dependencies']
+        self.problems = index['problems']
+        self._measure_names = {name.lower(): name for name in self.measures}
+        self._table_names = {name.lower(): name for name in self.tables}
+        self._dependents = None
+
+    def measure(self, name):
+        """A measure's entry, by name (case-insensitive, with or without brackets)"""
+        name = name.strip()
+        if name.startswith('[') and name.endswith(']'):
+            name = name[1:-1]
+        try:
+            return self.measures[self._measure_names[name.lower()]]
+        except KeyError:
+            raise KeyError(f"no measure [{name}] in {self.path or 'the model'}") from None
+
+    def expression(self, name):
+        return self.measure(name)['expression']
+
+    def node(self, text):
+        """The graph node for '[measure]', a measure name, 'table[column]', 'table.column' or a table"""
+        text = text.strip()
+        if text.startswith('['):
+            return measure_node(self.measure(text)['name'])
+        if text.lower() in self._measure_names:
+            return measure_node(self._measure_names[text.lower()])
+        if text.strip("'").lower() in self._table_names:
+            return self._table_names[text.strip("'").lower()]
+        table, column = parse_column_ref(text)
+        table = self._table_names.get((table or '').lower())
+        if table is None:
+            raise KeyError(f"{text!r} is not a measure, table or column of {self.path or 'the model'}")
+        match = next((c for c in self.tables[table]['columns'] if c.lower() == column.lower()), None)
+        if match is None:
+            raise KeyError(f"no column {table}[{column}] in {self.path or 'the model'}")
+        return column_node(table, match)
+
+    def depends_on(self, node, transitive=False):
+        """Nodes a measure, calculated column or calculated table references"""
+        node = self.node(node)
+        if not transitive:
+            return list(self.dependencies.get(node, ()))
+        return sorted(self._closure([node], lambda n: self.dependencies.get(n, ())) - {node})
+
+    def dependents(self, node, transitive=True):
+        """Nodes that reference node, directly or (by default) through other nodes.
+
+        For a column this includes nodes that reference its whole table.
+        """
+        node = self.node(node)
+        if self._dependents is None:
+            self._dependents = {}
+            for source, targets in self.dependencies.items():
+                for target in targets:
+                    self._dependents.setdefault(target, set()).add(source)
+        start = [node]
+        if node in self.columns:
+            start.append(self.columns[node]['table'])
+        if not transitive:
+            return sorted(set().union(*(self._dependents.get(n, ()) for n in start)) - {node})
+        return sorted(self._closure(start, lambda n: self._dependents.get(n, ())) - set(start))
+
+    @staticmethod
+    def _closure(start, edges):
+        seen = set(start)
+        stack = list(start)
+        while stack:
+            for other in edges(stack.pop()):
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        return seen
+
+    def topological_order(self, measures_only=True):
+        """Nodes ordered so every node comes after the nodes it depends on.
+
+        Ties are broken by name, so the order is stable. Raises ValueError
+        naming the nodes of any dependency cycle.
+        """
+        nodes = set(self.dependencies)
+        for targets in self.dependencies.values():
+            nodes.update(targets)
+        pending = {node: set(self.dependencies.get(node, ())) for node in nodes}
+        users = {}
+        for node, targets in pending.items():
+            for target in targets:
+                users.setdefault(target, []).append(node)
+        ready = [node for node, targets in pending.items() if not targets]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            node = heapq.heappop(ready)
+            order.append(node)
+            for user in users.get(node, ()):
+                pending[user].discard(node)
+                if not pending[user]:
+                    heapq.heappush(ready, user)
+        if len(order) < len(nodes):
+            cycle = sorted(node for node, targets in pending.items() if targets)
+            raise ValueError(f"dependency cycle among {', '.join(cycle)}")
+        if measures_only:
+            return [node[1:-1] for node in order if node.startswith('[')]
+        return order
+
+    def active_relationships(self):
+        return [rel for rel in self.relationships if rel['active']]
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def print_summary(index, seconds):
+    kinds = {}
+    for table in index.tables.values():
+        kinds[table['kind']] = kinds.get(table['kind'], 0) + 1
+    print(f"{index.path} ({index.hash[:12]}), loaded in {seconds * 1000:.1f} ms")
+    print(f"  Tables:        {len(index.tables):,} "
+          f"({', '.join(f'{n} {kind}' for kind, n in sorted(kinds.items()))})")
+    print(f"  Columns:       {len(index.columns):,}")
+    print(f"  Measures:      {len(index.measures):,}")
+    print(f"  Relationships: {len(index.relationships):,} ({len(index.active_relationships()):,} active)")
+    edges = sum(len(targets) for targets in index.dependencies.values())
+    print(f"  Dependencies:  {edges:,} edges from {len(index.dependencies):,} nodes")
+    for node, problem in sorted(index.problems.items()):
+        print(f"  Unreadable:    {node}: {problem}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Index a Model.bim and query its measure dependency graph")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Model.bim to index')
+    parser.add_argument('--cache-dir', default=DEFAULT_INDEX_CACHE_DIR,
+                        help="directory of index cache files ('' to disable)")
+    parser.add_argument('--measure', action='append', default=[],
+                        help='show a measure with its dependencies; may be repeated')
+    parser.add_argument('--depends-on', action='append', default=[], metavar='NODE',
+                        help="list what depends on a column, table or measure, e.g. 'fact_orders[OrderDate]'")
+    parser.add_argument('--order', action='store_true', help='list measures in dependency order')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.model):
+        print(f"Error: model not found: {args.model}")
+        sys.exit(1)
+    started = time.perf_counter()
+    index = load_model_index(args.model, args.cache_dir)
+    seconds = time.perf_counter() - started
+    try:
+        results = {
+            'measures': {name: dict(index.measure(name), depends_on=index.depends_on(f'[{name}]'),
+                                    uses=index.depends_on(f'[{name}]', transitive=True))
+                         for name in args.measure},
+            'dependents': {node: index.dependents(node) for node in args.depends_on},
+        }
+        if args.order:
+            results['order'] = index.topological_order()
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0]}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print_summary(index, seconds)
+    for name, measure in results['measures'].items():
+        print(f"\n[{measure['name']}] on {measure['table']}")
+        for line in measure['expression'].splitlines():
+            print(f"    {line}")
+        print(f"  References: {', '.join(measure['depends_on']) or '-'}")
+        print(f"  Uses:       {', '.join(measure['uses']) or '-'}")
+    for node, dependents in results['dependents'].items():
+        print(f"\nDepends on {node}: {len(dependents):,}")
+        for dependent in dependents:
+            print(f"    {dependent}")
+    if args.order:
+        print(f"\nMeasures in dependency order ({len(results['order']):,}):")
+        for name in results['order']:
+            print(f"    {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+VertiPaq-Analyzer-style statistics for legacy/Model.bim over the data/ tables.
+
+Joins the Model.bim schema with the CSV files and reports, per table and
+column, the row count, blanks, cardinality, encoding, dictionary and data size
+in the compressed column store (column_store.py) and the share of the total
+model size. Relationships (from Model.bim plus the ones query_engine.py
+autodetects) get their key cardinalities and referential-integrity
+violations: rows whose key has no match on the one side.
+
+Tables are read in chunks and encoded one at a time, so only one encoded
+table plus the distinct values of relationship keys are held in memory.
+
+Columns are flagged when they are text with high cardinality (they dominate
+dictionary size and refresh time and should be split or dropped), when the
+model and the data disagree, or when a one-side key is not unique.
+
+Usage:
+    python model_stats.py [--data DIR] [--model Model.bim] [--sort size|cardinality|rows|name]
+                          [--top N] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from column_store import load_encoded_table
+from model_index import load_model_index
+from query_engine import DEFAULT_DATA_DIR, DEFAULT_MODEL_PATH, read_relationships, table_paths
+
+# Text columns with at least this many distinct values are flagged
+HIGH_CARDINALITY = 10000
+# ... if they are also at least this distinct (distinct values / rows)
+HIGH_CARDINALITY_RATIO = 0.1
+
+SORT_KEYS = {
+    'size': lambda c: -c['total_bytes'],
+    'cardinality': lambda c: -(c['cardinality'] or 0),
+    'rows': lambda c: -c['rows'],
+    'name': lambda c: (c['table'].lower(), c['column'].lower()),
+}
+
+# ---------------------------------------------------------------------------
+# Schema
+# ---------------------------------------------------------------------------
+
+def read_schema(model_path):
+    """Table name -> {column name: {'data_type', 'kind', 'hidden'}} from a Model.bim file"""
+    index = load_model_index(model_path)
+    schema = {table: {} for table in index.tables}
+    for column in index.columns.values():
+        schema[column['table']][column['column']] = {
+            'data_type': column['data_type'],
+            'kind': column['kind'],
+            'hidden': column['hidden'],
+        }
+    return schema
+
+def _match(name, names):
+    """Spelling of name in names, compared case-insensitively (None if absent)"""
+    return next((n for n in names if n.lower() == name.lower()), None)
+
+# ---------------------------------------------------------------------------
+# Column statistics
+# ---------------------------------------------------------------------------
+
+def value_counts(column):
+    """(sorted distinct values, row count of each, blank rows) of an EncodedColumn"""
+    codes = column.codes()
+    if codes is not None:
+        codes, uniques = codes
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        return uniques, counts, int(np.count_nonzero(codes < 0))
+    values = column.values()
+    blank = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype=bool)
+    uniques, counts = np.unique(values[~blank], return_counts=True)
+    return uniques, counts, int(np.count_nonzero(blank))
+
+def column_stats(table, name, column, uniques, blanks):
+    return {
+        'table': table,
+        'column': name,
+        'data_type': str(column.dtype),
+        'encoding': column.encoding,
+        'rows': len(column),
+        'blanks': blanks,
+        'cardinality': len(uniques),
+        'dictionary_bytes': column.dictionary_bytes,
+        'data_bytes': column.nbytes - column.dictionary_bytes,
+        'total_bytes': column.nbytes,
+        'bits_per_row': round(column.bits, 2),
+        'flags': [],
+    }
+
+def _flag_column(stats, model_column):
+    stats['model_type'] = model_column['data_type'] if model_column is not None else None
+    if stats['data_type'] != 'object':
+        return
+    if stats['cardinality'] >= HIGH_CARDINALITY and stats['cardinality'] >= HIGH_CARDINALITY_RATIO * stats['rows']:
+        if stats['encoding'] == 'pattern':
+            advice = 'store its numeric part as an integer key or drop it'
+        else:
+            advice = 'split it into lower-cardinality parts or drop it'
+        stats['flags'].append(f"high-cardinality text ({stats['cardinality']:,} distinct): {advice}")
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def analyze(data_dir=DEFAULT_DATA_DIR, model_path=DEFAULT_MODEL_PATH):
+    """Statistics of every table, column and relationship, as a JSON-ready dict"""
+    schema = read_schema(model_path) if model_path else {}
+    model_relationships = read_relationships(model_path) if model_path else []
+    paths = table_paths(data_dir)
+    # Dimensions first: their unique columns decide which fact keys to keep for autodetection
+    order = sorted(paths, key=lambda name: (not name.startswith('dim_'), name))
+    wanted = {(r.from_table, r.from_column) for r in model_relationships}
+    wanted |= {(r.to_table, r.to_column) for r in model_relationships}
+
+    tables, columns, keys = [], [], {}
+    dim_keys = {}
+    for name in order:
+        print(f"  reading {name}...", file=sys.stderr)
+        started = time.perf_counter()
+        encoded = load_encoded_table(paths[name])
+        elapsed = time.perf_counter() - started
+        model_table = schema.get(_match(name, schema) or '', None)
+        table_columns = []
+        for column_name, column in encoded.columns.items():
+            uniques, counts, blanks = value_counts(column)
+            stats = column_stats(name, column_name, column, uniques, blanks)
+            model_column = model_table.get(_match(column_name, model_table)) if model_table is not None else None
+            _flag_column(stats, model_column)
+            table_columns.append(stats)
+            if name.startswith('dim_') and stats['cardinality'] == len(column) and not blanks:
+                dim_keys.setdefault(column_name, []).append(name)
+            if (name, column_name) in wanted or column_name in dim_keys:
+                keys[(name, column_name)] = (uniques, counts, blanks)
+        size = sum(c['total_bytes'] for c in table_columns)
+        table_stats = {
+            'table': name,
+            'rows': encoded.n_rows,
+            'columns': len(table_columns),
+            'total_bytes': size,
+            'csv_bytes': os.path.getsize(paths[name]),
+            'load_seconds': round(elapsed, 3),
+            'flags': [],
+        }
+        if model_table is None:
+            table_stats['flags'].append('not in Model.bim')
+        else:
+            missing = [c for c in model_table if model_table[c]['kind'] == 'data' and _match(c, encoded) is None]
+            if missing:
+                table_stats['flags'].append(f"Model.bim columns missing from the data: {', '.join(missing)}")
+            extra = [c['column'] for c in table_columns if c['model_type'] is None]
+            if extra:
+                table_stats['flags'].append(f"columns not in Model.bim: {', '.join(extra)}")
+        tables.append(table_stats)
+        columns.extend(table_columns)
+        del encoded
+
+    total = sum(t['total_bytes'] for t in tables) or 1
+    for stats in tables + columns:
+        stats['model_share'] = round(stats['total_bytes'] / total, 4)
+    absent = [name for name in schema if _match(name, paths) is None]
+
+    relationships = [relationship_stats(r, 'Model.bim', keys) for r in model_relationships]
+    linked = {frozenset((r.from_table, r.to_table)) for r in model_relationships
+              if (r.from_table, r.from_column) in keys and (r.to_table, r.to_column) in keys}
+    for column_name, dims in dim_keys.items():
+        for dim in dims:
+            for name in order:
+                if name == dim or (name, column_name) not in keys or frozenset((name, dim)) in linked:
+                    continue
+                linked.add(frozenset((name, dim)))
+                rel = {'from_table': name, 'from_column': column_name, 'to_table': dim, 'to_column': column_name}
+                relationships.append(relationship_stats(rel, 'autodetected', keys))
+
+    return {
+        'data_dir': os.path.abspath(data_dir),
+        'model': os.path.abspath(model_path) if model_path else None,
+        'total_bytes': total,
+        'tables': tables,
+        'columns': columns,
+        'relationships': relationships,
+        'model_tables_without_data': absent,
+    }
+
+def relationship_stats(rel, source, keys):
+    """Key cardinalities and referential integrity of one many-to-one relationship"""
+    if not isinstance(rel, dict):
+        rel = {'from_table': rel.from_table, 'from_column': rel.from_column,
+               'to_table': rel.to_table, 'to_column': rel.to_column}
+    stats = dict(rel, source=source, flags=[])
+    many, one = keys.get((rel['from_table'], rel['from_column'])), keys.get((rel['to_table'], rel['to_column']))
+    stats['resolved'] = many is not None and one is not None
+    if not stats['resolved']:
+        return stats
+    many_values, many_counts, many_blanks = many
+    one_values, one_counts, one_blanks = one
+    numeric = (many_values.dtype.kind in 'biuf', one_values.dtype.kind in 'biuf')
+    if numeric[0] != numeric[1]:
+        # Compare as text when only one side is numeric (e.g. 12 vs '12')
+        many_values, one_values = many_values.astype(str), one_values.astype(str)
+    missing = ~np.isin(many_values, one_values)
+    stats.update({
+        'many_cardinality': len(many_values),
+        'one_cardinality': len(one_values),
+        'blank_keys': many_blanks,
+        'missing_keys': int(np.count_nonzero(missing)),
+        'invalid_rows': int(many_counts[missing].sum()),
+        'sample_missing': [_plain(v) for v in many_values[missing][:5]],
+    })
+    if (one_counts > 1).any() or one_blanks:
+        stats['flags'].append(f"{rel['to_table']}[{rel['to_column']}] is not unique")
+    if stats['invalid_rows']:
+        stats['flags'].append(f"{stats['invalid_rows']:,} rows with keys missing from {rel['to_table']} "
+                              f"({stats['missing_keys']:,} distinct)")
+    return stats
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def _mb(size):
+    return f'{size / (1 << 20):,.2f}'
+
+def print_report(report, sort='size', top=None):
+    tables = pd.DataFrame([{
+        'table': t['table'], 'rows': t['rows'], 'columns': t['columns'], 'MB': _mb(t['total_bytes']),
+        'share': f"{t['model_share']:.1%}", 'load s': t['load_seconds'],
+    } for t in sorted(report['tables'], key=lambda t: -t['total_bytes'])])
+    print(tables.to_string(index=False))
+
+    columns = sorted(report['columns'], key=SORT_KEYS[sort])[:top]
+    frame = pd.DataFrame([{
+        'table': c['table'], 'column': c['column'], 'encoding': c['encoding'], 'rows': c['rows'],
+        'blanks': c['blanks'], 'cardinality': c['cardinality'], 'dict MB': _mb(c['dictionary_bytes']),
+        'data MB': _mb(c['data_bytes']), 'total MB': _mb(c['total_bytes']), 'bits/row': c['bits_per_row'],
+        'share': f"{c['model_share']:.1%}",
+    } for c in columns])
+    print()
+    print(frame.to_string(index=False))
+
+    print("\nRelationships:")
+    for r in report['relationships']:
+        line = f"  {r['from_table']}[{r['from_column']}] -> {r['to_table']}[{r['to_column']}] ({r['source']})"
+        if r['resolved']:
+            line += f": {r['many_cardinality']:,} -> {r['one_cardinality']:,} keys"
+        else:
+            line += ": not in the data"
+        print(line)
+
+    flagged = [(f"{c['table']}[{c['column']}]", c['flags']) for c in report['columns'] if c['flags']]
+    flagged += [(t['table'], t['flags']) for t in report['tables'] if t['flags']]
+    flagged += [(f"{r['from_table']}[{r['from_column']}] -> {r['to_table']}", r['flags'])
+                for r in report['relationships'] if r['flags']]
+    if flagged or report['model_tables_without_data']:
+        print("\nFlags:")
+        for name, flags in flagged:
+            for flag in flags:
+                print(f"  {name}: {flag}")
+        if report['model_tables_without_data']:
+            print(f"  Model.bim tables without data: {', '.join(report['model_tables_without_data'])}")
+    print(f"\nTotal {_mb(report['total_bytes'])} MB encoded")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Report column and relationship statistics of the data model.')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of table CSV files')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="Model.bim with the schema ('' to skip)")
+    parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='size', help='order of the column table')
+    parser.add_argument('--top', type=int, help='only list the first N columns')
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not table_paths(args.data):
+        print(f"Error: no CSV files in {args.data}")
+        sys.exit(1)
+    report = analyze(args.data, args.model or None)
+    if args.json:
+        print(json.dumps(report, indent=2, default=_plain))
+        return
+    print_report(report, args.sort, args.top)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Extract many PBIX files at once, skipping anything that has not changed.
+
+Takes PBIX files, directories (every *.pbix inside, recursively) or glob
+patterns and processes them in a process pool, one file per task. Each file's
+DataModel and Report/Layout members are hashed (SHA-256, streamed from the
+archive) and looked up in a persistent cache directory:
+
+    index.json          DataModel hash -> {table: table hash}
+    tables/<sha>.<ext>  exported tables, keyed by a hash of the table's
+                        column metadata and segment files
+    layouts/<sha>.json  report layouts, keyed by the Layout member's hash
+
+A DataModel seen before is not decompressed at all: its tables are linked
+straight from the cache. A changed DataModel is decompressed (see
+xpress9_decompress.py) and only tables whose segments changed are exported
+again. Outputs go to <output>/<path>/, where <path> is the PBIX path relative
+to the directory common to all inputs (without the extension), so
+v1/report.pbix and v2/report.pbix land in different directories. Each holds a
+manifest.json of the hashes; tables listed in an earlier manifest that the
+model no longer has are removed. A summary of throughput and cache hit rate
+is printed at the end.
+
+Usage: python pbix_batch.py <pbix|dir|glob>... [--output DIR] [--cache DIR]
+                            [--workers N] [--format csv|parquet] [--json FILE]
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pbix_reader import PbixReader
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pbix_batch_cache')
+INDEX_FILE = 'index.json'
+MANIFEST_FILE = 'manifest.json'
+DATAMODEL_MEMBER = 'DataModel'
+LAYOUT_MEMBER = 'Report/Layout'
+EXTENSIONS = {'csv': 'csv', 'parquet': 'parquet'}
+
+# ---------------------------------------------------------------------------
+# Inputs and cache
+# ---------------------------------------------------------------------------
+
+def find_pbix_files(inputs):
+    """Expand files, directories and glob patterns into a sorted, de-duplicated list"""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            found.update(glob.glob(os.path.join(item, '**', '*.pbix'), recursive=True))
+        elif os.path.isfile(item):
+            found.add(item)
+        else:
+            found.update(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in found)
+
+def output_names(pbix_files):
+    """Output subdirectory of each PBIX: its path relative to the inputs' common directory, minus the extension.
+
+    Raises ValueError if two inputs would write to the same directory.
+    """
+    if not pbix_files:
+        return {}
+    root = os.path.commonpath([os.path.dirname(path) for path in pbix_files])
+    names = {path: os.path.splitext(os.path.relpath(path, root))[0] for path in pbix_files}
+    seen = {}
+    for path, name in names.items():
+        key = os.path.normcase(name).lower()
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {path} would both be written to {name}/")
+        seen[key] = path
+    return names
+
+def read_index(cache_dir):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {'version': CACHE_VERSION, 'models': {}}
+    try:
+        with open(path, encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    if index.get('version') != CACHE_VERSION:
+        return {'version': CACHE_VERSION, 'models': {}}
+    return index
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _prune_tables(out_dir, previous, tables, fmt):
+    """Remove the table files of an earlier manifest that this model no longer writes"""
+    if previous.get('format') not in EXTENSIONS:
+        return
+    keep = {f'{table}.{EXTENSIONS[fmt]}' for table in tables}
+    for table in previous.get('tables', {}):
+        name = f"{table}.{EXTENSIONS[previous['format']]}"
+        if name not in keep and os.path.exists(os.path.join(out_dir, name)):
+            os.remove(os.path.join(out_dir, name))
+
+def _link(source, dest):
+    """Hard-link a cached file into the output (copy across filesystems)"""
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+def hash_member(reader, name):
+    digest = hashlib.sha256()
+    for chunk in reader.iter_chunks(name):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_table(abf, table):
+    """SHA-256 over a table's column metadata and every segment file it decodes from"""
+    digest = hashlib.sha256()
+    for column, info in abf.columns()[table].items():
+        digest.update(json.dumps([column, info['data_type'], info['base_id'],
+                                  info['magnitude']]).encode('utf-8'))
+        files = [name for idf in info['idf'] for name in (idf, idf + 'meta')]
+        if info['dictionary']:
+            files.append(info['dictionary'])
+        for name in files:
+            digest.update(abf.file(name))
+    return digest.hexdigest()
+
+# ---------------------------------------------------------------------------
+# One PBIX
+# ---------------------------------------------------------------------------
+
+_worker_state = {}
+
+def _init_worker(cache_dir, output_dir, fmt, models):
+    _worker_state.update(cache_dir=cache_dir, output_dir=output_dir, fmt=fmt, models=models)
+
+def _process_layout(reader, result, out_dir):
+    if LAYOUT_MEMBER not in reader:
+        return
+    sha = hash_member(reader, LAYOUT_MEMBER)
+    cached = os.path.join(_worker_state['cache_dir'], 'layouts', f'{sha}.json')
+    result['layout'] = sha
+    if os.path.exists(cached):
+        result['layout_hit'] = True
+    else:
+        tmp_path = f'{cached}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(reader.read_text(LAYOUT_MEMBER))
+        os.replace(tmp_path, cached)
+        result['layout_hit'] = False
+    _link(cached, os.path.join(out_dir, 'Layout.json'))
+
+def _export_changed_tables(pbix_path, result):
+    """Decompress the DataModel and export the tables whose segments are not cached"""
+    import abf_reader
+    from xpress9_decompress import decompress_datamodel
+
+    fmt, cache_dir = _worker_state['fmt'], _worker_state['cache_dir']
+    fd, abf_path = tempfile.mkstemp(suffix='.abf')
+    os.close(fd)
+    try:
+        result['decompressed_bytes'] = decompress_datamodel(pbix_path, abf_path, workers=1)['decompressed_bytes']
+        tables = {}
+        with abf_reader.AbfReader(abf_path) as abf:
+            for table in abf.tables():
+                sha = hash_table(abf, table)
+                cached = os.path.join(cache_dir, 'tables', f'{sha}.{EXTENSIONS[fmt]}')
+                tables[table] = sha
+                if os.path.exists(cached):
+                    result['tables_reused'] += 1
+                    continue
+                tmp_path = f'{cached}.{os.getpid()}.tmp'
+                rows = abf_reader.write_table(abf, table, tmp_path, fmt)
+                os.replace(tmp_path, cached)
+                result['tables_exported'] += 1
+                result['rows_exported'] += rows
+    finally:
+        os.remove(abf_path)
+    return tables
+
+def process_pbix(pbix_path, name=None):
+    """Hash, look up and (if needed) extract one PBIX into <output>/<name>; returns a result dict for the summary"""
+    started = time.perf_counter()
+    cache_dir, fmt = _worker_state['cache_dir'], _worker_state['fmt']
+    name = name or os.path.splitext(os.path.basename(pbix_path))[0]
+    out_dir = os.path.join(_worker_state['output_dir'], name)
+    result = {
+        'pbix': pbix_path, 'name': name, 'output': out_dir, 'bytes': os.path.getsize(pbix_path),
+        'datamodel': None, 'datamodel_hit': None, 'layout': None, 'layout_hit': None,
+        'tables': {}, 'tables_reused': 0, 'tables_exported': 0, 'rows_exported': 0,
+        'decompressed_bytes': 0, 'error': None,
+    }
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        previous = _read_json(os.path.join(out_dir, MANIFEST_FILE))
+        with PbixReader(pbix_path) as reader:
+            _process_layout(reader, result, out_dir)
+            if DATAMODEL_MEMBER in reader:
+                result['datamodel'] = hash_member(reader, DATAMODEL_MEMBER)
+        sha = result['datamodel']
+        if sha:
+            tables = _worker_state['models'].get(sha)
+            paths = tables and [os.path.join(cache_dir, 'tables', f'{table_sha}.{EXTENSIONS[fmt]}')
+                                for table_sha in tables.values()]
+            result['datamodel_hit'] = bool(paths) and all(os.path.exists(path) for path in paths)
+            if result['datamodel_hit']:
+                result['tables_reused'] = len(tables)
+            else:
+                tables = _export_changed_tables(pbix_path, result)
+            result['tables'] = tables
+            for table, table_sha in tables.items():
+                _link(os.path.join(cache_dir, 'tables', f'{table_sha}.{EXTENSIONS[fmt]}'),
+                      os.path.join(out_dir, f'{table}.{EXTENSIONS[fmt]}'))
+        _prune_tables(out_dir, previous, result['tables'], fmt)
+        _write_json(os.path.join(out_dir, MANIFEST_FILE), {
+            'pbix': pbix_path, 'datamodel': sha, 'layout': result['layout'],
+            'format': fmt, 'tables': result['tables'],
+        })
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+# ---------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------
+
+def run_batch(pbix_files, output_dir, cache_dir=DEFAULT_CACHE_DIR, workers=0, fmt='csv', progress=None):
+    """Process PBIX files in a pool and update the cache index; returns the per-file results.
+
+    Raises ValueError if two files would share an output directory.
+    """
+    names = output_names(pbix_files)
+    for sub in ('tables', 'layouts'):
+        os.makedirs(os.path.join(cache_dir, sub), exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    index = read_index(cache_dir)
+    initargs = (cache_dir, output_dir, fmt, index['models'])
+    workers = min(workers or os.cpu_count(), len(pbix_files)) or 1
+
+    results = []
+    def finish(result):
+        results.append(result)
+        if result['datamodel'] and result['tables']:
+            index['models'][result['datamodel']] = result['tables']
+        if progress:
+            progress(result)
+
+    if workers == 1:
+        _init_worker(*initargs)
+        for path in pbix_files:
+            finish(process_pbix(path, names[path]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            in_flight = deque()
+            for path in pbix_files:
+                in_flight.append(pool.submit(process_pbix, path, names[path]))
+                if len(in_flight) >= 2 * workers:
+                    finish(in_flight.popleft().result())
+            while in_flight:
+                finish(in_flight.popleft().result())
+    _write_json(os.path.join(cache_dir, INDEX_FILE), index)
+    return results
+
+def summarize(results, seconds):
+    """Aggregate throughput and cache hit rates over a batch"""
+    ok = [r for r in results if not r['error']]
+    models = [r for r in ok if r['datamodel']]
+    layouts = [r for r in ok if r['layout']]
+    reused = sum(r['tables_reused'] for r in ok)
+    exported = sum(r['tables_exported'] for r in ok)
+    total_bytes = sum(r['bytes'] for r in results)
+    return {
+        'files': len(results),
+        'failed': len(results) - len(ok),
+        'bytes': total_bytes,
+        'seconds': round(seconds, 3),
+        'files_per_second': round(len(results) / seconds, 2) if seconds else None,
+        'mb_per_second': round(total_bytes / 1e6 / seconds, 2) if seconds else None,
+        'datamodel_hits': sum(1 for r in models if r['datamodel_hit']),
+        'datamodel_misses': sum(1 for r in models if not r['datamodel_hit']),
+        'layout_hits': sum(1 for r in layouts if r['layout_hit']),
+        'layout_misses': sum(1 for r in layouts if not r['layout_hit']),
+        'tables_reused': reused,
+        'tables_exported': exported,
+        'rows_exported': sum(r['rows_exported'] for r in ok),
+        'decompressed_bytes': sum(r['decompressed_bytes'] for r in ok),
+        'table_hit_rate': round(reused / (reused + exported), 3) if reused + exported else None,
+    }
+
+def print_result(result):
+    name = result['name']
+    if result['error']:
+        print(f"  FAILED {name}: {result['error']}")
+        return
+    model = ('no DataModel' if result['datamodel'] is None else
+             'DataModel cached' if result['datamodel_hit'] else
+             f"{result['tables_exported']} table(s) exported, {result['tables_reused']} reused")
+    print(f"  {name}: {model} ({result['seconds']:.2f}s)")
+
+def print_summary(summary):
+    print("\nBatch summary")
+    print(f"  Files:      {summary['files']:,} ({summary['failed']:,} failed), "
+          f"{summary['bytes'] / 1e6:,.1f} MB in {summary['seconds']:.2f}s "
+          f"({summary['files_per_second'] or 0:.2f} files/s, {summary['mb_per_second'] or 0:.1f} MB/s)")
+    print(f"  DataModel:  {summary['datamodel_hits']:,} cached, {summary['datamodel_misses']:,} changed")
+    print(f"  Layout:     {summary['layout_hits']:,} cached, {summary['layout_misses']:,} changed")
+    rate = summary['table_hit_rate']
+    print(f"  Tables:     {summary['tables_reused']:,} reused, {summary['tables_exported']:,} exported "
+          f"({summary['rows_exported']:,} rows); hit rate "
+          f"{'n/a' if rate is None else f'{rate:.1%}'}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract many PBIX files, reusing cached tables for unchanged models")
+    parser.add_argument('inputs', nargs='+', help="PBIX files, directories or glob patterns")
+    parser.add_argument('--output', default='pbix_batch_output', help="output directory (default: pbix_batch_output)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_DIR, help=f"cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="PBIX files processed in parallel; 0 uses every CPU (default: 0)")
+    parser.add_argument('--format', choices=sorted(EXTENSIONS), default='csv', help="table format (default: csv)")
+    parser.add_argument('--json', metavar='FILE', help="also write the per-file results and summary here")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    pbix_files = find_pbix_files(args.inputs)
+    if not pbix_files:
+        print("Error: no PBIX files matched")
+        sys.exit(1)
+    print(f"Processing {len(pbix_files):,} PBIX file(s) into {args.output} (cache: {args.cache})")
+    started = time.perf_counter()
+    try:
+        results = run_batch(pbix_files, args.output, args.cache, args.workers, args.format, progress=print_result)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    summary = summarize(results, time.perf_counter() - started)
+    print_summary(summary)
+    if args.json:
+        _write_json(args.json, {'summary': summary, 'files': results})
+        print(f"\nResults written to {args.json}")
+    if summary['failed']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
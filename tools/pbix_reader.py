@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Read PBIX files in place, without extracting them.
+
+A PBIX is a ZIP archive. PbixReader reads its central directory (a few KB at
+the end of the file) and serves members from there: listings, streamed reads
+in chunks, byte ranges such as the DataModel header, and small text members
+(Report/Layout, Metadata) decoded from UTF-16. Members stored without ZIP
+compression, which is how Power BI writes the already-compressed DataModel,
+are memory-mapped, so reading a header or handing the whole member to a
+decompressor costs no copy. Opening a 1 GB PBIX takes the same time and
+memory as opening a 1 MB one.
+
+Usage: python pbix_reader.py <pbix-file> [--member NAME] [--header BYTES] [--copy DEST]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import zipfile
+
+CHUNK_SIZE = 1 << 20
+# Fixed part of a ZIP local file header, followed by the name and extra field
+LOCAL_HEADER = struct.Struct('<4s22xHH')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+COMPRESSION_NAMES = {
+    zipfile.ZIP_STORED: 'stored',
+    zipfile.ZIP_DEFLATED: 'deflated',
+    zipfile.ZIP_BZIP2: 'bzip2',
+    zipfile.ZIP_LZMA: 'lzma',
+}
+
+class PbixReader:
+    """Random and streaming access to the members of a PBIX archive.
+
+    Use as a context manager. Views returned by buffer() and read() on stored
+    members point into the mapped file and are valid until close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._zip = zipfile.ZipFile(self._file)
+        except zipfile.BadZipFile:
+            self._file.close()
+            raise ValueError(f"{path} is not a PBIX (ZIP) archive")
+        self._infos = {info.filename: info for info in self._zip.infolist()}
+        self._map = None
+        self._offsets = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A caller still holds a view; the mapping goes when it does
+                pass
+            self._map = None
+        self._file.close()
+
+    # Listing -----------------------------------------------------------------
+
+    def names(self):
+        return list(self._infos)
+
+    def __contains__(self, name):
+        return name in self._infos
+
+    def info(self, name):
+        try:
+            return self._infos[name]
+        except KeyError:
+            raise KeyError(f"{name!r} is not a member of {self.path}") from None
+
+    def size(self, name):
+        return self.info(name).file_size
+
+    def is_stored(self, name):
+        """True when the member's bytes sit uncompressed in the archive and can be mapped"""
+        info = self.info(name)
+        return info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1
+
+    def members(self):
+        """One dict per member: name, size, compressed size, method and whether it can be mapped"""
+        return [{
+            'name': info.filename,
+            'size': info.file_size,
+            'compressed_size': info.compress_size,
+            'method': COMPRESSION_NAMES.get(info.compress_type, str(info.compress_type)),
+            'mapped': self.is_stored(info.filename),
+        } for info in self._infos.values() if not info.is_dir()]
+
+    def find_model_members(self):
+        """Members that may hold the tabular model: *.bim files and anything named like a model"""
+        return [name for name in self._infos
+                if name.endswith('.bim') or 'model' in name.lower()]
+
+    # Reading -----------------------------------------------------------------
+
+    def data_offset(self, name):
+        """Offset of a member's data in the archive, past its local file header"""
+        if name not in self._offsets:
+            info = self.info(name)
+            self._file.seek(info.header_offset)
+            signature, name_len, extra_len = LOCAL_HEADER.unpack(self._file.read(LOCAL_HEADER.size))
+            if signature != LOCAL_HEADER_SIGNATURE:
+                raise ValueError(f"{self.path}: bad local header for {name!r}")
+            self._offsets[name] = info.header_offset + LOCAL_HEADER.size + name_len + extra_len
+        return self._offsets[name]
+
+    def buffer(self, name):
+        """The whole member as a buffer: a zero-copy view for stored members, bytes otherwise"""
+        if not self.is_stored(name):
+            with self.open(name) as f:
+                return f.read()
+        size = self.size(name)
+        if size == 0:
+            return memoryview(b'')
+        if self._map is None:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = self.data_offset(name)
+        return memoryview(self._map)[start:start + size]
+
+    def read(self, name, offset=0, size=-1):
+        """Read a byte range of a member; only stored members support random access cheaply"""
+        end = self.size(name) if size < 0 else min(self.size(name), offset + size)
+        if self.is_stored(name):
+            return bytes(self.buffer(name)[offset:end])
+        with self.open(name) as f:
+            if offset:
+                f.seek(offset)
+            return f.read(max(end - offset, 0))
+
+    def header(self, name, size=4096):
+        """The first bytes of a member, e.g. to sniff a DataModel's compression signature"""
+        return self.read(name, 0, size)
+
+    def open(self, name):
+        """A streaming, read-only file object for a member (decompressed on the fly)"""
+        return self._zip.open(self.info(name))
+
+    def iter_chunks(self, name, chunk_size=CHUNK_SIZE):
+        """Yield a member's bytes in chunks of at most chunk_size"""
+        if self.is_stored(name):
+            view = self.buffer(name)
+            for start in range(0, len(view), chunk_size):
+                yield view[start:start + chunk_size]
+            return
+        with self.open(name) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read_text(self, name):
+        """Decode a small text member; PBIX JSON members are UTF-16-LE, others UTF-8"""
+        data = bytes(self.buffer(name))
+        if data[:2] == b'\xff\xfe' or (len(data) > 1 and data[1:2] == b'\x00'):
+            return data.decode('utf-16-le').lstrip('\ufeff')
+        return data.decode('utf-8-sig')
+
+    def copy(self, name, dest, chunk_size=CHUNK_SIZE):
+        """Stream a member to a file without holding it in memory; returns the bytes written"""
+        written = 0
+        with open(dest, 'wb') as out:
+            for chunk in self.iter_chunks(name, chunk_size):
+                out.write(chunk)
+                written += len(chunk)
+        return written
+
+def print_members(reader):
+    print(f"{'Member':<40}{'Size':>16}{'Stored as':>16}  Access")
+    for member in reader.members():
+        access = 'mmap' if member['mapped'] else 'stream'
+        print(f"{member['name']:<40}{member['size']:>16,}{member['method']:>16}  {access}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="List and read PBIX members without extracting the archive")
+    parser.add_argument('pbix', help="PBIX file")
+    parser.add_argument('--member', help="member to inspect (default: list all members)")
+    parser.add_argument('--header', type=int, default=64, help="bytes of --member to show (default: 64)")
+    parser.add_argument('--copy', metavar='DEST', help="stream --member to this file")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.pbix):
+        print(f"Error: PBIX file not found: {args.pbix}")
+        sys.exit(1)
+    with PbixReader(args.pbix) as reader:
+        if not args.member:
+            print_members(reader)
+            return
+        if args.member not in reader:
+            print(f"Error: no member {args.member!r} in {args.pbix}")
+            sys.exit(1)
+        print(f"{args.member}: {reader.size(args.member):,} bytes, "
+              f"{'memory-mapped' if reader.is_stored(args.member) else 'streamed'}")
+        print(f"  First {args.header} bytes: {reader.header(args.member, args.header)!r}")
+        if args.copy:
+            written = reader.copy(args.member, args.copy)
+            print(f"  Copied {written:,} bytes to {args.copy}")
+
+if __name__ == "__main__":
+    main()
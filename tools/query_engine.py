@@ -0,0 +1,786 @@
+#!/usr/bin/env python3
+"""
+In-process star-schema query engine over the CSV tables in data/.
+
+Loads every table into columnar NumPy arrays, reads the relationships from
+legacy/Model.bim and answers grouped aggregations (SUM, COUNT, DISTINCTCOUNT,
+MIN, MAX) with slicer filters, so dashboard numbers can be checked headlessly
+instead of through Power BI Desktop.
+
+Relationships are resolved once into foreign-key -> dimension-row index
+arrays. Slicer filters on a dimension become a boolean row mask that is
+propagated to the fact table through those arrays (many-to-one, plus the
+reverse direction for bothDirections relationships).
+
+Model.bim relationships whose tables or columns are not present in the data
+directory are skipped. Key columns that share a name with a unique column of
+a dim_* table (e.g. fact_orders.CustomerKey -> dim_customer.CustomerKey) are
+linked automatically, the same way Power BI autodetects relationships.
+
+With --encoded the tables are held in the compressed column store
+(column_store.py): filters, group keys and COUNT/DISTINCTCOUNT/MIN/MAX work
+on the dictionary codes, and only columns that are summed get decoded.
+
+When bitmap_index.py has built DATA/_bitmaps, slicer filters on the indexed
+attributes of a fact table are answered from its bitmaps (OR within an
+attribute, AND across attributes) instead of through the relationships.
+Tables whose files changed since the index was built are filtered with
+joins; --no-bitmaps always does.
+
+Usage:
+    python query_engine.py --table TABLE --measure SPEC [--measure SPEC ...]
+                           [--group-by COLUMN ...] [--filter COLUMN=VALUE[,VALUE...] ...]
+                           [--data DIR] [--model Model.bim] [--no-autodetect] [--encoded] [--no-bitmaps]
+                           [--json]
+
+    SPEC is [Name=]FUNC(column) with FUNC one of SUM, COUNT, DISTINCTCOUNT,
+    MIN, MAX. Columns are 'column' (on TABLE), 'table.column' or 'table[column]'.
+
+Example:
+    python query_engine.py --data ../data --table fact_returns \\
+        --measure "Returns=SUM(ReturnAmount)" --group-by dim_date.Year \\
+        --filter dim_date.Quarter=1,2
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import pandas as pd
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(TOOLS_DIR, '..', 'data')
+DEFAULT_MODEL_PATH = os.path.join(TOOLS_DIR, '..', 'legacy', 'Model.bim')
+
+AGGREGATIONS = ('SUM', 'COUNT', 'DISTINCTCOUNT', 'MIN', 'MAX')
+# Aggregations answered from dictionary codes alone on encoded tables
+CODE_AGGREGATIONS = ('COUNT', 'DISTINCTCOUNT', 'MIN', 'MAX')
+DATE_TABLE = 'dim_date'
+
+Relationship = namedtuple('Relationship', 'from_table from_column to_table to_column both_directions')
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+def load_table(path, encoded=False):
+    """Read a CSV file into a dict of column name -> NumPy array.
+
+    With encoded=True the table is kept dictionary/RLE-encoded in memory
+    (column_store.EncodedTable) and columns are decoded on first use.
+    """
+    if encoded:
+        from column_store import load_encoded_table
+        return load_encoded_table(path)
+    return frame_columns(pd.read_csv(path))
+
+def frame_columns(df):
+    """A DataFrame as a dict of column name -> NumPy array (numbers stay numeric, the rest object)"""
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        if series.dtype.kind in 'biuf':
+            columns[name] = series.to_numpy()
+        else:
+            columns[name] = series.to_numpy(dtype=object, na_value=None)
+    return columns
+
+def table_paths(data_dir):
+    """Every *.csv in data_dir, keyed by file name without extension"""
+    paths = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.csv'))):
+        paths[os.path.splitext(os.path.basename(path))[0]] = path
+    return paths
+
+def load_tables(data_dir, encoded=False):
+    """Load every *.csv in data_dir, keyed by file name without extension"""
+    return {name: load_table(path, encoded) for name, path in table_paths(data_dir).items()}
+
+def table_rows(columns):
+    """Row count of a loaded table"""
+    if hasattr(columns, 'n_rows'):
+        return columns.n_rows
+    return len(next(iter(columns.values()), ()))
+
+def file_hash(path):
+    """Hex digest of a file's content"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class SourceFingerprints:
+    """Detects which table files changed since they were loaded.
+
+    A file whose size and mtime are unchanged is assumed unchanged; otherwise
+    its content hash decides, so touching or rewriting a file with the same
+    bytes does not count as a change.
+    """
+
+    def __init__(self, paths):
+        self.paths = dict(paths)
+        self._stats = {name: self._stat(path) for name, path in self.paths.items()}
+        self._hashes = {name: file_hash(path) for name, path in self.paths.items()}
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def changed(self):
+        """Tables whose file content differs from the last check (missing files count as changed)"""
+        changed = []
+        for name, path in self.paths.items():
+            stat = self._stat(path)
+            if stat == self._stats[name]:
+                continue
+            self._stats[name] = stat
+            digest = file_hash(path) if stat is not None else None
+            if digest != self._hashes[name]:
+                self._hashes[name] = digest
+                changed.append(name)
+        return changed
+
+def read_relationships(model_path):
+    """Read the active relationships from a Model.bim (tabular JSON) file"""
+    from model_index import load_model_index
+    return [Relationship(rel['from_table'], rel['from_column'], rel['to_table'], rel['to_column'],
+                         rel['both_directions'])
+            for rel in load_model_index(model_path).active_relationships()]
+
+def autodetect_relationships(tables, existing=()):
+    """Link columns to the same-named unique key column of a dim_* table.
+
+    Pairs of tables already connected by a relationship are left alone.
+    """
+    linked = {frozenset((r.from_table, r.to_table)) for r in existing}
+    detected = []
+    for dim_name, dim in tables.items():
+        if not dim_name.startswith('dim_'):
+            continue
+        for key, values in dim.items():
+            if len(pd.unique(values)) != len(values):
+                continue
+            for name, table in tables.items():
+                if name == dim_name or key not in table:
+                    continue
+                if frozenset((name, dim_name)) in linked:
+                    continue
+                detected.append(Relationship(name, key, dim_name, key, False))
+                linked.add(frozenset((name, dim_name)))
+    return detected
+
+def parse_column_ref(text, default_table=None):
+    """Split 'column', 'table.column', 'table[column]' or "'table'[column]" into (table, column)"""
+    text = text.strip()
+    match = re.fullmatch(r"'?([^'\[]*?)'?\[([^\]]+)\]", text)
+    if match:
+        table, column = match.group(1).strip(), match.group(2)
+    elif '.' in text:
+        table, column = text.split('.', 1)
+    else:
+        table, column = '', text
+    return (table or default_table), column
+
+# ---------------------------------------------------------------------------
+# Grouping helpers
+# ---------------------------------------------------------------------------
+
+def _is_null(values):
+    if values.dtype.kind == 'f':
+        return np.isnan(values)
+    if values.dtype.kind == 'O':
+        return pd.isna(values)
+    return np.zeros(len(values), dtype=bool)
+
+def factorize_groups(key_columns, n_rows):
+    """Dense group ids for the combined keys plus the key values of each group"""
+    if not key_columns:
+        return np.zeros(n_rows, dtype=np.int64), 1, []
+    codes = []
+    uniques = []
+    for values in key_columns:
+        col_codes, col_uniques = pd.factorize(values, sort=True, use_na_sentinel=False)
+        codes.append(col_codes)
+        uniques.append(np.asarray(col_uniques, dtype=values.dtype))
+    return combine_groups(codes, uniques)
+
+def combine_groups(codes, uniques):
+    """factorize_groups for key columns already given as codes into sorted uniques"""
+    combined = np.ravel_multi_index(codes, [len(u) for u in uniques]) if len(codes) > 1 else codes[0]
+    group_keys, group_ids = np.unique(combined, return_inverse=True)
+    if len(codes) > 1:
+        key_codes = np.unravel_index(group_keys, [len(u) for u in uniques])
+    else:
+        key_codes = (group_keys,)
+    keys = [u[c] for u, c in zip(uniques, key_codes)]
+    return group_ids.reshape(-1), len(group_keys), keys
+
+def _segment_reduce(ufunc, group_ids, values, n_groups):
+    """Apply ufunc.reduceat per group over the non-null values; empty groups are None"""
+    valid = ~_is_null(values)
+    order = np.argsort(group_ids[valid], kind='stable')
+    group_ids = group_ids[valid][order]
+    values = values[valid][order]
+    result = np.full(n_groups, None, dtype=object)
+    if not len(values):
+        return result
+    starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+    result[group_ids[starts]] = ufunc.reduceat(values, starts)
+    if len(starts) == n_groups and values.dtype.kind != 'O':
+        return result.astype(values.dtype)
+    return result
+
+def aggregate_groups(func, values, group_ids, n_groups):
+    """Evaluate one aggregation per group (SUM, COUNT, DISTINCTCOUNT, MIN, MAX)"""
+    func = func.upper()
+    if func == 'SUM':
+        valid = ~_is_null(values)
+        sums = np.bincount(group_ids[valid], weights=values[valid], minlength=n_groups)
+        return sums.astype(np.int64) if values.dtype.kind in 'biu' else sums
+    if func == 'COUNT':
+        return np.bincount(group_ids[~_is_null(values)], minlength=n_groups)
+    if func == 'DISTINCTCOUNT':
+        valid = ~_is_null(values)
+        codes, uniques = pd.factorize(values[valid])
+        width = max(len(uniques), 1)
+        pairs = np.unique(group_ids[valid] * width + codes)
+        return np.bincount(pairs // width, minlength=n_groups)
+    if func == 'MIN':
+        return _segment_reduce(np.minimum, group_ids, values, n_groups)
+    if func == 'MAX':
+        return _segment_reduce(np.maximum, group_ids, values, n_groups)
+    raise ValueError(f"unsupported aggregation {func!r}; expected one of {', '.join(AGGREGATIONS)}")
+
+def ragged_positions(starts, lengths):
+    """Concatenation of range(start, start + length) for each pair"""
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(int(lengths.sum())) + offsets
+
+# ---------------------------------------------------------------------------
+# Time index
+# ---------------------------------------------------------------------------
+
+def date_order(values):
+    """Stable row order that sorts values by date (blanks first), or None if already sorted"""
+    codes = pd.factorize(values, sort=True)[0]
+    if (np.diff(codes) >= 0).all():
+        return None
+    return np.argsort(codes, kind='stable')
+
+class TimeIndex:
+    """Row ranges of a table whose rows are sorted by a date column.
+
+    Rows starts[d]:starts[d + 1] hold the d-th distinct date (in date order),
+    so any set of dates - a year, a month, a shifted period - is a handful of
+    contiguous row ranges instead of a scan.
+    """
+
+    def __init__(self, column, codes, n_dates):
+        self.column = column
+        self.starts = np.searchsorted(codes, np.arange(n_dates + 1))
+
+    def ranges(self, selected):
+        """(starts, lengths) of the row ranges of the dates selected by a boolean mask over date codes"""
+        edges = np.diff(np.concatenate(([0], selected.astype(np.int8), [0])))
+        first, end = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        return self.starts[first], self.starts[end] - self.starts[first]
+
+    def rows(self, selected):
+        return ragged_positions(*self.ranges(selected))
+
+    def period(self, first, last):
+        """Row slice of the dates first..last (date codes, inclusive)"""
+        return slice(int(self.starts[first]), int(self.starts[last + 1]))
+
+# ---------------------------------------------------------------------------
+# Model
+# ---------------------------------------------------------------------------
+
+class StarModel:
+    """Columnar tables plus the relationships that connect them"""
+
+    def __init__(self, tables, relationships=(), autodetect=True, sort_by_date=False, bitmaps=None):
+        self.tables = dict(tables)
+        self.rows = {name: table_rows(cols) for name, cols in tables.items()}
+        self.model_relationships = list(relationships)
+        self.autodetect = autodetect
+        self.sort_by_date = sort_by_date
+        # bitmap_index.BitmapIndex answering slicer filters on fact tables (row ids in file order)
+        self.bitmaps = bitmaps
+        self._row_orders = {}
+        self.relationships = [r for r in relationships if self._resolves(r)]
+        if autodetect:
+            self.relationships += autodetect_relationships(tables, self.relationships)
+        # Column of each table that relates it to the date table
+        self.date_columns = {r.from_table: r.from_column for r in self.relationships
+                             if r.to_table == DATE_TABLE and r.from_table != DATE_TABLE}
+        self._dictionaries = {}
+        if sort_by_date:
+            for name, column in self.date_columns.items():
+                encoded = self.encoded_column(name, column)
+                order = date_order(self.tables[name][column] if encoded is None else self.dictionary(name, column)[0])
+                if order is None:
+                    continue
+                self._row_orders[name] = order
+                if encoded is None:
+                    self.tables[name] = {c: values[order] for c, values in self.tables[name].items()}
+                else:
+                    self.tables[name] = self.tables[name].take(order)
+                    self._dictionaries.pop((name, column))
+        self._time_indexes = {}
+        self._date_codes = {}
+        self._lookups = {}
+        self._paths = {}
+        self._related = {}
+        self._names = {name.lower(): (name, {c.lower(): c for c in cols}) for name, cols in tables.items()}
+        for rel in self.relationships:
+            self.lookup(rel)
+
+    @classmethod
+    def from_directory(cls, data_dir=DEFAULT_DATA_DIR, model_path=DEFAULT_MODEL_PATH, autodetect=True,
+                       sort_by_date=False, encoded=False, bitmaps=True):
+        """Load every table of data_dir; bitmaps=True uses the bitmap index in DATA/_bitmaps if one was built"""
+        relationships = read_relationships(model_path) if model_path else []
+        index = None
+        if bitmaps:
+            from bitmap_index import BitmapIndex
+            index = BitmapIndex.from_directory(data_dir)
+        return cls(load_tables(data_dir, encoded), relationships, autodetect=autodetect, sort_by_date=sort_by_date,
+                   bitmaps=index if index is not None and index.tables else None)
+
+    @property
+    def encoded(self):
+        """True if the tables are held in the encoded column store"""
+        return any(hasattr(cols, 'encoded') for cols in self.tables.values())
+
+    def with_tables(self, tables):
+        """A new model with some tables replaced; indexes are rebuilt and their bitmaps no longer used"""
+        bitmaps = self.bitmaps.excluding(tables) if self.bitmaps is not None else None
+        return StarModel({**self.tables, **tables}, self.model_relationships, self.autodetect, self.sort_by_date,
+                         bitmaps)
+
+    def _resolves(self, rel):
+        return (rel.from_column in self.tables.get(rel.from_table, ())
+                and rel.to_column in self.tables.get(rel.to_table, ()))
+
+    def column(self, table, column):
+        try:
+            return self.tables[table][column]
+        except KeyError:
+            raise KeyError(f"unknown column {table}[{column}]") from None
+
+    def encoded_column(self, table, column):
+        """The column_store.EncodedColumn behind table[column] (None for a plain array)"""
+        columns = self.tables[table]
+        return columns.encoded(column) if hasattr(columns, 'encoded') else None
+
+    def resolve(self, table, column=None):
+        """Canonical spelling of a table (and column) name; model names are case-insensitive"""
+        entry = self._names.get(table.lower())
+        if entry is None:
+            raise KeyError(f"unknown table {table!r}")
+        if column is None:
+            return entry[0]
+        name = entry[1].get(column.lower())
+        if name is None:
+            raise KeyError(f"unknown column {entry[0]}[{column}]")
+        return entry[0], name
+
+    def dictionary(self, table, column):
+        """Sorted distinct values of table[column] and the code of every row (-1 for blanks)"""
+        key = (table, column)
+        if key not in self._dictionaries:
+            encoded = self.encoded_column(table, column)
+            dictionary = encoded.codes() if encoded is not None else None
+            if dictionary is None:
+                codes, uniques = pd.factorize(self.column(table, column), sort=True)
+                dictionary = codes.astype(np.int64), np.asarray(uniques)
+            self._dictionaries[key] = dictionary
+        return self._dictionaries[key]
+
+    def lookup(self, rel):
+        """Row index into rel.to_table for every row of rel.from_table (-1 if unmatched)"""
+        index = self._lookups.get(rel)
+        if index is None:
+            keys = pd.Index(self.column(rel.to_table, rel.to_column))
+            if not keys.is_unique:
+                raise ValueError(f"{rel.to_table}[{rel.to_column}] is not unique; "
+                                 f"cannot be the one side of a relationship")
+            index = keys.get_indexer(self.column(rel.from_table, rel.from_column))
+            self._lookups[rel] = index
+        return index
+
+    # -- related columns (fact -> dimension lookups) -------------------------
+
+    def path(self, source, target):
+        """Shortest chain of many-to-one relationships from source to target"""
+        key = (source, target)
+        if key not in self._paths:
+            path = None
+            queue = deque([(source, [])])
+            seen = {source}
+            while queue:
+                table, steps = queue.popleft()
+                if table == target:
+                    path = steps
+                    break
+                for rel in self.relationships:
+                    if rel.from_table == table and rel.to_table not in seen:
+                        seen.add(rel.to_table)
+                        queue.append((rel.to_table, steps + [rel]))
+            self._paths[key] = path
+        return self._paths[key]
+
+    def row_index(self, source, target):
+        """Row of target related to every row of source (-1 if unmatched)"""
+        if source == target:
+            return None
+        path = self.path(source, target)
+        if path is None:
+            raise ValueError(f"no relationship path from {source} to {target}")
+        index = self.lookup(path[0])
+        for rel in path[1:]:
+            index = np.where(index >= 0, self.lookup(rel)[index], -1)
+        return index
+
+    def related_tables(self, source):
+        """source plus every table reachable from it through many-to-one relationships"""
+        tables = {source}
+        queue = deque([source])
+        while queue:
+            table = queue.popleft()
+            for rel in self.relationships:
+                if rel.from_table == table and rel.to_table not in tables:
+                    tables.add(rel.to_table)
+                    queue.append(rel.to_table)
+        return tables
+
+    def time_index(self, table):
+        """TimeIndex of a table sorted by its date column (None if it is not)"""
+        if table not in self._time_indexes:
+            index = None
+            column = self.date_columns.get(table)
+            if column is not None:
+                codes, uniques = self.dictionary(table, column)
+                if (np.diff(codes) >= 0).all():
+                    index = TimeIndex(column, codes, len(uniques))
+            self._time_indexes[table] = index
+        return self._time_indexes[table]
+
+    def date_codes(self, table, filter_table, column):
+        """Code of filter_table[column] for each distinct date of table's time index.
+
+        None unless the column depends on the date alone: the date column
+        itself or a column reached through the date relationship.
+        """
+        key = (table, filter_table, column)
+        if key not in self._date_codes:
+            index = self.time_index(table)
+            codes = None
+            if index is not None:
+                if (filter_table, column) == (table, index.column):
+                    codes = np.arange(len(index.starts) - 1)
+                elif filter_table != table:
+                    path = self.path(table, filter_table)
+                    if path and path[0].from_column == index.column:
+                        codes = self.related_codes(table, filter_table, column)[index.starts[:-1]]
+            self._date_codes[key] = codes
+        return self._date_codes[key]
+
+    def reachable(self, source, target):
+        """True if filters on target reach source (target is source or one of its dimensions)"""
+        return source == target or self.path(source, target) is not None
+
+    def related_codes(self, source, table, column):
+        """Dictionary codes of table[column] aligned to the rows of source (-1 if unmatched)"""
+        codes = self.dictionary(table, column)[0]
+        if source == table:
+            return codes
+        key = (source, table, column, 'codes')
+        if key not in self._related:
+            index = self.row_index(source, table)
+            self._related[key] = np.where(index >= 0, codes[index], -1)
+        return self._related[key]
+
+    def related_column(self, source, table, column):
+        """Values of table[column] aligned to the rows of source (RELATED semantics)"""
+        values = self.column(table, column)
+        if source == table:
+            return values
+        key = (source, table, column)
+        if key not in self._related:
+            index = self.row_index(source, table)
+            related = values[index]
+            missing = index < 0
+            if missing.any():
+                related = related.astype(float if related.dtype.kind in 'biuf' else object)
+                related[missing] = np.nan if related.dtype.kind == 'f' else None
+            self._related[key] = related
+        return self._related[key]
+
+    # -- filters --------------------------------------------------------------
+
+    def _own_mask(self, table, filters):
+        mask = None
+        for (filter_table, column), condition in filters.items():
+            if filter_table == table:
+                if self.encoded_column(table, column) is not None:
+                    column_mask = self._code_mask(table, column, condition)
+                else:
+                    column_mask = filter_mask(self.column(table, column), condition)
+                mask = column_mask if mask is None else mask & column_mask
+        return mask
+
+    def _code_mask(self, table, column, condition):
+        """filter_mask evaluated once per distinct value and looked up through the row codes"""
+        codes, uniques = self.dictionary(table, column)
+        if (codes < 0).any():
+            # An extra last entry for BLANK, which code -1 picks
+            blank = np.nan if uniques.dtype.kind == 'f' else None
+            uniques = np.append(uniques.astype(object) if blank is None else uniques, blank)
+        return filter_mask(uniques, condition)[codes]
+
+    def bitmap_mask(self, table, filters):
+        """(row mask of table for the filters the bitmap index covers or None, the other filters)"""
+        if self.bitmaps is None:
+            return None, filters
+        selected, rest = self.bitmaps.filter_rows(table, filters, self.rows[table])
+        if selected is not None and table in self._row_orders:
+            selected = selected[self._row_orders[table]]
+        return selected, rest
+
+    def table_mask(self, table, filters, _visiting=frozenset()):
+        """Boolean row mask of table under the slicer filters (None if unfiltered).
+
+        filters maps (table, column) to a value, a collection of values or a
+        vectorized predicate. Filters reach table through many-to-one
+        relationships, and from the many side through bothDirections ones.
+        Filters on attributes in the bitmap index are answered from it.
+        """
+        filters = _normalize_filters(filters)
+        selected = None
+        if not _visiting:
+            selected, filters = self.bitmap_mask(table, filters)
+        visiting = _visiting | {table}
+        mask = self._own_mask(table, filters)
+        for rel in self.relationships:
+            if rel.from_table == table and rel.to_table not in visiting:
+                dim_mask = self.table_mask(rel.to_table, filters, visiting)
+                if dim_mask is not None:
+                    index = self.lookup(rel)
+                    reached = dim_mask[index] & (index >= 0)
+                    mask = reached if mask is None else mask & reached
+            elif rel.to_table == table and rel.both_directions and rel.from_table not in visiting:
+                fact_mask = self.table_mask(rel.from_table, filters, visiting)
+                if fact_mask is not None:
+                    index = self.lookup(rel)[fact_mask]
+                    reached = np.zeros(self.rows[table], dtype=bool)
+                    reached[index[index >= 0]] = True
+                    mask = reached if mask is None else mask & reached
+        if selected is not None:
+            mask = selected if mask is None else mask & selected
+        return mask
+
+    # -- queries ----------------------------------------------------------------
+
+    def aggregate(self, table, measures, group_by=(), filters=None):
+        """Grouped aggregation over table.
+
+        measures maps output name -> (FUNC, column reference). group_by lists
+        column references, which may live on any table reachable from table
+        through many-to-one relationships. Returns a DataFrame with one row
+        per group, ordered by the group columns.
+        """
+        if table not in self.tables:
+            raise KeyError(f"unknown table {table!r}")
+        mask = self.table_mask(table, filters or {})
+        group_refs = [parse_column_ref(ref, table) for ref in group_by]
+        n_rows = self.rows[table] if mask is None else int(np.count_nonzero(mask))
+        if self.encoded:
+            group_ids, n_groups, keys = self._code_groups(table, group_refs, mask, n_rows)
+        else:
+            key_columns = [self.related_column(table, t, c) for t, c in group_refs]
+            if mask is not None:
+                key_columns = [values[mask] for values in key_columns]
+            group_ids, n_groups, keys = factorize_groups(key_columns, n_rows)
+
+        result = {}
+        for (t, c), values in zip(group_refs, keys):
+            result[c if c not in result else f'{t}[{c}]'] = values
+        for name, (func, ref) in measures.items():
+            ref_table, ref_column = parse_column_ref(ref, table)
+            if self.encoded and func.upper() in CODE_AGGREGATIONS:
+                result[name] = self._code_aggregate(func.upper(), table, ref_table, ref_column, mask,
+                                                    group_ids, n_groups)
+                continue
+            values = self.related_column(table, ref_table, ref_column)
+            if mask is not None:
+                values = values[mask]
+            result[name] = aggregate_groups(func, values, group_ids, n_groups)
+        return pd.DataFrame(result)
+
+    # -- queries on dictionary codes (encoded tables) -------------------------
+
+    def _related_dtype(self, source, table, column):
+        """dtype related_column() would return, without decoding the column"""
+        uniques = self.dictionary(table, column)[1]
+        if uniques.dtype.kind in 'biu' and source != table and (self.related_codes(source, table, column) < 0).any():
+            return np.dtype(float)
+        return uniques.dtype
+
+    def _code_groups(self, table, group_refs, mask, n_rows):
+        """factorize_groups over the dictionary codes of the group columns"""
+        if not group_refs:
+            return np.zeros(n_rows, dtype=np.int64), 1, []
+        codes = []
+        uniques = []
+        for t, c in group_refs:
+            col_codes = self.related_codes(table, t, c)
+            if mask is not None:
+                col_codes = col_codes[mask]
+            col_uniques = self.dictionary(t, c)[1].astype(self._related_dtype(table, t, c))
+            if (col_codes < 0).any():
+                col_codes = np.where(col_codes < 0, len(col_uniques), col_codes)
+                blank = np.nan if col_uniques.dtype.kind == 'f' else None
+                col_uniques = np.append(col_uniques.astype(object) if blank is None else col_uniques, blank)
+            codes.append(col_codes)
+            uniques.append(col_uniques)
+        return combine_groups(codes, uniques)
+
+    def _code_aggregate(self, func, source, table, column, mask, group_ids, n_groups):
+        """COUNT, DISTINCTCOUNT, MIN or MAX of a related column from its dictionary codes"""
+        codes = self.related_codes(source, table, column)
+        if mask is not None:
+            codes = codes[mask]
+        valid = codes >= 0
+        if func == 'COUNT':
+            return np.bincount(group_ids[valid], minlength=n_groups)
+        uniques = self.dictionary(table, column)[1]
+        width = max(len(uniques), 1)
+        if func == 'DISTINCTCOUNT':
+            pairs = np.unique(group_ids[valid] * width + codes[valid])
+            return np.bincount(pairs // width, minlength=n_groups)
+        reduce, empty = (np.minimum, width) if func == 'MIN' else (np.maximum, -1)
+        best = np.full(n_groups, empty, dtype=np.int64)
+        reduce.at(best, group_ids[valid], codes[valid])
+        found = (best >= 0) & (best < len(uniques))
+        result = np.full(n_groups, None, dtype=object)
+        result[found] = uniques[best[found]]
+        dtype = self._related_dtype(source, table, column)
+        if found.all() and valid.any() and dtype.kind != 'O':
+            return result.astype(dtype)
+        return result
+
+def filter_mask(values, condition):
+    """Rows of values matching a slicer condition: a value, a collection of values or a predicate"""
+    if callable(condition):
+        return np.asarray(condition(values), dtype=bool)
+    if isinstance(condition, (list, tuple, set, frozenset, np.ndarray)):
+        wanted = [coerce_value(v, values) for v in condition]
+    else:
+        wanted = [coerce_value(condition, values)]
+    if len(wanted) == 1:
+        return values == wanted[0]
+    return np.isin(values, np.asarray(wanted, dtype=values.dtype if values.dtype.kind != 'O' else object))
+
+def coerce_value(value, values):
+    """Convert a (CLI string) filter value to the dtype of the filtered column"""
+    if not isinstance(value, str) or values.dtype.kind == 'O':
+        return value
+    if values.dtype.kind == 'b':
+        return value.strip().lower() in ('true', '1', 'yes')
+    if values.dtype.kind in 'iu':
+        return int(value)
+    if values.dtype.kind == 'f':
+        return float(value)
+    return value
+
+def _normalize_filters(filters):
+    """Accept {'table.column': cond} or {(table, column): cond}"""
+    normalized = {}
+    for ref, condition in filters.items():
+        if isinstance(ref, str):
+            ref = parse_column_ref(ref)
+            if ref[0] is None:
+                raise ValueError(f"filter column {ref[1]!r} needs a table name (table.column)")
+        normalized[ref] = condition
+    return normalized
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+MEASURE_PATTERN = re.compile(r'^(?:(.+?)\s*=\s*)?(%s)\s*\((.+)\)$' % '|'.join(AGGREGATIONS), re.IGNORECASE)
+
+def parse_measure(spec):
+    """Parse '[Name=]FUNC(column)' into (name, (FUNC, column))"""
+    match = MEASURE_PATTERN.match(spec.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(
+            f"invalid measure {spec!r}; expected [Name=]FUNC(column) with FUNC in {', '.join(AGGREGATIONS)}")
+    name, func, column = match.groups()
+    func = func.upper()
+    return name or f'{func}({column.strip()})', (func, column.strip())
+
+def parse_filter(spec):
+    """Parse 'table.column=v1,v2' into ((table, column), [v1, v2])"""
+    column, sep, values = spec.partition('=')
+    table, column = parse_column_ref(column)
+    if not sep or table is None:
+        raise argparse.ArgumentTypeError(f"invalid filter {spec!r}; expected table.column=value[,value...]")
+    return (table, column), values.split(',')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Query the sample data star schema.')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory of table CSV files')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Model.bim with the relationships')
+    parser.add_argument('--no-autodetect', dest='autodetect', action='store_false',
+                        help='only use relationships from Model.bim')
+    parser.add_argument('--encoded', action='store_true',
+                        help='keep the tables in the compressed column store (less memory)')
+    parser.add_argument('--table', required=True, help='table to aggregate (usually a fact table)')
+    parser.add_argument('--measure', type=parse_measure, action='append', required=True,
+                        help='[Name=]FUNC(column); may be repeated')
+    parser.add_argument('--group-by', action='append', default=[], help='group column; may be repeated')
+    parser.add_argument('--filter', type=parse_filter, action='append', default=[],
+                        help='table.column=value[,value...]; may be repeated')
+    parser.add_argument('--no-bitmaps', dest='bitmaps', action='store_false',
+                        help='filter with joins even where a bitmap index was built (bitmap_index.py)')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON records')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    started = time.perf_counter()
+    model = StarModel.from_directory(args.data, args.model, autodetect=args.autodetect, encoded=args.encoded,
+                                     bitmaps=args.bitmaps)
+    loaded = time.perf_counter()
+
+    try:
+        result = model.aggregate(args.table, dict(args.measure), args.group_by, dict(args.filter))
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0] if e.args else e}")
+        sys.exit(1)
+    finished = time.perf_counter()
+
+    if args.json:
+        print(result.to_json(orient='records'))
+        return
+    print(result.to_string(index=False))
+    print(f"\n{len(result)} rows; load {(loaded - started) * 1000:.0f} ms, "
+          f"query {(finished - loaded) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
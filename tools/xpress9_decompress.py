@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Decompress the XPress9-compressed DataModel of a PBIX file to a file on disk.
+
+The DataModel member is framed as:
+    102 bytes   UTF-16-LE signature "This backup was created using XPress9 compression."
+    repeated    uint32 uncompressed size, uint32 compressed size, compressed block
+
+Each compressed block starts with its own header: magic 0x4E86D72A, sizes,
+an encoder session id and, at byte 24, the block's index within that
+session. Blocks of one session must be decoded in order by one decoder
+(each continues the previous block's state); a block with index 0 starts a
+new, independent session. Sessions are decoded in parallel across a process
+pool, and every block is written straight to its final offset in the output
+file, which is sized up front from the framing. Workers map the PBIX
+themselves, so no compressed or decompressed data passes through the parent
+and the multi-GB ABF never has to fit in memory.
+
+Only the signature above is read. Newer Power BI Desktop builds can also
+write "This backup was created using multithreaded XPress9 compression.",
+whose blocks are all independent but framed differently; with no sample of
+that layout to check a reader against, it is refused with an error rather
+than decoded by guesswork.
+
+The framing, session split, streaming and parallelism are plain Python; the
+block codec itself is Microsoft's XPress9 decoder through the xpress9
+package (see requirements.txt). The block header layout is the one that
+package's encoder writes. --info works without it.
+
+Usage: python xpress9_decompress.py <pbix-file> [<output-file>] [--workers N] [--info]
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pbix_reader import PbixReader
+
+SIGNATURE = 'This backup was created using XPress9 compression.'
+HEADER_SIZE = 102
+# Framing before each block: uncompressed size, compressed size
+BLOCK_FRAME = struct.Struct('<II')
+# Start of a compressed block: magic, then the block index within its session at byte 24
+BLOCK_HEADER = struct.Struct('<I20xI')
+BLOCK_MAGIC = 0x4E86D72A
+
+def load_codec():
+    """A new XPress9 decoder; raises ImportError when the xpress9 package is missing"""
+    try:
+        from xpress9 import Xpress9
+    except ImportError:
+        raise ImportError("decompressing XPress9 blocks requires the xpress9 package (pip install xpress9)")
+    return Xpress9()
+
+def read_signature(header):
+    """The backup signature at the start of a DataModel, or None when it is not text"""
+    try:
+        return bytes(header[:HEADER_SIZE]).decode('utf-16-le').rstrip('\x00')
+    except UnicodeDecodeError:
+        return None
+
+def is_xpress9(header):
+    signature = read_signature(header)
+    return bool(signature) and signature.startswith('This backup was created using') and 'XPress9' in signature
+
+def _check_signature(header):
+    signature = read_signature(header)
+    if signature != SIGNATURE:
+        if is_xpress9(header):
+            raise ValueError(f"unsupported XPress9 variant: {signature!r}; "
+                             f"only {SIGNATURE!r} is read")
+        raise ValueError("the DataModel does not start with an XPress9 backup signature")
+    return signature
+
+def _block_index(block, name):
+    if len(block) < BLOCK_HEADER.size:
+        raise ValueError(f"{name}: truncated XPress9 block header")
+    magic, index = BLOCK_HEADER.unpack_from(block)
+    if magic != BLOCK_MAGIC:
+        raise ValueError(f"{name}: bad XPress9 block magic {magic:#010x}")
+    return index
+
+# ---------------------------------------------------------------------------
+# Framing
+# ---------------------------------------------------------------------------
+
+def scan_blocks(buffer, name='DataModel'):
+    """Read the block framing of a mapped DataModel without touching the block payloads.
+
+    Returns (src_offset, compressed_size, dst_offset, uncompressed_size,
+    block_index) per block; offsets are within the member and the output.
+    """
+    _check_signature(buffer[:HEADER_SIZE])
+    blocks = []
+    offset = HEADER_SIZE
+    dst_offset = 0
+    end = len(buffer)
+    while offset < end:
+        if offset + BLOCK_FRAME.size > end:
+            raise ValueError(f"{name}: truncated block frame at byte {offset:,}")
+        uncompressed_size, compressed_size = BLOCK_FRAME.unpack_from(buffer, offset)
+        offset += BLOCK_FRAME.size
+        if offset + compressed_size > end:
+            raise ValueError(f"{name}: block at byte {offset:,} runs past the end of the member")
+        index = _block_index(buffer[offset:offset + BLOCK_HEADER.size], name)
+        blocks.append((offset, compressed_size, dst_offset, uncompressed_size, index))
+        offset += compressed_size
+        dst_offset += uncompressed_size
+    return blocks
+
+def iter_stream_blocks(stream, name='DataModel'):
+    """Yield (dst_offset, uncompressed_size, payload, block_index) from a sequential stream"""
+    _check_signature(stream.read(HEADER_SIZE))
+    dst_offset = 0
+    while True:
+        frame = stream.read(BLOCK_FRAME.size)
+        if not frame:
+            return
+        if len(frame) < BLOCK_FRAME.size:
+            raise ValueError(f"{name}: truncated block frame")
+        uncompressed_size, compressed_size = BLOCK_FRAME.unpack(frame)
+        payload = stream.read(compressed_size)
+        if len(payload) < compressed_size:
+            raise ValueError(f"{name}: truncated block")
+        yield dst_offset, uncompressed_size, payload, _block_index(payload, name)
+        dst_offset += uncompressed_size
+
+def split_sessions(blocks):
+    """Group blocks into encoder sessions: runs that start at block index 0"""
+    sessions = []
+    for block in blocks:
+        if block[4] == 0 or not sessions:
+            if block[4] != 0:
+                raise ValueError("the first XPress9 block does not start a session")
+            sessions.append([])
+        elif block[4] != sessions[-1][-1][4] + 1:
+            raise ValueError(f"XPress9 block index {block[4]} follows {sessions[-1][-1][4]}")
+        sessions[-1].append(block)
+    return sessions
+
+# ---------------------------------------------------------------------------
+# Decoding
+# ---------------------------------------------------------------------------
+
+def decode_block(codec, payload, uncompressed_size):
+    data = codec.decompress(bytes(payload), uncompressed_size)
+    if len(data) != uncompressed_size:
+        raise ValueError(f"XPress9 block decoded to {len(data):,} bytes, expected {uncompressed_size:,}")
+    return data
+
+_worker_state = {}
+
+def _init_worker(pbix_path, name, dest):
+    reader = PbixReader(pbix_path)
+    _worker_state.update(reader=reader, source=reader.buffer(name), out=open(dest, 'r+b'))
+
+def _close_worker():
+    state = _worker_state
+    state.pop('out').close()
+    state.pop('source').release()
+    state.pop('reader').close()
+
+def _decode_session(blocks):
+    """Decode one session's blocks in order into their places in the output file"""
+    source = _worker_state['source']
+    out = _worker_state['out']
+    codec = load_codec()
+    written = 0
+    for src_offset, compressed_size, dst_offset, uncompressed_size, _ in blocks:
+        data = decode_block(codec, source[src_offset:src_offset + compressed_size], uncompressed_size)
+        out.seek(dst_offset)
+        out.write(data)
+        written += len(data)
+    # Pool workers are never closed explicitly; each session is on disk when it returns
+    out.flush()
+    return written
+
+def decompress_datamodel(pbix_path, dest, workers=1, name='DataModel', progress=None):
+    """Decompress a PBIX's XPress9 DataModel into dest; returns a summary dict.
+
+    workers > 1 decodes independent sessions in a process pool (0 = all CPUs).
+    A DataModel stored compressed in the ZIP cannot be mapped; it is streamed
+    and decoded in this process instead. progress(done_bytes, total_bytes) is
+    called as sessions complete.
+    """
+    load_codec()
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+    with PbixReader(pbix_path) as reader:
+        compressed_bytes = reader.size(name)
+        if not reader.is_stored(name):
+            return _decompress_stream(reader, name, dest, compressed_bytes, started)
+        source = reader.buffer(name)
+        try:
+            blocks = scan_blocks(source, name)
+        finally:
+            source.release()
+    sessions = split_sessions(blocks)
+    total = sum(block[3] for block in blocks)
+    with open(dest, 'wb') as f:
+        f.truncate(total)
+
+    done = 0
+    workers = min(workers, len(sessions)) or 1
+    if workers == 1:
+        _init_worker(pbix_path, name, dest)
+        try:
+            for session in sessions:
+                done += _decode_session(session)
+                if progress:
+                    progress(done, total)
+        finally:
+            _close_worker()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(pbix_path, name, dest)) as pool:
+            in_flight = deque()
+            for session in sessions:
+                in_flight.append(pool.submit(_decode_session, session))
+                if len(in_flight) >= 2 * workers:
+                    done += in_flight.popleft().result()
+                    if progress:
+                        progress(done, total)
+            while in_flight:
+                done += in_flight.popleft().result()
+                if progress:
+                    progress(done, total)
+    return {
+        'blocks': len(blocks),
+        'sessions': len(sessions),
+        'workers': workers,
+        'compressed_bytes': compressed_bytes,
+        'decompressed_bytes': done,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+def _decompress_stream(reader, name, dest, compressed_bytes, started):
+    """Decode a DataModel that is deflated inside the ZIP, block by block as it streams"""
+    n_blocks = n_sessions = done = 0
+    codec = None
+    with reader.open(name) as stream, open(dest, 'wb') as out:
+        for dst_offset, uncompressed_size, payload, index in iter_stream_blocks(stream, name):
+            if index == 0:
+                codec = load_codec()
+                n_sessions += 1
+            elif codec is None:
+                raise ValueError("the first XPress9 block does not start a session")
+            out.write(decode_block(codec, payload, uncompressed_size))
+            n_blocks += 1
+            done += uncompressed_size
+    return {
+        'blocks': n_blocks,
+        'sessions': n_sessions,
+        'workers': 1,
+        'compressed_bytes': compressed_bytes,
+        'decompressed_bytes': done,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+def describe_datamodel(pbix_path, name='DataModel'):
+    """Signature, block and session counts and sizes, read from the framing alone"""
+    with PbixReader(pbix_path) as reader:
+        if reader.is_stored(name):
+            source = reader.buffer(name)
+            try:
+                signature = read_signature(source[:HEADER_SIZE])
+                blocks = scan_blocks(source, name)
+            finally:
+                source.release()
+        else:
+            with reader.open(name) as stream:
+                signature = read_signature(reader.header(name, HEADER_SIZE))
+                blocks = [(None, len(payload), dst, size, index)
+                          for dst, size, payload, index in iter_stream_blocks(stream, name)]
+    sizes = [block[3] for block in blocks]
+    return {
+        'signature': signature,
+        'blocks': len(blocks),
+        'sessions': len(split_sessions(blocks)),
+        'compressed_bytes': sum(block[1] for block in blocks),
+        'decompressed_bytes': sum(sizes),
+        'largest_block': max(sizes, default=0),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Decompress the XPress9 DataModel of a PBIX file")
+    parser.add_argument('pbix', help="PBIX file")
+    parser.add_argument('output', nargs='?', help="decompressed ABF file to write (default: <pbix>.abf)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes decoding sessions in parallel; 0 uses every CPU (default: 0)")
+    parser.add_argument('--member', default='DataModel', help="member to decompress (default: DataModel)")
+    parser.add_argument('--info', action='store_true', help="only describe the framing; no decoding")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.pbix):
+        print(f"Error: PBIX file not found: {args.pbix}")
+        sys.exit(1)
+    try:
+        if args.info:
+            info = describe_datamodel(args.pbix, args.member)
+            print(f"{args.member}: {info['signature']!r}")
+            print(f"  {info['blocks']:,} blocks in {info['sessions']:,} session(s), "
+                  f"{info['compressed_bytes']:,} -> {info['decompressed_bytes']:,} bytes "
+                  f"(largest block {info['largest_block']:,})")
+            return
+        output = args.output or os.path.splitext(args.pbix)[0] + '.abf'
+
+        def progress(done, total):
+            print(f"  {done:,} / {total:,} bytes", end='\r', flush=True)
+        stats = decompress_datamodel(args.pbix, output, args.workers, args.member, progress)
+        print()
+    except (ImportError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    rate = stats['decompressed_bytes'] / stats['seconds'] / 1e6 if stats['seconds'] else 0
+    print(f"Decompressed {stats['blocks']:,} blocks ({stats['sessions']:,} session(s), "
+          f"{stats['workers']} worker(s)) into {output}")
+    print(f"  {stats['compressed_bytes']:,} -> {stats['decompressed_bytes']:,} bytes "
+          f"in {stats['seconds']:.2f} s ({rate:,.0f} MB/s)")
+
+if __name__ == "__main__":
+    main()